@@ -19,11 +19,45 @@ COMPILED_EXE_BUILD_TIMESTAMP = "REPLACETHISWITHTIMESTAMPDURINGBUILD"
 SOFTWARE_RELEASE_CHANNEL = "REPLACETHISWITHRELEASECHANNELDURINGBUILD"
 
 DEFAULT_SERVER_PORT_NUMBER = 4565
+# status updates sent to the UI within this window of time are merged into a single message
+DEFAULT_UI_STATUS_UPDATE_WINDOW_SECONDS = 0.02
+# the codec used to encode and decode messages sent over the websocket, see utils/websocket_codecs.py
+DEFAULT_WEBSOCKET_CODEC = "json"
+# the path of the websocket route that streams waveform data to the UI in binary frames
+WAVEFORM_STREAM_PATH = "/waveform"
+# the max number of batches of waveform data that can be waiting to be sent to a single client of the waveform stream
+WAVEFORM_STREAM_MAX_NUM_QUEUED_BATCHES = 100
+# the path of the websocket route for clients that only receive the messages sent to the UI, e.g. monitoring dashboards
+READ_ONLY_CLIENT_PATH = "/read-only"
+# the max number of messages that can be waiting to be sent to a single read-only client before it is disconnected
+BROADCAST_CLIENT_MAX_NUM_QUEUED_MSGS = 1000
 
 NUM_WELLS = 24
 GENERIC_24_WELL_DEFINITION = LabwareDefinition(row_count=4, column_count=6)
+ALL_WELL_NAMES = frozenset(
+    GENERIC_24_WELL_DEFINITION.get_well_name_from_well_index(well_idx) for well_idx in range(NUM_WELLS)
+)
 
 FW_UPDATE_SUBDIR = "firmware_updates"
+# this must be a subdir since all files in FW_UPDATE_SUBDIR are assumed to be firmware files
+FW_UPDATE_CHECKPOINT_SUBDIR = "checkpoints"
+# downloaded firmware files are cached here. This is not in FW_UPDATE_SUBDIR since cached files should not force an update
+FW_CACHE_SUBDIR = "firmware_cache"
+FW_CACHE_MAX_SIZE_BYTES = 32 * 1024**2
+# responses to the requests made when checking for new versions are cached in this file in the base directory
+VERSION_CHECK_CACHE_FILE_NAME = "version_check_cache.json"
+# cached responses are used without revalidating them for this long after they were fetched
+VERSION_CHECK_CACHE_TTL_SECONDS = 60 * 60
+# files waiting to be uploaded to the cloud and the manifests of multipart uploads in progress are stored here
+UPLOADS_SUBDIR = "uploads"
+UPLOAD_MANIFEST_FILE_SUFFIX = ".manifest.json"
+# files larger than a single part are uploaded in parts. S3 does not allow any part other than the last to be smaller than 5 MiB
+DEFAULT_UPLOAD_PART_SIZE_BYTES = 8 * 1024**2
+MIN_UPLOAD_PART_SIZE_BYTES = 5 * 1024**2
+# the max number of parts of a multipart upload that are uploaded at the same time
+DEFAULT_MAX_NUM_CONCURRENT_UPLOAD_PARTS = 4
+# a multipart upload that still hasn't completed after being resumed this many times is abandoned
+UPLOAD_MAX_NUM_RESUME_ATTEMPTS = 3
 
 AuthTokens = namedtuple("AuthTokens", ["access", "refresh"])
 AuthCreds = namedtuple("AuthCreds", ["customer_id", "username", "password"])
@@ -48,9 +82,79 @@ CLOUD_DOMAIN = CLOUD_ENDPOINT_VALID_OPTIONS.get(CLOUD_ENDPOINT_USER_OPTION, "cur
 CLOUD_API_ENDPOINT = f"apiv2.{CLOUD_DOMAIN}.com"
 CLOUD_PULSE3D_ENDPOINT = f"pulse3d.{CLOUD_DOMAIN}.com"
 
+CloudClientSettings = namedtuple(
+    "CloudClientSettings",
+    ["max_connections", "max_keepalive_connections", "keepalive_expiry_seconds", "http2"],
+)
+# HTTP/2 also requires the optional h2 package to be installed
+DEFAULT_CLOUD_CLIENT_SETTINGS = CloudClientSettings(
+    max_connections=10, max_keepalive_connections=5, keepalive_expiry_seconds=30, http2=False
+)
+
+
+class CloudRequestTypes(Enum):
+    """Groups of requests made to cloud services that share the same timeouts and latency histogram."""
+
+    # logging in and refreshing tokens
+    AUTH = auto()
+    # small requests to the cloud APIs, such as getting versions or presigned URLs
+    METADATA = auto()
+    # downloading files through presigned URLs
+    DOWNLOAD = auto()
+    # uploading files through presigned URLs
+    UPLOAD = auto()
+
+
+CloudRequestTimeouts = namedtuple("CloudRequestTimeouts", ["connect", "read", "write", "pool"])
+CLOUD_REQUEST_TIMEOUTS: immutabledict[CloudRequestTypes, CloudRequestTimeouts] = immutabledict(
+    {
+        CloudRequestTypes.AUTH: CloudRequestTimeouts(connect=5, read=10, write=10, pool=5),
+        CloudRequestTypes.METADATA: CloudRequestTimeouts(connect=5, read=10, write=10, pool=5),
+        CloudRequestTypes.DOWNLOAD: CloudRequestTimeouts(connect=5, read=60, write=10, pool=5),
+        CloudRequestTypes.UPLOAD: CloudRequestTimeouts(connect=5, read=60, write=120, pool=5),
+    }
+)
+# only requests that can safely be sent more than once are retried
+CLOUD_REQUEST_IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+# responses with these status codes may succeed if the request is sent again
+CLOUD_REQUEST_RETRYABLE_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+CLOUD_REQUEST_MAX_NUM_ATTEMPTS = 3
+# the delay before each retry is random, up to base * 2^retry_idx, capped at the max
+CLOUD_REQUEST_RETRY_BASE_DELAY_SECONDS = 0.5
+CLOUD_REQUEST_RETRY_MAX_DELAY_SECONDS = 8
+# the upper bounds of the buckets of the latency histogram of each type of cloud request
+CLOUD_REQUEST_LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
 
 # System
 SERVER_BOOT_UP_TIMEOUT_SECONDS = 5
+# the max number of diffs of the system state that can be waiting to be processed by a subscriber
+SYSTEM_STATE_SUBSCRIPTION_MAX_QUEUE_SIZE = 10
+# the max number of messages that can be waiting in each queue to and from a subsystem, see create_system_queues in main.py
+SYSTEM_QUEUE_MAX_SIZES: immutabledict[str, int] = immutabledict(
+    {"server": 1000, "instrument_comm": 1000, "cloud_comm": 100}
+)
+
+
+class QueuePolicies(Enum):
+    """What to do with a message put into a full queue between subsystems."""
+
+    # wait until there is room in the queue
+    BLOCK = auto()
+    # make room by removing the oldest queued message of the same type
+    DROP_OLDEST = auto()
+    # merge the message into the newest queued message of the same type
+    COALESCE = auto()
+
+
+# the policy of each type of message. If a message type is not in here, or there is no queued message of the same
+# type to drop or merge into, then QueuePolicies.BLOCK is used
+SYSTEM_QUEUE_POLICIES: immutabledict[str, QueuePolicies] = immutabledict(
+    {"status_update": QueuePolicies.COALESCE, "magnetometer_data": QueuePolicies.DROP_OLDEST}
+)
+# the (direction, subsystem) of each queue that drops its oldest message instead of using QueuePolicies.BLOCK. The
+# UI can stall at any time, and blocking the queue to the Server would eventually stall InstrumentComm too
+NON_BLOCKING_SYSTEM_QUEUES: frozenset[tuple[str, str]] = frozenset({("to", "server")})
 
 
 class SystemStatuses(Enum):
@@ -109,12 +213,20 @@ STM_VID = 1155
 CURI_VID = 1027
 SERIAL_COMM_BAUD_RATE = int(5e6)
 SERIAL_COMM_BUFFER_RX_SIZE = 1000000
+SERIAL_COMM_PACKET_BUFFER_SIZE_BYTES = SERIAL_COMM_BUFFER_RX_SIZE
 SERIAL_COMM_BYTESIZE = 8
 SERIAL_COMM_READ_TIMEOUT = 0.01
 
+SerialCommErrorBudget = namedtuple("SerialCommErrorBudget", ["max_num_errors", "window_seconds"])
+DEFAULT_SERIAL_COMM_ERROR_BUDGET = SerialCommErrorBudget(max_num_errors=10, window_seconds=60)
+
 MAX_MC_REBOOT_DURATION_SECONDS = 15
 MAX_MAIN_FIRMWARE_UPDATE_DURATION_SECONDS = 60
 MAX_CHANNEL_FIRMWARE_UPDATE_DURATION_SECONDS = 600
+# the max number of firmware data packets sent to the instrument before receiving a response
+DEFAULT_FIRMWARE_UPDATE_WINDOW_SIZE = 1
+# the number of firmware data packets acknowledged by the instrument between each save of a firmware update checkpoint
+FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS = 16
 
 SERIAL_COMM_NUM_ALLOWED_MISSED_HANDSHAKES = 2
 
@@ -160,6 +272,9 @@ SERIAL_COMM_STATUS_CODE_LENGTH_BYTES = 2 + NUM_WELLS  # main micro, idx of threa
 SERIAL_COMM_TIME_INDEX_LENGTH_BYTES = 8
 SERIAL_COMM_TIME_OFFSET_LENGTH_BYTES = 2
 SERIAL_COMM_DATA_SAMPLE_LENGTH_BYTES = 2
+SERIAL_COMM_NUM_CHANNELS_PER_SENSOR = 3
+# the firmware only supports sampling periods that are a whole number of milliseconds
+SERIAL_COMM_MIN_SAMPLING_PERIOD_MICROSECONDS = MICROS_PER_MILLI
 
 SERIAL_COMM_MAX_TIMESTAMP_VALUE = 2 ** (8 * SERIAL_COMM_TIMESTAMP_LENGTH_BYTES) - 1
 
@@ -170,6 +285,11 @@ SERIAL_COMM_PACKET_TYPE_INDEX = SERIAL_COMM_TIMESTAMP_BYTES_INDEX + SERIAL_COMM_
 SERIAL_COMM_PAYLOAD_INDEX = SERIAL_COMM_PACKET_TYPE_INDEX + 1
 
 
+class SerialCommReadModes(Enum):
+    POLLING = auto()
+    EVENT_DRIVEN = auto()
+
+
 class SerialCommPacketTypes(IntEnum):
     # General
     STATUS_BEACON = 0
@@ -243,6 +363,9 @@ STIM_COMPLETE_SUBPROTOCOL_IDX = 255
 
 STIM_NO_PROTOCOL_ASSIGNED = 255
 
+# the approximate max amount of memory used by the cache of encoded stim info, see utils/stim_encoding_cache.py
+STIM_ENCODING_CACHE_MAX_SIZE_BYTES = 4 * 1024 * 1024
+
 # Stimulator Impedance Thresholds
 STIM_OPEN_CIRCUIT_THRESHOLD_OHMS = 20000
 STIM_SHORT_CIRCUIT_THRESHOLD_OHMS = 10
@@ -13,6 +13,10 @@ class WebsocketCommandError(Exception):
     pass
 
 
+class WebsocketCodecUnavailableError(Exception):
+    pass
+
+
 class ElectronControllerVersionMismatchError(Exception):
     pass
 
@@ -77,6 +81,10 @@ class SerialCommIncorrectChecksumFromInstrumentError(InstrumentBadDataError):
     pass
 
 
+class SerialCommErrorBudgetExceededError(InstrumentBadDataError):
+    pass
+
+
 class InvalidStimulatorCircuitStatus(InstrumentBadDataError):
     pass
 
@@ -17,20 +17,37 @@ from stdlib_utils import is_port_in_use
 
 from .constants import COMPILED_EXE_BUILD_TIMESTAMP
 from .constants import CURRENT_SOFTWARE_VERSION
+from .constants import DEFAULT_CLOUD_CLIENT_SETTINGS
+from .constants import DEFAULT_FIRMWARE_UPDATE_WINDOW_SIZE
+from .constants import DEFAULT_SERIAL_COMM_ERROR_BUDGET
 from .constants import DEFAULT_SERVER_PORT_NUMBER
+from .constants import DEFAULT_UPLOAD_PART_SIZE_BYTES
+from .constants import DEFAULT_WEBSOCKET_CODEC
+from .constants import FW_CACHE_SUBDIR
+from .constants import NON_BLOCKING_SYSTEM_QUEUES
+from .constants import SerialCommErrorBudget
+from .constants import SerialCommReadModes
 from .constants import SERVER_BOOT_UP_TIMEOUT_SECONDS
 from .constants import SOFTWARE_RELEASE_CHANNEL
+from .constants import SYSTEM_QUEUE_MAX_SIZES
 from .constants import SystemStatuses
+from .constants import UPLOADS_SUBDIR
 from .constants import VALID_CONFIG_SETTINGS
+from .constants import VERSION_CHECK_CACHE_FILE_NAME
 from .exceptions import LocalServerPortAlreadyInUseError
 from .main_systems.server import Server
 from .main_systems.system_monitor import SystemMonitor
 from .subsystems.cloud_comm import CloudComm
 from .subsystems.instrument_comm import InstrumentComm
 from .utils.aio import wait_tasks_clean
+from .utils.cloud_client import CloudRequestMetrics
 from .utils.logging import configure_logging
 from .utils.logging import redact_sensitive_info_from_path
+from .utils.queues import BoundedQueue
 from .utils.state_management import SystemStateManager
+from .utils.waveform_stream import WaveformStream
+from .utils.websocket_codecs import create_websocket_codec
+from .utils.websocket_codecs import WEBSOCKET_CODECS
 
 
 logger = logging.getLogger(__name__)
@@ -76,15 +93,49 @@ async def main(command_line_args: list[str]) -> None:
         queues = create_system_queues()
 
         # create subsystems
-        system_monitor = SystemMonitor(system_state_manager, queues)
+        # waveform data is sent from the SystemMonitor directly to the Server's waveform stream connections
+        waveform_stream = WaveformStream()
+
+        # metrics of requests made by CloudComm are included in the diagnostics reported by the SystemMonitor
+        cloud_request_metrics = CloudRequestMetrics()
+
+        system_monitor = SystemMonitor(
+            system_state_manager,
+            queues,
+            waveform_stream=waveform_stream,
+            cloud_request_metrics=cloud_request_metrics,
+        )
         server = Server(
-            system_state_manager.get_read_only_copy, queues["to"]["server"], queues["from"]["server"]
+            system_state_manager.get_read_only_copy,
+            queues["to"]["server"],
+            queues["from"]["server"],
+            codec=create_websocket_codec(parsed_args["websocket_codec"] or DEFAULT_WEBSOCKET_CODEC),
+            waveform_stream=waveform_stream,
         )
         instrument_comm_subsystem = InstrumentComm(
-            queues["to"]["instrument_comm"], queues["from"]["instrument_comm"]
+            queues["to"]["instrument_comm"],
+            queues["from"]["instrument_comm"],
+            serial_read_mode=(
+                SerialCommReadModes.EVENT_DRIVEN
+                if parsed_args["event_driven_serial_reads"]
+                else SerialCommReadModes.POLLING
+            ),
+            serial_comm_error_budget=_get_serial_comm_error_budget(parsed_args),
+            firmware_update_window_size=(
+                parsed_args["firmware_update_window_size"] or DEFAULT_FIRMWARE_UPDATE_WINDOW_SIZE
+            ),
         )
+        base_directory = _get_base_directory(parsed_args)
         cloud_comm_subsystem = CloudComm(
-            queues["to"]["cloud_comm"], queues["from"]["cloud_comm"], **_get_user_config_settings(parsed_args)
+            queues["to"]["cloud_comm"],
+            queues["from"]["cloud_comm"],
+            upload_dir_path=os.path.join(base_directory, UPLOADS_SUBDIR),
+            upload_part_size=_get_upload_part_size(parsed_args),
+            firmware_cache_dir_path=os.path.join(base_directory, FW_CACHE_SUBDIR),
+            version_check_cache_file_path=os.path.join(base_directory, VERSION_CHECK_CACHE_FILE_NAME),
+            cloud_client_settings=DEFAULT_CLOUD_CLIENT_SETTINGS._replace(http2=parsed_args["cloud_http2"]),
+            request_metrics=cloud_request_metrics,
+            **_get_user_config_settings(parsed_args),
         )
 
         # future for subsystems to set if they experience an error. The server will report the error in the future to the UI
@@ -123,7 +174,13 @@ async def main(command_line_args: list[str]) -> None:
 # TODO consider moving this to a different file
 def create_system_queues() -> dict[str, Any]:
     return {
-        direction: {subsystem: asyncio.Queue() for subsystem in ("server", "instrument_comm", "cloud_comm")}
+        direction: {
+            subsystem: BoundedQueue(
+                SYSTEM_QUEUE_MAX_SIZES[subsystem],
+                block_when_full=(direction, subsystem) not in NON_BLOCKING_SYSTEM_QUEUES,
+            )
+            for subsystem in ("server", "instrument_comm", "cloud_comm")
+        }
         for direction in ("to", "from")
     }
 
@@ -155,6 +212,43 @@ def _parse_cmd_line_args(command_line_args: list[str]) -> dict[str, Any]:
         action="store_true",
         help="override any supplied expected software version and disable the check",
     )
+    parser.add_argument(
+        "--event-driven-serial-reads",
+        action="store_true",
+        help="read from the instrument as soon as bytes arrive instead of polling for them",
+    )
+    parser.add_argument(
+        "--resilient-serial-parsing",
+        action="store_true",
+        help="drop corrupted packets from the instrument instead of treating them as a fatal error, unless the error budget is exceeded",
+    )
+    parser.add_argument(
+        "--serial-comm-error-budget",
+        nargs=2,
+        type=float,
+        metavar=("MAX_NUM_ERRORS", "WINDOW_SECONDS"),
+        help="the max number of corrupted packets allowed in the given window when using resilient serial parsing",
+    )
+    parser.add_argument(
+        "--firmware-update-window-size",
+        type=int,
+        help="the max number of firmware data packets to send to the instrument before receiving a response",
+    )
+    parser.add_argument(
+        "--websocket-codec",
+        choices=WEBSOCKET_CODECS.keys(),
+        help="the codec used to encode and decode messages sent over the websocket to and from the UI",
+    )
+    parser.add_argument(
+        "--cloud-http2",
+        action="store_true",
+        help="use HTTP/2 for requests to cloud services if the h2 package is installed",
+    )
+    parser.add_argument(
+        "--upload-part-size-mib",
+        type=int,
+        help="the size of each part of files uploaded to the cloud in multiple parts in MiB, must be at least 5",
+    )
     return vars(parser.parse_args(command_line_args))
 
 
@@ -171,10 +265,15 @@ def _log_cmd_line_args(parsed_args: dict[str, Any]) -> None:
     logger.info(f"Command Line Args: {parsed_args_copy}".replace(r"\\", "\\"))
 
 
-def initialize_system_state(parsed_args: dict[str, Any], log_file_id: uuid.UUID) -> dict[str, Any]:
-    base_directory = (
+def _get_base_directory(parsed_args: dict[str, Any]) -> str:
+    base_directory: str = (
         parsed_args["base_directory"] if parsed_args["base_directory"] is not None else os.getcwd()
     )
+    return base_directory
+
+
+def initialize_system_state(parsed_args: dict[str, Any], log_file_id: uuid.UUID) -> dict[str, Any]:
+    base_directory = _get_base_directory(parsed_args)
 
     system_state = {
         # main
@@ -229,5 +328,21 @@ def _log_system_info() -> None:
         logger.info(msg)
 
 
+def _get_serial_comm_error_budget(parsed_args: dict[str, Any]) -> SerialCommErrorBudget | None:
+    if not parsed_args["resilient_serial_parsing"]:
+        return None
+    if not (error_budget_args := parsed_args["serial_comm_error_budget"]):
+        return DEFAULT_SERIAL_COMM_ERROR_BUDGET
+    max_num_errors, window_seconds = error_budget_args
+    return SerialCommErrorBudget(max_num_errors=int(max_num_errors), window_seconds=window_seconds)
+
+
+def _get_upload_part_size(parsed_args: dict[str, Any]) -> int:
+    upload_part_size_mib: int | None = parsed_args["upload_part_size_mib"]
+    if not upload_part_size_mib:
+        return DEFAULT_UPLOAD_PART_SIZE_BYTES
+    return upload_part_size_mib * 1024**2
+
+
 def _get_user_config_settings(parsed_args: dict[str, Any]) -> dict[str, Any]:
     return {key: val for key, val in parsed_args.items() if key in VALID_CONFIG_SETTINGS}
@@ -2,11 +2,12 @@
 import asyncio
 import copy
 import functools
-import json
 import logging
 from typing import Any
 from typing import Awaitable
 from typing import Callable
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
 
 from semver import VersionInfo
 import websockets
@@ -14,26 +15,35 @@ from websockets import serve
 from websockets.server import WebSocketServerProtocol
 
 from ..constants import DEFAULT_SERVER_PORT_NUMBER
-from ..constants import GENERIC_24_WELL_DEFINITION
-from ..constants import NUM_WELLS
+from ..constants import DEFAULT_UI_STATUS_UPDATE_WINDOW_SECONDS
+from ..constants import DEFAULT_WEBSOCKET_CODEC
+from ..constants import READ_ONLY_CLIENT_PATH
 from ..constants import StimulationStates
 from ..constants import StimulatorCircuitStatuses
 from ..constants import SystemStatuses
 from ..constants import VALID_CREDENTIAL_TYPES
-from ..constants import VALID_STIMULATION_TYPES
+from ..constants import WAVEFORM_STREAM_PATH
 from ..exceptions import WebsocketCommandError
 from ..utils.aio import clean_up_tasks
 from ..utils.aio import wait_tasks_clean
+from ..utils.broadcast import BroadcastClient
+from ..utils.broadcast import BroadcastHub
 from ..utils.generic import handle_system_error
 from ..utils.logging import get_redacted_string
-from ..utils.state_management import ReadOnlyDict
-from ..utils.stimulation import validate_stim_subprotocol
+from ..utils.state_management import derived_from_system_state
+from ..utils.state_management import SystemStateSnapshot
+from ..utils.stimulation import validate_stim_info
+from ..utils.ui_messages import UiMessageAggregator
+from ..utils.waveform_stream import WaveformStream
+from ..utils.waveform_stream import WaveformStreamClient
+from ..utils.websocket_codecs import create_websocket_codec
+from ..utils.websocket_codecs import WebsocketCodec
 
 logger = logging.getLogger(__name__)
 
 ERROR_MSG = "IN SERVER"
 
-COMMANDS_ALLOWED_IN_OFFLINE_MODE = ("set_offline_state", "shutdown")
+COMMANDS_ALLOWED_IN_OFFLINE_MODE = ("set_offline_state", "shutdown", "get_diagnostics")
 
 
 def mark_handler(fn: Callable[..., Any]) -> Callable[..., Any]:
@@ -57,13 +67,18 @@ class Server:
 
     def __init__(
         self,
-        get_system_state_ro: Callable[..., ReadOnlyDict],
+        get_system_state_ro: Callable[..., SystemStateSnapshot],
         from_monitor_queue: asyncio.Queue[dict[str, Any]],
         to_monitor_queue: asyncio.Queue[dict[str, Any]],
+        status_update_window_seconds: float = DEFAULT_UI_STATUS_UPDATE_WINDOW_SECONDS,
+        codec: WebsocketCodec | None = None,
+        waveform_stream: WaveformStream | None = None,
     ) -> None:
         self._serve_task: asyncio.Task[None] | None = None
-        # this is only used in _report_system_error
+        # the connection to the UI, which is the only client commands are accepted from
         self._websocket: WebSocketServerProtocol | None = None
+        # every message sent to the UI is also sent to any clients connected to the read-only route
+        self._broadcast_hub = BroadcastHub()
 
         # TODO consider just passing in the read only version of the dict instead
         self._get_system_state_ro = get_system_state_ro
@@ -71,6 +86,10 @@ class Server:
         self._from_monitor_queue = from_monitor_queue
         self._to_monitor_queue = to_monitor_queue
 
+        self._status_update_window_seconds = status_update_window_seconds
+        self._codec = codec or create_websocket_codec(DEFAULT_WEBSOCKET_CODEC)
+        self._waveform_stream = waveform_stream or WaveformStream()
+
         self._ui_connection_made = asyncio.Event()
         self.user_initiated_shutdown = False
 
@@ -116,9 +135,20 @@ class Server:
         if not self._serve_task:
             raise NotImplementedError("_serve_task must be not be None here")
 
+        url = urlsplit(websocket.path)
+        if url.path == WAVEFORM_STREAM_PATH:
+            # waveform stream connections are independent of the main UI connection
+            await self._handle_waveform_stream_connection(websocket, parse_qs(url.query))
+            return
+
+        if url.path == READ_ONLY_CLIENT_PATH:
+            await self._handle_read_only_connection(websocket)
+            return
+
         if self._websocket:
-            logger.error("SECOND CONNECTION MADE")
-            # TODO figure out a good way to handle this
+            logger.error("Rejecting second UI connection")
+            # 1008 is the close code for policy violations
+            await websocket.close(code=1008, reason="UI already connected")
             return
 
         self._ui_connection_made.set()
@@ -162,7 +192,9 @@ class Server:
             logger.info(f"Sending system error code {error_code} to UI")
             msg = {"communication_type": "error", "error_code": error_code, **extra_info}
             try:
-                await self._websocket.send(json.dumps(msg))
+                encoded_msg = self._codec.encode(msg)
+                self._broadcast_hub.broadcast(encoded_msg)
+                await self._websocket.send(encoded_msg)
             except BaseException:
                 logger.exception("Failed to send error message to UI")
         else:
@@ -174,18 +206,98 @@ class Server:
         await wait_tasks_clean({producer, consumer}, error_msg=ERROR_MSG)
 
     async def _producer(self, websocket: WebSocketServerProtocol) -> None:
-        while True:
-            msg = json.dumps(await self._from_monitor_queue.get())
-            try:
+        encoded_msg: str | bytes = ""
+
+        async def _send_msg(msg: dict[str, Any]) -> None:
+            nonlocal encoded_msg
+            encoded_msg = self._codec.encode(msg)
+            self._broadcast_hub.broadcast(encoded_msg)
+            await websocket.send(encoded_msg)
+
+        aggregator = UiMessageAggregator(_send_msg, self._status_update_window_seconds)
+
+        try:
+            while True:
+                # timeout_at does not time out if given None, which is the case if nothing needs to be flushed
+                try:
+                    async with asyncio.timeout_at(aggregator.flush_deadline):
+                        msg = await self._from_monitor_queue.get()
+                except TimeoutError:
+                    await aggregator.flush()
+                else:
+                    await aggregator.add(msg)
+        except websockets.ConnectionClosed:
+            logger.error(f"Failed to send message to UI: {encoded_msg!r}")
+        finally:
+            logger.info(f"UI message metrics: {aggregator.get_metrics()}")
+
+    async def _handle_read_only_connection(self, websocket: WebSocketServerProtocol) -> None:
+        """Send the client every message sent to the UI until it disconnects.
+
+        Read-only clients can connect before the UI, but messages are held for the UI until it connects so
+        they will not receive any before then. Any messages received from the client are ignored. If the
+        client falls too far behind, it is disconnected so that it does not hold up the UI.
+        """
+        client = self._broadcast_hub.add_client()
+        logger.info(f"Read-only client connected, {self._broadcast_hub.num_clients} total")
+
+        send_task = asyncio.create_task(self._send_broadcast_msgs(websocket, client))
+        try:
+            async for _ in websocket:
+                logger.error("Ignoring message from read-only client, commands are only accepted from the UI")
+        finally:
+            self._broadcast_hub.remove_client(client)
+            await clean_up_tasks({send_task}, ERROR_MSG)
+            logger.info("Read-only client disconnected")
+
+    async def _send_broadcast_msgs(self, websocket: WebSocketServerProtocol, client: BroadcastClient) -> None:
+        # an empty list is only returned once the client has been evicted
+        while msgs := await client.get_msgs():
+            for msg in msgs:
                 await websocket.send(msg)
-            except websockets.ConnectionClosed:
-                logger.error(f"Failed to send message to UI: {msg}")
-                return
+
+        # 1008 is the close code for policy violations
+        await websocket.close(code=1008, reason="Client fell behind")
+
+    async def _handle_waveform_stream_connection(
+        self, websocket: WebSocketServerProtocol, query_params: dict[str, list[str]]
+    ) -> None:
+        """Stream waveform data to the client in binary frames until it disconnects.
+
+        The client can request that only every Nth sample is sent by connecting with `?decimation=N`.
+        """
+        try:
+            decimation = int(query_params.get("decimation", ["1"])[0])
+            client = self._waveform_stream.add_client(decimation)
+        except ValueError as e:
+            logger.error(f"Rejecting waveform stream connection: {e}")
+            # 1008 is the close code for policy violations
+            await websocket.close(code=1008, reason=str(e))
+            return
+
+        logger.info(f"Waveform stream client connected with decimation: {decimation}")
+
+        send_task = asyncio.create_task(self._send_waveform_frames(websocket, client))
+        try:
+            await websocket.wait_closed()
+        finally:
+            self._waveform_stream.remove_client(client)
+            await clean_up_tasks({send_task}, ERROR_MSG)
+            logger.info(
+                f"Waveform stream client disconnected, {client.num_batches_dropped} batches dropped because the client fell behind"
+            )
+
+    async def _send_waveform_frames(
+        self, websocket: WebSocketServerProtocol, client: WaveformStreamClient
+    ) -> None:
+        while True:
+            for frame in await client.get_frames():
+                await websocket.send(frame)
 
     async def _consumer(self, websocket: WebSocketServerProtocol) -> None:
         while not self.user_initiated_shutdown:
             try:
-                msg = json.loads(await websocket.recv())
+                msg = self._codec.decode(await websocket.recv())
             except websockets.ConnectionClosed:
                 return
 
@@ -230,6 +342,11 @@ class Server:
         logger.info("User initiated shutdown")
         self.user_initiated_shutdown = True
 
+    @mark_handler
+    async def _get_diagnostics(self, comm: dict[str, Any]) -> None:
+        """Request the depth and drop counters of the queues between subsystems."""
+        await self._to_monitor_queue.put(comm)
+
     @mark_handler
     async def _login(self, comm: dict[str, str]) -> None:
         """Update the customer/user settings."""
@@ -275,53 +392,8 @@ class Server:
         if system_status != SystemStatuses.IDLE_READY_STATE:
             raise WebsocketCommandError(f"Cannot change protocols while in {system_status.name}")
 
-        stim_info = comm["stim_info"]
-
-        protocol_list = stim_info["protocols"]
-        # make sure at least one protocol is given
-        if not protocol_list:
-            raise WebsocketCommandError("Protocol list empty")
-
-        # validate protocols
-        given_protocol_ids = set()
-        for protocol in protocol_list:
-            # make sure protocol ID is unique
-            protocol_id = protocol["protocol_id"]
-            if protocol_id in given_protocol_ids:
-                raise WebsocketCommandError(f"Multiple protocols given with ID: {protocol_id}")
-            given_protocol_ids.add(protocol_id)
-
-            # validate stim type
-            stim_type = protocol["stimulation_type"]
-            if stim_type not in VALID_STIMULATION_TYPES:
-                raise WebsocketCommandError(f"Protocol {protocol_id}, Invalid stimulation type: {stim_type}")
-
-            # validate subprotocol dictionaries
-            try:
-                for idx, subprotocol in enumerate(protocol["subprotocols"]):
-                    validate_stim_subprotocol(subprotocol, stim_type, protocol_id, idx)
-            except WebsocketCommandError:
-                raise
-
-        protocol_assignments_dict = stim_info["protocol_assignments"]
-        # make sure protocol assignments are not missing any wells and do not contain any invalid wells
-        all_well_names = set(
-            GENERIC_24_WELL_DEFINITION.get_well_name_from_well_index(well_idx)
-            for well_idx in range(NUM_WELLS)
-        )
-        given_well_names = set(protocol_assignments_dict.keys())
-        if missing_wells := all_well_names - given_well_names:
-            raise WebsocketCommandError(f"Protocol assignments missing wells: {missing_wells}")
-        if invalid_wells := given_well_names - all_well_names:
-            raise WebsocketCommandError(f"Protocol assignments contain invalid wells: {invalid_wells}")
-        # make sure all protocol IDs are valid and that no protocols are unassigned
-        assigned_ids = set(pid for pid in protocol_assignments_dict.values() if pid)
-        if missing_protocol_ids := given_protocol_ids - assigned_ids:
-            raise WebsocketCommandError(f"Protocol assignments missing protocol IDs: {missing_protocol_ids}")
-        if invalid_protocol_ids := assigned_ids - given_protocol_ids:
-            raise WebsocketCommandError(
-                f"Protocol assignments contain invalid protocol IDs: {invalid_protocol_ids}"
-            )
+        if errors := validate_stim_info(comm["stim_info"]):
+            raise WebsocketCommandError(f"Invalid stim info: {'; '.join(errors)}")
 
         comm["command_processed_event"] = asyncio.Event()
         await self._to_monitor_queue.put(comm)
@@ -414,28 +486,31 @@ class Server:
 # HELPERS
 
 
-def _is_in_offline_mode(system_state: ReadOnlyDict) -> bool:
+def _is_in_offline_mode(system_state: SystemStateSnapshot) -> bool:
     system_status = system_state["system_status"]
     return system_status == SystemStatuses.OFFLINE_STATE  # type: ignore  # for some reason mypy thinks the type here is Any
 
 
-def _are_any_stim_protocols_running(system_state: ReadOnlyDict) -> bool:
+@derived_from_system_state
+def _are_any_stim_protocols_running(system_state: SystemStateSnapshot) -> bool:
     stim_statuses = system_state["stimulation_protocol_statuses"]
     return any(status in (StimulationStates.STARTING, StimulationStates.RUNNING) for status in stim_statuses)
 
 
-def _are_stimulator_checks_running(system_state: ReadOnlyDict) -> bool:
+@derived_from_system_state
+def _are_stimulator_checks_running(system_state: SystemStateSnapshot) -> bool:
     return any(
         status == StimulatorCircuitStatuses.CALCULATING.name.lower()
         for status in system_state["stimulator_circuit_statuses"].values()
     )
 
 
-def _are_initial_stimulator_checks_complete(system_state: ReadOnlyDict) -> bool:
+def _are_initial_stimulator_checks_complete(system_state: SystemStateSnapshot) -> bool:
     return bool(system_state["stimulator_circuit_statuses"])
 
 
-def _are_any_stimulator_circuits_short(system_state: ReadOnlyDict) -> bool:
+@derived_from_system_state
+def _are_any_stimulator_circuits_short(system_state: SystemStateSnapshot) -> bool:
     return any(
         status == StimulatorCircuitStatuses.SHORT.name.lower()
         for status in system_state["stimulator_circuit_statuses"].values()
@@ -6,12 +6,14 @@ import asyncio
 import logging
 import os
 from typing import Any
+from typing import Mapping
 
 from pulse3D.constants import CHANNEL_FIRMWARE_VERSION_UUID
 from pulse3D.constants import MAIN_FIRMWARE_VERSION_UUID
 from pulse3D.constants import MANTARRAY_SERIAL_NUMBER_UUID as INSTRUMENT_SERIAL_NUMBER_UUID
 
 from ..constants import CURRENT_SOFTWARE_VERSION
+from ..constants import FW_UPDATE_CHECKPOINT_SUBDIR
 from ..constants import FW_UPDATE_SUBDIR
 from ..constants import GENERIC_24_WELL_DEFINITION
 from ..constants import InstrumentConnectionStatuses
@@ -21,17 +23,37 @@ from ..constants import SystemStatuses
 from ..exceptions import ElectronControllerVersionMismatchError
 from ..exceptions import InvalidStimulatorCircuitStatus
 from ..utils.aio import wait_tasks_clean
+from ..utils.cloud_client import CloudRequestMetrics
 from ..utils.generic import handle_system_error
 from ..utils.generic import semver_gt
-from ..utils.state_management import ReadOnlyDict
+from ..utils.queues import get_queue_diagnostics
 from ..utils.state_management import SystemStateManager
-from ..utils.stimulation import chunk_protocols_in_stim_info
+from ..utils.stim_encoding_cache import StimEncodingCache
+from ..utils.waveform_stream import WaveformStream
 
 
 logger = logging.getLogger(__name__)
 
 ERROR_MSG = "IN SYSTEM MONITOR"
 
+# the values in the system state that _update_system_status_special_cases reads
+SPECIAL_CASES_SYSTEM_STATE_KEYS = frozenset(
+    [
+        "system_status",
+        "expected_software_version",
+        "instrument_metadata",
+        "latest_software_version",
+        "firmware_updates_accepted",
+        "firmware_updates_require_download",
+        "is_user_logged_in",
+        "base_directory",
+        "main_firmware_update",
+        "channel_firmware_update",
+    ]
+)
+# the values in the system state that are sent to the UI in status updates
+STATUS_UPDATE_SYSTEM_STATE_KEYS = ("system_status", "stimulation_protocol_statuses", "in_simulation_mode")
+
 
 class SystemMonitor:
     """Manages the state of the system and delegates tasks to subsystems."""
@@ -40,9 +62,20 @@ class SystemMonitor:
         self,
         system_state_manager: SystemStateManager,
         queues: dict[str, dict[str, asyncio.Queue[dict[str, Any]]]],
+        waveform_stream: WaveformStream | None = None,
+        cloud_request_metrics: CloudRequestMetrics | None = None,
     ) -> None:
         self._system_state_manager = system_state_manager
         self._queues = queues
+        self._waveform_stream = waveform_stream or WaveformStream()
+        # recorded by CloudComm
+        self._cloud_request_metrics = cloud_request_metrics or CloudRequestMetrics()
+        # the UI often resends protocols that have already been set, so they are only encoded once
+        self._stim_encoding_cache = StimEncodingCache()
+
+        # subscribing here so that no updates made before run is called are missed
+        self._special_cases_subscription = system_state_manager.subscribe(SPECIAL_CASES_SYSTEM_STATE_KEYS)
+        self._status_update_subscription = system_state_manager.subscribe(STATUS_UPDATE_SYSTEM_STATE_KEYS)
 
     async def run(self, system_error_future: asyncio.Future[tuple[int, dict[str, str]]]) -> None:
         logger.info("Starting SystemMonitor")
@@ -51,7 +84,8 @@ class SystemMonitor:
             asyncio.create_task(self._handle_comm_from_server()),
             asyncio.create_task(self._handle_comm_from_instrument_comm()),
             asyncio.create_task(self._handle_comm_from_cloud_comm()),
-            asyncio.create_task(self._handle_system_state_updates()),
+            asyncio.create_task(self._handle_system_status_special_cases()),
+            asyncio.create_task(self._handle_system_status_updates()),
         }
         try:
             await wait_tasks_clean(tasks, error_msg=ERROR_MSG)
@@ -66,10 +100,12 @@ class SystemMonitor:
 
     # STATE HANDLING
 
-    async def _handle_system_state_updates(self) -> None:
-        while True:
-            update_details = await self._system_state_manager.previous_update_queue.get()
+    async def _handle_system_status_special_cases(self) -> None:
+        async for _ in self._special_cases_subscription:
             await self._update_system_status_special_cases()
+
+    async def _handle_system_status_updates(self) -> None:
+        async for update_details in self._status_update_subscription:
             await self._push_system_status_update(update_details)
 
     async def _update_system_status_special_cases(self) -> None:
@@ -150,10 +186,10 @@ class SystemMonitor:
             system_status_dict = {"system_status": new_system_status}
             await self._system_state_manager.update(system_status_dict)
 
-    async def _push_system_status_update(self, update_details: ReadOnlyDict) -> None:
+    async def _push_system_status_update(self, update_details: Mapping[str, Any]) -> None:
         status_update_details = {
             status_name: new_system_status
-            for status_name in ("system_status", "stimulation_protocol_statuses", "in_simulation_mode")
+            for status_name in STATUS_UPDATE_SYSTEM_STATE_KEYS
             if (new_system_status := update_details.get(status_name))
         }
         if not status_update_details:
@@ -238,9 +274,13 @@ class SystemMonitor:
                     await self._queues["to"]["instrument_comm"].put({"command": command})
                 case {"command": "set_stim_protocols", "stim_info": stim_info}:
                     system_state_updates["stim_info"] = stim_info
-                    chunked_stim_info, *_ = chunk_protocols_in_stim_info(stim_info)
+                    encoded_stim_info = self._stim_encoding_cache.encode(stim_info)
                     await self._queues["to"]["instrument_comm"].put(
-                        {**communication, "stim_info": chunked_stim_info}
+                        {
+                            **communication,
+                            "stim_info": encoded_stim_info.chunked_stim_info,
+                            "stim_bytes": encoded_stim_info.stim_bytes,
+                        }
                     )
                 case {"command": "start_stim_checks", "well_indices": well_indices}:
                     system_state_updates["stimulator_circuit_statuses"] = {
@@ -253,6 +293,15 @@ class SystemMonitor:
                     await self._queues["to"]["instrument_comm"].put(communication)
                 case {"command": "end_offline_mode"}:
                     await self._queues["to"]["instrument_comm"].put(communication)
+                case {"command": "get_diagnostics"}:
+                    await self._queues["to"]["server"].put(
+                        {
+                            "communication_type": "diagnostics",
+                            "queues": get_queue_diagnostics(self._queues),
+                            "stim_encoding_cache": self._stim_encoding_cache.get_metrics(),
+                            "cloud_requests": self._cloud_request_metrics.get_metrics(),
+                        }
+                    )
                 case invalid_comm:
                     raise NotImplementedError(f"Invalid communication from Server: {invalid_comm}")
 
@@ -273,6 +322,8 @@ class SystemMonitor:
             match communication:
                 case {"command": "set_stim_protocols"}:
                     pass  # nothing to do here
+                case {"command": "magnetometer_data", "time_indices": time_indices, "data": data}:
+                    self._waveform_stream.publish(time_indices, data)
                 case {"command": "start_stimulation"}:
                     system_state_updates["stimulation_protocol_statuses"] = [StimulationStates.RUNNING] * len(
                         system_state["stim_info"]["protocols"]
@@ -404,6 +455,8 @@ class SystemMonitor:
                     # error will be logged by cloud comm
                     system_state_updates["system_status"] = SystemStatuses.IDLE_READY_STATE
                 case {"command": "check_versions"}:
+                    if communication.get("stale"):
+                        logger.warning("Cloud could not be reached, using last known versions")
                     system_state_updates["firmware_updates_require_download"] = communication["download"]
 
                     required_sw_for_fw = communication["latest_versions"]["sting_sw"]
@@ -455,6 +508,11 @@ class SystemMonitor:
                                     "firmware_type": firmware_type,
                                     "file_contents": communication[f"{firmware_type}_firmware_contents"],
                                     "version": version,
+                                    "checkpoint_dir_path": os.path.join(
+                                        system_state["base_directory"],
+                                        FW_UPDATE_SUBDIR,
+                                        FW_UPDATE_CHECKPOINT_SUBDIR,
+                                    ),
                                 }
                             )
                 case invalid_comm:
@@ -3,12 +3,13 @@
 
 import asyncio
 import copy
+import json
 import logging
+import math
 import os
 import tempfile
 from typing import Any
 from typing import Coroutine
-import zipfile
 
 from controller.utils.logging import get_redacted_string
 import httpx
@@ -19,9 +20,18 @@ from ..constants import AuthCreds
 from ..constants import AuthTokens
 from ..constants import CLOUD_API_ENDPOINT
 from ..constants import CLOUD_PULSE3D_ENDPOINT
+from ..constants import CLOUD_REQUEST_RETRYABLE_STATUS_CODES
+from ..constants import CloudClientSettings
+from ..constants import CloudRequestTypes
 from ..constants import ConfigSettings
 from ..constants import CURRENT_SOFTWARE_VERSION
+from ..constants import DEFAULT_CLOUD_CLIENT_SETTINGS
+from ..constants import DEFAULT_MAX_NUM_CONCURRENT_UPLOAD_PARTS
+from ..constants import DEFAULT_UPLOAD_PART_SIZE_BYTES
+from ..constants import MIN_UPLOAD_PART_SIZE_BYTES
 from ..constants import SOFTWARE_RELEASE_CHANNEL
+from ..constants import UPLOAD_MANIFEST_FILE_SUFFIX
+from ..constants import UPLOAD_MAX_NUM_RESUME_ATTEMPTS
 from ..exceptions import FirmwareAndSoftwareNotCompatibleError
 from ..exceptions import FirmwareDownloadError
 from ..exceptions import LoginFailedError
@@ -29,9 +39,14 @@ from ..exceptions import RefreshFailedError
 from ..exceptions import RequestFailedError
 from ..utils.aio import clean_up_tasks
 from ..utils.aio import wait_tasks_clean
+from ..utils.cloud_client import CloudClient
+from ..utils.cloud_client import CloudRequestMetrics
 from ..utils.files import check_for_local_firmware_versions
+from ..utils.files import create_zip_file_and_get_md5
 from ..utils.files import get_file_md5
+from ..utils.firmware_cache import FirmwareCache
 from ..utils.generic import handle_system_error
+from ..utils.version_check_cache import VersionCheckCache
 
 
 logger = logging.getLogger(__name__)
@@ -40,6 +55,14 @@ ERROR_MSG = "IN CLOUD COMM"
 
 IS_PROD = SOFTWARE_RELEASE_CHANNEL == "prod"
 
+UPLOAD_MANIFEST_KEYS = frozenset(
+    ["file_path", "file_size", "md5s", "upload_type", "upload_id", "part_size", "completed_parts"]
+)
+
+
+def _get_auth_headers(access_token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {access_token}"}
+
 
 def _get_tokens(response_json: dict[str, Any]) -> AuthTokens:
     return AuthTokens(access=response_json["access"]["token"], refresh=response_json["refresh"]["token"])
@@ -58,19 +81,94 @@ def _load_fw_files(command: dict[str, Any]) -> dict[str, bytes]:
     return subtask_res
 
 
+def _check_response_status(res: Response, error_message: str) -> None:
+    if not (200 <= res.status_code < 300):
+        try:
+            message = res.json()["message"]
+        except Exception:
+            message = res.reason_phrase
+        raise RequestFailedError(f"{error_message}. Status code: {res.status_code}, Reason: {message}")
+
+
+def _get_upload_route(upload_type: str) -> str:
+    return "uploads" if upload_type == "recording" else "logs"
+
+
+def _read_file_part(file_path: str, part_number: int, part_size: int) -> bytes:
+    with open(file_path, "rb") as file_handle:
+        file_handle.seek((part_number - 1) * part_size)
+        return file_handle.read(part_size)
+
+
+def _load_upload_manifest(manifest_file_path: str) -> dict[str, Any] | None:
+    try:
+        with open(manifest_file_path) as manifest_file:
+            manifest: dict[str, Any] = json.load(manifest_file)
+        if missing_keys := UPLOAD_MANIFEST_KEYS - manifest.keys():
+            raise KeyError(f"Missing keys: {missing_keys}")
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.exception(f"Unable to load upload manifest {os.path.basename(manifest_file_path)}")
+        return None
+
+    return manifest
+
+
+def _save_upload_manifest(manifest_file_path: str, manifest: dict[str, Any]) -> None:
+    # write to a temporary file first so that the manifest is never left partially written
+    tmp_file_path = f"{manifest_file_path}.tmp"
+    with open(tmp_file_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_file_path, manifest_file_path)
+
+
 class CloudComm:
-    """Subsystem that manages communication with cloud services."""
+    """Subsystem that manages communication with cloud services.
+
+    If a version check cache file is given, the responses to the version check requests are saved there.
+    They are reused for a short time and then revalidated, and are used if the cloud can't be reached.
+
+    If a firmware cache dir is given, downloaded firmware files are saved there and reused the next time
+    the same version is needed.
+
+    If an upload dir is given, files larger than the upload part size are uploaded to s3 in parts, several at
+    a time. The progress of each of these uploads is saved to a manifest in the upload dir after each part
+    completes, so that if the upload does not finish, the remaining parts can be uploaded after the next login.
+    """
 
     def __init__(
         self,
         from_monitor_queue: asyncio.Queue[dict[str, Any]],
         to_monitor_queue: asyncio.Queue[dict[str, Any]],
+        *,
+        upload_dir_path: str | None = None,
+        upload_part_size: int = DEFAULT_UPLOAD_PART_SIZE_BYTES,
+        max_num_concurrent_upload_parts: int = DEFAULT_MAX_NUM_CONCURRENT_UPLOAD_PARTS,
+        firmware_cache_dir_path: str | None = None,
+        version_check_cache_file_path: str | None = None,
+        cloud_client_settings: CloudClientSettings = DEFAULT_CLOUD_CLIENT_SETTINGS,
+        request_metrics: CloudRequestMetrics | None = None,
         **config_settings: dict[str, Any],
     ) -> None:
+        if upload_part_size < MIN_UPLOAD_PART_SIZE_BYTES:
+            raise ValueError(f"Invalid upload part size: {upload_part_size}")
+        if max_num_concurrent_upload_parts < 1:
+            raise ValueError(f"Invalid max num concurrent upload parts: {max_num_concurrent_upload_parts}")
+
         # comm queues
         self._from_monitor_queue = from_monitor_queue
         self._to_monitor_queue = to_monitor_queue
 
+        # uploads
+        self._upload_dir_path = upload_dir_path
+        self._upload_part_size = upload_part_size
+        self._max_num_concurrent_upload_parts = max_num_concurrent_upload_parts
+        self._resume_uploads_task: asyncio.Task[None] | None = None
+
+        self._firmware_cache = FirmwareCache(firmware_cache_dir_path) if firmware_cache_dir_path else None
+        self._version_check_cache = (
+            VersionCheckCache(version_check_cache_file_path) if version_check_cache_file_path else None
+        )
+
         # TODO figure out if there is a better way to define this default value for auto_upload_on_completion,
         # or if it should also become a command line arg
         self._config = ConfigSettings(**config_settings, auto_upload_on_completion=True)
@@ -78,7 +176,11 @@ class CloudComm:
         self._creds: AuthCreds | None = None
         self._tokens: AuthTokens | None = None
 
-        self._client: httpx.AsyncClient | None = None
+        self._client: CloudClient | None = None
+        self._cloud_client_settings = cloud_client_settings
+        self._request_metrics = request_metrics or CloudRequestMetrics()
+        # only one token refresh should be in progress at a time
+        self._refresh_lock = asyncio.Lock()
 
     # ONE-SHOT TASKS
 
@@ -87,7 +189,7 @@ class CloudComm:
         logger.info("Starting CloudComm")
 
         try:
-            self._client = httpx.AsyncClient()
+            self._client = CloudClient(self._cloud_client_settings, self._request_metrics)
             tasks = {
                 asyncio.create_task(self._manage_subtasks()),
                 # TODO add other tasks?
@@ -100,8 +202,13 @@ class CloudComm:
             logger.exception(ERROR_MSG)
             handle_system_error(e, system_error_future)
         finally:
+            if self._resume_uploads_task:
+                # any progress made has already been saved, so these can be resumed again next time
+                await clean_up_tasks({self._resume_uploads_task})
             # TODO consider making this a public function and calling in main after this is shut down
             await self._attempt_to_upload_log_files_to_s3()
+            if self._client:
+                await self._client.aclose()
             self._client = None
             logger.info("CloudComm shut down")
 
@@ -123,11 +230,18 @@ class CloudComm:
         logger.info("Attempting upload of log files to s3")
 
         try:
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                # TODO put a timeout on this
+            # TODO put a timeout on this
+            if self._upload_dir_path:
+                # the zip file must outlive this session in case the upload needs to be resumed
+                os.makedirs(self._upload_dir_path, exist_ok=True)
                 await self._upload_to_s3(
-                    self._config.log_directory, upload_type="log", dir_for_zipping=tmp_dir
+                    self._config.log_directory, upload_type="log", dir_for_zipping=self._upload_dir_path
                 )
+            else:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    await self._upload_to_s3(
+                        self._config.log_directory, upload_type="log", dir_for_zipping=tmp_dir
+                    )
         except BaseException:
             logger.exception("Failed to upload log files to s3")
         else:
@@ -188,6 +302,8 @@ class CloudComm:
         else:
             username = self._creds.username  # type: ignore  # mypy doesn't realize this will never be None here
             logger.info(f"User '{username}' successfully logged in")
+            if self._upload_dir_path and not self._resume_uploads_task:
+                self._resume_uploads_task = asyncio.create_task(self._resume_multipart_uploads())
         # TODO also handle NetworkError?
 
         return subtask_res
@@ -201,13 +317,25 @@ class CloudComm:
             # catch all errors here to avoid user error preventing the next checks
             pass
 
-        check_sw_response = await self._request(
-            "get",
-            f"https://{CLOUD_API_ENDPOINT}/mantarray/software-range/{command['main_fw_version']}/{IS_PROD}",
-            auth_required=False,
-            error_message="Error checking software/firmware compatibility",
-        )
-        range = check_sw_response.json()
+        # make both requests at the same time
+        tasks = [
+            asyncio.create_task(
+                self._get_version_check_response(
+                    f"https://{CLOUD_API_ENDPOINT}/mantarray/software-range/{command['main_fw_version']}/{IS_PROD}",
+                    "Error checking software/firmware compatibility",
+                )
+            ),
+            asyncio.create_task(
+                self._get_version_check_response(
+                    f"https://{CLOUD_API_ENDPOINT}/mantarray/versions/{command['serial_number']}/{IS_PROD}",
+                    "Error getting latest firmware versions",
+                )
+            ),
+        ]
+        try:
+            (range, is_range_stale), (latest_versions, are_versions_stale) = await asyncio.gather(*tasks)
+        finally:
+            await clean_up_tasks(set(tasks))
 
         current_version_no_pre = CURRENT_SOFTWARE_VERSION.split("-pre")[0]
 
@@ -219,50 +347,40 @@ class CloudComm:
             if not (range["min_sting_sw"] <= sw_version_semver <= range["max_sting_sw"]):
                 raise FirmwareAndSoftwareNotCompatibleError(range["max_sting_sw"])
 
-        get_versions_response = await self._request(
-            "get",
-            f"https://{CLOUD_API_ENDPOINT}/mantarray/versions/{command['serial_number']}/{IS_PROD}",
-            auth_required=False,
-            error_message="Error getting latest firmware versions",
-        )
-        return {"latest_versions": get_versions_response.json(), "download": True}
+        return {
+            "latest_versions": latest_versions,
+            "download": True,
+            "stale": is_range_stale or are_versions_stale,
+        }
 
     async def _download_firmware_updates(self, command: dict[str, str]) -> dict[str, bytes]:
         try:
             if command["fw_update_dir_path"]:
                 return _load_fw_files(command)
 
-            presigned_urls = {}
-
-            # get presigned download URL(s)
-            for fw_type in ("main", "channel"):
-                if version := command[fw_type]:
-                    download_details = await self._request(
-                        "get",
-                        f"https://{CLOUD_API_ENDPOINT}/mantarray/firmware/{fw_type}/{version}",
-                        auth_required=True,
-                        error_message=f"Error getting presigned URL for {fw_type} firmware download",
-                    )
-                    presigned_urls[fw_type] = download_details.json()["presigned_url"]
-
-            if not presigned_urls:
+            fw_types = [fw_type for fw_type in ("main", "channel") if command[fw_type]]
+            if not fw_types:
                 raise NotImplementedError("No firmware types specified")
 
-            subtask_res = {}
-
-            # download firmware file(s)
-            for fw_type, presigned_url in presigned_urls.items():
-                download_response = await self._request(
-                    "get",
-                    presigned_url,
-                    auth_required=False,
-                    error_message=f"Error during download of {fw_type} firmware",
-                )
-                subtask_res[f"{fw_type}_firmware_contents"] = download_response.content
+            # get each firmware file at the same time
+            tasks = [
+                asyncio.create_task(self._get_firmware_file(fw_type, command[fw_type]))
+                for fw_type in fw_types
+            ]
+            try:
+                fw_files = await asyncio.gather(*tasks)
+            finally:
+                await clean_up_tasks(set(tasks))
         except Exception as e:
             raise FirmwareDownloadError() from e
 
-        return subtask_res
+        if self._firmware_cache:
+            logger.info(f"Firmware cache metrics: {self._firmware_cache.get_metrics()}")
+
+        return {
+            f"{fw_type}_firmware_contents": fw_file_contents
+            for fw_type, fw_file_contents in zip(fw_types, fw_files)
+        }
 
     # HELPERS
 
@@ -281,12 +399,91 @@ class CloudComm:
         except (RequestFailedError, httpx.ConnectError) as e:
             return {"error": repr(e)}
 
+    async def _get_version_check_response(self, url: str, error_message: str) -> tuple[Any, bool]:
+        """Return the JSON body of the response and whether or not it came from a stale cache entry."""
+        if not self._version_check_cache:
+            res = await self._request(
+                "get",
+                url,
+                request_type=CloudRequestTypes.METADATA,
+                auth_required=False,
+                error_message=error_message,
+            )
+            return res.json(), False
+
+        cached_response = self._version_check_cache.get(url)
+        if cached_response and self._version_check_cache.is_fresh(cached_response):
+            return cached_response.body, False
+
+        headers = {"If-None-Match": cached_response.etag} if cached_response and cached_response.etag else {}
+        try:
+            res = await self._request_with_refresh(
+                "get", url, request_type=CloudRequestTypes.METADATA, auth_required=False, headers=headers
+            )
+        except httpx.TransportError:
+            if not cached_response:
+                raise
+            logger.exception(f"Unable to reach cloud, using last cached response from {url}")
+            return cached_response.body, True
+
+        if cached_response:
+            if res.status_code == 304:
+                self._version_check_cache.mark_revalidated(url)
+                return cached_response.body, False
+            if res.status_code in CLOUD_REQUEST_RETRYABLE_STATUS_CODES:
+                logger.error(f"Cloud unavailable ({res.status_code}), using last cached response from {url}")
+                return cached_response.body, True
+
+        _check_response_status(res, error_message)
+        body = res.json()
+        self._version_check_cache.update(url, body, res.headers.get("ETag"))
+        return body, False
+
+    async def _get_firmware_file(self, fw_type: str, version: str) -> bytes:
+        if self._firmware_cache and (fw_file_contents := self._firmware_cache.get(fw_type, version)):
+            logger.info(f"Using cached {fw_type} firmware v{version}")
+            return fw_file_contents
+
+        download_details = await self._request(
+            "get",
+            f"https://{CLOUD_API_ENDPOINT}/mantarray/firmware/{fw_type}/{version}",
+            request_type=CloudRequestTypes.METADATA,
+            auth_required=True,
+            error_message=f"Error getting presigned URL for {fw_type} firmware download",
+        )
+        presigned_url = download_details.json()["presigned_url"]
+        download_error_message = f"Error during download of {fw_type} firmware"
+
+        if not self._firmware_cache:
+            download_response = await self._request(
+                "get",
+                presigned_url,
+                request_type=CloudRequestTypes.DOWNLOAD,
+                auth_required=False,
+                error_message=download_error_message,
+            )
+            return download_response.content
+
+        if self._client is None:
+            raise NotImplementedError("self._client should never be None here")
+
+        # stream the file straight to the cache instead of loading the whole response into memory first
+        async with self._client.stream(
+            "get", presigned_url, request_type=CloudRequestTypes.DOWNLOAD
+        ) as download_response:
+            _check_response_status(download_response, download_error_message)
+            return await self._firmware_cache.add_from_stream(
+                fw_type, version, download_response.aiter_bytes()
+            )
+
     async def _get_cloud_api_tokens(self, customer_id: str, username: str, password: str) -> None:
         if self._client is None:
             raise NotImplementedError("self._client should never be None here")
 
-        res = await self._client.post(
+        res = await self._client.request(
+            "post",
             f"https://{CLOUD_API_ENDPOINT}/users/login",
+            request_type=CloudRequestTypes.AUTH,
             json={
                 "customer_id": customer_id,
                 "username": username,
@@ -302,24 +499,41 @@ class CloudComm:
         self._tokens = _get_tokens(res.json()["tokens"])
         self._creds = AuthCreds(customer_id=customer_id, username=username, password=password)
 
-    async def _refresh_cloud_api_tokens(self) -> None:
-        """Use refresh token to get new set of auth tokens."""
+    async def _refresh_cloud_api_tokens(self, expired_access_token: str) -> None:
+        """Use refresh token to get new set of auth tokens.
+
+        Only one refresh is made at a time. Requests that were rejected with the same access token while a
+        refresh was in progress will use the tokens from that refresh instead of making another one.
+        """
         if self._client is None:
             raise NotImplementedError("self._client should never be None here")
-        if self._tokens is None:
-            raise NotImplementedError("self._tokens should never be None here")
 
-        res = await self._client.post(
-            f"https://{CLOUD_API_ENDPOINT}/users/refresh",
-            headers={"Authorization": f"Bearer {self._tokens.refresh}"},
-        )
-        if res.status_code != 201:
-            raise RefreshFailedError(res.status_code)
+        async with self._refresh_lock:
+            if self._tokens is None:
+                raise NotImplementedError("self._tokens should never be None here")
+            if self._tokens.access != expired_access_token:
+                return
 
-        self._tokens = _get_tokens(res.json()["tokens"])
+            res = await self._client.request(
+                "post",
+                f"https://{CLOUD_API_ENDPOINT}/users/refresh",
+                request_type=CloudRequestTypes.AUTH,
+                headers={"Authorization": f"Bearer {self._tokens.refresh}"},
+            )
+            if res.status_code != 201:
+                raise RefreshFailedError(res.status_code)
+
+            self._tokens = _get_tokens(res.json()["tokens"])
+            self._request_metrics.num_token_refreshes += 1
 
     async def _request_with_refresh(
-        self, method: str, url: str, **request_kwargs: dict[str, Any]
+        self,
+        method: str,
+        url: str,
+        *,
+        request_type: CloudRequestTypes,
+        auth_required: bool,
+        **request_kwargs: Any,
     ) -> Response:
         """Make request, refresh once if needed, and try request once more.
 
@@ -328,19 +542,32 @@ class CloudComm:
         if self._client is None:
             raise NotImplementedError("self._client should never be None here")
 
-        res = await self._client.request(method, url, **request_kwargs)
+        if not auth_required:
+            return await self._client.request(method, url, request_type=request_type, **request_kwargs)
+
+        if self._tokens is None:
+            raise NotImplementedError("self._tokens should never be None here")
+        access_token = self._tokens.access
+
+        res = await self._client.request(
+            method, url, request_type=request_type, headers=_get_auth_headers(access_token), **request_kwargs
+        )
         # if auth token expired then request will return 401 code
         if res.status_code == 401:
-            # TODO check service worker to see how refresh mutex is handled
-
             # get new tokens
             try:
-                self.tokens = self._refresh_cloud_api_tokens()
+                await self._refresh_cloud_api_tokens(access_token)
             except RefreshFailedError:
                 raise  # TODO try logging in again if this also fails
 
             # try request once more
-            res = await self._client.request(method, url, **request_kwargs)
+            res = await self._client.request(
+                method,
+                url,
+                request_type=request_type,
+                headers=_get_auth_headers(self._tokens.access),
+                **request_kwargs,
+            )
 
         return res
 
@@ -349,28 +576,19 @@ class CloudComm:
         method: str,
         url: str,
         *,
+        request_type: CloudRequestTypes,
         auth_required: bool,
         error_message: str,
-        **request_kwargs: dict[str, Any],
+        **request_kwargs: Any,
     ) -> Response:
         """Make a request.
 
         This is the primary function that should be used to handle requests.
         """
-        if auth_required:
-            if self._tokens is None:
-                raise NotImplementedError("self._tokens should never be None here")
-            request_kwargs["headers"] = {"Authorization": f"Bearer {self._tokens.access}"}
-
-        res = await self._request_with_refresh(method, url, **request_kwargs)
-
-        if not (200 <= res.status_code < 300):
-            try:
-                message = await res.json()["message"]
-            except Exception:
-                message = res.reason_phrase
-            raise RequestFailedError(f"{error_message}. Status code: {res.status_code}, Reason: {message}")
-
+        res = await self._request_with_refresh(
+            method, url, request_type=request_type, auth_required=auth_required, **request_kwargs
+        )
+        _check_response_status(res, error_message)
         return res
 
     # TODO make an enum for upload types
@@ -386,23 +604,44 @@ class CloudComm:
             path_to_upload_file = os.path.join(dir_for_zipping, uploaded_file_name)
 
             # Tanner (4/10/23): assuming that the folder only contains files. Can change this if needed
-            with zipfile.ZipFile(path_to_upload_file, "w") as zf:
-                for file_name in os.listdir(path_):
-                    zf.write(os.path.join(path_, file_name), file_name)
+            # compressing and hashing are CPU bound, so run them in a thread to keep the event loop responsive
+            file_md5 = await asyncio.to_thread(create_zip_file_and_get_md5, path_, path_to_upload_file)
         elif os.path.isfile(path_):
             uploaded_file_name = os.path.basename(path_)
             path_to_upload_file = path_
+            file_md5 = await asyncio.to_thread(get_file_md5, path_to_upload_file)
         else:
             raise NotImplementedError("given path does not exist")
 
-        # upload file
-        file_md5 = get_file_md5(path_to_upload_file)
+        file_size = os.path.getsize(path_to_upload_file)
+        if self._upload_dir_path and file_size > self._upload_part_size:
+            await self._start_multipart_upload(
+                path_to_upload_file,
+                uploaded_file_name,
+                file_md5,
+                file_size,
+                upload_type=upload_type,
+                delete_file_when_complete=path_to_upload_file != path_,
+            )
+            return
+
+        try:
+            await self._upload_file_to_s3(
+                path_to_upload_file, uploaded_file_name, file_md5, upload_type=upload_type
+            )
+        finally:
+            if path_to_upload_file != path_ and self._upload_dir_path:
+                # a single request upload can't be resumed, so there is no reason to keep the zip file
+                os.remove(path_to_upload_file)
 
-        route = "uploads" if upload_type == "recording" else "logs"
+    async def _upload_file_to_s3(
+        self, path_to_upload_file: str, uploaded_file_name: str, file_md5: str, *, upload_type: str
+    ) -> None:
         upload_details_res = await self._request(
             "post",
-            f"https://{CLOUD_PULSE3D_ENDPOINT}/{route}",
+            f"https://{CLOUD_PULSE3D_ENDPOINT}/{_get_upload_route(upload_type)}",
             json={"filename": uploaded_file_name, "md5s": file_md5, "upload_type": "pulse3d"},
+            request_type=CloudRequestTypes.METADATA,
             auth_required=True,
             error_message="Error getting presigned URL for file upload",
         )
@@ -414,6 +653,191 @@ class CloudComm:
                 upload_details["params"]["url"],
                 data=upload_details["params"]["fields"],
                 files={"file": (uploaded_file_name, file_handle)},
+                request_type=CloudRequestTypes.UPLOAD,
                 auth_required=False,
                 error_message="Error uploading file to s3 through presigned URL",
             )
+
+    async def _start_multipart_upload(
+        self,
+        path_to_upload_file: str,
+        uploaded_file_name: str,
+        file_md5: str,
+        file_size: int,
+        *,
+        upload_type: str,
+        delete_file_when_complete: bool,
+    ) -> None:
+        if not self._upload_dir_path:
+            raise NotImplementedError("self._upload_dir_path should never be None here")
+
+        manifest_file_path = os.path.join(
+            self._upload_dir_path, f"{uploaded_file_name}{UPLOAD_MANIFEST_FILE_SUFFIX}"
+        )
+        try:
+            start_upload_res = await self._request(
+                "post",
+                f"https://{CLOUD_PULSE3D_ENDPOINT}/{_get_upload_route(upload_type)}/multipart",
+                json={
+                    "filename": uploaded_file_name,
+                    "md5s": file_md5,
+                    "upload_type": "pulse3d",
+                    "num_parts": math.ceil(file_size / self._upload_part_size),
+                },
+                request_type=CloudRequestTypes.METADATA,
+                auth_required=True,
+                error_message="Error starting multipart file upload",
+            )
+
+            manifest = {
+                "file_path": path_to_upload_file,
+                "file_size": file_size,
+                "md5s": file_md5,
+                "upload_type": upload_type,
+                "upload_id": start_upload_res.json()["upload_id"],
+                "part_size": self._upload_part_size,
+                "completed_parts": {},
+                "delete_file_when_complete": delete_file_when_complete,
+                "num_resume_attempts": 0,
+            }
+            os.makedirs(self._upload_dir_path, exist_ok=True)
+            _save_upload_manifest(manifest_file_path, manifest)
+        except BaseException:
+            # the upload can only be resumed once the manifest is saved, so a file created for the upload
+            # would otherwise never be removed
+            if delete_file_when_complete:
+                os.remove(path_to_upload_file)
+            raise
+
+        await self._upload_remaining_parts_to_s3(manifest_file_path, manifest)
+
+    async def _resume_multipart_uploads(self) -> None:
+        if not self._upload_dir_path or not os.path.isdir(self._upload_dir_path):
+            return
+
+        for file_name in sorted(os.listdir(self._upload_dir_path)):
+            if not file_name.endswith(UPLOAD_MANIFEST_FILE_SUFFIX):
+                continue
+            manifest_file_path = os.path.join(self._upload_dir_path, file_name)
+            if not (manifest := _load_upload_manifest(manifest_file_path)):
+                os.remove(manifest_file_path)
+                continue
+
+            uploaded_file_name = file_name.removesuffix(UPLOAD_MANIFEST_FILE_SUFFIX)
+            file_path = manifest["file_path"]
+
+            if manifest.get("num_resume_attempts", 0) >= UPLOAD_MAX_NUM_RESUME_ATTEMPTS:
+                logger.error(
+                    f"Abandoning upload of {uploaded_file_name} after too many attempts to resume it"
+                )
+                self._delete_multipart_upload_files(manifest_file_path, manifest)
+                continue
+            if not os.path.isfile(file_path) or os.path.getsize(file_path) != manifest["file_size"]:
+                logger.error(
+                    f"Abandoning upload of {uploaded_file_name} since the file has been changed or removed"
+                )
+                self._delete_multipart_upload_files(manifest_file_path, manifest)
+                continue
+            if await asyncio.to_thread(get_file_md5, file_path) != manifest["md5s"]:
+                logger.error(f"Abandoning upload of {uploaded_file_name} since the file has been changed")
+                self._delete_multipart_upload_files(manifest_file_path, manifest)
+                continue
+
+            manifest["num_resume_attempts"] = manifest.get("num_resume_attempts", 0) + 1
+            _save_upload_manifest(manifest_file_path, manifest)
+
+            logger.info(
+                f"Resuming upload of {uploaded_file_name}, {len(manifest['completed_parts'])} parts already uploaded"
+            )
+            try:
+                await self._upload_remaining_parts_to_s3(manifest_file_path, manifest)
+            except Exception:
+                logger.exception(f"Failed to resume upload of {uploaded_file_name}")
+            else:
+                logger.info(f"Successfully resumed upload of {uploaded_file_name}")
+
+    async def _upload_remaining_parts_to_s3(self, manifest_file_path: str, manifest: dict[str, Any]) -> None:
+        upload_url = (
+            f"https://{CLOUD_PULSE3D_ENDPOINT}/{_get_upload_route(manifest['upload_type'])}"
+            f"/multipart/{manifest['upload_id']}"
+        )
+        num_parts = math.ceil(manifest["file_size"] / manifest["part_size"])
+        remaining_part_numbers = [
+            part_number
+            for part_number in range(1, num_parts + 1)
+            if str(part_number) not in manifest["completed_parts"]
+        ]
+
+        if remaining_part_numbers:
+            # presigned URLs expire, so new ones are requested each time the upload is resumed
+            part_urls_res = await self._request(
+                "post",
+                f"{upload_url}/parts",
+                json={"part_numbers": remaining_part_numbers},
+                request_type=CloudRequestTypes.METADATA,
+                auth_required=True,
+                error_message="Error getting presigned URLs for file upload parts",
+            )
+            part_urls = part_urls_res.json()["urls"]
+
+            semaphore = asyncio.Semaphore(self._max_num_concurrent_upload_parts)
+            tasks = {
+                asyncio.create_task(
+                    self._upload_part_to_s3(
+                        manifest_file_path, manifest, part_number, part_urls[str(part_number)], semaphore
+                    )
+                )
+                for part_number in remaining_part_numbers
+            }
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # if any part fails, stop uploading the rest
+                await clean_up_tasks(tasks)
+
+        await self._request(
+            "post",
+            f"{upload_url}/complete",
+            json={
+                "parts": [
+                    {"part_number": int(part_number), "etag": etag}
+                    for part_number, etag in sorted(
+                        manifest["completed_parts"].items(), key=lambda p: int(p[0])
+                    )
+                ]
+            },
+            request_type=CloudRequestTypes.METADATA,
+            auth_required=True,
+            error_message="Error completing multipart file upload",
+        )
+
+        self._delete_multipart_upload_files(manifest_file_path, manifest)
+
+    async def _upload_part_to_s3(
+        self,
+        manifest_file_path: str,
+        manifest: dict[str, Any],
+        part_number: int,
+        part_url: str,
+        semaphore: asyncio.Semaphore,
+    ) -> None:
+        async with semaphore:
+            part = await asyncio.to_thread(
+                _read_file_part, manifest["file_path"], part_number, manifest["part_size"]
+            )
+            res = await self._request(
+                "put",
+                part_url,
+                content=part,
+                request_type=CloudRequestTypes.UPLOAD,
+                auth_required=False,
+                error_message=f"Error uploading part {part_number} of file to s3 through presigned URL",
+            )
+
+        manifest["completed_parts"][str(part_number)] = res.headers["ETag"]
+        _save_upload_manifest(manifest_file_path, manifest)
+
+    def _delete_multipart_upload_files(self, manifest_file_path: str, manifest: dict[str, Any]) -> None:
+        os.remove(manifest_file_path)
+        if manifest.get("delete_file_when_complete") and os.path.isfile(manifest["file_path"]):
+            os.remove(manifest["file_path"])
@@ -1,22 +1,32 @@
 # -*- coding: utf-8 -*-
 import asyncio
+from collections import deque
 from collections import namedtuple
 import copy
 import datetime
+import json
 import logging
+import math
+import os
 import struct
 from time import perf_counter
 from typing import Any
+from typing import Sequence
 from zlib import crc32
 
 from aioserial import AioSerial
+import numpy as np
 import serial
 import serial.tools.list_ports as list_ports
 from stdlib_utils import is_system_windows
 
 from ..constants import CURI_VID
+from ..constants import DEFAULT_FIRMWARE_UPDATE_WINDOW_SIZE
+from ..constants import FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS
 from ..constants import GENERIC_24_WELL_DEFINITION
 from ..constants import InstrumentConnectionStatuses
+from ..constants import MAX_CHANNEL_FIRMWARE_UPDATE_DURATION_SECONDS
+from ..constants import MAX_MAIN_FIRMWARE_UPDATE_DURATION_SECONDS
 from ..constants import NUM_WELLS
 from ..constants import SERIAL_COMM_BAUD_RATE
 from ..constants import SERIAL_COMM_BUFFER_RX_SIZE
@@ -25,26 +35,33 @@ from ..constants import SERIAL_COMM_HANDSHAKE_PERIOD_SECONDS
 from ..constants import SERIAL_COMM_MAGIC_WORD_BYTES
 from ..constants import SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES
 from ..constants import SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES
+from ..constants import SERIAL_COMM_NUM_CHANNELS_PER_SENSOR
 from ..constants import SERIAL_COMM_PACKET_METADATA_LENGTH_BYTES
 from ..constants import SERIAL_COMM_READ_TIMEOUT
 from ..constants import SERIAL_COMM_REGISTRATION_TIMEOUT_SECONDS
 from ..constants import SERIAL_COMM_STATUS_BEACON_PERIOD_SECONDS
 from ..constants import SERIAL_COMM_STATUS_BEACON_TIMEOUT_SECONDS
 from ..constants import SERIAL_COMM_STATUS_CODE_LENGTH_BYTES
+from ..constants import SerialCommErrorBudget
 from ..constants import SerialCommPacketTypes
+from ..constants import SerialCommReadModes
 from ..constants import STIM_COMPLETE_SUBPROTOCOL_IDX
 from ..constants import STIM_MODULE_ID_TO_WELL_IDX
 from ..constants import STM_VID
 from ..exceptions import FirmwareGoingDormantError
+from ..exceptions import FirmwareUpdateTimeoutError
 from ..exceptions import IncorrectInstrumentConnectedError
 from ..exceptions import InstrumentCommandAttemptError
 from ..exceptions import InstrumentCommandResponseError
+from ..exceptions import InstrumentConnectionLostError
 from ..exceptions import InstrumentError
 from ..exceptions import InstrumentFirmwareError
 from ..exceptions import NoInstrumentDetectedError
 from ..exceptions import SerialCommCommandProcessingError
 from ..exceptions import SerialCommCommandResponseTimeoutError
+from ..exceptions import SerialCommErrorBudgetExceededError
 from ..exceptions import SerialCommIncorrectChecksumFromPCError
+from ..exceptions import SerialCommIncorrectMagicWordFromInstrumentError
 from ..exceptions import SerialCommPacketRegistrationReadEmptyError
 from ..exceptions import SerialCommPacketRegistrationSearchExhaustedError
 from ..exceptions import SerialCommStatusBeaconTimeoutError
@@ -52,20 +69,25 @@ from ..exceptions import SerialCommUntrackedCommandResponseError
 from ..utils.aio import clean_up_tasks
 from ..utils.aio import wait_tasks_clean
 from ..utils.command_tracking import CommandTracker
+from ..utils.data_parsing_cy import PacketBuilder
+from ..utils.data_parsing_cy import parse_magnetometer_data
 from ..utils.data_parsing_cy import parse_stim_data
 from ..utils.data_parsing_cy import sort_serial_packets
 from ..utils.generic import handle_system_error
+from ..utils.packet_buffer import SerialPacketBuffer
 from ..utils.serial_comm import convert_semver_str_to_bytes
 from ..utils.serial_comm import convert_status_code_bytes_to_dict
 from ..utils.serial_comm import convert_stim_dict_to_bytes
 from ..utils.serial_comm import convert_stimulator_check_bytes_to_dict
-from ..utils.serial_comm import create_data_packet
-from ..utils.serial_comm import get_serial_comm_timestamp
+from ..utils.serial_comm import find_first_valid_packet
+from ..utils.serial_comm import get_valid_packet_length
 from ..utils.serial_comm import METADATA_TAGS_FOR_LOGGING
 from ..utils.serial_comm import parse_end_offline_mode_bytes
 from ..utils.serial_comm import parse_instrument_event_info
 from ..utils.serial_comm import parse_metadata_bytes
 from ..utils.serial_comm import validate_instrument_metadata
+from ..utils.serial_reader import EventDrivenSerialReader
+from ..utils.serial_writer import CoalescingSerialWriter
 
 logger = logging.getLogger(__name__)
 
@@ -106,6 +128,9 @@ COMMAND_PACKET_TYPES = frozenset(
 )
 
 
+# one byte of the payload of each firmware data packet is used for the packet index
+FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES = SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES - 1
+
 INTERMEDIATE_FIRMWARE_UPDATE_COMMANDS = (
     "start_firmware_update",
     "send_firmware_data",
@@ -123,6 +148,9 @@ class InstrumentComm:
         from_monitor_queue: asyncio.Queue[dict[str, Any]],
         to_monitor_queue: asyncio.Queue[dict[str, Any]],
         hardware_test_mode: bool = False,
+        serial_read_mode: SerialCommReadModes = SerialCommReadModes.POLLING,
+        serial_comm_error_budget: SerialCommErrorBudget | None = None,
+        firmware_update_window_size: int = DEFAULT_FIRMWARE_UPDATE_WINDOW_SIZE,
     ) -> None:
         # comm queues
         self._from_monitor_queue = from_monitor_queue
@@ -134,8 +162,18 @@ class InstrumentComm:
         self._instrument_error_detected = False  # Tanner (7/18/23): this flag currently only used to decide which command response to grab the system stats from when reporting a FW error
         self._hardware_test_mode = hardware_test_mode
         # instrument comm
-        self._serial_packet_cache = bytes(0)
+        self._serial_read_mode = serial_read_mode
+        self._serial_reader: EventDrivenSerialReader | None = None
+        self._serial_packet_buffer = SerialPacketBuffer()
+        self._serial_writer = CoalescingSerialWriter(self._write_to_instrument)
+        self._packet_builder = PacketBuilder()
         self._command_tracker = CommandTracker()
+        # corrupted packets are only dropped instead of raising an error immediately if there is an error budget
+        self._serial_comm_error_budget = serial_comm_error_budget
+        self._serial_comm_error_timepoints: deque[float] = deque()
+        self._total_corruption_counts: dict[str, dict[str, int]] = {}
+        # whether or not the bytes at the start of the packet buffer are the remainder of a dropped corrupted packet
+        self._is_in_corrupted_run = False
         # instrument status
         self._is_waiting_for_reboot = False
         self._status_beacon_received_event = asyncio.Event()
@@ -144,6 +182,7 @@ class InstrumentComm:
         self._protocols_running: set[int] = set()
         # firmware updating
         self._firmware_update_manager: FirmwareUpdateManager | None = None
+        self._firmware_update_window_size = firmware_update_window_size
         # comm tracking
         self._timepoints_of_events = TimepointsOfEvents()
         # used to tell instrument comm to ignore all messages when offline
@@ -192,12 +231,18 @@ class InstrumentComm:
             logger.exception(ERROR_MSG)
             handle_system_error(e, system_error_future)
         finally:
+            await self._serial_writer.stop()
             self._log_dur_since_events()
+            logger.info(f"Serial packet buffer metrics: {self._serial_packet_buffer.get_metrics()}")
+            logger.info(f"Serial writer metrics: {self._serial_writer.get_metrics()}")
+            if self._serial_comm_error_budget:
+                logger.info(f"Total corrupted packets dropped: {self._total_corruption_counts}")
             logger.info("InstrumentComm shut down")
 
     async def _setup(self) -> None:
         # attempt to connect to a real or virtual instrument
         await self._create_connection_to_instrument()
+        self._serial_writer.start()
         # send a single handshake to speed up the magic word registration since it will prompt a response from the instrument immediately
         await self._send_data_packet(SerialCommPacketTypes.HANDSHAKE)
         # register magic word to sync with data stream before starting other tasks
@@ -248,56 +293,32 @@ class InstrumentComm:
 
     async def _register_magic_word(self) -> None:
         logger.info("Syncing with packets from instrument")
-        magic_word_test_bytes = bytearray()
-
-        async def read_initial_bytes(magic_word_test_bytes: bytearray) -> None:
-            if not self._instrument:
-                raise NotImplementedError("_instrument should never be None here")
-
-            magic_word_len = len(SERIAL_COMM_MAGIC_WORD_BYTES)
+        self._serial_packet_buffer.clear()
 
+        async def read_initial_bytes() -> None:
             # read bytes until enough bytes have been read
-            while num_bytes_remaining := magic_word_len - len(magic_word_test_bytes):
-                magic_word_test_bytes += await self._instrument.read_async(num_bytes_remaining)
-                # wait 1 second between reads
-                await asyncio.sleep(1)
+            while len(self._serial_packet_buffer) < len(SERIAL_COMM_MAGIC_WORD_BYTES):
+                if not await self._read_into_packet_buffer():
+                    await asyncio.sleep(0.01)
 
         try:
             # Tanner (3/16/21): issue seen with simulator taking slightly longer than status beacon period to send next data packet
-            await asyncio.wait_for(
-                read_initial_bytes(magic_word_test_bytes), SERIAL_COMM_STATUS_BEACON_TIMEOUT_SECONDS
-            )
+            await asyncio.wait_for(read_initial_bytes(), SERIAL_COMM_STATUS_BEACON_TIMEOUT_SECONDS)
         except asyncio.TimeoutError as e:
             # after the timeout, not having read enough bytes means that a fatal error has occurred on the instrument
-            raise SerialCommPacketRegistrationReadEmptyError(list(magic_word_test_bytes)) from e
-
-        # read more bytes until the magic word is registered, the timeout value is reached, or the maximum number of bytes are read
-        async def search_for_magic_word(magic_word_test_bytes: bytes) -> None:
-            if not self._instrument:
-                raise NotImplementedError("_instrument should never be None here")
-
-            num_bytes_checked = 0
-            while magic_word_test_bytes != SERIAL_COMM_MAGIC_WORD_BYTES:
-                # read 0 or 1 bytes, depending on what is available in serial port
-                next_byte = await self._instrument.read_async(1)
-                num_bytes_checked += len(next_byte)
-                if next_byte:
-                    # only want to run this append expression if a byte was read
-                    magic_word_test_bytes = magic_word_test_bytes[1:] + next_byte
-                if num_bytes_checked > SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES:
-                    # A magic word should be encountered if this many bytes are read. If not, we can assume there is a problem with the instrument
-                    raise SerialCommPacketRegistrationSearchExhaustedError()
+            raise SerialCommPacketRegistrationReadEmptyError(
+                list(self._serial_packet_buffer.unread_bytes)
+            ) from e
 
         try:
-            await asyncio.wait_for(
-                search_for_magic_word(magic_word_test_bytes), SERIAL_COMM_REGISTRATION_TIMEOUT_SECONDS
+            num_bytes_discarded = await asyncio.wait_for(
+                self._sync_to_next_valid_packet(), SERIAL_COMM_REGISTRATION_TIMEOUT_SECONDS
             )
         except asyncio.TimeoutError as e:
             # if this point is reach it's most likely that at some point no additional bytes were being read
             raise SerialCommPacketRegistrationReadEmptyError() from e
 
-        # put the magic word bytes into the cache so the next data packet can be read properly
-        self._serial_packet_cache = SERIAL_COMM_MAGIC_WORD_BYTES
+        logger.info(f"Synced with packets from instrument after discarding {num_bytes_discarded} bytes")
 
     async def _prompt_instrument_for_metadata(self) -> None:
         logger.info("Prompting instrument for metadata")
@@ -306,7 +327,8 @@ class InstrumentComm:
 
     async def _catch_expired_command(self) -> None:
         expired_command = await self._command_tracker.wait_for_expired_command()
-        # TODO raise FirmwareUpdateTimeoutError when necessary
+        if expired_command["command"] == "end_of_firmware_update":
+            raise FirmwareUpdateTimeoutError(expired_command["firmware_type"])
         raise SerialCommCommandResponseTimeoutError(expired_command["command"])
 
     # INFINITE TASKS
@@ -336,7 +358,10 @@ class InstrumentComm:
                     )
                 case {"command": "set_stim_protocols", "stim_info": stim_info}:
                     packet_type = SerialCommPacketTypes.SET_STIM_PROTOCOL
-                    bytes_to_send = convert_stim_dict_to_bytes(stim_info)
+                    # SystemMonitor will usually have already encoded the stim info
+                    bytes_to_send = comm_from_monitor.get("stim_bytes") or convert_stim_dict_to_bytes(
+                        stim_info
+                    )
                     if self._is_stimulating and not self._hardware_test_mode:
                         raise InstrumentCommandAttemptError(
                             "Cannot update stimulation protocols while stimulating"
@@ -450,42 +475,92 @@ class InstrumentComm:
         if not self._instrument:
             raise NotImplementedError("_instrument should never be None here")
 
-        while True:
-            # read all available bytes from serial buffer
-            try:
-                data_read_bytes = await self._instrument.read_async(self._instrument.in_waiting)
-            except serial.SerialException as e:
-                logger.error(f"Serial data read failed: {e}. Trying one more time")
-                data_read_bytes = await self._instrument.read_async(self._instrument.in_waiting)
-
-            # append all bytes to cache
-            self._serial_packet_cache += data_read_bytes
-            # return if not at least 1 complete packet available
-            if len(self._serial_packet_cache) < SERIAL_COMM_PACKET_METADATA_LENGTH_BYTES:
-                # wait a little bit before reading again
-                await asyncio.sleep(0.01)
-                continue
-
-            # sort packets by into packet type groups: magnetometer data, stim status, other
-            sorted_packet_dict = sort_serial_packets(bytearray(self._serial_packet_cache))
-            # update unsorted bytes
-            self._serial_packet_cache = bytes(sorted_packet_dict["unread_bytes"])
+        is_event_driven = self._serial_read_mode == SerialCommReadModes.EVENT_DRIVEN
+        # reads from the virtual instrument already wait for bytes to arrive, so only a real serial port needs a reader
+        if is_event_driven and not isinstance(self._instrument, VirtualInstrumentConnection):
+            self._serial_reader = EventDrivenSerialReader(self._instrument)
+            self._serial_reader.start()
 
-            # process any other packets
-            for other_packet_info in sorted_packet_dict["other_packet_info"]:
-                timestamp, packet_type, packet_payload = other_packet_info
+        try:
+            while True:
+                # read all available bytes from serial buffer directly into the end of the packet buffer
                 try:
-                    await self._process_comm_from_instrument(packet_type, packet_payload)
-                except InstrumentError:
-                    raise
-                except Exception as e:
-                    raise SerialCommCommandProcessingError(
-                        f"Timestamp: {timestamp}, Packet Type: {packet_type}, Payload: {packet_payload}"
-                    ) from e
+                    await self._read_into_packet_buffer()
+                except serial.SerialException as e:
+                    logger.error(f"Serial data read failed: {e}. Trying one more time")
+                    await self._read_into_packet_buffer()
+
+                # return if not at least 1 complete packet available
+                if len(self._serial_packet_buffer) < SERIAL_COMM_PACKET_METADATA_LENGTH_BYTES:
+                    # reads in event-driven mode wait for more bytes to arrive, all others need to wait here
+                    if not self._get_waiting_reader():
+                        # wait a little bit before reading again
+                        await asyncio.sleep(0.01)
+                    continue
+
+                await self._sort_and_process_packets()
+        finally:
+            if self._serial_reader:
+                self._serial_reader.stop()
+                self._serial_reader = None
 
-            # Tanner (2/28/23): there is currently no data stream, so magnetometer packets can be completely ignored.
+    async def _sort_and_process_packets(self) -> None:
+        # sort packets by into packet type groups: magnetometer data, stim status, other.
+        # The bytes are parsed in place, so no copy of the buffer is made here
+        try:
+            sorted_packet_dict = sort_serial_packets(
+                self._serial_packet_buffer.unread_bytes,
+                resilient=self._serial_comm_error_budget is not None,
+                is_in_corrupted_run=self._is_in_corrupted_run,
+            )
+        except SerialCommIncorrectMagicWordFromInstrumentError as e:
+            await self._recover_from_incorrect_magic_word(e)
+            return
+        # remove sorted bytes, only the bytes of an incomplete packet will remain
+        self._serial_packet_buffer.consume(sorted_packet_dict["num_bytes_sorted"])
+        self._is_in_corrupted_run = sorted_packet_dict["is_in_corrupted_run"]
+
+        self._check_serial_comm_error_budget(sorted_packet_dict["corruption_counts"])
+
+        await self._process_sorted_packets(sorted_packet_dict)
+
+    async def _recover_from_incorrect_magic_word(
+        self, error: SerialCommIncorrectMagicWordFromInstrumentError
+    ) -> None:
+        logger.error(f"Incorrect magic word from instrument, resyncing with packets. {error}")
+
+        # all packets before the corrupted bytes are still valid, so process them first
+        unread_bytes = self._serial_packet_buffer.unread_bytes
+        num_valid_bytes = 0
+        while packet_len := get_valid_packet_length(unread_bytes, num_valid_bytes):
+            num_valid_bytes += packet_len
+        if num_valid_bytes:
+            sorted_packet_dict = sort_serial_packets(unread_bytes[:num_valid_bytes])
+            self._serial_packet_buffer.consume(num_valid_bytes)
+            await self._process_sorted_packets(sorted_packet_dict)
+
+        try:
+            num_bytes_discarded = await self._sync_to_next_valid_packet()
+        except SerialCommPacketRegistrationSearchExhaustedError as sync_error:
+            raise error from sync_error
 
-            await self._process_stim_packets(sorted_packet_dict["stimulation_stream_info"])
+        logger.info(f"Resynced with packets from instrument after discarding {num_bytes_discarded} bytes")
+
+    async def _process_sorted_packets(self, sorted_packet_dict: dict[str, Any]) -> None:
+        # process any other packets
+        for other_packet_info in sorted_packet_dict["other_packet_info"]:
+            timestamp, packet_type, packet_payload = other_packet_info
+            try:
+                await self._process_comm_from_instrument(packet_type, packet_payload)
+            except InstrumentError:
+                raise
+            except Exception as e:
+                raise SerialCommCommandProcessingError(
+                    f"Timestamp: {timestamp}, Packet Type: {packet_type}, Payload: {packet_payload}"
+                ) from e
+
+        await self._process_magnetometer_packets(sorted_packet_dict["magnetometer_stream_info"])
+        await self._process_stim_packets(sorted_packet_dict["stimulation_stream_info"])
 
     # TEMPORARY TASKS
 
@@ -493,12 +568,28 @@ class InstrumentComm:
         logger.info("Beginning firmware update")
 
         # create FW update manager and wait for it to complete. Updates will be pushed to it from another task
-        self._firmware_update_manager = FirmwareUpdateManager(comm_from_monitor)
+        self._firmware_update_manager = FirmwareUpdateManager(
+            comm_from_monitor, window_size=self._firmware_update_window_size
+        )
 
-        async for packet_type, bytes_to_send, command in self._firmware_update_manager:
-            await self._send_data_packet(packet_type, bytes_to_send)
-            await self._command_tracker.add(packet_type, command)
+        try:
+            async for packet_type, bytes_to_send, command in self._firmware_update_manager:
+                await self._send_data_packet(packet_type, bytes_to_send)
+                timeout_seconds = None
+                if packet_type == SerialCommPacketTypes.END_FIRMWARE_UPDATE:
+                    # the instrument only responds after applying the new firmware, which can take a while
+                    timeout_seconds = (
+                        MAX_CHANNEL_FIRMWARE_UPDATE_DURATION_SECONDS
+                        if command["firmware_type"] == "channel"
+                        else MAX_MAIN_FIRMWARE_UPDATE_DURATION_SECONDS
+                    )
+                await self._command_tracker.add(packet_type, command, timeout_seconds)
+        except BaseException:
+            # checkpoints are only saved periodically, so make sure the update resumes from the latest packet
+            self._firmware_update_manager.save_checkpoint()
+            raise
 
+        logger.info(f"Firmware update metrics: {self._firmware_update_manager.get_metrics()}")
         self._firmware_update_manager = None
 
         await self._wait_for_reboot()
@@ -521,20 +612,87 @@ class InstrumentComm:
 
     # HELPERS
 
-    async def _send_data_packet(self, packet_type: int, data_to_send: bytes = bytes(0)) -> None:
+    async def _sync_to_next_valid_packet(self) -> int:
+        """Discard bytes until the packet buffer starts with a complete packet with a valid checksum.
+
+        Returns:
+            The number of bytes discarded
+        """
+        num_bytes_discarded = 0
+        while True:
+            packet_start_idx, is_valid_packet = find_first_valid_packet(
+                self._serial_packet_buffer.unread_bytes
+            )
+            self._serial_packet_buffer.consume(packet_start_idx)
+            num_bytes_discarded += packet_start_idx
+
+            if is_valid_packet:
+                return num_bytes_discarded
+            if num_bytes_discarded > SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES:
+                # A valid packet should be encountered if this many bytes are read. If not, we can assume there is a problem with the instrument
+                raise SerialCommPacketRegistrationSearchExhaustedError()
+
+            if not await self._read_into_packet_buffer():
+                await asyncio.sleep(0.01)
+
+    async def _read_into_packet_buffer(self) -> int:
         if not self._instrument:
             raise NotImplementedError("_instrument should never be None here")
 
-        # update trackers if necessary
-        if packet_type == SerialCommPacketTypes.HANDSHAKE:
-            self._update_timepoints_of_events("handshake_sent")
-        elif packet_type in COMMAND_PACKET_TYPES:
-            self._update_timepoints_of_events("command_sent")
+        reader: AioSerial | VirtualInstrumentConnection | EventDrivenSerialReader
+        if waiting_reader := self._get_waiting_reader():
+            # wait for bytes to arrive and read as many as will fit
+            write_view = self._serial_packet_buffer.get_write_view()
+            reader = waiting_reader
+        else:
+            # only read the bytes that are already available
+            write_view = self._serial_packet_buffer.get_write_view(self._instrument.in_waiting)
+            reader = self._instrument
+        num_bytes_read: int = await reader.readinto_async(write_view)
+        if waiting_reader and write_view and not num_bytes_read:
+            # a read that waits for bytes will only ever return none if the connection has been closed
+            raise InstrumentConnectionLostError("No bytes returned from read")
+        self._serial_packet_buffer.commit(num_bytes_read)
+        return num_bytes_read
+
+    def _get_waiting_reader(self) -> "EventDrivenSerialReader | VirtualInstrumentConnection | None":
+        """Return the reader to use for reads that wait for bytes to arrive, or None if reads should not wait.
+
+        Reads only wait in event-driven mode. A real serial port is only read from this way once the data
+        stream has started its serial reader.
+        """
+        if self._serial_read_mode != SerialCommReadModes.EVENT_DRIVEN:
+            return None
+        if isinstance(self._instrument, VirtualInstrumentConnection):
+            return self._instrument
+        return self._serial_reader
 
-        data_packet = create_data_packet(get_serial_comm_timestamp(), packet_type, data_to_send)
-        write_len = await self._instrument.write_async(data_packet)
-        if write_len == 0:
-            logger.error("Serial data write reporting no bytes written")
+    async def _send_data_packet(self, packet_type: int, data_to_send: bytes = bytes(0)) -> None:
+        await self._send_data_packets([(packet_type, data_to_send)])
+
+    async def _send_data_packets(self, packets_to_send: Sequence[tuple[int, bytes]]) -> None:
+        """Send all of the given packets to the instrument in a single write."""
+        for packet_type, _ in packets_to_send:
+            # update trackers if necessary
+            if packet_type == SerialCommPacketTypes.HANDSHAKE:
+                self._update_timepoints_of_events("handshake_sent")
+            elif packet_type in COMMAND_PACKET_TYPES:
+                self._update_timepoints_of_events("command_sent")
+
+        timestamp = self._packet_builder.get_timestamp()
+        await self._serial_writer.send_many(
+            [
+                self._packet_builder.build(packet_type, data_to_send, timestamp)
+                for packet_type, data_to_send in packets_to_send
+            ]
+        )
+
+    async def _write_to_instrument(self, data: bytes) -> int:
+        if not self._instrument:
+            raise NotImplementedError("_instrument should never be None here")
+
+        write_len: int = await self._instrument.write_async(data)
+        return write_len
 
     async def _report_instrument_fw_error(self, error_details: dict[Any, Any]) -> None:
         await self._send_data_packet(SerialCommPacketTypes.ERROR_ACK)
@@ -689,6 +847,20 @@ class InstrumentComm:
         if prev_command_info["command"] not in INTERMEDIATE_FIRMWARE_UPDATE_COMMANDS:
             await self._to_monitor_queue.put(prev_command_info)
 
+    async def _process_magnetometer_packets(self, mag_stream_info: dict[str, Any]) -> None:
+        num_packets = mag_stream_info["num_packets"]
+        if not num_packets:
+            return
+
+        # decode directly into the arrays that are sent to the monitor, so no intermediate copies are made
+        time_indices = np.empty(num_packets, dtype=np.int64)
+        data = np.empty((NUM_WELLS, SERIAL_COMM_NUM_CHANNELS_PER_SENSOR, num_packets), dtype=np.uint16)
+        parse_magnetometer_data(mag_stream_info["raw_bytes"], num_packets, time_indices, data)
+
+        await self._to_monitor_queue.put(
+            {"command": "magnetometer_data", "time_indices": time_indices, "data": data}
+        )
+
     async def _process_stim_packets(self, stim_stream_info: dict[str, bytes | int]) -> None:
         if not stim_stream_info["num_packets"]:
             return
@@ -697,15 +869,20 @@ class InstrumentComm:
 
         # Tanner (2/28/23): there is currently no data stream, so only need to check for protocols that have completed
 
-        protocol_statuses: dict[int, Any] = parse_stim_data(*stim_stream_info.values())
+        status_updates, status_updates_by_protocol = parse_stim_data(*stim_stream_info.values())
 
-        logger.debug("Stim statuses received: %s", protocol_statuses)
+        logger.debug("Stim statuses received: %s", status_updates_by_protocol)
 
-        protocols_completed = [
-            protocol_idx
-            for protocol_idx, status_updates_arr in protocol_statuses.items()
-            if status_updates_arr[1][-1] == STIM_COMPLETE_SUBPROTOCOL_IDX
-        ]
+        # find the most recent status update of each protocol by looking for the first occurrence of each
+        # protocol idx in the reversed array
+        protocol_indices, reversed_last_update_indices = np.unique(
+            status_updates["protocol_idx"][::-1], return_index=True
+        )
+        last_update_indices = len(status_updates) - 1 - reversed_last_update_indices
+        is_protocol_complete = (
+            status_updates["subprotocol_idx"][last_update_indices] == STIM_COMPLETE_SUBPROTOCOL_IDX
+        )
+        protocols_completed = protocol_indices[is_protocol_complete].tolist()
         if protocols_completed:
             self._protocols_running -= set(protocols_completed)
             await self._to_monitor_queue.put(
@@ -736,6 +913,32 @@ class InstrumentComm:
             **{event: perf_counter() for event in event_names}
         )
 
+    def _check_serial_comm_error_budget(self, corruption_counts: dict[str, dict[str, int]]) -> None:
+        num_new_errors = sum(counts["num_packets_dropped"] for counts in corruption_counts.values())
+        if not num_new_errors:
+            return
+
+        if not self._serial_comm_error_budget:
+            raise NotImplementedError("_serial_comm_error_budget should never be None here")
+
+        logger.error(f"Dropped corrupted packets from instrument: {corruption_counts}")
+        for error_type, counts in corruption_counts.items():
+            total_counts = self._total_corruption_counts.setdefault(error_type, dict.fromkeys(counts, 0))
+            for count_name, count in counts.items():
+                total_counts[count_name] += count
+
+        max_num_errors, window_seconds = self._serial_comm_error_budget
+
+        current_timepoint = perf_counter()
+        self._serial_comm_error_timepoints.extend([current_timepoint] * num_new_errors)
+        while current_timepoint - self._serial_comm_error_timepoints[0] > window_seconds:
+            self._serial_comm_error_timepoints.popleft()
+
+        if (num_errors_in_window := len(self._serial_comm_error_timepoints)) > max_num_errors:
+            raise SerialCommErrorBudgetExceededError(
+                f"{num_errors_in_window} corrupted packets in the last {window_seconds} seconds. Total dropped: {self._total_corruption_counts}"
+            )
+
     def _log_dur_since_events(self) -> None:
         current_timepoint = perf_counter()
         durs = {
@@ -748,81 +951,262 @@ class InstrumentComm:
 FirmwareUpdateItems = tuple[int, bytes, dict[str, Any]]
 
 
-# TODO ADD LOGGING TO THIS
 class FirmwareUpdateManager:
-    def __init__(self, update_info: dict[str, Any]) -> None:
-        self._file_contents = update_info.pop("file_contents")
-        self._file_checksum = crc32(self._file_contents)
+    """Produces the packets of a firmware update as the instrument responds to them.
+
+    Up to `window_size` firmware data packets are sent before a response to the first of them is received.
+    If the instrument rejects a packet while more than one is in flight, the window size falls back to 1 and
+    all packets starting from the rejected one are resent once responses to the rest of the packets that were
+    in flight have been received.
+
+    If a checkpoint dir is given, the index of the last packet acknowledged by the instrument is saved there
+    every FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS acknowledgements, and by `save_checkpoint` if the update
+    is interrupted. If an update of the same firmware file is interrupted, the next update of it will ask the
+    instrument to resume from the packet after that one, and start over if it can't.
+    """
+
+    def __init__(
+        self, update_info: dict[str, Any], window_size: int = DEFAULT_FIRMWARE_UPDATE_WINDOW_SIZE
+    ) -> None:
+        if window_size < 1:
+            raise ValueError(f"Invalid window size: {window_size}")
+
+        file_contents = update_info.pop("file_contents")
+        self._file_checksum = crc32(file_contents)
+        # chunks are sent from views into the file contents so that each byte is only copied once
+        self._file_view = memoryview(file_contents)
+        self._num_chunks = math.ceil(len(file_contents) / FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES)
 
         self._update_type = update_info["firmware_type"]
         self._version = update_info.pop("version")
 
+        checkpoint_dir_path = update_info.pop("checkpoint_dir_path", None)
+        self._checkpoint_file_path = (
+            os.path.join(checkpoint_dir_path, f"{self._update_type}.json") if checkpoint_dir_path else None
+        )
+        self._resume_chunk_idx = self._load_checkpoint()
+        self._last_acknowledged_chunk_idx: int | None = None
+        self._num_unsaved_acknowledgements = 0
+
         self._command_template = update_info
         self._command_template.pop("command")
 
-        self._packet_idx = -1
+        self._window_size = window_size
+        self._has_started = False
+        self._next_chunk_idx = 0
+        # (chunk idx, timepoint queued) of each chunk sent that has not received a response yet, in the order they were sent
+        self._chunks_in_flight: deque[tuple[int, float]] = deque()
+        # responses to chunks that were in flight when falling back to a window size of 1 are ignored
+        self._num_responses_to_ignore = 0
+
+        # metrics
+        self._start_timepoint: float | None = None
+        self._chunk_round_trip_durs: list[float] = []
+        self._did_fall_back = False
 
         self._sentinel = object()
         self._command_queue: asyncio.Queue[FirmwareUpdateItems | object] = asyncio.Queue()
 
     def __aiter__(self) -> "FirmwareUpdateManager":
-        self._packet_idx = -1
         return self
 
     async def __anext__(self) -> FirmwareUpdateItems:
-        if self._packet_idx == -1:
-            command_items = self._create_initial_update_items()
-            self._packet_idx += 1
-        else:
-            command_items = await self._command_queue.get()  # type: ignore
-            if command_items is self._sentinel:
-                raise StopAsyncIteration
-        return command_items
+        if not self._has_started:
+            self._has_started = True
+            self._start_timepoint = perf_counter()
+            return self._create_initial_update_items()
 
-    async def update(self, command: str, response_data: bytes) -> None:
-        if response_data[0]:
-            error_msg = command
-            if command == "send_firmware_data":
-                error_msg += f", packet index: {self._packet_idx}"
-            raise InstrumentCommandResponseError(error_msg)
+        command_items = await self._command_queue.get()
+        if command_items is self._sentinel:
+            raise StopAsyncIteration
+        return command_items  # type: ignore
 
-        if command != "end_of_firmware_update":
-            if command == "send_firmware_data":
-                self._packet_idx += 1
-            await self._command_queue.put(self._create_next_update_items())
+    async def update(self, command: str, response_data: bytes) -> None:
+        command_failed = bool(response_data[0])
+
+        match command:
+            case "start_firmware_update":
+                if not command_failed:
+                    self._next_chunk_idx = self._resume_chunk_idx or 0
+                    self._queue_next_items()
+                elif self._resume_chunk_idx is not None:
+                    logger.warning(
+                        f"Instrument could not resume firmware update from packet {self._resume_chunk_idx}, starting over"
+                    )
+                    self._resume_chunk_idx = None
+                    self._delete_checkpoint()
+                    self._command_queue.put_nowait(self._create_initial_update_items())
+                else:
+                    raise InstrumentCommandResponseError(command)
+            case "send_firmware_data":
+                await self._handle_firmware_data_response(command_failed)
+            case "end_of_firmware_update":
+                # whether or not the instrument accepted the firmware, there is nothing left to resume
+                self._delete_checkpoint()
+                if command_failed:
+                    raise InstrumentCommandResponseError(command)
 
     async def complete(self) -> None:
         await self._command_queue.put(self._sentinel)
 
+    def save_checkpoint(self) -> None:
+        """Save the index of the last packet acknowledged by the instrument if it has not been saved yet.
+
+        A resumed update is checked against the checksum of all bytes before the packet it resumes from, so
+        a checkpoint that is a few packets behind is still safe to resume from.
+        """
+        if not self._num_unsaved_acknowledgements or self._last_acknowledged_chunk_idx is None:
+            return
+        self._num_unsaved_acknowledgements = 0
+        if not self._checkpoint_file_path:
+            return
+
+        os.makedirs(os.path.dirname(self._checkpoint_file_path), exist_ok=True)
+        # write to a temporary file first so that the checkpoint is never left partially written
+        tmp_file_path = f"{self._checkpoint_file_path}.tmp"
+        with open(tmp_file_path, "w") as checkpoint_file:
+            json.dump(
+                {
+                    **self._get_checkpoint_file_info(),
+                    "last_acknowledged_packet_index": self._last_acknowledged_chunk_idx,
+                },
+                checkpoint_file,
+            )
+        os.replace(tmp_file_path, self._checkpoint_file_path)
+
+    def get_metrics(self) -> dict[str, Any]:
+        metrics: dict[str, Any] = {
+            "num_chunks": self._num_chunks,
+            "window_size": self._window_size,
+            "fell_back_to_window_size_of_1": self._did_fall_back,
+            "resumed_from_packet_index": self._resume_chunk_idx,
+        }
+        if self._start_timepoint is not None:
+            metrics["duration_seconds"] = perf_counter() - self._start_timepoint
+        if self._chunk_round_trip_durs:
+            metrics["chunk_round_trip_seconds"] = {
+                "mean": sum(self._chunk_round_trip_durs) / len(self._chunk_round_trip_durs),
+                "max": max(self._chunk_round_trip_durs),
+            }
+        return metrics
+
+    async def _handle_firmware_data_response(self, command_failed: bool) -> None:
+        if self._num_responses_to_ignore:
+            self._num_responses_to_ignore -= 1
+            if not self._num_responses_to_ignore:
+                self._queue_next_items()
+            return
+
+        chunk_idx, queued_timepoint = self._chunks_in_flight.popleft()
+
+        if command_failed:
+            if self._window_size == 1:
+                raise InstrumentCommandResponseError(f"send_firmware_data, packet index: {chunk_idx}")
+
+            logger.warning(
+                f"Instrument rejected firmware packet {chunk_idx} with {len(self._chunks_in_flight) + 1} packets in flight, falling back to a window size of 1"
+            )
+            self._window_size = 1
+            self._did_fall_back = True
+            # the instrument will also reject every packet sent after this one
+            self._next_chunk_idx = chunk_idx
+            self._num_responses_to_ignore = len(self._chunks_in_flight)
+            self._chunks_in_flight.clear()
+            if self._num_responses_to_ignore:
+                return
+        else:
+            self._chunk_round_trip_durs.append(perf_counter() - queued_timepoint)
+            self._last_acknowledged_chunk_idx = chunk_idx
+            self._num_unsaved_acknowledgements += 1
+            # saving after every acknowledgement would add file I/O to each packet of the update
+            if self._num_unsaved_acknowledgements >= FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS:
+                self.save_checkpoint()
+
+        self._queue_next_items()
+
+    def _queue_next_items(self) -> None:
+        while len(self._chunks_in_flight) < self._window_size and self._next_chunk_idx < self._num_chunks:
+            self._command_queue.put_nowait(self._create_firmware_data_items(self._next_chunk_idx))
+            self._chunks_in_flight.append((self._next_chunk_idx, perf_counter()))
+            self._next_chunk_idx += 1
+
+        if not self._chunks_in_flight and self._next_chunk_idx == self._num_chunks:
+            self._command_queue.put_nowait(
+                (
+                    SerialCommPacketTypes.END_FIRMWARE_UPDATE,
+                    self._file_checksum.to_bytes(4, byteorder="little"),
+                    {"command": "end_of_firmware_update", "firmware_type": self._update_type},
+                )
+            )
+
     def _create_initial_update_items(self) -> FirmwareUpdateItems:
-        return (
-            SerialCommPacketTypes.BEGIN_FIRMWARE_UPDATE,
+        bytes_to_send = (
             bytes([self._update_type == "channel"])
             + convert_semver_str_to_bytes(self._version)
-            + len(self._file_contents).to_bytes(4, byteorder="little"),
-            {**self._command_template, "command": "start_firmware_update"},
+            + len(self._file_view).to_bytes(4, byteorder="little")
         )
+        command: dict[str, Any] = {**self._command_template, "command": "start_firmware_update"}
 
-    def _create_next_update_items(self) -> FirmwareUpdateItems:
-        command: dict[str, Any]
-
-        if len(self._file_contents) > 0:
-            packet_type = SerialCommPacketTypes.FIRMWARE_UPDATE
-            bytes_to_send = (
-                bytes([self._packet_idx]) + self._file_contents[: SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES - 1]
+        if self._resume_chunk_idx is not None:
+            # the checksum of all bytes sent before this packet lets the instrument confirm it has the same bytes
+            bytes_sent = self._file_view[: self._resume_chunk_idx * FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES]
+            bytes_to_send += bytes([self._resume_chunk_idx]) + crc32(bytes_sent).to_bytes(
+                4, byteorder="little"
             )
-            command = {
-                "command": "send_firmware_data",
-                "firmware_type": self._update_type,
-                "packet_index": self._packet_idx,
-            }
-            self._file_contents = self._file_contents[SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES - 1 :]
-        else:
-            packet_type = SerialCommPacketTypes.END_FIRMWARE_UPDATE
-            bytes_to_send = self._file_checksum.to_bytes(4, byteorder="little")
-            command = {"command": "end_of_firmware_update", "firmware_type": self._update_type}
+            command["resume_from_packet_index"] = self._resume_chunk_idx
 
-        return packet_type, bytes_to_send, command
+        return SerialCommPacketTypes.BEGIN_FIRMWARE_UPDATE, bytes_to_send, command
+
+    def _load_checkpoint(self) -> int | None:
+        """Return the index of the packet to resume the update from, if there is a checkpoint for this file."""
+        if not self._checkpoint_file_path or not os.path.isfile(self._checkpoint_file_path):
+            return None
+
+        try:
+            with open(self._checkpoint_file_path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            last_acknowledged_chunk_idx = checkpoint["last_acknowledged_packet_index"]
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.exception("Unable to load firmware update checkpoint")
+            return None
+
+        if any(checkpoint.get(key) != value for key, value in self._get_checkpoint_file_info().items()):
+            logger.info("Ignoring firmware update checkpoint for a different firmware file")
+            return None
+        if not isinstance(last_acknowledged_chunk_idx, int) or not (
+            0 <= last_acknowledged_chunk_idx < self._num_chunks
+        ):
+            logger.error(f"Invalid packet index in firmware update checkpoint: {last_acknowledged_chunk_idx}")
+            return None
+
+        resume_chunk_idx = last_acknowledged_chunk_idx + 1
+        logger.info(
+            f"Found firmware update checkpoint, will attempt to resume from packet {resume_chunk_idx}"
+        )
+        return resume_chunk_idx
+
+    def _delete_checkpoint(self) -> None:
+        # nothing acknowledged before this point should be saved again
+        self._last_acknowledged_chunk_idx = None
+        self._num_unsaved_acknowledgements = 0
+        if self._checkpoint_file_path and os.path.isfile(self._checkpoint_file_path):
+            os.remove(self._checkpoint_file_path)
+
+    def _get_checkpoint_file_info(self) -> dict[str, Any]:
+        return {
+            "version": self._version,
+            "file_checksum": self._file_checksum,
+            "packet_length": FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES,
+        }
+
+    def _create_firmware_data_items(self, chunk_idx: int) -> FirmwareUpdateItems:
+        chunk_start_idx = chunk_idx * FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES
+        chunk = self._file_view[chunk_start_idx : chunk_start_idx + FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES]
+        return (
+            SerialCommPacketTypes.FIRMWARE_UPDATE,
+            bytes([chunk_idx]) + chunk,
+            {"command": "send_firmware_data", "firmware_type": self._update_type, "packet_index": chunk_idx},
+        )
 
 
 class VirtualInstrumentConnection:
@@ -848,6 +1232,12 @@ class VirtualInstrumentConnection:
         logger.debug("RECV: %s", list(data))
         return data
 
+    async def readinto_async(self, buffer: bytearray | memoryview) -> int:
+        data = await self.read_async(len(buffer))
+        num_bytes_read = len(data)
+        buffer[:num_bytes_read] = data
+        return num_bytes_read
+
     async def write_async(self, data: bytearray | bytes | memoryview) -> int:
         try:
             self.writer.write(data)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Fan-out of messages sent to the UI to additional read-only websocket clients."""
+
+import asyncio
+from collections import deque
+import logging
+
+from ..constants import BROADCAST_CLIENT_MAX_NUM_QUEUED_MSGS
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastClient:
+    """The encoded messages waiting to be sent to a single client of a BroadcastHub.
+
+    Unlike the waveform stream, messages are never dropped since the client would then have an inaccurate view
+    of the system. Instead, a client that falls too far behind is evicted.
+    """
+
+    def __init__(self, max_num_queued_msgs: int = BROADCAST_CLIENT_MAX_NUM_QUEUED_MSGS):
+        if max_num_queued_msgs < 1:
+            raise ValueError(f"Invalid max num queued msgs: {max_num_queued_msgs}")
+
+        self._max_num_queued_msgs = max_num_queued_msgs
+        self._msgs: deque[str | bytes] = deque()
+        self._msg_available = asyncio.Event()
+
+        self.is_evicted = False
+
+    @property
+    def is_full(self) -> bool:
+        return len(self._msgs) >= self._max_num_queued_msgs
+
+    def add_msg(self, encoded_msg: str | bytes) -> None:
+        self._msgs.append(encoded_msg)
+        self._msg_available.set()
+
+    def evict(self) -> None:
+        self.is_evicted = True
+        self._msgs.clear()
+        self._msg_available.set()
+
+    async def get_msgs(self) -> list[str | bytes]:
+        """Wait for at least one message, then return all queued messages.
+
+        Returns an empty list once the client has been evicted.
+        """
+        while not self._msgs and not self.is_evicted:
+            self._msg_available.clear()
+            await self._msg_available.wait()
+
+        msgs = list(self._msgs)
+        self._msgs.clear()
+        return msgs
+
+
+class BroadcastHub:
+    """Distributes each message sent to the UI to all read-only clients."""
+
+    def __init__(self, max_num_queued_msgs_per_client: int = BROADCAST_CLIENT_MAX_NUM_QUEUED_MSGS) -> None:
+        self._max_num_queued_msgs_per_client = max_num_queued_msgs_per_client
+        self._clients: set[BroadcastClient] = set()
+
+        # metrics
+        self.num_clients_evicted = 0
+
+    @property
+    def num_clients(self) -> int:
+        return len(self._clients)
+
+    def add_client(self) -> BroadcastClient:
+        client = BroadcastClient(self._max_num_queued_msgs_per_client)
+        self._clients.add(client)
+        return client
+
+    def remove_client(self, client: BroadcastClient) -> None:
+        self._clients.discard(client)
+
+    def broadcast(self, encoded_msg: str | bytes) -> None:
+        """Queue the message to be sent to each client.
+
+        The message must already be encoded so that it is only encoded once regardless of the number of clients.
+        """
+        for client in list(self._clients):
+            if client.is_full:
+                logger.error("Evicting broadcast client that fell behind")
+                self.remove_client(client)
+                client.evict()
+                self.num_clients_evicted += 1
+            else:
+                client.add_msg(encoded_msg)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Transport layer for the requests CloudComm makes to cloud services."""
+
+import asyncio
+import bisect
+from contextlib import asynccontextmanager
+import importlib.util
+import logging
+import random
+from time import perf_counter
+from typing import Any
+from typing import AsyncIterator
+
+import httpx
+
+from ..constants import CLOUD_REQUEST_IDEMPOTENT_METHODS
+from ..constants import CLOUD_REQUEST_LATENCY_BUCKETS_MS
+from ..constants import CLOUD_REQUEST_MAX_NUM_ATTEMPTS
+from ..constants import CLOUD_REQUEST_RETRY_BASE_DELAY_SECONDS
+from ..constants import CLOUD_REQUEST_RETRY_MAX_DELAY_SECONDS
+from ..constants import CLOUD_REQUEST_RETRYABLE_STATUS_CODES
+from ..constants import CLOUD_REQUEST_TIMEOUTS
+from ..constants import CloudClientSettings
+from ..constants import CloudRequestTypes
+from ..constants import DEFAULT_CLOUD_CLIENT_SETTINGS
+
+
+logger = logging.getLogger(__name__)
+
+# httpx only supports HTTP/2 if this optional dependency is installed
+IS_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _get_retry_delay(retry_idx: int) -> float:
+    # using the full range of delays spreads out the retries of requests that failed at the same time
+    return random.uniform(  # nosec B311 # not used for anything security related
+        0, min(CLOUD_REQUEST_RETRY_MAX_DELAY_SECONDS, CLOUD_REQUEST_RETRY_BASE_DELAY_SECONDS * 2**retry_idx)
+    )
+
+
+def _get_timeout(request_type: CloudRequestTypes) -> httpx.Timeout:
+    return httpx.Timeout(**CLOUD_REQUEST_TIMEOUTS[request_type]._asdict())
+
+
+class LatencyHistogram:
+    """Counts of latencies in fixed buckets.
+
+    Each bucket counts the latencies larger than the previous bucket's upper bound, up to and including its
+    own. The last bucket counts the latencies larger than the largest upper bound.
+    """
+
+    def __init__(self, bucket_upper_bounds_ms: tuple[float, ...] = CLOUD_REQUEST_LATENCY_BUCKETS_MS) -> None:
+        self._bucket_upper_bounds_ms = bucket_upper_bounds_ms
+        self._bucket_counts = [0] * (len(bucket_upper_bounds_ms) + 1)
+
+        self._count = 0
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+
+    def record(self, latency_ms: float) -> None:
+        self._bucket_counts[bisect.bisect_left(self._bucket_upper_bounds_ms, latency_ms)] += 1
+        self._count += 1
+        self._total_ms += latency_ms
+        self._max_ms = max(self._max_ms, latency_ms)
+
+    def get_metrics(self) -> dict[str, Any]:
+        bucket_names = [f"<={upper_bound}ms" for upper_bound in self._bucket_upper_bounds_ms] + [
+            f">{self._bucket_upper_bounds_ms[-1]}ms"
+        ]
+        return {
+            "count": self._count,
+            "mean_ms": self._total_ms / self._count if self._count else None,
+            "max_ms": self._max_ms if self._count else None,
+            "buckets": dict(zip(bucket_names, self._bucket_counts)),
+        }
+
+
+class CloudRequestMetrics:
+    """Metrics of the requests made to cloud services.
+
+    This is shared between CloudComm, which records the metrics, and SystemMonitor, which includes them in
+    its diagnostics.
+    """
+
+    def __init__(self) -> None:
+        self.latency_histograms = {request_type: LatencyHistogram() for request_type in CloudRequestTypes}
+        self.num_retries = 0
+        self.num_token_refreshes = 0
+
+    def get_metrics(self) -> dict[str, Any]:
+        return {
+            "latencies": {
+                request_type.name.lower(): histogram.get_metrics()
+                for request_type, histogram in self.latency_histograms.items()
+            },
+            "num_retries": self.num_retries,
+            "num_token_refreshes": self.num_token_refreshes,
+        }
+
+
+class CloudClient:
+    """Wrapper around a single httpx.AsyncClient used for all requests made to cloud services.
+
+    The timeouts of each request are set by its type. Requests with idempotent methods are retried after a
+    random delay that grows with each attempt if they fail with a transport error or a status code that may
+    not occur again. The latency of each response is recorded in the histogram of the request's type.
+    """
+
+    def __init__(
+        self,
+        settings: CloudClientSettings = DEFAULT_CLOUD_CLIENT_SETTINGS,
+        metrics: CloudRequestMetrics | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        http2 = settings.http2
+        if http2 and not IS_HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requires the h2 package to be installed, using HTTP/1.1 instead")
+            http2 = False
+
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.max_connections,
+                max_keepalive_connections=settings.max_keepalive_connections,
+                keepalive_expiry=settings.keepalive_expiry_seconds,
+            ),
+            transport=transport,
+        )
+        self.metrics = metrics or CloudRequestMetrics()
+
+    async def request(
+        self, method: str, url: str, *, request_type: CloudRequestTypes, **request_kwargs: Any
+    ) -> httpx.Response:
+        timeout = _get_timeout(request_type)
+        max_num_attempts = (
+            CLOUD_REQUEST_MAX_NUM_ATTEMPTS if method.upper() in CLOUD_REQUEST_IDEMPOTENT_METHODS else 1
+        )
+
+        for retry_idx in range(max_num_attempts):
+            is_last_attempt = retry_idx == max_num_attempts - 1
+
+            start = perf_counter()
+            try:
+                res = await self._client.request(method, url, timeout=timeout, **request_kwargs)
+            except httpx.TransportError as e:
+                if is_last_attempt:
+                    raise
+                logger.warning(f"{method.upper()} request failed with {e!r}, retrying")
+            else:
+                self._record_latency(request_type, start)
+                if is_last_attempt or res.status_code not in CLOUD_REQUEST_RETRYABLE_STATUS_CODES:
+                    return res
+                logger.warning(
+                    f"{method.upper()} request failed with status code {res.status_code}, retrying"
+                )
+
+            self.metrics.num_retries += 1
+            await asyncio.sleep(_get_retry_delay(retry_idx))
+
+        raise NotImplementedError("The last attempt should always return or raise")
+
+    @asynccontextmanager
+    async def stream(
+        self, method: str, url: str, *, request_type: CloudRequestTypes
+    ) -> AsyncIterator[httpx.Response]:
+        """Make a request without reading the body of the response.
+
+        These are not retried since the body may have already been partially consumed when an error occurs.
+        The latency recorded is the time until the headers of the response are received.
+        """
+        start = perf_counter()
+        async with self._client.stream(method, url, timeout=_get_timeout(request_type)) as res:
+            self._record_latency(request_type, start)
+            yield res
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _record_latency(self, request_type: CloudRequestTypes, start: float) -> None:
+        self.metrics.latency_histograms[request_type].record((perf_counter() - start) * 1e3)
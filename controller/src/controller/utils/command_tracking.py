@@ -2,47 +2,61 @@
 import asyncio
 from collections import defaultdict
 from collections import deque
+import heapq
+import itertools
 from typing import Any
 
 from ..constants import SERIAL_COMM_RESPONSE_TIMEOUT_SECONDS
 
 
 class _Command:
-    def __init__(self, info: dict[str, Any], timeout_info: asyncio.Future[dict[str, Any]]) -> None:
+    __slots__ = ("info", "deadline", "is_complete")
+
+    def __init__(self, info: dict[str, Any], deadline: float) -> None:
         self.info = info
+        self.deadline = deadline
+        self.is_complete = False
 
-        self._timeout_info = timeout_info
-        self._timer = asyncio.create_task(self._start_timer())
 
-    async def _start_timer(self) -> None:
-        try:
-            await asyncio.sleep(SERIAL_COMM_RESPONSE_TIMEOUT_SECONDS)
-        except asyncio.CancelledError:
-            return
-        else:
-            if not self._timeout_info.done() and not self._timeout_info.cancelled():
-                self._timeout_info.set_result(self.info)
-
-    async def complete(self) -> None:
-        self._timer.cancel()
-        await self._timer
-        # TODO see if this helps clean up errors here
-        # try:
-        #     await self._timer
-        # except asyncio.CancelledError:
-        #     pass
+class CommandTracker:
+    """Tracks commands sent to the instrument until a response to each is received.
 
+    The deadlines of all commands are kept in a single heap which is only serviced by the task waiting in
+    `wait_for_expired_command`. Completed commands are removed from the heap lazily.
+    """
 
-class CommandTracker:
     def __init__(self) -> None:
         self._command_mapping: dict[int, deque[_Command]] = defaultdict(deque)
 
-        self._timeout_info: asyncio.Future[dict[str, Any]] = asyncio.Future()
+        # entries are (deadline, insertion order, command) so that commands with equal deadlines expire in the order they were added
+        self._deadline_heap: list[tuple[float, int, _Command]] = []
+        self._insertion_counter = itertools.count()
+        self._num_completed_commands_in_heap = 0
+        self._earliest_deadline_changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._deadline_heap) - self._num_completed_commands_in_heap
+
+    async def add(
+        self, packet_type: int, command_info: dict[str, Any], timeout_seconds: float | None = None
+    ) -> None:
+        """Start tracking a command.
+
+        Args:
+            packet_type: the packet type of the command, which will also be the packet type of its response
+            command_info: the info to return when the command is popped or expires
+            timeout_seconds: how long to wait for a response to the command. Defaults to SERIAL_COMM_RESPONSE_TIMEOUT_SECONDS
+        """
+        if timeout_seconds is None:
+            timeout_seconds = SERIAL_COMM_RESPONSE_TIMEOUT_SECONDS
+
+        command = _Command(command_info, asyncio.get_running_loop().time() + timeout_seconds)
+        self._command_mapping[packet_type].append(command)
 
-    async def add(self, packet_type: int, command_info: dict[str, Any]) -> None:
-        self._command_mapping[packet_type].append(_Command(command_info, self._timeout_info))
-        # make sure the command's timer task begins
-        await asyncio.sleep(0)
+        is_earliest_deadline = not self._deadline_heap or command.deadline < self._deadline_heap[0][0]
+        heapq.heappush(self._deadline_heap, (command.deadline, next(self._insertion_counter), command))
+        if is_earliest_deadline:
+            self._earliest_deadline_changed.set()
 
     async def pop(self, packet_type: int) -> dict[str, Any]:
         commands_for_packet_type = self._command_mapping[packet_type]
@@ -52,14 +66,44 @@ class CommandTracker:
         except IndexError as e:
             raise ValueError(f"No commands of packet type: {packet_type}") from e
 
-        await command.complete()
+        command.is_complete = True
+        self._num_completed_commands_in_heap += 1
+        self._discard_completed_commands()
 
         return command.info
 
     async def wait_for_expired_command(self) -> dict[str, Any]:
-        try:
-            return await self._timeout_info
-        except asyncio.CancelledError:
-            raise
-        finally:
-            pass  # TODO complete all commands?
+        """Wait until the deadline of any incomplete command passes, then return the info of that command."""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            self._earliest_deadline_changed.clear()
+            self._discard_completed_commands()
+
+            if not self._deadline_heap:
+                await self._earliest_deadline_changed.wait()
+                continue
+
+            deadline, _, command = self._deadline_heap[0]
+            if deadline <= loop.time():
+                heapq.heappop(self._deadline_heap)
+                return command.info
+
+            try:
+                async with asyncio.timeout_at(deadline):
+                    await self._earliest_deadline_changed.wait()
+            except TimeoutError:
+                pass
+
+    # HELPERS
+
+    def _discard_completed_commands(self) -> None:
+        while self._deadline_heap and self._deadline_heap[0][2].is_complete:
+            heapq.heappop(self._deadline_heap)
+            self._num_completed_commands_in_heap -= 1
+
+        # completed commands that aren't at the top of the heap may otherwise stay in it for an entire timeout
+        if self._num_completed_commands_in_heap > len(self._deadline_heap) // 2:
+            self._deadline_heap = [entry for entry in self._deadline_heap if not entry[2].is_complete]
+            heapq.heapify(self._deadline_heap)
+            self._num_completed_commands_in_heap = 0
@@ -3,23 +3,34 @@
 # Tanner (9/1/20): Make sure to set `linetrace=False` except when profiling cython code or creating annotation file. All performance tests should be timed without line tracing enabled. Cython files in this package can easily be recompiled with `pip install -e .`
 # cython: linetrace=False
 """Parsing data from instrument firmware."""
+import datetime
+import time
+
 from ..constants import NUM_WELLS
 from ..constants import SERIAL_COMM_PAYLOAD_INDEX
 from ..constants import SERIAL_COMM_CHECKSUM_LENGTH_BYTES
 from ..constants import SERIAL_COMM_DATA_SAMPLE_LENGTH_BYTES
 from ..constants import SERIAL_COMM_MAGIC_WORD_BYTES
+from ..constants import SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES
+from ..constants import SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES
+from ..constants import SERIAL_COMM_MODULE_ID_TO_WELL_IDX
 from ..constants import SERIAL_COMM_PACKET_METADATA_LENGTH_BYTES
 from ..constants import SERIAL_COMM_PACKET_REMAINDER_SIZE_LENGTH_BYTES
 from ..constants import SERIAL_COMM_TIME_OFFSET_LENGTH_BYTES
+from ..constants import SERIAL_COMM_TIMESTAMP_EPOCH
 from ..constants import SerialCommPacketTypes
 from ..exceptions import SerialCommIncorrectChecksumFromInstrumentError
 from ..exceptions import SerialCommIncorrectMagicWordFromInstrumentError
 
+cimport cython
+from cpython.bytes cimport PyBytes_FromStringAndSize
 from libc.stdint cimport int64_t
 from libc.stdint cimport uint8_t
 from libc.stdint cimport uint16_t
 from libc.stdint cimport uint32_t
 from libc.stdint cimport uint64_t
+from libc.string cimport memcmp
+from libc.string cimport memcpy
 from libc.string cimport strncpy
 from libc.string cimport strncmp
 # import numpy correctly
@@ -51,16 +62,22 @@ cdef int SERIAL_COMM_CHECKSUM_LENGTH_BYTES_C_INT = SERIAL_COMM_CHECKSUM_LENGTH_B
 
 cdef int PACKET_HEADER_LEN = MAGIC_WORD_LEN + SERIAL_COMM_PRS_LENGTH_BYTES_C_INT
 cdef int MIN_PACKET_SIZE = SERIAL_COMM_PACKET_METADATA_LENGTH_BYTES
+cdef int MAX_PACKET_SIZE = SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES
+cdef int MAX_PAYLOAD_SIZE = SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES
 
 cdef int SERIAL_COMM_TIME_OFFSET_LENGTH_BYTES_C_INT = SERIAL_COMM_TIME_OFFSET_LENGTH_BYTES
 cdef int SERIAL_COMM_DATA_SAMPLE_LENGTH_BYTES_C_INT = SERIAL_COMM_DATA_SAMPLE_LENGTH_BYTES
 cdef int SERIAL_COMM_NUM_CHANNELS_PER_SENSOR_C_INT = NUM_CHANNELS_PER_SENSOR
 
 cdef int SERIAL_COMM_PAYLOAD_INDEX_C_INT = SERIAL_COMM_PAYLOAD_INDEX
+cdef int SERIAL_COMM_MAGNETOMETER_DATA_PACKET_TYPE_C_INT = SerialCommPacketTypes.MAGNETOMETER_DATA
 cdef int SERIAL_COMM_STIM_STATUS_PACKET_TYPE_C_INT = SerialCommPacketTypes.STIM_STATUS
 
 
 cdef int TOTAL_NUM_WELLS_C_INT = NUM_WELLS
+cdef int[::1] MODULE_ID_TO_WELL_IDX = np.array(
+    [SERIAL_COMM_MODULE_ID_TO_WELL_IDX[module_id] for module_id in range(NUM_WELLS)], dtype=np.intc
+)
 
 
 cdef packed struct Packet:
@@ -84,22 +101,67 @@ cdef packed struct MagnetometerData:
 cdef int TIME_INDEX_LEN = sizeof(uint64_t)
 
 
+cdef packed struct StimStatusUpdate:
+    uint8_t protocol_idx
+    int64_t time_index
+    uint8_t status
+    uint8_t subprotocol_idx
+
+
+cdef int STIM_STATUS_UPDATE_LEN = sizeof(StimStatusUpdate)
+
+# Tanner (10/18/21): using int64 for time index since top bit will never be used and these values can be negative
+STIM_STATUS_UPDATE_DTYPE = np.dtype(
+    [
+        ("protocol_idx", np.uint8),
+        ("time_index", "<i8"),
+        ("status", np.uint8),
+        ("subprotocol_idx", np.uint8),
+    ],
+    align=False,
+)
+
+
 cdef int get_checksum_index(int packet_len):
     return packet_len + PACKET_HEADER_LEN - SERIAL_COMM_CHECKSUM_LENGTH_BYTES_C_INT
 
 
-cpdef dict sort_serial_packets(unsigned char [:] read_bytes):
+cdef int get_next_magic_word_index(unsigned char [::1] read_bytes, int bytes_idx, int num_bytes):
+    """Return the idx of the next magic word after the given idx.
+
+    If there isn't one, the idx of the first of the final bytes that could still be the start of a magic word
+    is returned instead.
+    """
+    cdef int idx
+    for idx in range(bytes_idx + 1, num_bytes - MAGIC_WORD_LEN + 1):
+        if memcmp(&read_bytes[idx], MAGIC_WORD, MAGIC_WORD_LEN) == 0:
+            return idx
+    return max(bytes_idx + 1, num_bytes - MAGIC_WORD_LEN + 1)
+
+
+cpdef dict sort_serial_packets(
+    unsigned char [::1] read_bytes, bint resilient=False, bint is_in_corrupted_run=False
+):
     """Sort all complete packets from the given buffer by packet type.
 
+    The given buffer is parsed in place, so it must be C contiguous and must not be modified until this
+    function returns. None of the returned values reference the given buffer.
+
     Args:
         read_bytes: an array of all bytes to be parsed are sorted by packet type
+        resilient: if True, instead of raising an error when a corrupted packet is found, all bytes up to the
+            next magic word will be dropped and counted
+        is_in_corrupted_run: if True, the bytes at the start of read_bytes are the remainder of a corrupted
+            packet dropped by the previous call, so they are dropped without being counted as another packet.
+            This should be the value returned for this key by the previous call
 
     Returns:
         A dict whose values consist of a dict containing a bytearray and the number of packets found for both
-        magnetometer data and stim data, a list of bytearrays of all other data packets, and a bytearray of
-        all remaining bytes that were not sorted (usually part of an incomplete packet)
+        magnetometer data and stim data, a list of bytearrays of all other data packets, the number of
+        packets and bytes dropped for each type of corruption, and the number of bytes sorted. All bytes after
+        this number were not sorted (usually part of an incomplete packet), and whether or not the unsorted
+        bytes are the remainder of a corrupted packet
     """
-    read_bytes = read_bytes.copy()  # make sure data is C contiguous
     cdef int num_bytes = len(read_bytes)
 
     # generic data parsing values
@@ -126,6 +188,12 @@ cpdef dict sort_serial_packets(unsigned char [:] read_bytes):
     cdef char[MAGIC_WORD_LEN + 1] magic_word
     magic_word[MAGIC_WORD_LEN] = 0
 
+    # corruption tracking values, only used in resilient mode
+    cdef int next_bytes_idx
+    cdef int num_incorrect_magic_words = 0, num_incorrect_magic_word_bytes = 0
+    cdef int num_invalid_packet_lengths = 0, num_invalid_packet_length_bytes = 0
+    cdef int num_incorrect_checksums = 0, num_incorrect_checksum_bytes = 0
+
     cdef Packet *p
     cdef int bytes_idx = 0
     cdef int payload_start_idx, checksum_start_idx
@@ -133,16 +201,36 @@ cpdef dict sort_serial_packets(unsigned char [:] read_bytes):
     while bytes_idx <= num_bytes - MIN_PACKET_SIZE:
         p = <Packet *> &read_bytes[bytes_idx]
 
-        # make sure data packet is complete before attempting to parse
-        if num_bytes - (bytes_idx + PACKET_HEADER_LEN) < p.packet_len:
-            break
-
-        # check that magic word is correct
+        # check that magic word is correct. Do this before checking if the packet is complete since the packet
+        # length can't be trusted if the magic word is incorrect
         strncpy(magic_word, p.magic, MAGIC_WORD_LEN)
         if strncmp(magic_word, MAGIC_WORD, MAGIC_WORD_LEN) != 0:
+            if resilient:
+                next_bytes_idx = get_next_magic_word_index(read_bytes, bytes_idx, num_bytes)
+                if not is_in_corrupted_run:
+                    num_incorrect_magic_words += 1
+                num_incorrect_magic_word_bytes += next_bytes_idx - bytes_idx
+                bytes_idx = next_bytes_idx
+                # if no magic word was found, the remaining bytes may still be part of this corrupted packet
+                is_in_corrupted_run = True
+                continue
             raise SerialCommIncorrectMagicWordFromInstrumentError(
                 f"At byte idx: {bytes_idx} of {num_bytes}: {list(bytes(read_bytes[bytes_idx : bytes_idx + MAGIC_WORD_LEN]))}"
             )
+        is_in_corrupted_run = False
+
+        # a corrupted packet length could otherwise make the packet look incomplete indefinitely
+        if resilient and not MIN_PACKET_SIZE <= PACKET_HEADER_LEN + p.packet_len <= MAX_PACKET_SIZE:
+            next_bytes_idx = get_next_magic_word_index(read_bytes, bytes_idx, num_bytes)
+            num_invalid_packet_lengths += 1
+            num_invalid_packet_length_bytes += next_bytes_idx - bytes_idx
+            bytes_idx = next_bytes_idx
+            is_in_corrupted_run = True
+            continue
+
+        # make sure data packet is complete before attempting to parse
+        if num_bytes - (bytes_idx + PACKET_HEADER_LEN) < p.packet_len:
+            break
 
         relative_checksum_idx = get_checksum_index(p.packet_len)
 
@@ -153,6 +241,14 @@ cpdef dict sort_serial_packets(unsigned char [:] read_bytes):
         crc = crc32(crc, <uint8_t *> &p.magic, relative_checksum_idx)
         # check that actual CRC is the expected value. Do this before checking if it is a data packet
         if crc != original_crc:
+            if resilient:
+                # the packet length may be what was corrupted, so can't assume the next packet starts after it
+                next_bytes_idx = get_next_magic_word_index(read_bytes, bytes_idx, num_bytes)
+                num_incorrect_checksums += 1
+                num_incorrect_checksum_bytes += next_bytes_idx - bytes_idx
+                bytes_idx = next_bytes_idx
+                is_in_corrupted_run = True
+                continue
             # raising error here, so ok to incur python overhead
             packet_end_idx = bytes_idx + PACKET_HEADER_LEN + p.packet_len
             full_data_packet = bytearray(read_bytes[bytes_idx : packet_end_idx])
@@ -166,7 +262,13 @@ cpdef dict sort_serial_packets(unsigned char [:] read_bytes):
         packet_payload = read_bytes[payload_start_idx : checksum_start_idx]
         payload_len = checksum_start_idx - payload_start_idx
 
-        if p.packet_type == SERIAL_COMM_STIM_STATUS_PACKET_TYPE_C_INT:
+        if p.packet_type == SERIAL_COMM_MAGNETOMETER_DATA_PACKET_TYPE_C_INT:
+            mag_data_packet_bytes[
+                mag_data_packet_byte_idx : mag_data_packet_byte_idx + payload_len
+            ] = packet_payload
+            mag_data_packet_byte_idx += payload_len
+            num_mag_data_packets += 1
+        elif p.packet_type == SERIAL_COMM_STIM_STATUS_PACKET_TYPE_C_INT:
             stim_packet_bytes[
                 stim_packet_byte_idx : stim_packet_byte_idx + payload_len
             ] = packet_payload
@@ -190,38 +292,202 @@ cpdef dict sort_serial_packets(unsigned char [:] read_bytes):
             "num_packets": num_stim_packets,
         },
         "other_packet_info": other_packet_info,
-        "unread_bytes": bytearray(read_bytes[bytes_idx:]),
+        "corruption_counts": {
+            "incorrect_magic_word": {
+                "num_packets_dropped": num_incorrect_magic_words,
+                "num_bytes_dropped": num_incorrect_magic_word_bytes,
+            },
+            "invalid_packet_length": {
+                "num_packets_dropped": num_invalid_packet_lengths,
+                "num_bytes_dropped": num_invalid_packet_length_bytes,
+            },
+            "incorrect_checksum": {
+                "num_packets_dropped": num_incorrect_checksums,
+                "num_bytes_dropped": num_incorrect_checksum_bytes,
+            },
+        },
+        "num_bytes_sorted": bytes_idx,
+        "is_in_corrupted_run": is_in_corrupted_run,
     }
 
 
-cpdef dict parse_stim_data(unsigned char [:] stim_packet_bytes, int num_stim_packets):
-    cdef dict stim_data_dict = {}  # dict for storing stim statuses
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef int parse_magnetometer_data(
+    unsigned char [::1] mag_data_packet_bytes,
+    int num_mag_data_packets,
+    int64_t [::1] time_indices,
+    uint16_t [:, :, ::1] data,
+    int start_idx=0,
+) except -1:
+    """Decode magnetometer data packet payloads into the given arrays.
+
+    All packets must be the same length. Each payload is a time index followed by the sensor data of each
+    module in order of module ID. If a module reports more than one sensor, only the first is decoded. Time
+    offsets are not decoded.
 
-    # Tanner (10/15/21): No need to heavily optimize this function until stim waveforms are streamed
-    cdef int64_t time_index
-    cdef int num_status_updates
+    Args:
+        mag_data_packet_bytes: the concatenated payloads of all magnetometer data packets
+        num_mag_data_packets: the number of packets in mag_data_packet_bytes
+        time_indices: the array to write the time index of each packet into
+        data: the array of shape (num_wells, num_channels, num_samples) to write the data points into
+        start_idx: the sample idx to write the data of the first packet to
+
+    Returns:
+        The number of samples written to each array
+    """
+    if num_mag_data_packets == 0:
+        return 0
+
+    cdef int num_bytes = mag_data_packet_bytes.shape[0]
+    if num_bytes % num_mag_data_packets != 0:
+        raise ValueError(f"{num_bytes} bytes cannot be evenly split into {num_mag_data_packets} packets")
+    cdef int packet_len = num_bytes // num_mag_data_packets
+
+    cdef int module_data_len = (packet_len - TIME_INDEX_LEN) // TOTAL_NUM_WELLS_C_INT
+    if (
+        module_data_len < <int> sizeof(SensorData)
+        or (packet_len - TIME_INDEX_LEN) % TOTAL_NUM_WELLS_C_INT != 0
+    ):
+        raise ValueError(f"Invalid magnetometer data packet payload length: {packet_len}")
+
+    if data.shape[0] != TOTAL_NUM_WELLS_C_INT or data.shape[1] != NUM_CHANNELS_PER_SENSOR:
+        raise ValueError(
+            f"data array must have shape ({TOTAL_NUM_WELLS_C_INT}, {NUM_CHANNELS_PER_SENSOR}, num_samples)"
+        )
+    if start_idx < 0:
+        raise ValueError(f"Invalid start_idx: {start_idx}")
+    cdef int stop_idx = start_idx + num_mag_data_packets
+    if stop_idx > data.shape[2] or stop_idx > time_indices.shape[0]:
+        raise ValueError(f"Not enough space to write {num_mag_data_packets} samples starting at idx {start_idx}")
+
+    cdef int packet_idx, module_id, well_idx, channel_idx, sample_idx
+    cdef unsigned char *packet_start
+    cdef SensorData *sensor_data
+
+    with nogil:
+        for packet_idx in range(num_mag_data_packets):
+            packet_start = &mag_data_packet_bytes[packet_idx * packet_len]
+            sample_idx = start_idx + packet_idx
+
+            time_indices[sample_idx] = (<int64_t *> packet_start)[0]
+
+            for module_id in range(TOTAL_NUM_WELLS_C_INT):
+                sensor_data = <SensorData *> (packet_start + TIME_INDEX_LEN + module_id * module_data_len)
+                well_idx = MODULE_ID_TO_WELL_IDX[module_id]
+                for channel_idx in range(NUM_CHANNELS_PER_SENSOR):
+                    data[well_idx, channel_idx, sample_idx] = sensor_data.data_points[channel_idx]
+
+    return num_mag_data_packets
+
+
+cpdef tuple parse_stim_data(unsigned char [::1] stim_packet_bytes, int num_stim_packets):
+    """Parse all stim status updates into a single structured array.
+
+    The packed layout of STIM_STATUS_UPDATE_DTYPE matches the layout of a status update in a stim packet, so
+    all status updates in each packet are copied into the array at once.
+
+    Args:
+        stim_packet_bytes: the concatenated payloads of all stim packets
+        num_stim_packets: the number of packets in stim_packet_bytes
+
+    Returns:
+        A tuple containing an array of all status updates in the order they were received, and a dict mapping
+        each protocol idx to an array of its status updates in the order they were received
+    """
+    # each packet has a single byte containing the number of status updates in it
+    cdef int num_status_updates_total = (len(stim_packet_bytes) - num_stim_packets) // STIM_STATUS_UPDATE_LEN
+    status_updates = np.empty(num_status_updates_total, dtype=STIM_STATUS_UPDATE_DTYPE)
+
+    cdef unsigned char [::1] status_update_bytes = status_updates.view(np.uint8)
+    cdef int num_status_update_bytes
     cdef int stim_packet_idx
     cdef int bytes_idx = 0
+    cdef int status_update_bytes_idx = 0
 
     for stim_packet_idx in range(num_stim_packets):
-        num_status_updates = stim_packet_bytes[bytes_idx]
+        num_status_update_bytes = stim_packet_bytes[bytes_idx] * STIM_STATUS_UPDATE_LEN
         bytes_idx += 1
-        for _ in range(num_status_updates):
-            # TODO find a way to share this code with parse_stim_offline_statuses
-            protocol_idx = stim_packet_bytes[bytes_idx]
-            time_index = (<uint64_t *> &stim_packet_bytes[bytes_idx + 1])[0]
-            stim_status = stim_packet_bytes[bytes_idx + 2]
-            subprotocol_idx = stim_packet_bytes[bytes_idx + 2 + TIME_INDEX_LEN]
-            bytes_idx += 2 + TIME_INDEX_LEN + 1
-
-            if protocol_idx not in stim_data_dict:
-                stim_data_dict[protocol_idx] = [[time_index], [subprotocol_idx]]
-            else:
-                stim_data_dict[protocol_idx][0].append(time_index)
-                stim_data_dict[protocol_idx][1].append(subprotocol_idx)
-
-    # convert stim status lists to arrays
-    for protocol_idx, stim_statuses in stim_data_dict.items():
-        stim_data_dict[protocol_idx] = np.array(stim_statuses, dtype=np.int64)  # Tanner (10/18/21): using int64 here since top bit will never be used and these values can be negative
-
-    return stim_data_dict
+        if status_update_bytes_idx + num_status_update_bytes > len(status_update_bytes):
+            raise ValueError(f"Stim packet {stim_packet_idx} contains more status updates than bytes")
+        # indexing the buffers is bounds checked, so packets without any status updates must be skipped since
+        # the index may be at the end of the buffers
+        if num_status_update_bytes == 0:
+            continue
+        memcpy(
+            &status_update_bytes[status_update_bytes_idx],
+            &stim_packet_bytes[bytes_idx],
+            num_status_update_bytes,
+        )
+        bytes_idx += num_status_update_bytes
+        status_update_bytes_idx += num_status_update_bytes
+
+    # sort by protocol, keeping the updates for each protocol in the order they were received, so that each
+    # protocol's updates can be given as a view
+    sorted_status_updates = status_updates[np.argsort(status_updates["protocol_idx"], kind="stable")]
+    protocol_indices, protocol_start_indices = np.unique(sorted_status_updates["protocol_idx"], return_index=True)
+    status_updates_by_protocol = {
+        int(protocol_idx): protocol_status_updates
+        for protocol_idx, protocol_status_updates in zip(
+            protocol_indices, np.split(sorted_status_updates, protocol_start_indices[1:])
+        )
+    }
+
+    return status_updates, status_updates_by_protocol
+
+
+cdef class PacketBuilder:
+    """Builds packets to send to the instrument in a reusable buffer.
+
+    The magic word is only written into the buffer and included in the checksum once, so building a packet
+    only requires writing and checksumming the rest of it.
+
+    Timestamps are taken from a monotonic clock anchored to the wall clock when the builder is created.
+    """
+
+    cdef bytearray _buffer
+    cdef unsigned char[::1] _buffer_view
+    cdef uLong _magic_word_crc
+    cdef int64_t _anchor_timestamp
+    cdef int64_t _anchor_monotonic_ns
+
+    def __init__(self):
+        self._buffer = bytearray(MAX_PACKET_SIZE)
+        self._buffer_view = self._buffer
+        memcpy(&self._buffer_view[0], MAGIC_WORD, MAGIC_WORD_LEN)
+        self._magic_word_crc = crc32(crc32(0, Z_NULL, 0), &self._buffer_view[0], MAGIC_WORD_LEN)
+
+        self._anchor_monotonic_ns = time.monotonic_ns()
+        self._anchor_timestamp = (
+            datetime.datetime.now(tz=datetime.timezone.utc) - SERIAL_COMM_TIMESTAMP_EPOCH
+        ) // datetime.timedelta(microseconds=1)
+
+    cpdef int64_t get_timestamp(self):
+        """Return the number of microseconds since SERIAL_COMM_TIMESTAMP_EPOCH."""
+        return self._anchor_timestamp + (time.monotonic_ns() - self._anchor_monotonic_ns) // 1000
+
+    cpdef bytes build(self, int packet_type, const unsigned char[::1] packet_payload=b"", timestamp=None):
+        """Create a data packet to send to the instrument.
+
+        If no timestamp is given, the current timestamp is used.
+        """
+        cdef int payload_len = len(packet_payload)
+        if payload_len > MAX_PAYLOAD_SIZE:
+            raise ValueError(f"Payload length {payload_len} exceeds max of {MAX_PAYLOAD_SIZE}")
+
+        cdef Packet *p = <Packet *> &self._buffer_view[0]
+        p.packet_len = SERIAL_COMM_PAYLOAD_INDEX_C_INT - PACKET_HEADER_LEN + payload_len + SERIAL_COMM_CHECKSUM_LENGTH_BYTES_C_INT
+        p.timestamp = self.get_timestamp() if timestamp is None else timestamp
+        p.packet_type = packet_type
+        if payload_len:
+            memcpy(&self._buffer_view[SERIAL_COMM_PAYLOAD_INDEX_C_INT], &packet_payload[0], payload_len)
+
+        cdef int checksum_idx = SERIAL_COMM_PAYLOAD_INDEX_C_INT + payload_len
+        cdef uLong crc = crc32(
+            self._magic_word_crc, &self._buffer_view[MAGIC_WORD_LEN], checksum_idx - MAGIC_WORD_LEN
+        )
+        (<uint32_t *> &self._buffer_view[checksum_idx])[0] = crc
+
+        return PyBytes_FromStringAndSize(
+            <char *> &self._buffer_view[0], checksum_idx + SERIAL_COMM_CHECKSUM_LENGTH_BYTES_C_INT
+        )
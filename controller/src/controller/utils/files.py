@@ -3,26 +3,75 @@ import base64
 import hashlib
 import os
 from typing import Any
+from typing import BinaryIO
+import zipfile
 
 from controller.constants import CURRENT_SOFTWARE_VERSION
 
 
+def _create_md5() -> "hashlib._Hash":
+    return hashlib.md5(usedforsecurity=False)
+
+
 def get_file_md5(file_path: str) -> str:
     """Generate md5 of zip file.
 
+    The file is read in chunks so that it never has to be fully loaded into memory.
+
     Args:
         file_path: path to zip file.
     """
     with open(file_path, "rb") as file_to_read:
-        contents = file_to_read.read()
-        md5 = hashlib.md5(  # nosec B324 B303 # Tanner (2/4/21): Bandit blacklisted this hash function for cryptographic security reasons that do not apply to the desktop app.
-            contents
-        ).digest()
-        md5s = base64.b64encode(md5).decode()
+        md5 = hashlib.file_digest(file_to_read, _create_md5).digest()
+    md5s = base64.b64encode(md5).decode()
 
     return md5s
 
 
+class _Md5Writer:
+    """Write to a file while updating an md5 of everything written to it.
+
+    This intentionally does not support tell or seek so that ZipFile writes the zip as a stream. Otherwise it
+    would seek back to update headers that have already been hashed.
+    """
+
+    def __init__(self, file_handle: BinaryIO) -> None:
+        self._file_handle = file_handle
+        self._md5 = _create_md5()
+
+    def write(self, data: bytes) -> int:
+        self._md5.update(data)
+        return self._file_handle.write(data)
+
+    def flush(self) -> None:
+        self._file_handle.flush()
+
+    def get_md5s(self) -> str:
+        return base64.b64encode(self._md5.digest()).decode()
+
+
+def create_zip_file_and_get_md5(dir_path: str, zip_file_path: str) -> str:
+    """Compress all files in the given folder into a zip file, hashing it as it is written.
+
+    Each file is compressed in small chunks, so memory use does not depend on the size of the files. This
+    is blocking, so it should be run in a thread when called from a coroutine.
+
+    Args:
+        dir_path: path to the folder to zip. Assumes the folder only contains files.
+        zip_file_path: path to write the zip file to.
+
+    Returns:
+        The base64 encoded md5 of the zip file, the same as get_file_md5 would return for it
+    """
+    with open(zip_file_path, "wb") as zip_file_handle:
+        md5_writer = _Md5Writer(zip_file_handle)
+        with zipfile.ZipFile(md5_writer, "w", compression=zipfile.ZIP_DEFLATED) as zf:  # type: ignore  # ZipFile only needs write and flush
+            for file_name in os.listdir(dir_path):
+                zf.write(os.path.join(dir_path, file_name), file_name)
+
+    return md5_writer.get_md5s()
+
+
 def check_for_local_firmware_versions(fw_update_dir_path: str) -> dict[str, Any] | None:
     if not os.path.isdir(fw_update_dir_path):
         return None
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""On-disk cache of downloaded firmware files."""
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+from typing import AsyncIterator
+import uuid
+
+from ..constants import FW_CACHE_MAX_SIZE_BYTES
+
+
+logger = logging.getLogger(__name__)
+
+
+INDEX_FILE_NAME = "index.json"
+OBJECTS_SUBDIR = "objects"
+
+
+def _get_key(fw_type: str, version: str) -> str:
+    return f"{fw_type}-{version}"
+
+
+class FirmwareCache:
+    """An LRU cache of firmware files stored on disk, keyed by firmware type and version.
+
+    Each file is stored under the sha256 of its contents, so the contents can be verified each time they are
+    read and identical files are only stored once. The index mapping each firmware type and version to a
+    file is saved alongside the files, in order from least to most recently used. The least recently used
+    entries are evicted once the total size of the files exceeds max_size_bytes.
+    """
+
+    def __init__(self, cache_dir_path: str, max_size_bytes: int = FW_CACHE_MAX_SIZE_BYTES) -> None:
+        self._cache_dir_path = cache_dir_path
+        self._objects_dir_path = os.path.join(cache_dir_path, OBJECTS_SUBDIR)
+        self._index_file_path = os.path.join(cache_dir_path, INDEX_FILE_NAME)
+        self._max_size_bytes = max_size_bytes
+
+        # values are the sha256 and size of the file
+        self._entries: OrderedDict[str, tuple[str, int]] = OrderedDict()
+
+        # metrics
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+
+        os.makedirs(self._objects_dir_path, exist_ok=True)
+        self._load_index()
+        self._remove_unused_files()
+
+    @property
+    def size_bytes(self) -> int:
+        # identical files for different versions share the same object, so only count each object once
+        return sum({digest: size_bytes for digest, size_bytes in self._entries.values()}.values())
+
+    def get(self, fw_type: str, version: str) -> bytes | None:
+        key = _get_key(fw_type, version)
+
+        if not (entry := self._entries.get(key)):
+            self.num_misses += 1
+            return None
+
+        digest, _ = entry
+        try:
+            with open(self._get_object_file_path(digest), "rb") as object_file:
+                contents = object_file.read()
+        except OSError:
+            contents = None
+
+        if contents is None or hashlib.sha256(contents).hexdigest() != digest:
+            logger.error(
+                f"Cached firmware file for {key} is missing or corrupted, removing it from the cache"
+            )
+            self._remove_entry(key)
+            self._save_index()
+            self.num_misses += 1
+            return None
+
+        self.num_hits += 1
+        self._entries.move_to_end(key)
+        self._save_index()
+        return contents
+
+    async def add_from_stream(self, fw_type: str, version: str, chunks: AsyncIterator[bytes]) -> bytes:
+        """Write the given chunks to the cache as they arrive, hashing them along the way.
+
+        Nothing is added to the cache if the stream raises an error.
+
+        Returns:
+            The contents of the file that was added
+        """
+        tmp_file_path = os.path.join(self._cache_dir_path, f"{uuid.uuid4()}.tmp")
+        sha256 = hashlib.sha256()
+        size_bytes = 0
+
+        try:
+            with open(tmp_file_path, "wb") as tmp_file:
+                async for chunk in chunks:
+                    sha256.update(chunk)
+                    tmp_file.write(chunk)
+                    size_bytes += len(chunk)
+        except BaseException:
+            os.remove(tmp_file_path)
+            raise
+
+        # the existing entry must be removed first since it may have the same object as the new one
+        key = _get_key(fw_type, version)
+        self._remove_entry(key)
+
+        digest = sha256.hexdigest()
+        object_file_path = self._get_object_file_path(digest)
+        os.replace(tmp_file_path, object_file_path)
+        self._entries[key] = (digest, size_bytes)
+
+        # always keep the entry just added, even if it is larger than the max size on its own
+        while self.size_bytes > self._max_size_bytes and len(self._entries) > 1:
+            self._remove_entry(next(iter(self._entries)))
+            self.num_evictions += 1
+
+        self._save_index()
+
+        with open(object_file_path, "rb") as object_file:
+            return object_file.read()
+
+    def get_metrics(self) -> dict[str, int]:
+        return {
+            "num_entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_size_bytes": self._max_size_bytes,
+            "num_hits": self.num_hits,
+            "num_misses": self.num_misses,
+            "num_evictions": self.num_evictions,
+        }
+
+    # HELPERS
+
+    def _get_object_file_path(self, digest: str) -> str:
+        return os.path.join(self._objects_dir_path, digest)
+
+    def _remove_entry(self, key: str) -> None:
+        if not (entry := self._entries.pop(key, None)):
+            return
+
+        digest, _ = entry
+        # identical files for different versions share the same object
+        if all(other_digest != digest for other_digest, _ in self._entries.values()):
+            try:
+                os.remove(self._get_object_file_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _load_index(self) -> None:
+        if not os.path.isfile(self._index_file_path):
+            return
+
+        try:
+            with open(self._index_file_path) as index_file:
+                self._entries = OrderedDict(
+                    (key, (digest, size_bytes)) for key, digest, size_bytes in json.load(index_file)
+                )
+        except (OSError, ValueError, TypeError):
+            logger.exception("Unable to load firmware cache index, clearing cache")
+            self._entries = OrderedDict()
+
+    def _save_index(self) -> None:
+        # write to a temporary file first so that the index is never left partially written
+        tmp_file_path = f"{self._index_file_path}.tmp"
+        with open(tmp_file_path, "w") as index_file:
+            json.dump(
+                [[key, digest, size_bytes] for key, (digest, size_bytes) in self._entries.items()], index_file
+            )
+        os.replace(tmp_file_path, self._index_file_path)
+
+    def _remove_unused_files(self) -> None:
+        """Remove files left behind by interrupted downloads or an index that could not be loaded."""
+        digests_in_use = {digest for digest, _ in self._entries.values()}
+
+        for file_name in os.listdir(self._objects_dir_path):
+            if file_name not in digests_in_use:
+                os.remove(os.path.join(self._objects_dir_path, file_name))
+        for file_name in os.listdir(self._cache_dir_path):
+            if file_name.endswith(".tmp"):
+                os.remove(os.path.join(self._cache_dir_path, file_name))
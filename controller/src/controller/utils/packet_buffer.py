@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Receive buffer for bytes read from the instrument."""
+
+from typing import Any
+
+from ..constants import SERIAL_COMM_PACKET_BUFFER_SIZE_BYTES
+
+
+class SerialPacketBuffer:
+    """Preallocated, reusable buffer that bytes from the instrument are read into.
+
+    Bytes are written to the end of the buffer and parsed in place from the start of it. Once the complete
+    packets have been parsed, only the trailing bytes of the final incomplete packet (if any) are moved back
+    to the start of the buffer.
+    """
+
+    def __init__(self, size: int = SERIAL_COMM_PACKET_BUFFER_SIZE_BYTES) -> None:
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._num_bytes = 0
+        # metrics
+        self._high_water_mark = 0
+        self._num_compactions = 0
+        self._num_bytes_compacted = 0
+
+    def __len__(self) -> int:
+        return self._num_bytes
+
+    @property
+    def capacity(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def num_bytes_free(self) -> int:
+        return self.capacity - self._num_bytes
+
+    @property
+    def unread_bytes(self) -> memoryview:
+        """View of all bytes that have been written and not yet consumed.
+
+        This view must not be held onto after more bytes are written or consumed.
+        """
+        return self._view[: self._num_bytes]
+
+    def get_write_view(self, max_num_bytes: int | None = None) -> memoryview:
+        """Return a view of the free space at the end of the buffer.
+
+        After writing into this view, `commit` must be called with the number of bytes written.
+        """
+        stop_idx = self.capacity
+        if max_num_bytes is not None:
+            stop_idx = min(stop_idx, self._num_bytes + max_num_bytes)
+        return self._view[self._num_bytes : stop_idx]
+
+    def commit(self, num_bytes: int) -> None:
+        """Mark the given number of bytes written into the write view as unread."""
+        if num_bytes > self.num_bytes_free:
+            raise ValueError(f"Cannot commit {num_bytes} bytes, only {self.num_bytes_free} bytes free")
+        self._num_bytes += num_bytes
+        self._high_water_mark = max(self._high_water_mark, self._num_bytes)
+
+    def write(self, data: bytes | bytearray | memoryview) -> None:
+        num_bytes = len(data)
+        if num_bytes > self.num_bytes_free:
+            raise ValueError(f"Cannot write {num_bytes} bytes, only {self.num_bytes_free} bytes free")
+        self._view[self._num_bytes : self._num_bytes + num_bytes] = data
+        self.commit(num_bytes)
+
+    def consume(self, num_bytes: int) -> None:
+        """Discard the given number of bytes from the start of the buffer.
+
+        Any bytes remaining after them are moved to the start of the buffer.
+        """
+        if num_bytes > self._num_bytes:
+            raise ValueError(f"Cannot consume {num_bytes} bytes, only {self._num_bytes} bytes unread")
+
+        num_bytes_remaining = self._num_bytes - num_bytes
+        if num_bytes_remaining and num_bytes:
+            # memoryview assignment handles overlapping regions correctly
+            self._view[:num_bytes_remaining] = self._view[num_bytes : self._num_bytes]
+            self._num_bytes_compacted += num_bytes_remaining
+            self._num_compactions += 1
+        self._num_bytes = num_bytes_remaining
+
+    def clear(self) -> None:
+        self._num_bytes = 0
+
+    def get_metrics(self) -> dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "high_water_mark": self._high_water_mark,
+            "num_compactions": self._num_compactions,
+            "num_bytes_compacted": self._num_bytes_compacted,
+        }
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Queues used to pass messages between subsystems."""
+
+import asyncio
+from collections import deque
+from typing import Any
+from typing import Mapping
+
+from ..constants import QueuePolicies
+from ..constants import SYSTEM_QUEUE_POLICIES
+
+
+def get_msg_type(msg: dict[str, Any]) -> str:
+    msg_type: str = msg.get("communication_type", msg.get("command", ""))
+    return msg_type
+
+
+class BoundedQueue(asyncio.Queue[dict[str, Any]]):
+    """A queue with a max size that handles messages put into it while full based on their type.
+
+    Messages are dropped or merged only when the queue is full, and only ever with queued messages of the same
+    type, so the order of messages of different types is always preserved. The exception is a queue that
+    does not block, which drops its oldest message of any type if there is no room for a new message
+    otherwise.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        policies: Mapping[str, QueuePolicies] = SYSTEM_QUEUE_POLICIES,
+        block_when_full: bool = True,
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError(f"Invalid max size: {maxsize}")
+
+        super().__init__(maxsize)
+        self._policies = policies
+        self._block_when_full = block_when_full
+
+        # metrics
+        self.max_size_reached = 0
+        self.num_msgs_dropped = 0
+        self.num_msgs_coalesced = 0
+        self.num_blocked_puts = 0
+
+    def _init(self, maxsize: int) -> None:
+        # the same storage asyncio.Queue uses, declared here since the policies need to access it directly
+        self._queue: deque[dict[str, Any]] = deque()
+
+    async def put(self, item: dict[str, Any]) -> None:
+        if self.full():
+            if self._apply_policy(item):
+                return
+            if self.full():
+                self.num_blocked_puts += 1
+        await super().put(item)
+
+    def put_nowait(self, item: dict[str, Any]) -> None:
+        if self.full() and self._apply_policy(item):
+            return
+        super().put_nowait(item)
+        self.max_size_reached = max(self.max_size_reached, self.qsize())
+
+    def get_diagnostics(self) -> dict[str, int]:
+        return {
+            "size": self.qsize(),
+            "max_size": self.maxsize,
+            "max_size_reached": self.max_size_reached,
+            "num_msgs_dropped": self.num_msgs_dropped,
+            "num_msgs_coalesced": self.num_msgs_coalesced,
+            "num_blocked_puts": self.num_blocked_puts,
+        }
+
+    def _apply_policy(self, item: dict[str, Any]) -> bool:
+        """Try to make room for the item in the full queue.
+
+        Returns True if the item was merged into a queued message, and so does not need to be put into the queue.
+        """
+        msg_type = get_msg_type(item)
+
+        match self._policies.get(msg_type):
+            case QueuePolicies.DROP_OLDEST:
+                for idx, queued_msg in enumerate(self._queue):
+                    if get_msg_type(queued_msg) == msg_type:
+                        self._drop(idx)
+                        return False
+            case QueuePolicies.COALESCE:
+                for idx in range(len(self._queue) - 1, -1, -1):
+                    if get_msg_type(queued_msg := self._queue[idx]) == msg_type:
+                        self._queue[idx] = {**queued_msg, **item}
+                        self.num_msgs_coalesced += 1
+                        return True
+
+        if not self._block_when_full:
+            self._drop(0)
+        return False
+
+    def _drop(self, idx: int) -> None:
+        del self._queue[idx]
+        self.num_msgs_dropped += 1
+        # the dropped message will never be marked as done by a consumer
+        self.task_done()
+
+
+def get_queue_diagnostics(
+    queues: dict[str, dict[str, asyncio.Queue[dict[str, Any]]]]
+) -> dict[str, dict[str, dict[str, int]]]:
+    """Get the depth and drop counters of each BoundedQueue created by create_system_queues."""
+    return {
+        direction: {
+            subsystem: queue.get_diagnostics()
+            for subsystem, queue in subsystem_queues.items()
+            if isinstance(queue, BoundedQueue)
+        }
+        for direction, subsystem_queues in queues.items()
+    }
@@ -30,8 +30,11 @@ from ..constants import NUM_WELLS
 from ..constants import PROTOCOL_STATUS_BYTES_LEN
 from ..constants import SERIAL_COMM_CHECKSUM_LENGTH_BYTES
 from ..constants import SERIAL_COMM_MAGIC_WORD_BYTES
+from ..constants import SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES
 from ..constants import SERIAL_COMM_MODULE_ID_TO_WELL_IDX
 from ..constants import SERIAL_COMM_OKAY_CODE
+from ..constants import SERIAL_COMM_PACKET_HEADER_LENGTH_BYTES
+from ..constants import SERIAL_COMM_PACKET_METADATA_LENGTH_BYTES
 from ..constants import SERIAL_COMM_PACKET_REMAINDER_SIZE_LENGTH_BYTES
 from ..constants import SERIAL_COMM_STATUS_CODE_LENGTH_BYTES
 from ..constants import SERIAL_COMM_TIMESTAMP_EPOCH
@@ -116,6 +119,62 @@ def validate_checksum(comm_from_pc: bytes) -> bool:
     return actual_checksum == expected_checksum
 
 
+def get_valid_packet_length(data: bytes | bytearray | memoryview, start_idx: int = 0) -> int | None:
+    """Check if a complete packet with a valid magic word, length, and checksum starts at the given idx.
+
+    Returns:
+        The full length of the packet if it is valid, 0 if it is invalid, or None if more bytes are needed to
+        tell
+    """
+    magic_word_end_idx = start_idx + len(SERIAL_COMM_MAGIC_WORD_BYTES)
+    header_end_idx = start_idx + SERIAL_COMM_PACKET_HEADER_LENGTH_BYTES
+    if len(data) < header_end_idx:
+        return None
+    if data[start_idx:magic_word_end_idx] != SERIAL_COMM_MAGIC_WORD_BYTES:
+        return 0
+
+    packet_len = SERIAL_COMM_PACKET_HEADER_LENGTH_BYTES + int.from_bytes(
+        data[magic_word_end_idx:header_end_idx], byteorder="little"
+    )
+    if not SERIAL_COMM_PACKET_METADATA_LENGTH_BYTES <= packet_len <= SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES:
+        return 0
+
+    packet_end_idx = start_idx + packet_len
+    if len(data) < packet_end_idx:
+        return None
+    if not validate_checksum(data[start_idx:packet_end_idx]):
+        return 0
+
+    return packet_len
+
+
+def find_first_valid_packet(data: bytes | bytearray | memoryview) -> tuple[int, bool]:
+    """Search for the first complete packet with a valid checksum.
+
+    Candidate packets are located with a bulk search for the magic word rather than checking one byte at a
+    time.
+
+    Returns:
+        A tuple containing an idx and whether or not a valid packet starts at that idx. If a valid packet is not
+        found, the idx is either that of a candidate packet which is not yet complete, or of the first byte
+        that could still be part of a magic word. Either way, all bytes before the idx can be discarded.
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+
+    idx = 0
+    while (idx := data.find(SERIAL_COMM_MAGIC_WORD_BYTES, idx)) != -1:
+        packet_len = get_valid_packet_length(data, idx)
+        if packet_len is None:
+            return idx, False
+        if packet_len:
+            return idx, True
+        idx += 1
+
+    # the final bytes may be the beginning of a magic word, so keep them
+    return max(0, len(data) - len(SERIAL_COMM_MAGIC_WORD_BYTES) + 1), False
+
+
 def parse_instrument_event_info(event_info: bytes) -> dict[str, Any]:
     return {
         "prev_main_status_update_timestamp": int.from_bytes(event_info[:8], byteorder="little"),
@@ -361,7 +420,7 @@ def convert_subprotocol_node_dict_to_bytes(
 ) -> tuple[bytes, int]:
     is_loop = subprotocol_node_dict["type"] == "loop"
 
-    subprotocol_node_bytes = bytes([is_loop])
+    subprotocol_node_bytes = bytearray([is_loop])
 
     curr_idx = start_idx
     if is_loop:
@@ -377,7 +436,7 @@ def convert_subprotocol_node_dict_to_bytes(
         subprotocol_node_bytes += convert_subprotocol_pulse_dict_to_bytes(subprotocol_node_dict, is_voltage)
         curr_idx += 1
 
-    return subprotocol_node_bytes, curr_idx
+    return bytes(subprotocol_node_bytes), curr_idx
 
 
 def _convert_subprotocol_node_bytes_to_dict(
@@ -415,8 +474,8 @@ def convert_stim_dict_to_bytes(stim_dict: dict[str, Any]) -> bytes:
 
     Assumes the stimulation dictionary given does not have any issues.
     """
-    # add bytes for protocol definitions
-    stim_bytes = bytes([len(stim_dict["protocols"])])  # number of unique protocols
+    # add bytes for protocol definitions. Using a bytearray since appending to bytes copies it every time
+    stim_bytes = bytearray([len(stim_dict["protocols"])])  # number of unique protocols
     for idx, protocol_dict in enumerate(stim_dict["protocols"]):
         is_voltage_controlled = protocol_dict["stimulation_type"] == "V"
 
@@ -439,7 +498,7 @@ def convert_stim_dict_to_bytes(stim_dict: dict[str, Any]) -> bytes:
         ]
         stim_bytes += bytes([len(module_ids_assigned)] + sorted(module_ids_assigned))
 
-    return stim_bytes
+    return bytes(stim_bytes)
 
 
 def convert_stim_bytes_to_dict(stim_bytes: bytes) -> dict[str, Any]:
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Event-driven reads from a serial port."""
+
+import asyncio
+import threading
+
+import serial
+from stdlib_utils import is_system_windows
+
+from ..constants import SERIAL_COMM_READ_TIMEOUT
+
+
+class EventDrivenSerialReader:
+    """Reads bytes from a serial port as soon as they arrive instead of polling for them.
+
+    On Windows, a background thread blocks on reads from the port. Everywhere else, the port's file
+    descriptor is watched by the event loop. Either way, all bytes read are put into a queue that
+    `readinto_async` waits on. Once the port hangs up, every read returns 0 bytes.
+    """
+
+    def __init__(self, serial_port: serial.Serial) -> None:
+        self._serial_port = serial_port
+
+        self._chunks: asyncio.Queue[bytes | Exception] = asyncio.Queue()
+        self._unread_chunk = memoryview(bytes(0))
+        # an error or the end of the stream that was taken off the queue, but not yet returned by readinto_async
+        self._deferred_chunk: bytes | Exception | None = None
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._fd: int | None = None
+        self._reader_thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._loop is not None
+
+    def start(self) -> None:
+        if self.is_running:
+            raise NotImplementedError("Reader is already running")
+
+        self._loop = asyncio.get_running_loop()
+        self._stop_event.clear()
+
+        if is_system_windows():
+            self._reader_thread = threading.Thread(target=self._read_in_thread, daemon=True)
+            self._reader_thread.start()
+        else:
+            self._fd = fd = self._serial_port.fileno()
+            self._loop.add_reader(fd, self._read_available_bytes)
+
+    def stop(self) -> None:
+        if not self._loop:
+            return
+
+        self._stop_watching_fd()
+        if self._reader_thread:
+            self._stop_event.set()
+            # the thread will exit after its current read times out
+            self._reader_thread.join()
+            self._reader_thread = None
+
+        self._loop = None
+
+    async def readinto_async(self, buffer: bytearray | memoryview) -> int:
+        """Wait until bytes are available, then read as many as will fit into the given buffer.
+
+        Returns:
+            The number of bytes read into the buffer. This will only be 0 if the port has hung up
+        """
+        if not len(buffer):
+            return 0
+
+        num_bytes_read = 0
+        if not self._unread_chunk:
+            chunk = self._deferred_chunk if self._deferred_chunk is not None else await self._chunks.get()
+            self._deferred_chunk = None
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                # the port hung up, so keep returning this for every read after it
+                self._deferred_chunk = chunk
+                return 0
+            self._unread_chunk = memoryview(chunk)
+
+        while True:
+            num_bytes_to_copy = min(len(buffer) - num_bytes_read, len(self._unread_chunk))
+            buffer[num_bytes_read : num_bytes_read + num_bytes_to_copy] = self._unread_chunk[
+                :num_bytes_to_copy
+            ]
+            self._unread_chunk = self._unread_chunk[num_bytes_to_copy:]
+            num_bytes_read += num_bytes_to_copy
+
+            # also copy any other chunks that have already arrived
+            if num_bytes_read == len(buffer) or self._chunks.empty():
+                break
+            chunk = self._chunks.get_nowait()
+            if isinstance(chunk, Exception) or not chunk:
+                # return the bytes already copied first, the next read will handle this
+                self._deferred_chunk = chunk
+                break
+            self._unread_chunk = memoryview(chunk)
+
+        return num_bytes_read
+
+    def _stop_watching_fd(self) -> None:
+        if self._loop and self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+
+    def _read_available_bytes(self) -> None:
+        try:
+            # if the file descriptor is readable but no bytes are waiting, the port has hung up. Reading at
+            # least 1 byte makes sure that this is detected instead of the event loop calling this repeatedly
+            data = self._serial_port.read(max(1, self._serial_port.in_waiting))
+        except OSError as e:  # serial.SerialException is a subclass of OSError
+            # the port can't be read from again, so stop watching it and wake up readinto_async. The error is
+            # raised by the next read, and all reads after that will return 0 bytes
+            self._stop_watching_fd()
+            self._chunks.put_nowait(e)
+            self._chunks.put_nowait(bytes(0))
+            return
+
+        if not data:
+            self._stop_watching_fd()
+        # an empty chunk marks the end of the stream
+        self._chunks.put_nowait(data)
+
+    def _read_in_thread(self) -> None:
+        if not self._loop:
+            raise NotImplementedError("_loop should never be None here")
+
+        while not self._stop_event.is_set():
+            try:
+                # block until at least one byte is available, then also grab everything else that has arrived
+                data = self._serial_port.read(max(1, self._serial_port.in_waiting))
+            except serial.SerialException as e:
+                self._loop.call_soon_threadsafe(self._chunks.put_nowait, e)
+                # wait a little bit before reading again
+                self._stop_event.wait(SERIAL_COMM_READ_TIMEOUT)
+                continue
+            if data:
+                self._loop.call_soon_threadsafe(self._chunks.put_nowait, data)
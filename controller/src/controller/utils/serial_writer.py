@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Coalesced writes to a serial port."""
+
+import asyncio
+import logging
+from time import perf_counter
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingSerialWriter:
+    """Writes packets to a serial port from a single task.
+
+    All packets that are queued while the task is waiting, which includes all packets queued in the same
+    iteration of the event loop, are combined into a single write.
+    """
+
+    def __init__(self, write_async: Callable[[bytes], Awaitable[int]]) -> None:
+        self._write_async = write_async
+
+        self._packet_queue: asyncio.Queue[tuple[bytes, float, asyncio.Future[None]]] = asyncio.Queue()
+        self._writer_task: asyncio.Task[None] | None = None
+
+        # metrics
+        self._num_writes = 0
+        self._num_packets_written = 0
+        self._num_bytes_written = 0
+        self._max_write_size = 0
+        self._max_num_packets_per_write = 0
+        self._total_queue_latency = 0.0
+        self._max_queue_latency = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._writer_task is not None
+
+    def start(self) -> None:
+        if self.is_running:
+            raise NotImplementedError("Writer is already running")
+        self._writer_task = asyncio.create_task(self._write_queued_packets())
+
+    async def stop(self) -> None:
+        if not self._writer_task:
+            return
+
+        self._writer_task.cancel()
+        await asyncio.gather(self._writer_task, return_exceptions=True)
+        self._writer_task = None
+
+        # nothing else will write these packets, so make sure nothing waits on them forever
+        while not self._packet_queue.empty():
+            *_, write_complete = self._packet_queue.get_nowait()
+            write_complete.cancel()
+
+    async def send(self, packet: bytes) -> None:
+        """Queue the given packet and wait for it to be written."""
+        await self.send_many([packet])
+
+    async def send_many(self, packets: Sequence[bytes]) -> None:
+        """Queue the given packets and wait for them to be written.
+
+        The packets are always written in the given order in a single write.
+        """
+        if not self._writer_task:
+            raise NotImplementedError("Writer must be running to send packets")
+
+        loop = asyncio.get_running_loop()
+        queued_at = perf_counter()
+
+        write_completes = []
+        for packet in packets:
+            write_complete = loop.create_future()
+            self._packet_queue.put_nowait((packet, queued_at, write_complete))
+            write_completes.append(write_complete)
+
+        await asyncio.gather(*write_completes)
+
+    def get_metrics(self) -> dict[str, Any]:
+        return {
+            "num_writes": self._num_writes,
+            "num_packets_written": self._num_packets_written,
+            "num_bytes_written": self._num_bytes_written,
+            "max_write_size": self._max_write_size,
+            "max_num_packets_per_write": self._max_num_packets_per_write,
+            "mean_queue_latency_seconds": self._total_queue_latency / max(1, self._num_packets_written),
+            "max_queue_latency_seconds": self._max_queue_latency,
+        }
+
+    # INFINITE TASKS
+
+    async def _write_queued_packets(self) -> None:
+        while True:
+            queued_packets = [await self._packet_queue.get()]
+            while not self._packet_queue.empty():
+                queued_packets.append(self._packet_queue.get_nowait())
+
+            try:
+                await self._write_packets(queued_packets)
+            except asyncio.CancelledError:
+                for *_, write_complete in queued_packets:
+                    write_complete.cancel()
+                raise
+            except Exception as e:
+                # the error is raised to all senders of the packets, leaving it up to them to handle it
+                for *_, write_complete in queued_packets:
+                    if not write_complete.done():
+                        write_complete.set_exception(e)
+                continue
+
+            for *_, write_complete in queued_packets:
+                if not write_complete.done():
+                    write_complete.set_result(None)
+
+    # HELPERS
+
+    async def _write_packets(self, queued_packets: list[tuple[bytes, float, asyncio.Future[None]]]) -> None:
+        write_start = perf_counter()
+        write_len = await self._write_async(b"".join(packet for packet, *_ in queued_packets))
+
+        queue_latencies = [write_start - queued_at for _, queued_at, _ in queued_packets]
+        self._update_metrics(write_len, queue_latencies)
+        logger.debug(
+            "Wrote %s bytes from %s packets, max queue latency: %.6f seconds",
+            write_len,
+            len(queued_packets),
+            max(queue_latencies),
+        )
+        if write_len == 0:
+            logger.error("Serial data write reporting no bytes written")
+
+    def _update_metrics(self, write_len: int, queue_latencies: list[float]) -> None:
+        self._num_writes += 1
+        self._num_packets_written += len(queue_latencies)
+        self._num_bytes_written += write_len
+        self._max_write_size = max(self._max_write_size, write_len)
+        self._max_num_packets_per_write = max(self._max_num_packets_per_write, len(queue_latencies))
+        self._total_queue_latency += sum(queue_latencies)
+        self._max_queue_latency = max(self._max_queue_latency, max(queue_latencies))
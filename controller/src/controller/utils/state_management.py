@@ -1,61 +1,230 @@
 # -*- coding: utf-8 -*-
 import asyncio
 import collections
+import functools
+from types import MappingProxyType
 from typing import Any
+from typing import Callable
+from typing import Iterable
 from typing import Iterator
+from typing import Mapping
+from typing import TypeVar
 
+from ..constants import SYSTEM_STATE_SUBSCRIPTION_MAX_QUEUE_SIZE
 
-class ReadOnlyDict(collections.abc.Mapping):  # type: ignore  # Tanner (3/16/23): not sure how to add the type here
-    def __init__(self, data: dict[str, Any]):
-        self._data = data
+T = TypeVar("T")
+
+
+def freeze(value: Any) -> Any:
+    """Return an immutable version of the given value.
+
+    Dicts become read-only mappings, lists and tuples become tuples, and sets become frozensets. This is
+    applied recursively to the items they contain. Values that are already frozen are returned as is.
+    """
+    if isinstance(value, MappingProxyType):
+        return value
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    return value
 
-    def __getitem__(self, key: str) -> Any:
-        item = self._data[key]
 
-        if isinstance(item, dict):
-            return ReadOnlyDict(item)
-        if isinstance(item, (list, set)):
-            # Tanner (3/15/23): for now, not worrying about making items inside sequences immutable, just want to make the sequence itself immutable
-            return tuple(item)
+class SystemStateSnapshot(collections.abc.Mapping):  # type: ignore  # Tanner (3/16/23): not sure how to add the type here
+    """An immutable view of the system state at a specific version.
 
-        return item
+    All values are frozen when they are added to the state, so lookups return them directly. Snapshots of
+    different versions share every value that was not updated between them.
+    """
+
+    __slots__ = ("_data", "version", "_derived_values")
+
+    def __init__(self, data: Mapping[str, Any], version: int) -> None:
+        self._data = data
+        self.version = version
+        # values computed from this snapshot, see derived_from_system_state
+        self._derived_values: dict[Callable[..., Any], Any] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
 
     def __iter__(self) -> Iterator[Any]:
-        # TODO see if this is really what we want
         return iter(self._data)
 
-    # TODO implement keys() and values()? need to see if it's fine since this is what gets called
-    # def __iter__(self):
-    #     for key in self._mapping:
-    #         yield self._mapping[key]
-
     def __len__(self) -> int:
         return len(self._data)
 
     def __str__(self) -> str:  # pragma: no cover
-        return str(self._data)
+        return str(dict(self._data))
+
+
+def derived_from_system_state(func: Callable[[SystemStateSnapshot], T]) -> Callable[[SystemStateSnapshot], T]:
+    """Only compute the value returned by the decorated function once per snapshot.
+
+    Since snapshots are immutable, the value can be reused until the version of the system state changes.
+    """
+
+    @functools.wraps(func)
+    def wrapper(system_state: SystemStateSnapshot) -> T:
+        try:
+            return system_state._derived_values[func]  # type: ignore
+        except KeyError:
+            value = system_state._derived_values[func] = func(system_state)
+            return value
+
+    return wrapper
+
+
+class SystemStateSubscription:
+    """Receives the changes made to specific values in the system state.
+
+    All changes made in the same iteration of the event loop are merged into a single diff of the new values.
+    If the max number of diffs are already waiting to be processed, the new diff is merged into the most
+    recent one instead of blocking the update, since the subscriber may be the one updating the state.
+    """
+
+    def __init__(
+        self,
+        keys: Iterable[str] | None,
+        predicate: Callable[[str, Any], bool] | None,
+        max_queue_size: int,
+    ) -> None:
+        if max_queue_size < 1:
+            raise ValueError(f"Invalid max queue size: {max_queue_size}")
+
+        self._keys = frozenset(keys) if keys is not None else None
+        self._predicate = predicate
+        self._max_queue_size = max_queue_size
+
+        self._diffs: collections.deque[dict[str, Any]] = collections.deque()
+        self._diff_available = asyncio.Event()
+        self._pending_diff: dict[str, Any] = {}
+        self._is_flush_scheduled = False
+
+        # metrics
+        self.num_diffs_merged_on_overflow = 0
+
+    def __aiter__(self) -> "SystemStateSubscription":
+        return self
+
+    async def __anext__(self) -> Mapping[str, Any]:
+        return await self.get()
+
+    def qsize(self) -> int:
+        return len(self._diffs)
+
+    async def get(self) -> Mapping[str, Any]:
+        """Wait for the next diff of the subscribed values."""
+        while not self._diffs:
+            self._diff_available.clear()
+            await self._diff_available.wait()
+        return MappingProxyType(self._diffs.popleft())
+
+    def _add_changes(self, changes: Mapping[str, Any]) -> None:
+        """Add the subscribed values in the given changes to the next diff."""
+        if not (matching_changes := self._get_subscribed_values(changes)):
+            return
+
+        self._pending_diff.update(matching_changes)
+        if not self._is_flush_scheduled:
+            self._is_flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush_pending_diff)
+
+    def _add_initial_values(self, values: Mapping[str, Any]) -> None:
+        # there is nothing to merge with, so this diff can be queued immediately
+        if initial_values := self._get_subscribed_values(values):
+            self._pending_diff.update(initial_values)
+            self._flush_pending_diff()
+
+    def _get_subscribed_values(self, values: Mapping[str, Any]) -> dict[str, Any]:
+        return {
+            key: value
+            for key, value in values.items()
+            if (self._keys is None or key in self._keys)
+            and (self._predicate is None or self._predicate(key, value))
+        }
+
+    def _flush_pending_diff(self) -> None:
+        self._is_flush_scheduled = False
+
+        if len(self._diffs) >= self._max_queue_size:
+            self._diffs[-1].update(self._pending_diff)
+            self.num_diffs_merged_on_overflow += 1
+        else:
+            self._diffs.append(self._pending_diff)
+        self._pending_diff = {}
+
+        self._diff_available.set()
 
 
 class SystemStateManager:
+    """Stores the system state as a series of immutable snapshots.
+
+    Each update creates a new snapshot with a higher version. Only the top level of the state is copied, so
+    values that were not updated are shared with the previous snapshot.
+    """
+
     def __init__(self) -> None:
-        self._data: dict[str, Any] = {}
+        self._snapshot = SystemStateSnapshot(MappingProxyType({}), 0)
 
-        self.previous_update_queue: asyncio.Queue[ReadOnlyDict] = asyncio.Queue()
+        self._subscriptions: set[SystemStateSubscription] = set()
 
     def __str__(self) -> str:  # pragma: no cover
-        return str(self._data)
+        return str(self._snapshot)
+
+    @property
+    def data(self) -> SystemStateSnapshot:
+        return self._snapshot
 
     @property
-    def data(self) -> ReadOnlyDict:
-        return ReadOnlyDict(self._data)
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def subscribe(
+        self,
+        keys: Iterable[str] | None = None,
+        predicate: Callable[[str, Any], bool] | None = None,
+        max_queue_size: int = SYSTEM_STATE_SUBSCRIPTION_MAX_QUEUE_SIZE,
+    ) -> SystemStateSubscription:
+        """Subscribe to changes in the system state.
+
+        Args:
+            keys: the keys of the values to receive changes to. If not given, changes to all values are received
+            predicate: if given, a change to a value is only received if this returns True for the key and new value
+            max_queue_size: the max number of diffs that can be waiting to be processed
+
+        The first diff received contains the current values of all subscribed keys.
+        """
+        subscription = SystemStateSubscription(keys, predicate, max_queue_size)
+        subscription._add_initial_values(self._snapshot)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: SystemStateSubscription) -> None:
+        self._subscriptions.discard(subscription)
 
     async def update(self, new_values: dict[str, Any]) -> None:
-        await self.previous_update_queue.put(ReadOnlyDict(new_values))
+        prev_data = self._snapshot._data
+
+        # only values that actually changed are sent to subscribers
+        changes = {
+            key: value
+            for key, value in freeze(new_values).items()
+            if key not in prev_data or prev_data[key] != value
+        }
+        if not changes:
+            return
+
+        self._snapshot = SystemStateSnapshot(
+            MappingProxyType({**prev_data, **changes}), self._snapshot.version + 1
+        )
 
-        # TODO make sure this updates the inner dicts correctly
-        self._data.update(new_values)
+        for subscription in self._subscriptions:
+            subscription._add_changes(changes)
 
-    def get_read_only_copy(self) -> ReadOnlyDict:
+    def get_read_only_copy(self) -> SystemStateSnapshot:
         # Tanner (3/15/23): this may not be necessary, but assuming for now that the data property won't
         # update, so creating this method that returns the data property to gaurantee that the most up to
         # date values can be accessed
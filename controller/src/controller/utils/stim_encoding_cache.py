@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Cache of stim info converted into the format sent to the instrument."""
+
+from collections import OrderedDict
+import hashlib
+import json
+from typing import Any
+from typing import Mapping
+from typing import NamedTuple
+
+from .serial_comm import convert_stim_dict_to_bytes
+from .state_management import freeze
+from .stimulation import chunk_protocols_in_stim_info
+from ..constants import STIM_ENCODING_CACHE_MAX_SIZE_BYTES
+
+
+class EncodedStimInfo(NamedTuple):
+    """The outputs of chunk_protocols_in_stim_info along with the bytes sent to the instrument.
+
+    Everything in here is frozen since the same instance is returned each time the stim info is encoded.
+    """
+
+    chunked_stim_info: Mapping[str, Any]
+    subprotocol_idx_mappings: Mapping[str, Mapping[int, int]]
+    max_subprotocol_idx_counts: Mapping[str, tuple[int, ...]]
+    stim_bytes: bytes
+
+
+def serialize_stim_info(stim_info: dict[str, Any]) -> bytes:
+    """Serialize the stim info so that identical stim info always produces the same bytes."""
+    return json.dumps(stim_info, sort_keys=True, separators=(",", ":")).encode()
+
+
+class StimEncodingCache:
+    """An LRU cache of encoded stim info, keyed by a hash of the stim info's contents.
+
+    The size of each entry is approximated by the length of its serialized stim info plus the length of its
+    encoded bytes. The least recently used entries are evicted once the total size exceeds max_size_bytes.
+    """
+
+    def __init__(self, max_size_bytes: int = STIM_ENCODING_CACHE_MAX_SIZE_BYTES) -> None:
+        self._max_size_bytes = max_size_bytes
+        self._entries: OrderedDict[str, tuple[EncodedStimInfo, int]] = OrderedDict()
+        self._size_bytes = 0
+
+        # metrics
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+
+    def encode(self, stim_info: dict[str, Any]) -> EncodedStimInfo:
+        serialized_stim_info = serialize_stim_info(stim_info)
+        key = hashlib.sha256(serialized_stim_info).hexdigest()
+
+        if entry := self._entries.get(key):
+            self.num_hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+        self.num_misses += 1
+
+        (
+            chunked_stim_info,
+            subprotocol_idx_mappings,
+            max_subprotocol_idx_counts,
+        ) = chunk_protocols_in_stim_info(stim_info)
+        encoded_stim_info = EncodedStimInfo(
+            freeze(chunked_stim_info),
+            freeze(subprotocol_idx_mappings),
+            freeze(max_subprotocol_idx_counts),
+            convert_stim_dict_to_bytes(chunked_stim_info),
+        )
+
+        entry_size_bytes = len(serialized_stim_info) + len(encoded_stim_info.stim_bytes)
+        if entry_size_bytes <= self._max_size_bytes:
+            self._entries[key] = (encoded_stim_info, entry_size_bytes)
+            self._size_bytes += entry_size_bytes
+            while self._size_bytes > self._max_size_bytes:
+                _, (_, evicted_entry_size_bytes) = self._entries.popitem(last=False)
+                self._size_bytes -= evicted_entry_size_bytes
+                self.num_evictions += 1
+
+        return encoded_stim_info
+
+    def get_metrics(self) -> dict[str, int]:
+        return {
+            "num_entries": len(self._entries),
+            "size_bytes": self._size_bytes,
+            "max_size_bytes": self._max_size_bytes,
+            "num_hits": self.num_hits,
+            "num_misses": self.num_misses,
+            "num_evictions": self.num_evictions,
+        }
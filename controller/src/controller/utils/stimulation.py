@@ -2,8 +2,10 @@
 """Utility functions for stimulation."""
 
 import copy
+import math
 from typing import Any
 
+from ..constants import ALL_WELL_NAMES
 from ..constants import STIM_MAX_ABSOLUTE_CURRENT_MICROAMPS
 from ..constants import STIM_MAX_ABSOLUTE_VOLTAGE_MILLIVOLTS
 from ..constants import STIM_MAX_CHUNKED_SUBPROTOCOL_DUR_MICROSECONDS
@@ -11,8 +13,7 @@ from ..constants import STIM_MAX_DUTY_CYCLE_DURATION_MICROSECONDS
 from ..constants import STIM_MAX_DUTY_CYCLE_PERCENTAGE
 from ..constants import STIM_MAX_SUBPROTOCOL_DURATION_MICROSECONDS
 from ..constants import STIM_MIN_SUBPROTOCOL_DURATION_MICROSECONDS
-from ..constants import VALID_SUBPROTOCOL_TYPES
-from ..exceptions import WebsocketCommandError
+from ..constants import VALID_STIMULATION_TYPES
 
 
 SUBPROTOCOL_DUTY_CYCLE_DUR_COMPONENTS = frozenset(
@@ -142,82 +143,166 @@ def chunk_protocols_in_stim_info(
     return chunked_stim_info, subprotocol_idx_mappings, max_subprotocol_idx_counts
 
 
-def _check_subprotocol_type(subprotocol: dict[str, Any], protocol_id: int, idx: int) -> Any:
-    subprotocol["type"] = subprotocol_type = subprotocol["type"].lower()
-    # validate subprotocol type
-    if subprotocol_type not in VALID_SUBPROTOCOL_TYPES:
-        raise WebsocketCommandError(
-            f"Protocol {protocol_id}, Subprotocol {idx}, Invalid subprotocol type: {subprotocol_type}"
-        )
+def validate_stim_info(stim_info: dict[str, Any]) -> list[str]:
+    """Validate the protocols and protocol assignments sent by the UI.
+
+    Subprotocol types are converted to lowercase and delay durations are converted to ints in place.
 
-    return subprotocol_type
+    Returns:
+        A list of every error found, which will be empty if the stim info is valid
+    """
+    errors = []
 
+    protocol_list = stim_info["protocols"]
+    if not protocol_list:
+        errors.append("Protocol list empty")
 
-def validate_stim_subprotocol(
-    subprotocol: dict[str, Any], stim_type: str, protocol_id: int, idx: int
+    given_protocol_ids = set()
+    for protocol in protocol_list:
+        protocol_id = protocol["protocol_id"]
+        if protocol_id in given_protocol_ids:
+            errors.append(f"Multiple protocols given with ID: {protocol_id}")
+        given_protocol_ids.add(protocol_id)
+
+        stim_type = protocol["stimulation_type"]
+        if stim_type not in VALID_STIMULATION_TYPES:
+            errors.append(f"Protocol {protocol_id}, Invalid stimulation type: {stim_type}")
+            # the pulse components cannot be validated without a valid stim type
+            continue
+
+        _validate_subprotocols(protocol["subprotocols"], stim_type, protocol_id, errors)
+
+    protocol_assignments_dict = stim_info["protocol_assignments"]
+    # make sure protocol assignments are not missing any wells and do not contain any invalid wells
+    given_well_names = set(protocol_assignments_dict)
+    if missing_wells := ALL_WELL_NAMES - given_well_names:
+        errors.append(f"Protocol assignments missing wells: {set(missing_wells)}")
+    if invalid_wells := given_well_names - ALL_WELL_NAMES:
+        errors.append(f"Protocol assignments contain invalid wells: {invalid_wells}")
+    # make sure all protocol IDs are valid and that no protocols are unassigned
+    assigned_ids = set(pid for pid in protocol_assignments_dict.values() if pid)
+    if missing_protocol_ids := given_protocol_ids - assigned_ids:
+        errors.append(f"Protocol assignments missing protocol IDs: {missing_protocol_ids}")
+    if invalid_protocol_ids := assigned_ids - given_protocol_ids:
+        errors.append(f"Protocol assignments contain invalid protocol IDs: {invalid_protocol_ids}")
+
+    return errors
+
+
+def _validate_subprotocols(
+    subprotocols: list[dict[str, Any]], stim_type: str, protocol_id: Any, errors: list[str]
 ) -> None:
-    subprotocol_type = _check_subprotocol_type(subprotocol, protocol_id, idx)
+    # nested subprotocols are reported using the idx of the top level subprotocol they are in
+    stack = [(subprotocol, idx) for idx, subprotocol in enumerate(subprotocols)]
+    # popping from the end of the stack, so reverse it to validate the subprotocols in order
+    stack.reverse()
 
-    if subprotocol_type == "loop":
-        for nested_subprotocol in subprotocol["subprotocols"]:
-            validate_stim_subprotocol(nested_subprotocol, stim_type, protocol_id, idx)
-    else:
-        # validate subprotocol components
-        if subprotocol_type == "delay":
-            # make sure this value is not a float
-            subprotocol["duration"] = int(subprotocol["duration"])
-            total_subprotocol_duration_us = subprotocol["duration"]
-        else:  # monophasic and biphasic
-            max_abs_charge = (
-                STIM_MAX_ABSOLUTE_VOLTAGE_MILLIVOLTS
-                if stim_type == "V"
-                else STIM_MAX_ABSOLUTE_CURRENT_MICROAMPS
+    while stack:
+        subprotocol, idx = stack.pop()
+
+        subprotocol["type"] = subprotocol_type = subprotocol["type"].lower()
+
+        if subprotocol_type == "loop":
+            stack.extend(
+                (nested_subprotocol, idx) for nested_subprotocol in reversed(subprotocol["subprotocols"])
             )
+            continue
 
-            subprotocol_component_validators = {
-                "phase_one_duration": lambda n: n > 0,
-                "phase_one_charge": lambda n: abs(n) <= max_abs_charge,
-                "postphase_interval": lambda n: n >= 0,
-            }
-            if subprotocol_type == "biphasic":
-                subprotocol_component_validators.update(
-                    {
-                        "phase_two_duration": lambda n: n > 0,
-                        "phase_two_charge": lambda n: abs(n) <= max_abs_charge,
-                        "interphase_interval": lambda n: n >= 0,
-                    }
-                )
-            for component_name, validator in subprotocol_component_validators.items():
-                if not validator(component_value := subprotocol[component_name]):  # type: ignore
-                    component_name = component_name.replace("_", " ")
-                    raise WebsocketCommandError(
-                        f"Protocol {protocol_id}, Subprotocol {idx}, Invalid {component_name}: {component_value}"
+        if subprotocol_type == "delay":
+            if (duration := subprotocol.get("duration")) is None:
+                errors.append(f"Protocol {protocol_id}, Subprotocol {idx}, Missing duration")
+                continue
+            # make sure this value is not a float
+            subprotocol["duration"] = total_subprotocol_duration_us = int(duration)
+        elif component_checks := _PULSE_COMPONENT_CHECKS.get((stim_type, subprotocol_type)):
+            num_errors = len(errors)
+            duty_cycle_dur_us = 0
+            for (
+                component_name,
+                component_display_name,
+                min_value,
+                max_value,
+                is_duty_cycle,
+            ) in component_checks:
+                if (component_value := subprotocol.get(component_name)) is None:
+                    errors.append(
+                        f"Protocol {protocol_id}, Subprotocol {idx}, Missing {component_display_name}"
                     )
-
-            duty_cycle_dur_us = get_pulse_duty_cycle_dur_us(subprotocol)
+                elif not min_value <= component_value <= max_value:
+                    errors.append(
+                        f"Protocol {protocol_id}, Subprotocol {idx}, Invalid {component_display_name}: {component_value}"
+                    )
+                elif is_duty_cycle:
+                    duty_cycle_dur_us += component_value
+            if len(errors) > num_errors:
+                # the remaining checks are derived from the components, so skip them if any are invalid
+                continue
 
             # make sure duty cycle duration is not too long
             if duty_cycle_dur_us > STIM_MAX_DUTY_CYCLE_DURATION_MICROSECONDS:
-                raise WebsocketCommandError(
-                    f"Protocol {protocol_id}, Subprotocol {idx}, Duty cycle duration too long"
-                )
+                errors.append(f"Protocol {protocol_id}, Subprotocol {idx}, Duty cycle duration too long")
 
-            total_subprotocol_duration_us = (
-                duty_cycle_dur_us + subprotocol["postphase_interval"]
-            ) * subprotocol["num_cycles"]
+            pulse_dur_us = duty_cycle_dur_us + subprotocol["postphase_interval"]
+            total_subprotocol_duration_us = pulse_dur_us * subprotocol["num_cycles"]
 
             # make sure duty cycle percentage is not too high
-            if duty_cycle_dur_us > get_pulse_dur_us(subprotocol) * STIM_MAX_DUTY_CYCLE_PERCENTAGE:
-                raise WebsocketCommandError(
+            if duty_cycle_dur_us > pulse_dur_us * STIM_MAX_DUTY_CYCLE_PERCENTAGE:
+                errors.append(
                     f"Protocol {protocol_id}, Subprotocol {idx}, Duty cycle exceeds {int(STIM_MAX_DUTY_CYCLE_PERCENTAGE * 100)}%"
                 )
+        else:
+            errors.append(
+                f"Protocol {protocol_id}, Subprotocol {idx}, Invalid subprotocol type: {subprotocol_type}"
+            )
+            continue
 
         # make sure subprotocol duration is within the acceptable limits
         if total_subprotocol_duration_us < STIM_MIN_SUBPROTOCOL_DURATION_MICROSECONDS:
-            raise WebsocketCommandError(
-                f"Protocol {protocol_id}, Subprotocol {idx}, Subprotocol duration not long enough"
-            )
-        if total_subprotocol_duration_us > STIM_MAX_SUBPROTOCOL_DURATION_MICROSECONDS:
-            raise WebsocketCommandError(
-                f"Protocol {protocol_id}, Subprotocol {idx}, Subprotocol duration too long"
-            )
+            errors.append(f"Protocol {protocol_id}, Subprotocol {idx}, Subprotocol duration not long enough")
+        elif total_subprotocol_duration_us > STIM_MAX_SUBPROTOCOL_DURATION_MICROSECONDS:
+            errors.append(f"Protocol {protocol_id}, Subprotocol {idx}, Subprotocol duration too long")
+
+
+# HELPERS
+
+
+# the name, name used in error messages, min value, max value, and whether or not it is part of the duty cycle
+PulseComponentChecks = tuple[tuple[str, str, float, float, bool], ...]
+
+
+def _compile_pulse_component_checks(subprotocol_type: str, max_abs_charge: int) -> PulseComponentChecks:
+    component_bounds: dict[str, tuple[float, float]] = {
+        "phase_one_duration": (1, math.inf),
+        "phase_one_charge": (-max_abs_charge, max_abs_charge),
+        "postphase_interval": (0, math.inf),
+    }
+    if subprotocol_type == "biphasic":
+        component_bounds |= {
+            "phase_two_duration": (1, math.inf),
+            "phase_two_charge": (-max_abs_charge, max_abs_charge),
+            "interphase_interval": (0, math.inf),
+        }
+    # num cycles is only required to be present, the subprotocol duration checks cover its value
+    component_bounds["num_cycles"] = (-math.inf, math.inf)
+
+    return tuple(
+        (
+            component_name,
+            component_name.replace("_", " "),
+            min_value,
+            max_value,
+            component_name in SUBPROTOCOL_DUTY_CYCLE_DUR_COMPONENTS,
+        )
+        for component_name, (min_value, max_value) in component_bounds.items()
+    )
+
+
+# built once for each combination of stim type and pulse type so that validating a pulse is just a few comparisons
+_PULSE_COMPONENT_CHECKS: dict[tuple[str, str], PulseComponentChecks] = {
+    (stim_type, subprotocol_type): _compile_pulse_component_checks(subprotocol_type, max_abs_charge)
+    for stim_type, max_abs_charge in (
+        ("V", STIM_MAX_ABSOLUTE_VOLTAGE_MILLIVOLTS),
+        ("C", STIM_MAX_ABSOLUTE_CURRENT_MICROAMPS),
+    )
+    for subprotocol_type in ("monophasic", "biphasic")
+}
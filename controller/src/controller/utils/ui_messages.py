@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Coalescing of messages sent to the UI."""
+
+import asyncio
+from collections import deque
+from time import perf_counter
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+
+import numpy as np
+
+from ..constants import DEFAULT_UI_STATUS_UPDATE_WINDOW_SECONDS
+
+# the number of most recent send latencies used to calculate percentiles
+NUM_SEND_LATENCIES_TRACKED = 10000
+
+
+class UiMessageAggregator:
+    """Merges status updates sent to the UI within a window of time into a single message.
+
+    The first status update received starts the window. Any status updates received before the window ends
+    are merged into it, with newer values replacing older values of the same field.
+
+    Error messages are sent immediately, ahead of any pending status update. Any other message causes the
+    pending status update to be sent first so that the UI receives them in the same order they were created.
+
+    This class does not send the pending status update once the window ends on its own. The owner is expected
+    to call `flush` once `flush_deadline` has passed.
+    """
+
+    def __init__(
+        self,
+        send_msg: Callable[[dict[str, Any]], Awaitable[None]],
+        window_seconds: float = DEFAULT_UI_STATUS_UPDATE_WINDOW_SECONDS,
+    ) -> None:
+        self._send_msg = send_msg
+        self._window_seconds = window_seconds
+
+        self._pending_status_update: dict[str, Any] = {}
+        # the time each status update merged into the pending one was received
+        self._pending_status_update_timepoints: list[float] = []
+        self._flush_deadline: float | None = None
+
+        # metrics
+        self._num_msgs_received = 0
+        self._num_msgs_sent = 0
+        self._num_status_updates_coalesced = 0
+        self._send_latencies: deque[float] = deque(maxlen=NUM_SEND_LATENCIES_TRACKED)
+
+    @property
+    def flush_deadline(self) -> float | None:
+        """The event loop time at which the pending status update should be sent, if there is one."""
+        return self._flush_deadline
+
+    async def add(self, msg: dict[str, Any]) -> None:
+        self._num_msgs_received += 1
+        received_timepoint = perf_counter()
+
+        match msg.get("communication_type"):
+            case "status_update":
+                if not self._pending_status_update:
+                    self._flush_deadline = asyncio.get_running_loop().time() + self._window_seconds
+                else:
+                    self._num_status_updates_coalesced += 1
+                self._pending_status_update.update(msg)
+                self._pending_status_update_timepoints.append(received_timepoint)
+
+                if self._window_seconds <= 0:
+                    await self.flush()
+            case "error":
+                await self._send(msg, [received_timepoint])
+            case _:
+                await self.flush()
+                await self._send(msg, [received_timepoint])
+
+    async def flush(self) -> None:
+        """Send the pending status update, if there is one."""
+        if not self._pending_status_update:
+            return
+
+        status_update = self._pending_status_update
+        received_timepoints = self._pending_status_update_timepoints
+
+        self._pending_status_update = {}
+        self._pending_status_update_timepoints = []
+        self._flush_deadline = None
+
+        await self._send(status_update, received_timepoints)
+
+    def get_metrics(self) -> dict[str, Any]:
+        metrics: dict[str, Any] = {
+            "num_msgs_received": self._num_msgs_received,
+            "num_msgs_sent": self._num_msgs_sent,
+            "num_status_updates_coalesced": self._num_status_updates_coalesced,
+        }
+        if self._send_latencies:
+            p50, p99 = np.percentile(np.array(self._send_latencies), [50, 99])
+            metrics["send_latency_seconds"] = {"p50": float(p50), "p99": float(p99)}
+        return metrics
+
+    # HELPERS
+
+    async def _send(self, msg: dict[str, Any], received_timepoints: list[float]) -> None:
+        await self._send_msg(msg)
+
+        self._num_msgs_sent += 1
+        sent_timepoint = perf_counter()
+        self._send_latencies.extend(sent_timepoint - timepoint for timepoint in received_timepoints)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Persisted cache of responses to the requests made when checking for new versions."""
+
+import json
+import logging
+import os
+import time
+from typing import Any
+from typing import NamedTuple
+
+from ..constants import VERSION_CHECK_CACHE_TTL_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse(NamedTuple):
+    body: Any
+    etag: str | None
+    fetched_at: float
+
+
+class VersionCheckCache:
+    """Cache of response bodies keyed by URL, saved to a file so they are available after a restart.
+
+    The URLs of the version check requests contain the serial number and main firmware version of the
+    instrument, so each instrument and firmware version gets its own entries. Entries are fresh for
+    ttl_seconds after they were last fetched or revalidated. Stale entries are kept, since they are used
+    when the cloud can't be reached and to revalidate with the ETag they were sent with.
+    """
+
+    def __init__(self, file_path: str, ttl_seconds: float = VERSION_CHECK_CACHE_TTL_SECONDS) -> None:
+        self._file_path = file_path
+        self._ttl_seconds = ttl_seconds
+        self._entries: dict[str, CachedResponse] = {}
+
+        self._load()
+
+    def get(self, url: str) -> CachedResponse | None:
+        return self._entries.get(url)
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        # an entry from the future means the clock has changed, so it can't be trusted
+        return 0 <= time.time() - entry.fetched_at < self._ttl_seconds
+
+    def update(self, url: str, body: Any, etag: str | None) -> None:
+        self._entries[url] = CachedResponse(body, etag, time.time())
+        self._save()
+
+    def mark_revalidated(self, url: str) -> None:
+        if entry := self._entries.get(url):
+            self._entries[url] = entry._replace(fetched_at=time.time())
+            self._save()
+
+    # HELPERS
+
+    def _load(self) -> None:
+        if not os.path.isfile(self._file_path):
+            return
+
+        try:
+            with open(self._file_path) as cache_file:
+                self._entries = {url: CachedResponse(**entry) for url, entry in json.load(cache_file).items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            logger.exception("Unable to load version check cache")
+            self._entries = {}
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
+        # write to a temporary file first so that the cache is never left partially written
+        tmp_file_path = f"{self._file_path}.tmp"
+        with open(tmp_file_path, "w") as cache_file:
+            json.dump({url: entry._asdict() for url, entry in self._entries.items()}, cache_file)
+        os.replace(tmp_file_path, self._file_path)
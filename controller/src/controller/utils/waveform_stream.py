@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Streaming of waveform data to the UI in binary websocket frames."""
+
+import asyncio
+from collections import deque
+import struct
+
+import numpy as np
+from numpy.typing import NDArray
+
+from ..constants import WAVEFORM_STREAM_MAX_NUM_QUEUED_BATCHES
+
+WAVEFORM_BLOCK_FORMAT_VERSION = 1
+
+# format version, dtype code, well idx, num channels, (2 bytes padding), num samples, sample period (µs), start time index (µs).
+# The header is 24 bytes so that the data following it is aligned for any typed array the UI creates over it
+WAVEFORM_BLOCK_HEADER = struct.Struct("<BBHHxxIIq")
+
+WAVEFORM_BLOCK_DTYPE_CODES = {np.dtype("<u2"): 0, np.dtype("<f4"): 1}
+
+
+def encode_waveform_block(
+    well_idx: int, start_time_index: int, sample_period_us: int, well_data: NDArray[np.generic]
+) -> bytes:
+    """Encode the data of a single well into a block that can be sent in a binary frame.
+
+    Args:
+        well_idx: the index of the well the data is from
+        start_time_index: the time index of the first sample in the block
+        sample_period_us: the time between each sample in the block
+        well_data: 2D array of shape (num channels, num samples). Each channel is written to the block contiguously
+    """
+    num_channels, num_samples = well_data.shape
+    try:
+        dtype_code = WAVEFORM_BLOCK_DTYPE_CODES[well_data.dtype.newbyteorder("<")]
+    except KeyError as e:
+        raise ValueError(f"Unsupported waveform dtype: {well_data.dtype}") from e
+
+    header = WAVEFORM_BLOCK_HEADER.pack(
+        WAVEFORM_BLOCK_FORMAT_VERSION,
+        dtype_code,
+        well_idx,
+        num_channels,
+        num_samples,
+        sample_period_us,
+        start_time_index,
+    )
+    # tobytes always writes in C order, so no intermediate contiguous copy is needed for decimated data
+    return header + well_data.astype(well_data.dtype.newbyteorder("<"), copy=False).tobytes()
+
+
+class WaveformStreamClient:
+    """The binary frames waiting to be sent to a single client of a WaveformStream.
+
+    Only every `decimation`th sample is sent to the client. The samples kept are chosen so that the decimated
+    stream stays evenly spaced across batches.
+
+    If the client falls behind, the oldest batches of frames are dropped so that publishing never has to wait
+    on the client.
+    """
+
+    def __init__(self, decimation: int, max_num_queued_batches: int = WAVEFORM_STREAM_MAX_NUM_QUEUED_BATCHES):
+        if decimation < 1:
+            raise ValueError(f"Invalid decimation: {decimation}")
+
+        self.decimation = decimation
+        # the index of the first sample in the next batch that should be sent
+        self.next_sample_offset = 0
+
+        self._batches: deque[list[bytes]] = deque(maxlen=max_num_queued_batches)
+        self._batch_available = asyncio.Event()
+
+        # metrics
+        self.num_batches_dropped = 0
+
+    def add_batch(self, frames: list[bytes], num_samples: int) -> None:
+        if frames:
+            if len(self._batches) == self._batches.maxlen:
+                # appending will drop the oldest batch
+                self.num_batches_dropped += 1
+            self._batches.append(frames)
+            self._batch_available.set()
+
+        self.next_sample_offset = (self.next_sample_offset - num_samples) % self.decimation
+
+    async def get_frames(self) -> list[bytes]:
+        """Wait for at least one batch, then return the frames of all queued batches."""
+        while not self._batches:
+            self._batch_available.clear()
+            await self._batch_available.wait()
+
+        frames = [frame for batch in self._batches for frame in batch]
+        self._batches.clear()
+        return frames
+
+
+class WaveformStream:
+    """Distributes waveform data to all connected clients."""
+
+    def __init__(self) -> None:
+        self._clients: set[WaveformStreamClient] = set()
+        self._sample_period_us = 0
+
+    @property
+    def num_clients(self) -> int:
+        return len(self._clients)
+
+    def add_client(self, decimation: int) -> WaveformStreamClient:
+        client = WaveformStreamClient(decimation)
+        self._clients.add(client)
+        return client
+
+    def remove_client(self, client: WaveformStreamClient) -> None:
+        self._clients.discard(client)
+
+    def publish(self, time_indices: NDArray[np.int64], data: NDArray[np.uint16]) -> None:
+        """Queue the given data to be sent to each client.
+
+        Args:
+            time_indices: 1D array of the time index of each sample
+            data: 3D array of shape (num wells, num channels, num samples)
+        """
+        if not self._clients:
+            return
+
+        num_samples = len(time_indices)
+        if num_samples > 1:
+            self._sample_period_us = int(round((time_indices[-1] - time_indices[0]) / (num_samples - 1)))
+
+        # clients with the same decimation and offset receive identical frames, so only encode them once
+        encoded_batches: dict[tuple[int, int], list[bytes]] = {}
+
+        for client in self._clients:
+            batch_key = (client.decimation, client.next_sample_offset)
+            if (frames := encoded_batches.get(batch_key)) is None:
+                frames = encoded_batches[batch_key] = self._encode_batch(time_indices, data, *batch_key)
+            client.add_batch(frames, num_samples)
+
+    def _encode_batch(
+        self, time_indices: NDArray[np.int64], data: NDArray[np.uint16], decimation: int, sample_offset: int
+    ) -> list[bytes]:
+        decimated_time_indices = time_indices[sample_offset::decimation]
+        if not len(decimated_time_indices):
+            return []
+
+        decimated_data = data[:, :, sample_offset::decimation]
+        start_time_index = int(decimated_time_indices[0])
+        sample_period_us = self._sample_period_us * decimation
+
+        return [
+            encode_waveform_block(well_idx, start_time_index, sample_period_us, well_data)
+            for well_idx, well_data in enumerate(decimated_data)
+        ]
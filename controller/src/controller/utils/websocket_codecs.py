@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Encoding and decoding of messages sent over the websocket to and from the UI."""
+
+import importlib
+import json
+from typing import Any
+
+import numpy as np
+
+from ..exceptions import WebsocketCodecUnavailableError
+from ..exceptions import WebsocketCommandError
+
+
+def _import_optional_dependency(name: str) -> Any:
+    try:
+        return importlib.import_module(name)
+    except ImportError:  # pragma: no cover
+        return None
+
+
+# these are only required if their respective codec is used
+orjson = _import_optional_dependency("orjson")
+msgpack = _import_optional_dependency("msgpack")
+
+
+# the first byte of every message encoded with msgpack. Must be incremented whenever the format of these messages changes
+MSGPACK_SCHEMA_VERSION = 1
+
+
+class WebsocketCodec:
+    """Base class for codecs used by the Server."""
+
+    name: str
+    # if True, encoded messages are sent in binary frames, otherwise they are sent in text frames
+    is_binary: bool
+
+    def encode(self, msg: dict[str, Any]) -> str | bytes:
+        raise NotImplementedError("Codecs must implement encode")
+
+    def decode(self, data: str | bytes) -> dict[str, Any]:
+        raise NotImplementedError("Codecs must implement decode")
+
+
+class JsonCodec(WebsocketCodec):
+    """Uses the json module from the standard library.
+
+    Since the json module can only serialize NumPy arrays after converting them to lists, this codec is much
+    slower than the others for messages that contain arrays.
+    """
+
+    name = "json"
+    is_binary = False
+
+    def encode(self, msg: dict[str, Any]) -> str:
+        return json.dumps(msg, default=_convert_numpy_obj_to_json_compatible)
+
+    def decode(self, data: str | bytes) -> dict[str, Any]:
+        msg: dict[str, Any] = json.loads(data)
+        return msg
+
+
+class OrjsonCodec(WebsocketCodec):
+    """Uses orjson, which serializes NumPy arrays directly from their buffers.
+
+    Produces the same JSON as JsonCodec, apart from whitespace.
+    """
+
+    name = "orjson"
+    is_binary = False
+
+    def encode(self, msg: dict[str, Any]) -> str:
+        encoded_msg: bytes = orjson.dumps(
+            msg, default=_make_numpy_obj_contiguous, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+        # the UI expects JSON in text frames, so this must be a str
+        return encoded_msg.decode()
+
+    def decode(self, data: str | bytes) -> dict[str, Any]:
+        msg: dict[str, Any] = orjson.loads(data)
+        return msg
+
+
+class MsgpackCodec(WebsocketCodec):
+    """Uses MessagePack and sends each message in a binary frame prefixed with MSGPACK_SCHEMA_VERSION.
+
+    NumPy arrays are sent as maps with the dtype, shape, and the raw bytes of the array, which are read
+    directly from its buffer.
+    """
+
+    name = "msgpack"
+    is_binary = True
+
+    def __init__(self) -> None:
+        self._schema_version_bytes = bytes([MSGPACK_SCHEMA_VERSION])
+        self._packer = msgpack.Packer(default=_convert_numpy_obj_to_msgpack_compatible)
+
+    def encode(self, msg: dict[str, Any]) -> bytes:
+        encoded_msg: bytes = self._packer.pack(msg)
+        return self._schema_version_bytes + encoded_msg
+
+    def decode(self, data: str | bytes) -> dict[str, Any]:
+        if isinstance(data, str):
+            raise WebsocketCommandError("Expected a binary frame from the UI")
+        if not data or data[0] != MSGPACK_SCHEMA_VERSION:
+            raise WebsocketCommandError(
+                f"Unsupported message schema version from UI: {data[0] if data else None}"
+            )
+        msg: dict[str, Any] = msgpack.unpackb(memoryview(data)[1:])
+        return msg
+
+
+WEBSOCKET_CODECS: dict[str, type[WebsocketCodec]] = {
+    codec.name: codec for codec in (JsonCodec, OrjsonCodec, MsgpackCodec)
+}
+
+_CODEC_DEPENDENCIES = {"orjson": orjson, "msgpack": msgpack}
+
+
+def create_websocket_codec(name: str) -> WebsocketCodec:
+    try:
+        codec_type = WEBSOCKET_CODECS[name]
+    except KeyError as e:
+        raise ValueError(f"Invalid websocket codec: {name}") from e
+
+    if name in _CODEC_DEPENDENCIES and _CODEC_DEPENDENCIES[name] is None:
+        raise WebsocketCodecUnavailableError(f"The {name} package must be installed to use the {name} codec")
+
+    return codec_type()
+
+
+# HELPERS
+
+
+def _convert_numpy_obj_to_json_compatible(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _make_numpy_obj_contiguous(obj: Any) -> Any:
+    # orjson only calls this for arrays that are not C-contiguous or have a dtype it does not support
+    if isinstance(obj, np.ndarray):
+        return obj.tolist() if obj.flags.c_contiguous else np.ascontiguousarray(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _convert_numpy_obj_to_msgpack_compatible(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        obj = np.ascontiguousarray(obj)
+        return {"dtype": obj.dtype.str, "shape": obj.shape, "data": obj.data}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
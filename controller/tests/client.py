@@ -17,7 +17,7 @@ def _get_command(command):
         case "err" | "ws_err":
             pass
         # REAL COMMANDS
-        case "shutdown":
+        case "shutdown" | "get_diagnostics":
             pass
         case "login":
             comm |= {
@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import json
+from time import perf_counter
 import uuid
 
+from controller.constants import NUM_WELLS
+from controller.constants import READ_ONLY_CLIENT_PATH
+from controller.constants import SERIAL_COMM_NUM_CHANNELS_PER_SENSOR
+from controller.constants import StimulationStates
+from controller.constants import StimulatorCircuitStatuses
+from controller.constants import SystemStatuses
+from controller.constants import WAVEFORM_STREAM_PATH
 from controller.main import initialize_system_state
+from controller.main_systems import server
 from controller.main_systems.server import Server
 from controller.utils.aio import clean_up_tasks
 from controller.utils.state_management import SystemStateManager
+from controller.utils.waveform_stream import WAVEFORM_BLOCK_HEADER
+import numpy as np
 import pytest
 from websockets import connect
 from websockets.server import WebSocketServerProtocol
@@ -42,7 +54,9 @@ async def test_Server__handles_new_connections_correctly(test_server_items, mock
 
     spied_handle_comm = mocker.spy(test_server, "_handle_comm")
 
-    server_run_task = asyncio.create_task(test_server.run(asyncio.Future(), asyncio.Event()))
+    server_running_event = asyncio.Event()
+    server_run_task = asyncio.create_task(test_server.run(asyncio.Future(), server_running_event))
+    await server_running_event.wait()
 
     assert not test_server._ui_connection_made.is_set()
     assert test_server._websocket is None
@@ -54,3 +68,192 @@ async def test_Server__handles_new_connections_correctly(test_server_items, mock
         spied_handle_comm.assert_called_once()
 
     await clean_up_tasks({server_run_task})
+
+
+@pytest.mark.slow
+def test_Server__performance_of_system_state_validation(test_server_items):
+    ssm = test_server_items["system_state_manager"]
+    test_server = test_server_items["server"]
+
+    asyncio.run(
+        ssm.update(
+            {
+                "system_status": SystemStatuses.IDLE_READY_STATE,
+                "stim_info": {"protocols": [{"protocol_id": "A"}] * 4},
+                "stimulation_protocol_statuses": [StimulationStates.INACTIVE] * 4,
+                "stimulator_circuit_statuses": {
+                    well_idx: StimulatorCircuitStatuses.MEDIA.name.lower() for well_idx in range(NUM_WELLS)
+                },
+            }
+        )
+    )
+
+    num_iterations = 10000
+
+    start = perf_counter()
+    for _ in range(num_iterations):
+        # the same checks made while handling a message from the UI
+        system_state = test_server._get_system_state_ro()
+        server._is_in_offline_mode(system_state)
+        server._are_any_stim_protocols_running(system_state)
+        server._are_stimulator_checks_running(system_state)
+        server._are_initial_stimulator_checks_complete(system_state)
+        server._are_any_stimulator_circuits_short(system_state)
+    dur = perf_counter() - start
+
+    print(f"System state validation: {dur / num_iterations * 1e6:.2f} us per message")  # allow-print
+
+
+@pytest.mark.asyncio
+async def test_Server__streams_decimated_waveform_data_to_waveform_stream_connection(test_server_items):
+    test_server = test_server_items["server"]
+    waveform_stream = test_server._waveform_stream
+
+    server_running_event = asyncio.Event()
+    server_run_task = asyncio.create_task(test_server.run(asyncio.Future(), server_running_event))
+    await server_running_event.wait()
+
+    async with connect(f"{WS_URI}{WAVEFORM_STREAM_PATH}?decimation=2") as websocket:
+        # wait for the server to register the client
+        while not waveform_stream.num_clients:
+            await asyncio.sleep(0.01)
+
+        time_indices = np.arange(4, dtype=np.int64) * 1000
+        data = np.arange(NUM_WELLS * SERIAL_COMM_NUM_CHANNELS_PER_SENSOR * 4, dtype=np.uint16).reshape(
+            NUM_WELLS, SERIAL_COMM_NUM_CHANNELS_PER_SENSOR, 4
+        )
+        waveform_stream.publish(time_indices, data)
+
+        frames = [await asyncio.wait_for(websocket.recv(), 1) for _ in range(NUM_WELLS)]
+
+    assert all(isinstance(frame, bytes) for frame in frames)
+    np.testing.assert_array_equal(
+        np.frombuffer(frames[-1], dtype=np.uint16, offset=WAVEFORM_BLOCK_HEADER.size),
+        data[-1, :, ::2].flatten(),
+    )
+
+    # the client should be removed once it disconnects
+    while waveform_stream.num_clients:
+        await asyncio.sleep(0.01)
+    # the waveform stream connection should not be treated as the UI connection
+    assert not test_server._ui_connection_made.is_set()
+
+    await clean_up_tasks({server_run_task})
+
+
+@pytest.mark.asyncio
+async def test_Server__rejects_waveform_stream_connection_with_invalid_decimation(test_server_items):
+    test_server = test_server_items["server"]
+
+    server_running_event = asyncio.Event()
+    server_run_task = asyncio.create_task(test_server.run(asyncio.Future(), server_running_event))
+    await server_running_event.wait()
+
+    async with connect(f"{WS_URI}{WAVEFORM_STREAM_PATH}?decimation=0") as websocket:
+        await websocket.wait_closed()
+        assert websocket.close_code == 1008
+
+    assert test_server._waveform_stream.num_clients == 0
+
+    await clean_up_tasks({server_run_task})
+
+
+@pytest.mark.asyncio
+async def test_Server__sends_msgs_to_read_only_clients_but_only_accepts_commands_from_ui(test_server_items):
+    test_server = test_server_items["server"]
+
+    server_running_event = asyncio.Event()
+    server_run_task = asyncio.create_task(test_server.run(asyncio.Future(), server_running_event))
+    await server_running_event.wait()
+
+    # the read-only client connects first to make sure it does not take over the UI connection
+    async with connect(f"{WS_URI}{READ_ONLY_CLIENT_PATH}") as read_only_websocket, connect(
+        WS_URI
+    ) as ui_websocket:
+        # wait for the server to register both clients
+        while not (test_server._broadcast_hub.num_clients and test_server._websocket):
+            await asyncio.sleep(0.01)
+
+        test_msg = {
+            "communication_type": "barcode_update",
+            "barcode_type": "plate_barcode",
+            "new_barcode": "A",
+        }
+        await test_server_items["from_monitor_queue"].put(test_msg)
+
+        for websocket in (ui_websocket, read_only_websocket):
+            assert json.loads(await asyncio.wait_for(websocket.recv(), 1)) == test_msg
+
+        test_command = {"command": "get_diagnostics"}
+        await read_only_websocket.send(json.dumps(test_command))
+        await ui_websocket.send(json.dumps(test_command))
+
+        assert await asyncio.wait_for(test_server_items["to_monitor_queue"].get(), 1) == test_command
+        assert test_server_items["to_monitor_queue"].empty()
+
+        # disconnect the read-only client before the UI since the server shuts down once the UI disconnects
+        await read_only_websocket.close()
+
+    await clean_up_tasks({server_run_task})
+
+
+@pytest.mark.asyncio
+async def test_Server__rejects_second_ui_connection(test_server_items):
+    test_server = test_server_items["server"]
+
+    server_running_event = asyncio.Event()
+    server_run_task = asyncio.create_task(test_server.run(asyncio.Future(), server_running_event))
+    await server_running_event.wait()
+
+    async with connect(WS_URI) as ui_websocket, connect(WS_URI) as second_websocket:
+        await asyncio.wait_for(second_websocket.wait_closed(), 1)
+        assert second_websocket.close_code == 1008
+
+        assert test_server._websocket is not None
+        assert not ui_websocket.closed
+
+    await clean_up_tasks({server_run_task})
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_Server__performance_of_fan_out_to_multiple_clients(test_server_items):
+    ssm = test_server_items["system_state_manager"]
+
+    test_msg = {
+        "communication_type": "stimulator_circuit_statuses",
+        "stimulator_circuit_statuses": {str(well_idx): "media" for well_idx in range(NUM_WELLS)},
+    }
+    num_msgs = 1000
+
+    async def _recv_all_msgs(websocket):
+        for _ in range(num_msgs):
+            await websocket.recv()
+
+    for num_clients in (1, 4, 16):
+        from_monitor_queue = asyncio.Queue()
+        test_server = Server(ssm.get_read_only_copy, from_monitor_queue, asyncio.Queue())
+
+        server_running_event = asyncio.Event()
+        server_run_task = asyncio.create_task(test_server.run(asyncio.Future(), server_running_event))
+        await server_running_event.wait()
+
+        websockets = [await connect(WS_URI)] + [
+            await connect(f"{WS_URI}{READ_ONLY_CLIENT_PATH}") for _ in range(num_clients - 1)
+        ]
+        while test_server._broadcast_hub.num_clients < num_clients - 1:
+            await asyncio.sleep(0.01)
+
+        start = perf_counter()
+        for _ in range(num_msgs):
+            from_monitor_queue.put_nowait(test_msg)
+        await asyncio.gather(*[_recv_all_msgs(websocket) for websocket in websockets])
+        dur = perf_counter() - start
+
+        print(  # allow-print
+            f"{num_clients} clients: {dur / num_msgs * 1e6:.1f} us per msg, {test_server._broadcast_hub.num_clients_evicted} clients evicted"
+        )
+
+        for websocket in websockets:
+            await websocket.close()
+        await clean_up_tasks({server_run_task})
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import uuid
+
+from controller.constants import SYSTEM_QUEUE_MAX_SIZES
+from controller.main import create_system_queues
+from controller.main import initialize_system_state
+from controller.main_systems.system_monitor import SystemMonitor
+from controller.utils.aio import clean_up_tasks
+from controller.utils.state_management import SystemStateManager
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_SystemMonitor__keeps_handling_comm_from_instrument_comm_if_ui_stops_receiving_msgs():
+    ssm = SystemStateManager()
+    await ssm.update(
+        initialize_system_state({"base_directory": None, "expected_software_version": None}, uuid.uuid4())
+    )
+    queues = create_system_queues()
+    system_monitor = SystemMonitor(ssm, queues)
+
+    # nothing ever reads the queue to the server, like when the UI has stalled
+    handle_comm_task = asyncio.create_task(system_monitor._handle_comm_from_instrument_comm())
+
+    # each new barcode is sent to the UI
+    num_msgs = SYSTEM_QUEUE_MAX_SIZES["server"] + SYSTEM_QUEUE_MAX_SIZES["instrument_comm"] + 1
+    try:
+        for barcode_idx in range(num_msgs):
+            # this is how InstrumentComm sends comm to the SystemMonitor
+            await asyncio.wait_for(
+                queues["from"]["instrument_comm"].put(
+                    {"command": "get_barcode", "barcode": f"ML{barcode_idx}"}
+                ),
+                1,
+            )
+        while not queues["from"]["instrument_comm"].empty():
+            await asyncio.sleep(0.01)
+    finally:
+        await clean_up_tasks({handle_comm_task})
+
+    assert queues["to"]["server"].full()
+    assert queues["to"]["server"].num_msgs_dropped == num_msgs - SYSTEM_QUEUE_MAX_SIZES["server"]
+    assert ssm.data["plate_barcode"] == f"ML{num_msgs - 1}"
@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from collections import Counter
+import hashlib
+import io
+import json
+import os
+from typing import AsyncIterator
+import uuid
+import zipfile
+
+from controller.constants import AuthCreds
+from controller.constants import AuthTokens
+from controller.constants import CLOUD_API_ENDPOINT
+from controller.constants import CLOUD_PULSE3D_ENDPOINT
+from controller.constants import CloudRequestTypes
+from controller.constants import MIN_UPLOAD_PART_SIZE_BYTES
+from controller.constants import UPLOAD_MANIFEST_FILE_SUFFIX
+from controller.constants import UPLOAD_MAX_NUM_RESUME_ATTEMPTS
+from controller.exceptions import FirmwareDownloadError
+from controller.exceptions import RequestFailedError
+from controller.subsystems.cloud_comm import CloudComm
+from controller.utils import cloud_client
+from controller.utils.cloud_client import CloudClient
+import httpx
+import pytest
+
+
+S3_HOST = "s3.local"
+
+# 2 full parts and a partial part
+TEST_LARGE_FILE_SIZE = int(MIN_UPLOAD_PART_SIZE_BYTES * 2.5)
+
+TEST_SOFTWARE_RANGE = {"min_sting_sw": "0.0.0", "max_sting_sw": "99.0.0"}
+TEST_LATEST_VERSIONS = {"main_fw": "1.0.0", "channel_fw": "1.0.0", "sting_sw": "1.0.0"}
+TEST_CHECK_VERSIONS_COMMAND = {"fw_update_dir_path": "", "main_fw_version": "0.9.0", "serial_number": "123"}
+
+
+class CloudStandIn:
+    """Local stand-in for the cloud API routes and the s3 requests made through the URLs they return.
+
+    Multipart uploads are checked the same way s3 checks them when they are completed. Firmware routes are
+    rejected unless they are sent with the current access token, which is what a refresh returns.
+    """
+
+    def __init__(self) -> None:
+        self.access_token = "a"
+        self.num_token_refreshes = 0
+        self.objects: dict[str, bytes] = {}
+        self.firmware_files: dict[str, bytes] = {}
+        self.failing_firmware_downloads: set[str] = set()
+        self.num_firmware_requests = 0
+        self.max_num_concurrent_firmware_downloads = 0
+        self.is_offline = False
+        self.version_check_responses: list[tuple[str, int]] = []
+        self.version_check_status_code: int | None = None
+        self.max_num_concurrent_version_checks = 0
+        self.failing_part_numbers: set[int] = set()
+        self.num_part_uploads: Counter[int] = Counter()
+        self.max_num_concurrent_part_uploads = 0
+
+        self._multipart_uploads: dict[str, dict] = {}
+        self._num_concurrent_part_uploads = 0
+        self._num_concurrent_firmware_downloads = 0
+        self._num_concurrent_version_checks = 0
+
+    async def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.is_offline:
+            raise httpx.ConnectError("No internet connection", request=request)
+
+        content = await request.aread()
+        path = request.url.path.strip("/").split("/")
+
+        if request.url.host == CLOUD_API_ENDPOINT:
+            match path:
+                case ["mantarray", ("software-range" | "versions") as route, _, _]:
+                    return await self._check_versions(request, route)
+                case ["users", "login"]:
+                    return httpx.Response(200, json={"tokens": self._get_tokens()})
+                case ["users", "refresh"]:
+                    self.num_token_refreshes += 1
+                    await asyncio.sleep(0.01)
+                    return httpx.Response(201, json={"tokens": self._get_tokens()})
+                case ["mantarray", "firmware", _, _] if (
+                    request.headers.get("Authorization") != f"Bearer {self.access_token}"
+                ):
+                    return httpx.Response(401)
+                case ["mantarray", "firmware", fw_type, version]:
+                    self.num_firmware_requests += 1
+                    file_name = f"{fw_type}-{version}.bin"
+                    return httpx.Response(
+                        200, json={"presigned_url": f"https://{S3_HOST}/firmware/{file_name}"}
+                    )
+
+        if request.url.host == CLOUD_PULSE3D_ENDPOINT:
+            body = json.loads(content)
+            match path:
+                case [_]:
+                    return httpx.Response(
+                        200,
+                        json={"params": {"url": f"https://{S3_HOST}/{body['filename']}", "fields": {}}},
+                    )
+                case [_, "multipart"]:
+                    upload_id = str(uuid.uuid4())
+                    self._multipart_uploads[upload_id] = {"filename": body["filename"], "parts": {}}
+                    return httpx.Response(200, json={"upload_id": upload_id})
+                case [_, "multipart", upload_id, "parts"] if upload_id in self._multipart_uploads:
+                    urls = {
+                        str(part_number): f"https://{S3_HOST}/{upload_id}/{part_number}"
+                        for part_number in body["part_numbers"]
+                    }
+                    return httpx.Response(200, json={"urls": urls})
+                case [_, "multipart", upload_id, "complete"] if upload_id in self._multipart_uploads:
+                    return self._complete_multipart_upload(upload_id, body["parts"])
+
+        if request.url.host == S3_HOST:
+            match path:
+                case ["firmware", file_name] if file_name in self.firmware_files:
+                    self.num_firmware_requests += 1
+                    return httpx.Response(200, content=self._stream_firmware_file(file_name))
+                case [file_name]:
+                    self.objects[file_name] = content
+                    return httpx.Response(204)
+                case [upload_id, part_number] if upload_id in self._multipart_uploads:
+                    return await self._upload_part(upload_id, int(part_number), content)
+
+        return httpx.Response(404, json={"message": "Not found"})
+
+    def _get_tokens(self) -> dict[str, dict[str, str]]:
+        return {"access": {"token": self.access_token}, "refresh": {"token": "r"}}
+
+    async def _check_versions(self, request: httpx.Request, route: str) -> httpx.Response:
+        self._num_concurrent_version_checks += 1
+        self.max_num_concurrent_version_checks = max(
+            self.max_num_concurrent_version_checks, self._num_concurrent_version_checks
+        )
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self._num_concurrent_version_checks -= 1
+
+        etag = f'"{route}-etag"'
+        if self.version_check_status_code:
+            res = httpx.Response(self.version_check_status_code)
+        elif request.headers.get("If-None-Match") == etag:
+            res = httpx.Response(304)
+        else:
+            body = TEST_SOFTWARE_RANGE if route == "software-range" else TEST_LATEST_VERSIONS
+            res = httpx.Response(200, json=body, headers={"ETag": etag})
+
+        self.version_check_responses.append((route, res.status_code))
+        return res
+
+    async def _stream_firmware_file(self, file_name: str) -> AsyncIterator[bytes]:
+        self._num_concurrent_firmware_downloads += 1
+        self.max_num_concurrent_firmware_downloads = max(
+            self.max_num_concurrent_firmware_downloads, self._num_concurrent_firmware_downloads
+        )
+        try:
+            contents = self.firmware_files[file_name]
+            for chunk_start_idx in range(0, len(contents), 1000):
+                await asyncio.sleep(0)
+                if file_name in self.failing_firmware_downloads and chunk_start_idx > 0:
+                    raise httpx.ReadError("Connection lost")
+                yield contents[chunk_start_idx : chunk_start_idx + 1000]
+        finally:
+            self._num_concurrent_firmware_downloads -= 1
+
+    async def _upload_part(self, upload_id: str, part_number: int, content: bytes) -> httpx.Response:
+        self.num_part_uploads[part_number] += 1
+        self._num_concurrent_part_uploads += 1
+        self.max_num_concurrent_part_uploads = max(
+            self.max_num_concurrent_part_uploads, self._num_concurrent_part_uploads
+        )
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self._num_concurrent_part_uploads -= 1
+
+        if part_number in self.failing_part_numbers:
+            # not a status code that is retried
+            return httpx.Response(403)
+
+        self._multipart_uploads[upload_id]["parts"][part_number] = content
+        return httpx.Response(200, headers={"ETag": f'"{hashlib.md5(content).hexdigest()}"'})
+
+    def _complete_multipart_upload(self, upload_id: str, parts: list[dict]) -> httpx.Response:
+        upload = self._multipart_uploads[upload_id]
+        uploaded_parts = upload["parts"]
+
+        if [part["part_number"] for part in parts] != list(range(1, len(uploaded_parts) + 1)):
+            return httpx.Response(400, json={"message": "Invalid part order"})
+        for part in parts:
+            part_contents = uploaded_parts[part["part_number"]]
+            if part["etag"] != f'"{hashlib.md5(part_contents).hexdigest()}"':
+                return httpx.Response(400, json={"message": "Invalid part"})
+            if part["part_number"] != len(parts) and len(part_contents) < MIN_UPLOAD_PART_SIZE_BYTES:
+                return httpx.Response(400, json={"message": "Entity too small"})
+
+        self.objects[upload["filename"]] = b"".join(uploaded_parts[part["part_number"]] for part in parts)
+        self._multipart_uploads.pop(upload_id)
+        return httpx.Response(200)
+
+
+@pytest.fixture(scope="function", name="cloud_stand_in")
+def fixture__cloud_stand_in():
+    yield CloudStandIn()
+
+
+@pytest.fixture(scope="function", autouse=True)
+def fixture__patch_retry_delay(mocker):
+    mocker.patch.object(cloud_client, "_get_retry_delay", autospec=True, return_value=0)
+
+
+@pytest.fixture(scope="function", name="upload_dir_path")
+def fixture__upload_dir_path(tmp_path):
+    yield os.path.join(tmp_path, "uploads")
+
+
+def _create_cloud_comm(cloud_stand_in, upload_dir_path, **kwargs):
+    cloud_comm = CloudComm(
+        asyncio.Queue(),
+        asyncio.Queue(),
+        upload_dir_path=upload_dir_path,
+        upload_part_size=MIN_UPLOAD_PART_SIZE_BYTES,
+        **{"log_directory": None, **kwargs},
+    )
+    cloud_comm._client = CloudClient(
+        metrics=cloud_comm._request_metrics, transport=httpx.MockTransport(cloud_stand_in.handle_request)
+    )
+    return cloud_comm
+
+
+def _log_in(cloud_comm):
+    cloud_comm._creds = AuthCreds(customer_id="id", username="user", password="pw")
+    cloud_comm._tokens = AuthTokens(access="a", refresh="r")
+
+
+def _create_file(file_path, num_bytes):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    contents = os.urandom(num_bytes)
+    with open(file_path, "wb") as f:
+        f.write(contents)
+    return contents
+
+
+@pytest.mark.parametrize(
+    "test_kwargs,expected_error",
+    [
+        ({"upload_part_size": MIN_UPLOAD_PART_SIZE_BYTES - 1}, "Invalid upload part size"),
+        ({"max_num_concurrent_upload_parts": 0}, "Invalid max num concurrent upload parts"),
+    ],
+)
+def test_CloudComm__raises_error_if_upload_settings_invalid(test_kwargs, expected_error):
+    with pytest.raises(ValueError, match=expected_error):
+        CloudComm(asyncio.Queue(), asyncio.Queue(), log_directory=None, **test_kwargs)
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__request__only_refreshes_tokens_once_when_concurrent_requests_are_rejected(
+    cloud_stand_in, upload_dir_path
+):
+    cloud_comm = _create_cloud_comm(cloud_stand_in, upload_dir_path)
+    _log_in(cloud_comm)
+    # expire the access token the CloudComm has
+    cloud_stand_in.access_token = "b"
+
+    responses = await asyncio.gather(
+        *(
+            cloud_comm._request(
+                "get",
+                f"https://{CLOUD_API_ENDPOINT}/mantarray/firmware/main/1.0.{patch}",
+                request_type=CloudRequestTypes.METADATA,
+                auth_required=True,
+                error_message="Error getting firmware",
+            )
+            for patch in range(3)
+        )
+    )
+
+    assert [res.status_code for res in responses] == [200] * 3
+    assert cloud_stand_in.num_token_refreshes == 1
+    assert cloud_comm._tokens.access == "b"
+
+    request_metrics = cloud_comm._request_metrics.get_metrics()
+    assert request_metrics["num_token_refreshes"] == 1
+    # 3 rejected requests, 3 retried requests
+    assert request_metrics["latencies"]["metadata"]["count"] == 6
+    assert request_metrics["latencies"]["auth"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__attempt_to_upload_log_files_to_s3__uploads_large_zip_file_in_parallel_parts(
+    cloud_stand_in, upload_dir_path, tmp_path
+):
+    test_log_dir_path = os.path.join(tmp_path, "logs")
+    # random bytes so that the zip file is not smaller than the log files
+    test_log_contents = {
+        f"log_{file_idx}.txt": _create_file(
+            os.path.join(test_log_dir_path, f"log_{file_idx}.txt"), TEST_LARGE_FILE_SIZE // 2
+        )
+        for file_idx in range(2)
+    }
+
+    cloud_comm = _create_cloud_comm(
+        cloud_stand_in, upload_dir_path, max_num_concurrent_upload_parts=2, log_directory=test_log_dir_path
+    )
+    _log_in(cloud_comm)
+
+    await cloud_comm._attempt_to_upload_log_files_to_s3()
+
+    with zipfile.ZipFile(io.BytesIO(cloud_stand_in.objects["logs.zip"])) as zf:
+        assert {file_name: zf.read(file_name) for file_name in zf.namelist()} == test_log_contents
+
+    assert set(cloud_stand_in.num_part_uploads.values()) == {1}
+    assert len(cloud_stand_in.num_part_uploads) == 3
+    assert cloud_stand_in.max_num_concurrent_part_uploads == 2
+    # both the zip file and the manifest should be removed once the upload completes
+    assert os.listdir(upload_dir_path) == []
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__attempt_to_upload_log_files_to_s3__removes_zip_file_if_multipart_upload_cannot_be_started(
+    cloud_stand_in, upload_dir_path, tmp_path
+):
+    test_log_dir_path = os.path.join(tmp_path, "logs")
+    test_log_file_path = os.path.join(test_log_dir_path, "log.txt")
+    _create_file(test_log_file_path, TEST_LARGE_FILE_SIZE)
+
+    cloud_comm = _create_cloud_comm(cloud_stand_in, upload_dir_path, log_directory=test_log_dir_path)
+    _log_in(cloud_comm)
+
+    cloud_stand_in.is_offline = True
+    await cloud_comm._attempt_to_upload_log_files_to_s3()
+
+    assert os.listdir(upload_dir_path) == []
+    # only files created for the upload should be removed
+    assert os.path.isfile(test_log_file_path)
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__attempt_to_upload_log_files_to_s3__uploads_small_zip_file_in_single_request(
+    cloud_stand_in, upload_dir_path, tmp_path
+):
+    test_log_dir_path = os.path.join(tmp_path, "logs")
+    _create_file(os.path.join(test_log_dir_path, "log.txt"), 1000)
+
+    cloud_comm = _create_cloud_comm(cloud_stand_in, upload_dir_path, log_directory=test_log_dir_path)
+    _log_in(cloud_comm)
+
+    await cloud_comm._attempt_to_upload_log_files_to_s3()
+
+    assert list(cloud_stand_in.objects) == ["logs.zip"]
+    assert not cloud_stand_in.num_part_uploads
+    assert os.listdir(upload_dir_path) == []
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__upload_to_s3__saves_progress_of_multipart_upload_and_resumes_it_after_next_login(
+    cloud_stand_in, upload_dir_path, tmp_path
+):
+    test_file_path = os.path.join(tmp_path, "recording.h5")
+    test_file_contents = _create_file(test_file_path, TEST_LARGE_FILE_SIZE)
+
+    # upload the parts one at a time so that it is known which parts complete before the failure
+    cloud_comm = _create_cloud_comm(cloud_stand_in, upload_dir_path, max_num_concurrent_upload_parts=1)
+    _log_in(cloud_comm)
+
+    cloud_stand_in.failing_part_numbers = {2}
+    with pytest.raises(RequestFailedError, match="Error uploading part 2"):
+        await cloud_comm._upload_to_s3(test_file_path, upload_type="recording")
+
+    manifest_file_path = os.path.join(upload_dir_path, f"recording.h5{UPLOAD_MANIFEST_FILE_SUFFIX}")
+    with open(manifest_file_path) as f:
+        assert list(json.load(f)["completed_parts"]) == ["1"]
+    assert not cloud_stand_in.objects
+
+    # simulate the next controller start
+    cloud_stand_in.failing_part_numbers = set()
+    cloud_comm = _create_cloud_comm(cloud_stand_in, upload_dir_path)
+    await cloud_comm._login({"customer_id": "id", "username": "user", "password": "pw"})
+    await cloud_comm._resume_uploads_task
+
+    assert cloud_stand_in.objects == {"recording.h5": test_file_contents}
+    assert cloud_stand_in.num_part_uploads == {1: 1, 2: 2, 3: 1}
+    assert not os.path.exists(manifest_file_path)
+    # only files created for the upload should be removed
+    assert os.path.isfile(test_file_path)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("test_change", ["file_modified", "too_many_resume_attempts"])
+async def test_CloudComm__resume_multipart_uploads__abandons_upload_that_cannot_be_resumed(
+    test_change, cloud_stand_in, upload_dir_path, tmp_path
+):
+    test_file_path = os.path.join(tmp_path, "recording.h5")
+    _create_file(test_file_path, TEST_LARGE_FILE_SIZE)
+
+    cloud_comm = _create_cloud_comm(cloud_stand_in, upload_dir_path, max_num_concurrent_upload_parts=1)
+    _log_in(cloud_comm)
+
+    cloud_stand_in.failing_part_numbers = {2}
+    with pytest.raises(RequestFailedError):
+        await cloud_comm._upload_to_s3(test_file_path, upload_type="recording")
+    cloud_stand_in.failing_part_numbers = set()
+
+    manifest_file_path = os.path.join(upload_dir_path, f"recording.h5{UPLOAD_MANIFEST_FILE_SUFFIX}")
+    if test_change == "file_modified":
+        with open(test_file_path, "r+b") as f:
+            f.write(b"changed")
+    else:
+        with open(manifest_file_path) as f:
+            manifest = json.load(f)
+        manifest["num_resume_attempts"] = UPLOAD_MAX_NUM_RESUME_ATTEMPTS
+        with open(manifest_file_path, "w") as f:
+            json.dump(manifest, f)
+
+    await cloud_comm._resume_multipart_uploads()
+
+    assert not os.path.exists(manifest_file_path)
+    assert not cloud_stand_in.objects
+    assert cloud_stand_in.num_part_uploads == {1: 1, 2: 1}
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__download_firmware_updates__downloads_firmware_files_concurrently_into_cache(
+    cloud_stand_in, upload_dir_path, tmp_path
+):
+    test_fw_files = {"main": os.urandom(10000), "channel": os.urandom(20000)}
+    cloud_stand_in.firmware_files = {
+        f"{fw_type}-1.0.0.bin": test_fw_file for fw_type, test_fw_file in test_fw_files.items()
+    }
+    test_command = {"main": "1.0.0", "channel": "1.0.0", "fw_update_dir_path": None}
+
+    cloud_comm = _create_cloud_comm(
+        cloud_stand_in, upload_dir_path, firmware_cache_dir_path=os.path.join(tmp_path, "cache")
+    )
+    _log_in(cloud_comm)
+
+    assert await cloud_comm._download_firmware_updates(dict(test_command)) == {
+        f"{fw_type}_firmware_contents": test_fw_file for fw_type, test_fw_file in test_fw_files.items()
+    }
+    assert cloud_stand_in.num_firmware_requests == 4
+    assert cloud_stand_in.max_num_concurrent_firmware_downloads == 2
+
+    # simulate the next controller start
+    cloud_comm = _create_cloud_comm(
+        cloud_stand_in, upload_dir_path, firmware_cache_dir_path=os.path.join(tmp_path, "cache")
+    )
+    _log_in(cloud_comm)
+
+    assert await cloud_comm._download_firmware_updates(dict(test_command)) == {
+        f"{fw_type}_firmware_contents": test_fw_file for fw_type, test_fw_file in test_fw_files.items()
+    }
+    # nothing should be requested for files in the cache
+    assert cloud_stand_in.num_firmware_requests == 4
+    assert cloud_comm._firmware_cache.num_hits == 2
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__download_firmware_updates__does_not_cache_file_if_download_fails(
+    cloud_stand_in, upload_dir_path, tmp_path
+):
+    cloud_stand_in.firmware_files = {"main-1.0.0.bin": os.urandom(10000)}
+    cloud_stand_in.failing_firmware_downloads = {"main-1.0.0.bin"}
+    test_cache_dir_path = os.path.join(tmp_path, "cache")
+
+    cloud_comm = _create_cloud_comm(
+        cloud_stand_in, upload_dir_path, firmware_cache_dir_path=test_cache_dir_path
+    )
+    _log_in(cloud_comm)
+
+    with pytest.raises(FirmwareDownloadError):
+        await cloud_comm._download_firmware_updates(
+            {"main": "1.0.0", "channel": None, "fw_update_dir_path": None}
+        )
+
+    assert cloud_comm._firmware_cache.get("main", "1.0.0") is None
+    # the partially downloaded file should be removed
+    assert os.listdir(test_cache_dir_path) == ["objects"]
+    assert os.listdir(os.path.join(test_cache_dir_path, "objects")) == []
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__check_versions__makes_requests_concurrently_and_uses_cached_responses_until_ttl_expires(
+    cloud_stand_in, upload_dir_path, tmp_path
+):
+    test_cache_file_path = os.path.join(tmp_path, "version_check_cache.json")
+
+    cloud_comm = _create_cloud_comm(
+        cloud_stand_in, upload_dir_path, version_check_cache_file_path=test_cache_file_path
+    )
+    assert await cloud_comm._check_versions(dict(TEST_CHECK_VERSIONS_COMMAND)) == {
+        "latest_versions": TEST_LATEST_VERSIONS,
+        "download": True,
+        "stale": False,
+    }
+    assert sorted(cloud_stand_in.version_check_responses) == [("software-range", 200), ("versions", 200)]
+    assert cloud_stand_in.max_num_concurrent_version_checks == 2
+
+    # simulate the next controller start
+    cloud_comm = _create_cloud_comm(
+        cloud_stand_in, upload_dir_path, version_check_cache_file_path=test_cache_file_path
+    )
+    assert (await cloud_comm._check_versions(dict(TEST_CHECK_VERSIONS_COMMAND)))["stale"] is False
+    # no requests should be made while the cached responses are fresh
+    assert len(cloud_stand_in.version_check_responses) == 2
+
+    # expire the cached responses
+    cloud_comm._version_check_cache._ttl_seconds = 0
+    assert await cloud_comm._check_versions(dict(TEST_CHECK_VERSIONS_COMMAND)) == {
+        "latest_versions": TEST_LATEST_VERSIONS,
+        "download": True,
+        "stale": False,
+    }
+    # the cached responses should be revalidated instead of sent again
+    assert sorted(cloud_stand_in.version_check_responses[2:]) == [("software-range", 304), ("versions", 304)]
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__check_versions__uses_stale_cached_responses_if_cloud_cannot_be_reached(
+    cloud_stand_in, upload_dir_path, tmp_path
+):
+    cloud_comm = _create_cloud_comm(
+        cloud_stand_in,
+        upload_dir_path,
+        version_check_cache_file_path=os.path.join(tmp_path, "version_check_cache.json"),
+    )
+    cloud_stand_in.is_offline = True
+    with pytest.raises(httpx.ConnectError):
+        await cloud_comm._check_versions(dict(TEST_CHECK_VERSIONS_COMMAND))
+
+    cloud_stand_in.is_offline = False
+    await cloud_comm._check_versions(dict(TEST_CHECK_VERSIONS_COMMAND))
+
+    cloud_stand_in.is_offline = True
+    cloud_comm._version_check_cache._ttl_seconds = 0
+    assert await cloud_comm._check_versions(dict(TEST_CHECK_VERSIONS_COMMAND)) == {
+        "latest_versions": TEST_LATEST_VERSIONS,
+        "download": True,
+        "stale": True,
+    }
+
+
+@pytest.mark.asyncio
+async def test_CloudComm__check_versions__uses_stale_cached_responses_if_cloud_keeps_returning_retryable_status_code(
+    cloud_stand_in, upload_dir_path, tmp_path
+):
+    cloud_comm = _create_cloud_comm(
+        cloud_stand_in,
+        upload_dir_path,
+        version_check_cache_file_path=os.path.join(tmp_path, "version_check_cache.json"),
+    )
+    cloud_stand_in.version_check_status_code = 503
+    with pytest.raises(RequestFailedError):
+        await cloud_comm._check_versions(dict(TEST_CHECK_VERSIONS_COMMAND))
+
+    cloud_stand_in.version_check_status_code = None
+    await cloud_comm._check_versions(dict(TEST_CHECK_VERSIONS_COMMAND))
+
+    cloud_stand_in.version_check_status_code = 503
+    cloud_comm._version_check_cache._ttl_seconds = 0
+    assert await cloud_comm._check_versions(dict(TEST_CHECK_VERSIONS_COMMAND)) == {
+        "latest_versions": TEST_LATEST_VERSIONS,
+        "download": True,
+        "stale": True,
+    }
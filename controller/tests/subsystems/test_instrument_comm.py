@@ -1,20 +1,56 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import json
+import os
 from random import choice
+from random import randint
+from random import random
+from statistics import median
+from time import perf_counter
+from zlib import crc32
 
+from aioserial import AioSerial
 from controller.constants import CURI_VID
+from controller.constants import FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS
+from controller.constants import MAX_CHANNEL_FIRMWARE_UPDATE_DURATION_SECONDS
+from controller.constants import MAX_MAIN_FIRMWARE_UPDATE_DURATION_SECONDS
+from controller.constants import NUM_WELLS
 from controller.constants import SERIAL_COMM_BAUD_RATE
 from controller.constants import SERIAL_COMM_BYTESIZE
+from controller.constants import SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES
+from controller.constants import SERIAL_COMM_MODULE_ID_TO_WELL_IDX
+from controller.constants import SERIAL_COMM_NUM_CHANNELS_PER_SENSOR
 from controller.constants import SERIAL_COMM_READ_TIMEOUT
+from controller.constants import SERIAL_COMM_TIME_INDEX_LENGTH_BYTES
+from controller.constants import SERIAL_COMM_TIME_OFFSET_LENGTH_BYTES
+from controller.constants import SerialCommErrorBudget
+from controller.constants import SerialCommPacketTypes
+from controller.constants import SerialCommReadModes
+from controller.constants import STIM_COMPLETE_SUBPROTOCOL_IDX
+from controller.constants import StimProtocolStatuses
 from controller.constants import STM_VID
+from controller.exceptions import FirmwareUpdateTimeoutError
+from controller.exceptions import InstrumentCommandResponseError
+from controller.exceptions import InstrumentConnectionLostError
 from controller.exceptions import NoInstrumentDetectedError
+from controller.exceptions import SerialCommErrorBudgetExceededError
+from controller.exceptions import SerialCommIncorrectMagicWordFromInstrumentError
+from controller.exceptions import SerialCommPacketRegistrationSearchExhaustedError
 from controller.subsystems import instrument_comm
+from controller.subsystems.instrument_comm import FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES
+from controller.subsystems.instrument_comm import FirmwareUpdateManager
 from controller.subsystems.instrument_comm import InstrumentComm
+from controller.utils.data_parsing_cy import sort_serial_packets
+from controller.utils.serial_comm import create_data_packet
+import numpy as np
 import pytest
 import serial
 from serial.tools.list_ports_common import ListPortInfo
+from stdlib_utils import is_system_windows
 
 from ..fixtures import fixture__wait_tasks_clean
+from ..helpers import get_random_protocol_status
+from ..helpers import random_timestamp
 
 
 __fixtures__ = [fixture__wait_tasks_clean]
@@ -27,6 +63,22 @@ def fixture__test_instrument_comm_obj(mocker):
     # TODO any teardown needed here?
 
 
+def set_mocked_instrument(instrument_comm_obj, mocker, stream_bytes=bytes(0), max_read_size=1000):
+    stream_bytes = bytearray(stream_bytes)
+
+    async def readinto_se(buffer):
+        num_bytes_read = min(len(buffer), len(stream_bytes), max_read_size)
+        buffer[:num_bytes_read] = stream_bytes[:num_bytes_read]
+        del stream_bytes[:num_bytes_read]
+        return num_bytes_read
+
+    mocked_instrument = mocker.MagicMock()
+    mocked_instrument.in_waiting = max_read_size
+    mocked_instrument.readinto_async = mocker.AsyncMock(side_effect=readinto_se)
+    instrument_comm_obj._instrument = mocked_instrument
+    return mocked_instrument
+
+
 @pytest.fixture(scope="function", name="patch_comports")
 def fixture__patch_comports(mocker):
     comport = "COM1"
@@ -128,3 +180,705 @@ async def test_InstrumentComm__reports_system_error_if_no_real_or_virtual_instru
     # TODO make a function for this if it becomes common
     assert isinstance(mocked_handle_error.call_args[0][0], NoInstrumentDetectedError)
     assert mocked_handle_error.call_args[0][1] is system_error_future
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__read_into_packet_buffer__reads_available_bytes_directly_into_buffer(
+    test_instrument_comm_obj, mocker
+):
+    test_bytes = bytes(range(randint(1, 100)))
+
+    async def readinto_se(buffer):
+        buffer[: len(test_bytes)] = test_bytes
+        return len(test_bytes)
+
+    mocked_instrument = mocker.MagicMock()
+    mocked_instrument.in_waiting = len(test_bytes)
+    mocked_instrument.readinto_async = mocker.AsyncMock(side_effect=readinto_se)
+    test_instrument_comm_obj._instrument = mocked_instrument
+
+    test_instrument_comm_obj._serial_packet_buffer.write(bytes([0xFF]))
+
+    assert await test_instrument_comm_obj._read_into_packet_buffer() == len(test_bytes)
+    assert bytes(test_instrument_comm_obj._serial_packet_buffer.unread_bytes) == bytes([0xFF]) + test_bytes
+    # make sure the instrument was only given enough space for the bytes available
+    assert len(mocked_instrument.readinto_async.call_args[0][0]) == len(test_bytes)
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__send_data_packets__writes_all_packets_to_instrument_in_single_write(
+    test_instrument_comm_obj, mocker
+):
+    mocked_instrument = set_mocked_instrument(test_instrument_comm_obj, mocker)
+    mocked_instrument.write_async = mocker.AsyncMock(side_effect=lambda data: len(data))
+
+    test_packets = [(SerialCommPacketTypes.HANDSHAKE, bytes(0)), (SerialCommPacketTypes.STOP_STIM, bytes(0))]
+
+    test_instrument_comm_obj._serial_writer.start()
+    try:
+        await test_instrument_comm_obj._send_data_packets(test_packets)
+    finally:
+        await test_instrument_comm_obj._serial_writer.stop()
+
+    mocked_instrument.write_async.assert_awaited_once()
+    written_bytes = bytearray(mocked_instrument.write_async.call_args[0][0])
+    sorted_packet_dict = sort_serial_packets(written_bytes)
+    assert sorted_packet_dict["num_bytes_sorted"] == len(written_bytes)
+    # all packets sent together should have the same timestamp
+    assert len({timestamp for timestamp, *_ in sorted_packet_dict["other_packet_info"]}) == 1
+    assert [
+        (packet_type, bytes(payload)) for _, packet_type, payload in sorted_packet_dict["other_packet_info"]
+    ] == test_packets
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__catch_expired_command__raises_firmware_update_timeout_error_for_end_of_firmware_update(
+    test_instrument_comm_obj,
+):
+    test_firmware_type = choice(["main", "channel"])
+    await test_instrument_comm_obj._command_tracker.add(
+        SerialCommPacketTypes.END_FIRMWARE_UPDATE,
+        {"command": "end_of_firmware_update", "firmware_type": test_firmware_type},
+        timeout_seconds=0,
+    )
+
+    with pytest.raises(FirmwareUpdateTimeoutError, match=test_firmware_type):
+        await test_instrument_comm_obj._catch_expired_command()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "test_firmware_type,expected_timeout",
+    [
+        ("main", MAX_MAIN_FIRMWARE_UPDATE_DURATION_SECONDS),
+        ("channel", MAX_CHANNEL_FIRMWARE_UPDATE_DURATION_SECONDS),
+    ],
+)
+async def test_InstrumentComm__handle_firmware_update__uses_max_update_duration_as_end_of_firmware_update_timeout(
+    test_firmware_type, expected_timeout, test_instrument_comm_obj, mocker
+):
+    mocker.patch.object(test_instrument_comm_obj, "_send_data_packet", autospec=True)
+    mocker.patch.object(test_instrument_comm_obj, "_wait_for_reboot", autospec=True)
+    spied_add = mocker.spy(test_instrument_comm_obj._command_tracker, "add")
+
+    update_task = asyncio.create_task(
+        test_instrument_comm_obj._handle_firmware_update(
+            {
+                "command": "start_firmware_update",
+                "firmware_type": test_firmware_type,
+                "file_contents": bytes(10),
+                "version": "1.0.0",
+            }
+        )
+    )
+    await asyncio.sleep(0)
+
+    manager = test_instrument_comm_obj._firmware_update_manager
+    await manager.update("start_firmware_update", bytes(1))
+    await manager.update("send_firmware_data", bytes(1))
+    await asyncio.sleep(0)
+    await manager.complete()
+    await asyncio.wait_for(update_task, timeout=1)
+
+    timeouts = {call.args[0]: call.args[2] for call in spied_add.call_args_list}
+    assert timeouts == {
+        SerialCommPacketTypes.BEGIN_FIRMWARE_UPDATE: None,
+        SerialCommPacketTypes.FIRMWARE_UPDATE: None,
+        SerialCommPacketTypes.END_FIRMWARE_UPDATE: expected_timeout,
+    }
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__handle_firmware_update__saves_checkpoint_if_interrupted(
+    test_instrument_comm_obj, mocker
+):
+    mocker.patch.object(test_instrument_comm_obj, "_send_data_packet", autospec=True)
+    spied_save = mocker.spy(FirmwareUpdateManager, "save_checkpoint")
+
+    update_task = asyncio.create_task(
+        test_instrument_comm_obj._handle_firmware_update(
+            {
+                "command": "start_firmware_update",
+                "firmware_type": choice(["main", "channel"]),
+                "file_contents": bytes(10),
+                "version": "1.0.0",
+            }
+        )
+    )
+    await asyncio.sleep(0)
+    assert spied_save.call_count == 0
+
+    update_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await update_task
+
+    spied_save.assert_called_once_with(test_instrument_comm_obj._firmware_update_manager)
+
+
+def _create_firmware_update_manager(
+    file_contents, window_size=1, checkpoint_dir_path=None, firmware_type=None, version="1.0.0"
+):
+    update_info = {
+        "command": "start_firmware_update",
+        "firmware_type": firmware_type or choice(["main", "channel"]),
+        "file_contents": file_contents,
+        "version": version,
+    }
+    if checkpoint_dir_path:
+        update_info["checkpoint_dir_path"] = str(checkpoint_dir_path)
+    return FirmwareUpdateManager(update_info, window_size=window_size)
+
+
+async def _interrupt_firmware_update_after_num_chunks(file_contents, checkpoint_dir_path, num_chunks):
+    manager = _create_firmware_update_manager(file_contents, 1, checkpoint_dir_path, firmware_type="main")
+    await manager.__anext__()
+    await manager.update("start_firmware_update", bytes([0]))
+    for _ in range(num_chunks):
+        await manager.update("send_firmware_data", bytes([0]))
+    manager.save_checkpoint()
+
+
+def _get_queued_firmware_update_items(manager):
+    queued_items = []
+    while not manager._command_queue.empty():
+        queued_items.append(manager._command_queue.get_nowait())
+    return queued_items
+
+
+def _get_firmware_chunk_indices(firmware_update_items):
+    return [
+        command["packet_index"]
+        for packet_type, _, command in firmware_update_items
+        if packet_type == SerialCommPacketTypes.FIRMWARE_UPDATE
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("test_window_size", [1, 3])
+async def test_FirmwareUpdateManager__sends_firmware_in_chunks_with_up_to_window_size_in_flight(
+    test_window_size,
+):
+    num_chunks = 5
+    test_file_contents = os.urandom(FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES * (num_chunks - 1) + 10)
+    manager = _create_firmware_update_manager(test_file_contents, test_window_size)
+
+    packet_type, _, command = await manager.__anext__()
+    assert packet_type == SerialCommPacketTypes.BEGIN_FIRMWARE_UPDATE
+    await manager.update("start_firmware_update", bytes([0]))
+
+    sent_items = _get_queued_firmware_update_items(manager)
+    assert len(sent_items) == test_window_size
+
+    num_responses = 0
+    while sent_items[-1][0] != SerialCommPacketTypes.END_FIRMWARE_UPDATE:
+        await manager.update("send_firmware_data", bytes([0]))
+        num_responses += 1
+
+        queued_items = _get_queued_firmware_update_items(manager)
+        assert len(queued_items) <= 1
+        sent_items.extend(queued_items)
+        assert len(_get_firmware_chunk_indices(sent_items)) - num_responses <= test_window_size
+
+    *firmware_data_items, end_items = sent_items
+    assert _get_firmware_chunk_indices(firmware_data_items) == list(range(num_chunks))
+    assert b"".join(bytes_to_send[1:] for _, bytes_to_send, _ in firmware_data_items) == test_file_contents
+    assert end_items[1] == crc32(test_file_contents).to_bytes(4, byteorder="little")
+
+    metrics = manager.get_metrics()
+    assert metrics["num_chunks"] == num_chunks
+    assert metrics["window_size"] == test_window_size
+    assert metrics["fell_back_to_window_size_of_1"] is False
+    assert metrics["chunk_round_trip_seconds"]["max"] >= metrics["chunk_round_trip_seconds"]["mean"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_FirmwareUpdateManager__falls_back_to_window_size_of_1_when_instrument_rejects_pipelined_chunk():
+    num_chunks = 6
+    manager = _create_firmware_update_manager(bytes(FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES * num_chunks), 3)
+
+    await manager.__anext__()
+    await manager.update("start_firmware_update", bytes([0]))
+    assert _get_firmware_chunk_indices(_get_queued_firmware_update_items(manager)) == [0, 1, 2]
+
+    await manager.update("send_firmware_data", bytes([0]))
+    assert _get_firmware_chunk_indices(_get_queued_firmware_update_items(manager)) == [3]
+
+    # chunk 1 is rejected, and so are the chunks sent after it
+    await manager.update("send_firmware_data", bytes([1]))
+    await manager.update("send_firmware_data", bytes([1]))
+    assert _get_queued_firmware_update_items(manager) == []
+    await manager.update("send_firmware_data", bytes([1]))
+
+    # all remaining chunks should be resent one at a time
+    for chunk_idx in range(1, num_chunks):
+        assert _get_firmware_chunk_indices(_get_queued_firmware_update_items(manager)) == [chunk_idx]
+        await manager.update("send_firmware_data", bytes([0]))
+
+    (end_items,) = _get_queued_firmware_update_items(manager)
+    assert end_items[0] == SerialCommPacketTypes.END_FIRMWARE_UPDATE
+    assert manager.get_metrics()["fell_back_to_window_size_of_1"] is True
+
+
+@pytest.mark.asyncio
+async def test_FirmwareUpdateManager__raises_error_if_chunk_rejected_with_window_size_of_1():
+    manager = _create_firmware_update_manager(bytes(FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES * 2), 1)
+
+    await manager.__anext__()
+    await manager.update("start_firmware_update", bytes([0]))
+    await manager.update("send_firmware_data", bytes([0]))
+
+    with pytest.raises(InstrumentCommandResponseError, match="send_firmware_data, packet index: 1"):
+        await manager.update("send_firmware_data", bytes([1]))
+
+
+@pytest.mark.asyncio
+async def test_FirmwareUpdateManager__saves_checkpoint_periodically_and_when_interrupted_and_deletes_it_after_update(
+    tmp_path,
+):
+    num_chunks = FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS + 2
+    test_file_contents = os.urandom(FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES * num_chunks)
+    manager = _create_firmware_update_manager(test_file_contents, 1, tmp_path, firmware_type="main")
+    checkpoint_file_path = tmp_path / "main.json"
+
+    def get_saved_chunk_idx():
+        checkpoint = json.loads(checkpoint_file_path.read_text())
+        saved_chunk_idx = checkpoint.pop("last_acknowledged_packet_index")
+        assert checkpoint == {
+            "version": "1.0.0",
+            "file_checksum": crc32(test_file_contents),
+            "packet_length": FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES,
+        }
+        return saved_chunk_idx
+
+    await manager.__anext__()
+    await manager.update("start_firmware_update", bytes([0]))
+    # nothing to save until a chunk is acknowledged
+    manager.save_checkpoint()
+    assert not checkpoint_file_path.exists()
+
+    for _ in range(FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS - 1):
+        await manager.update("send_firmware_data", bytes([0]))
+    assert not checkpoint_file_path.exists()
+
+    await manager.update("send_firmware_data", bytes([0]))
+    assert get_saved_chunk_idx() == FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS - 1
+
+    await manager.update("send_firmware_data", bytes([0]))
+    assert get_saved_chunk_idx() == FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS - 1
+    # simulate the update being interrupted
+    manager.save_checkpoint()
+    assert get_saved_chunk_idx() == FW_UPDATE_CHECKPOINT_INTERVAL_NUM_PACKETS
+
+    await manager.update("send_firmware_data", bytes([0]))
+    await manager.update("end_of_firmware_update", bytes([0]))
+    assert not checkpoint_file_path.exists()
+    # the completed update should never be saved again
+    manager.save_checkpoint()
+    assert not checkpoint_file_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_FirmwareUpdateManager__resumes_update_from_checkpoint_of_same_firmware_file(tmp_path):
+    num_chunks = 5
+    test_file_contents = os.urandom(FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES * num_chunks)
+    await _interrupt_firmware_update_after_num_chunks(test_file_contents, tmp_path, 2)
+
+    manager = _create_firmware_update_manager(test_file_contents, 1, tmp_path, firmware_type="main")
+    packet_type, bytes_to_send, command = await manager.__anext__()
+    assert packet_type == SerialCommPacketTypes.BEGIN_FIRMWARE_UPDATE
+    assert command["resume_from_packet_index"] == 2
+    assert bytes_to_send[8] == 2
+    assert bytes_to_send[9:] == crc32(test_file_contents[: 2 * FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES]).to_bytes(
+        4, byteorder="little"
+    )
+
+    await manager.update("start_firmware_update", bytes([0]))
+    for chunk_idx in range(2, num_chunks):
+        assert _get_firmware_chunk_indices(_get_queued_firmware_update_items(manager)) == [chunk_idx]
+        await manager.update("send_firmware_data", bytes([0]))
+
+    (end_items,) = _get_queued_firmware_update_items(manager)
+    assert end_items[1] == crc32(test_file_contents).to_bytes(4, byteorder="little")
+    assert manager.get_metrics()["resumed_from_packet_index"] == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "test_changes",
+    [{"version": "1.0.1"}, {"file_contents": bytes(FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES * 3)}],
+)
+async def test_FirmwareUpdateManager__ignores_checkpoint_of_different_firmware_file(tmp_path, test_changes):
+    test_file_contents = os.urandom(FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES * 3)
+    await _interrupt_firmware_update_after_num_chunks(test_file_contents, tmp_path, 1)
+
+    update_kwargs = {
+        "file_contents": test_file_contents,
+        "checkpoint_dir_path": tmp_path,
+        "firmware_type": "main",
+    }
+    manager = _create_firmware_update_manager(**{**update_kwargs, **test_changes})
+    _, bytes_to_send, command = await manager.__anext__()
+    assert len(bytes_to_send) == 8
+    assert "resume_from_packet_index" not in command
+
+
+@pytest.mark.asyncio
+async def test_FirmwareUpdateManager__starts_over_if_instrument_cannot_resume_update(tmp_path):
+    num_chunks = 3
+    test_file_contents = os.urandom(FIRMWARE_UPDATE_CHUNK_LENGTH_BYTES * num_chunks)
+    await _interrupt_firmware_update_after_num_chunks(test_file_contents, tmp_path, 1)
+
+    manager = _create_firmware_update_manager(test_file_contents, 1, tmp_path, firmware_type="main")
+    await manager.__anext__()
+    await manager.update("start_firmware_update", bytes([1]))
+    assert not (tmp_path / "main.json").exists()
+
+    (restart_items,) = _get_queued_firmware_update_items(manager)
+    packet_type, bytes_to_send, command = restart_items
+    assert packet_type == SerialCommPacketTypes.BEGIN_FIRMWARE_UPDATE
+    assert len(bytes_to_send) == 8
+    assert "resume_from_packet_index" not in command
+
+    await manager.update("start_firmware_update", bytes([0]))
+    assert _get_firmware_chunk_indices(_get_queued_firmware_update_items(manager)) == [0]
+
+    # a fresh update being rejected is still an error
+    with pytest.raises(InstrumentCommandResponseError, match="start_firmware_update"):
+        await manager.update("start_firmware_update", bytes([1]))
+
+
+def test_FirmwareUpdateManager__raises_error_if_window_size_invalid():
+    with pytest.raises(ValueError, match="Invalid window size: 0"):
+        _create_firmware_update_manager(bytes(1), 0)
+
+
+@pytest.mark.asyncio
+async def test_VirtualInstrumentConnection__readinto_async__copies_read_bytes_into_given_buffer(mocker):
+    vic = instrument_comm.VirtualInstrumentConnection()
+    test_bytes = bytes([1, 2, 3])
+    mocker.patch.object(vic, "read_async", autospec=True, return_value=test_bytes)
+
+    buffer = bytearray(10)
+    assert await vic.readinto_async(memoryview(buffer)) == len(test_bytes)
+    assert buffer[: len(test_bytes)] == test_bytes
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__process_magnetometer_packets__sends_decoded_data_to_monitor(
+    test_instrument_comm_obj,
+):
+    test_time_index = randint(0, 1000)
+    test_data = np.random.randint(
+        0, 0xFFFF, (NUM_WELLS, SERIAL_COMM_NUM_CHANNELS_PER_SENSOR), dtype=np.uint16
+    )
+
+    payload = test_time_index.to_bytes(SERIAL_COMM_TIME_INDEX_LENGTH_BYTES, byteorder="little")
+    for module_id in range(NUM_WELLS):
+        well_idx = SERIAL_COMM_MODULE_ID_TO_WELL_IDX[module_id]
+        payload += bytes(SERIAL_COMM_TIME_OFFSET_LENGTH_BYTES) + test_data[well_idx].astype("<u2").tobytes()
+
+    await test_instrument_comm_obj._process_magnetometer_packets(
+        {"raw_bytes": bytearray(payload), "num_packets": 1}
+    )
+
+    msg_to_monitor = test_instrument_comm_obj._to_monitor_queue.get_nowait()
+    assert msg_to_monitor["command"] == "magnetometer_data"
+    np.testing.assert_array_equal(msg_to_monitor["time_indices"], [test_time_index])
+    np.testing.assert_array_equal(msg_to_monitor["data"][:, :, 0], test_data)
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__process_magnetometer_packets__does_nothing_if_no_packets(
+    test_instrument_comm_obj,
+):
+    await test_instrument_comm_obj._process_magnetometer_packets({"raw_bytes": bytearray(), "num_packets": 0})
+    assert test_instrument_comm_obj._to_monitor_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__process_stim_packets__reports_protocols_whose_most_recent_update_is_complete(
+    test_instrument_comm_obj,
+):
+    test_instrument_comm_obj._protocols_running = {0, 1, 2, 3}
+
+    test_status_updates = [
+        # protocol 0 completes in the middle of the packets, but then restarts
+        (0, STIM_COMPLETE_SUBPROTOCOL_IDX),
+        (1, 0),
+        (2, STIM_COMPLETE_SUBPROTOCOL_IDX),
+        (0, 0),
+        (3, 1),
+        (1, STIM_COMPLETE_SUBPROTOCOL_IDX),
+    ]
+    payload = bytes([len(test_status_updates)]) + b"".join(
+        get_random_protocol_status(
+            protocol_id=protocol_idx, stim_status=StimProtocolStatuses.ACTIVE, subprotocol_idx=subprotocol_idx
+        )
+        for protocol_idx, subprotocol_idx in test_status_updates
+    )
+
+    await test_instrument_comm_obj._process_stim_packets({"raw_bytes": bytearray(payload), "num_packets": 1})
+
+    assert test_instrument_comm_obj._protocols_running == {0, 3}
+    assert test_instrument_comm_obj._to_monitor_queue.get_nowait() == {
+        "command": "stim_status_update",
+        "protocols_completed": [1, 2],
+    }
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__read_into_packet_buffer__waits_for_bytes_from_reader_in_event_driven_mode(
+    mocker,
+):
+    ic = InstrumentComm(asyncio.Queue(), asyncio.Queue(), serial_read_mode=SerialCommReadModes.EVENT_DRIVEN)
+    ic._instrument = mocker.MagicMock()
+    ic._instrument.in_waiting = 0
+
+    test_bytes = bytes([1, 2, 3])
+
+    async def readinto_se(buffer):
+        buffer[: len(test_bytes)] = test_bytes
+        return len(test_bytes)
+
+    ic._serial_reader = mocker.MagicMock()
+    ic._serial_reader.readinto_async = mocker.AsyncMock(side_effect=readinto_se)
+
+    assert await ic._read_into_packet_buffer() == len(test_bytes)
+    assert bytes(ic._serial_packet_buffer.unread_bytes) == test_bytes
+    # make sure the reader was given all the free space in the buffer instead of only the bytes currently available
+    assert len(ic._serial_reader.readinto_async.call_args[0][0]) == ic._serial_packet_buffer.capacity
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__read_into_packet_buffer__raises_error_if_reader_returns_no_bytes_in_event_driven_mode(
+    mocker,
+):
+    ic = InstrumentComm(asyncio.Queue(), asyncio.Queue(), serial_read_mode=SerialCommReadModes.EVENT_DRIVEN)
+    ic._instrument = mocker.MagicMock()
+    ic._serial_reader = mocker.MagicMock()
+    ic._serial_reader.readinto_async = mocker.AsyncMock(return_value=0)
+
+    with pytest.raises(InstrumentConnectionLostError):
+        await ic._read_into_packet_buffer()
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__read_into_packet_buffer__raises_error_if_virtual_instrument_returns_no_bytes_in_event_driven_mode(
+    mocker,
+):
+    ic = InstrumentComm(asyncio.Queue(), asyncio.Queue(), serial_read_mode=SerialCommReadModes.EVENT_DRIVEN)
+    ic._instrument = instrument_comm.VirtualInstrumentConnection()
+    mocked_readinto = mocker.patch.object(ic._instrument, "readinto_async", autospec=True, return_value=0)
+
+    with pytest.raises(InstrumentConnectionLostError):
+        await ic._read_into_packet_buffer()
+
+    # make sure the virtual instrument was given all the free space in the buffer instead of in_waiting bytes
+    assert len(mocked_readinto.call_args[0][0]) == ic._serial_packet_buffer.capacity
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__handle_data_stream__starts_and_stops_serial_reader_in_event_driven_mode(
+    mocker,
+):
+    ic = InstrumentComm(asyncio.Queue(), asyncio.Queue(), serial_read_mode=SerialCommReadModes.EVENT_DRIVEN)
+    ic._instrument = mocker.MagicMock()
+
+    mocked_reader_cls = mocker.patch.object(instrument_comm, "EventDrivenSerialReader", autospec=True)
+    mocker.patch.object(ic, "_read_into_packet_buffer", autospec=True, side_effect=Exception("stop"))
+
+    with pytest.raises(Exception, match="stop"):
+        await ic._handle_data_stream()
+
+    mocked_reader_cls.assert_called_once_with(ic._instrument)
+    mocked_reader_cls.return_value.start.assert_called_once_with()
+    mocked_reader_cls.return_value.stop.assert_called_once_with()
+    assert ic._serial_reader is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.slow
+@pytest.mark.skipif(is_system_windows(), reason="ptys are not available on Windows")
+async def test_InstrumentComm__performance_of_command_round_trip_in_each_serial_read_mode():
+    num_round_trips = 50
+    median_round_trip_durs = {}
+
+    for read_mode in SerialCommReadModes:
+        primary_fd, secondary_fd = os.openpty()
+
+        ic = InstrumentComm(asyncio.Queue(), asyncio.Queue(), serial_read_mode=read_mode)
+        ic._instrument = AioSerial(port=os.ttyname(secondary_fd), timeout=SERIAL_COMM_READ_TIMEOUT)
+        ic._serial_writer.start()
+        data_stream_task = asyncio.create_task(ic._handle_data_stream())
+
+        round_trip_durs = []
+        try:
+            for _ in range(num_round_trips):
+                # offset each command by a random amount so that it's not in sync with the read polling
+                await asyncio.sleep(random() * 0.01)
+
+                start = perf_counter()
+                await ic._send_data_packet(SerialCommPacketTypes.STOP_STIM)
+                await ic._command_tracker.add(
+                    SerialCommPacketTypes.STOP_STIM, {"command": "stop_stimulation"}
+                )
+                # respond to the command as the instrument would
+                os.read(primary_fd, SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES)
+                os.write(
+                    primary_fd,
+                    create_data_packet(random_timestamp(), SerialCommPacketTypes.STOP_STIM, bytes(1)),
+                )
+                await asyncio.wait_for(ic._to_monitor_queue.get(), 1)
+                round_trip_durs.append(perf_counter() - start)
+        finally:
+            data_stream_task.cancel()
+            await asyncio.gather(data_stream_task, return_exceptions=True)
+            await ic._serial_writer.stop()
+            ic._instrument.close()
+            os.close(primary_fd)
+            os.close(secondary_fd)
+
+        median_round_trip_durs[read_mode] = median(round_trip_durs)
+
+    print(  # allow-print
+        {read_mode.name: f"{dur * 1000:.3f} ms" for read_mode, dur in median_round_trip_durs.items()}
+    )
+    assert (
+        median_round_trip_durs[SerialCommReadModes.EVENT_DRIVEN]
+        < median_round_trip_durs[SerialCommReadModes.POLLING]
+    )
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__register_magic_word__syncs_with_first_valid_packet(
+    test_instrument_comm_obj, mocker
+):
+    test_packet = create_data_packet(random_timestamp(), SerialCommPacketTypes.STATUS_BEACON, bytes(10))
+    bad_packet = bytearray(test_packet)
+    bad_packet[-1] ^= 0xFF
+
+    test_stream = bytes(randint(1, 100)) + bad_packet + bytes(randint(0, 10)) + test_packet
+    set_mocked_instrument(test_instrument_comm_obj, mocker, test_stream, max_read_size=randint(10, 50))
+
+    await test_instrument_comm_obj._register_magic_word()
+
+    unread_bytes = bytes(test_instrument_comm_obj._serial_packet_buffer.unread_bytes)
+    assert unread_bytes[: len(test_packet)] == test_packet
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__register_magic_word__raises_error_if_no_valid_packet_found_in_max_packet_length(
+    test_instrument_comm_obj, mocker
+):
+    set_mocked_instrument(
+        test_instrument_comm_obj, mocker, bytes(SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES * 2)
+    )
+
+    with pytest.raises(SerialCommPacketRegistrationSearchExhaustedError):
+        await test_instrument_comm_obj._register_magic_word()
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__sort_and_process_packets__recovers_from_incorrect_magic_word(
+    test_instrument_comm_obj, mocker
+):
+    set_mocked_instrument(test_instrument_comm_obj, mocker)
+    mocked_process_comm = mocker.patch.object(
+        test_instrument_comm_obj, "_process_comm_from_instrument", autospec=True
+    )
+
+    test_packets = [
+        create_data_packet(random_timestamp(), SerialCommPacketTypes.BARCODE_FOUND, bytes([i]))
+        for i in range(2)
+    ]
+    test_instrument_comm_obj._serial_packet_buffer.write(
+        test_packets[0] + bytes(randint(1, 10)) + test_packets[1]
+    )
+
+    await test_instrument_comm_obj._sort_and_process_packets()
+    # the packet after the corrupted bytes is left in the buffer to be processed normally
+    assert bytes(test_instrument_comm_obj._serial_packet_buffer.unread_bytes) == test_packets[1]
+    await test_instrument_comm_obj._sort_and_process_packets()
+
+    assert mocked_process_comm.call_args_list == [
+        mocker.call(SerialCommPacketTypes.BARCODE_FOUND, bytearray([i])) for i in range(2)
+    ]
+    assert len(test_instrument_comm_obj._serial_packet_buffer) == 0
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__sort_and_process_packets__raises_error_if_resync_fails_after_incorrect_magic_word(
+    test_instrument_comm_obj, mocker
+):
+    set_mocked_instrument(test_instrument_comm_obj, mocker)
+    test_instrument_comm_obj._serial_packet_buffer.write(bytes(SERIAL_COMM_MAX_FULL_PACKET_LENGTH_BYTES * 2))
+
+    with pytest.raises(SerialCommIncorrectMagicWordFromInstrumentError):
+        await test_instrument_comm_obj._sort_and_process_packets()
+
+
+def _create_corruption_counts(num_packets_dropped):
+    return {
+        "incorrect_magic_word": {"num_packets_dropped": num_packets_dropped, "num_bytes_dropped": 10},
+        "incorrect_checksum": {"num_packets_dropped": 0, "num_bytes_dropped": 0},
+    }
+
+
+@pytest.mark.asyncio
+async def test_InstrumentComm__sort_and_process_packets__drops_corrupted_packets_when_given_error_budget(
+    mocker,
+):
+    ic = InstrumentComm(
+        asyncio.Queue(), asyncio.Queue(), serial_comm_error_budget=SerialCommErrorBudget(1, 60)
+    )
+    set_mocked_instrument(ic, mocker)
+    mocked_process_comm = mocker.patch.object(ic, "_process_comm_from_instrument", autospec=True)
+
+    test_packet = create_data_packet(random_timestamp(), SerialCommPacketTypes.BARCODE_FOUND, bytes(1))
+    bad_packet = bytearray(test_packet)
+    bad_packet[-1] ^= 0xFF
+    ic._serial_packet_buffer.write(bad_packet + test_packet)
+
+    await ic._sort_and_process_packets()
+
+    mocked_process_comm.assert_called_once_with(SerialCommPacketTypes.BARCODE_FOUND, bytearray(1))
+    assert ic._total_corruption_counts["incorrect_checksum"] == {
+        "num_packets_dropped": 1,
+        "num_bytes_dropped": len(bad_packet),
+    }
+
+
+def test_InstrumentComm__check_serial_comm_error_budget__raises_error_if_budget_exceeded_in_window():
+    test_max_num_errors = randint(2, 5)
+    ic = InstrumentComm(
+        asyncio.Queue(),
+        asyncio.Queue(),
+        serial_comm_error_budget=SerialCommErrorBudget(test_max_num_errors, 60),
+    )
+
+    ic._check_serial_comm_error_budget(_create_corruption_counts(test_max_num_errors))
+
+    with pytest.raises(SerialCommErrorBudgetExceededError):
+        ic._check_serial_comm_error_budget(_create_corruption_counts(1))
+
+
+def test_InstrumentComm__check_serial_comm_error_budget__does_not_count_errors_outside_of_window(mocker):
+    test_window_seconds = 60
+    ic = InstrumentComm(
+        asyncio.Queue(),
+        asyncio.Queue(),
+        serial_comm_error_budget=SerialCommErrorBudget(1, test_window_seconds),
+    )
+
+    mocker.patch.object(
+        instrument_comm, "perf_counter", autospec=True, side_effect=[0, test_window_seconds + 1]
+    )
+
+    ic._check_serial_comm_error_budget(_create_corruption_counts(1))
+    ic._check_serial_comm_error_budget(_create_corruption_counts(1))
+
+    assert len(ic._serial_comm_error_timepoints) == 1
+    assert ic._total_corruption_counts["incorrect_magic_word"] == {
+        "num_packets_dropped": 2,
+        "num_bytes_dropped": 20,
+    }
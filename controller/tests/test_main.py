@@ -11,10 +11,24 @@ import sys
 from controller import main
 from controller.constants import COMPILED_EXE_BUILD_TIMESTAMP
 from controller.constants import CURRENT_SOFTWARE_VERSION
+from controller.constants import DEFAULT_CLOUD_CLIENT_SETTINGS
+from controller.constants import DEFAULT_FIRMWARE_UPDATE_WINDOW_SIZE
+from controller.constants import DEFAULT_SERIAL_COMM_ERROR_BUDGET
 from controller.constants import DEFAULT_SERVER_PORT_NUMBER
+from controller.constants import DEFAULT_UPLOAD_PART_SIZE_BYTES
+from controller.constants import DEFAULT_WEBSOCKET_CODEC
+from controller.constants import FW_CACHE_SUBDIR
+from controller.constants import NON_BLOCKING_SYSTEM_QUEUES
+from controller.constants import SerialCommErrorBudget
+from controller.constants import SerialCommReadModes
 from controller.constants import SOFTWARE_RELEASE_CHANNEL
+from controller.constants import SYSTEM_QUEUE_MAX_SIZES
 from controller.constants import SystemStatuses
+from controller.constants import UPLOADS_SUBDIR
+from controller.constants import VERSION_CHECK_CACHE_FILE_NAME
 from controller.utils.logging import redact_sensitive_info_from_path
+from controller.utils.queues import BoundedQueue
+from controller.utils.websocket_codecs import OrjsonCodec
 import pytest
 
 
@@ -236,23 +250,42 @@ async def test_main__initializes_system_state_correctly(
 # TODO test state management
 
 
+def test_create_system_queues__creates_bounded_queue_to_and_from_each_subsystem():
+    queues = main.create_system_queues()
+
+    for direction in ("to", "from"):
+        assert set(queues[direction]) == set(SYSTEM_QUEUE_MAX_SIZES)
+        for subsystem, queue in queues[direction].items():
+            assert isinstance(queue, BoundedQueue)
+            assert queue.maxsize == SYSTEM_QUEUE_MAX_SIZES[subsystem]
+            assert queue._block_when_full is ((direction, subsystem) not in NON_BLOCKING_SYSTEM_QUEUES)
+
+
 # TODO make sure to add all the run() assertions
 @pytest.mark.asyncio
 async def test_main__creates_SystemMonitor_and_runs_correctly(patch_run_tasks, patch_subsystem_inits, mocker):
     spied_ssm = mocker.spy(main, "SystemStateManager")
     spied_create_queues = mocker.spy(main, "create_system_queues")
+    spied_waveform_stream = mocker.spy(main, "WaveformStream")
+    spied_cloud_request_metrics = mocker.spy(main, "CloudRequestMetrics")
 
     await main.main([])
 
     patch_subsystem_inits["system_monitor"].assert_called_once_with(
-        mocker.ANY, spied_ssm.spy_return, spied_create_queues.spy_return
+        mocker.ANY,
+        spied_ssm.spy_return,
+        spied_create_queues.spy_return,
+        waveform_stream=spied_waveform_stream.spy_return,
+        cloud_request_metrics=spied_cloud_request_metrics.spy_return,
     )
 
 
 @pytest.mark.asyncio
 async def test_main__creates_Server_and_runs_correctly(patch_run_tasks, patch_subsystem_inits, mocker):
     spied_ssm = mocker.spy(main, "SystemStateManager")
+    spied_create_codec = mocker.spy(main, "create_websocket_codec")
     spied_create_queues = mocker.spy(main, "create_system_queues")
+    spied_waveform_stream = mocker.spy(main, "WaveformStream")
 
     await main.main([])
 
@@ -263,7 +296,21 @@ async def test_main__creates_Server_and_runs_correctly(patch_run_tasks, patch_su
         spied_ssm.spy_return.get_read_only_copy,
         expected_queues["to"]["server"],
         expected_queues["from"]["server"],
+        codec=spied_create_codec.spy_return,
+        waveform_stream=spied_waveform_stream.spy_return,
     )
+    spied_create_codec.assert_called_once_with(DEFAULT_WEBSOCKET_CODEC)
+
+
+@pytest.mark.asyncio
+async def test_main__creates_Server_with_websocket_codec_if_specified(
+    patch_run_tasks, patch_subsystem_inits, mocker
+):
+    pytest.importorskip("orjson")
+
+    await main.main(["--websocket-codec", "orjson"])
+
+    assert isinstance(patch_subsystem_inits["server"].call_args[1]["codec"], OrjsonCodec)
 
 
 @pytest.mark.asyncio
@@ -277,13 +324,62 @@ async def test_main__creates_InstrumentComm_and_runs_correctly(
     expected_queues = spied_create_queues.spy_return
 
     patch_subsystem_inits["instrument_comm"].assert_called_once_with(
-        mocker.ANY, expected_queues["to"]["instrument_comm"], expected_queues["from"]["instrument_comm"]
+        mocker.ANY,
+        expected_queues["to"]["instrument_comm"],
+        expected_queues["from"]["instrument_comm"],
+        serial_read_mode=SerialCommReadModes.POLLING,
+        serial_comm_error_budget=None,
+        firmware_update_window_size=DEFAULT_FIRMWARE_UPDATE_WINDOW_SIZE,
+    )
+
+
+@pytest.mark.asyncio
+async def test_main__creates_InstrumentComm_with_event_driven_serial_reads_if_specified(
+    patch_run_tasks, patch_subsystem_inits, mocker
+):
+    await main.main(["--event-driven-serial-reads"])
+
+    assert (
+        patch_subsystem_inits["instrument_comm"].call_args[1]["serial_read_mode"]
+        == SerialCommReadModes.EVENT_DRIVEN
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "test_args,expected_error_budget",
+    [
+        (["--resilient-serial-parsing"], DEFAULT_SERIAL_COMM_ERROR_BUDGET),
+        (
+            ["--resilient-serial-parsing", "--serial-comm-error-budget", "5", "10.5"],
+            SerialCommErrorBudget(5, 10.5),
+        ),
+    ],
+)
+async def test_main__creates_InstrumentComm_with_serial_comm_error_budget_if_resilient_parsing_specified(
+    test_args, expected_error_budget, patch_run_tasks, patch_subsystem_inits, mocker
+):
+    await main.main(test_args)
+
+    assert (
+        patch_subsystem_inits["instrument_comm"].call_args[1]["serial_comm_error_budget"]
+        == expected_error_budget
     )
 
 
+@pytest.mark.asyncio
+async def test_main__creates_InstrumentComm_with_firmware_update_window_size_if_specified(
+    patch_run_tasks, patch_subsystem_inits, mocker
+):
+    await main.main(["--firmware-update-window-size", "4"])
+
+    assert patch_subsystem_inits["instrument_comm"].call_args[1]["firmware_update_window_size"] == 4
+
+
 @pytest.mark.asyncio
 async def test_main__creates_CloudComm_and_runs_correctly(patch_run_tasks, patch_subsystem_inits, mocker):
     spied_create_queues = mocker.spy(main, "create_system_queues")
+    spied_cloud_request_metrics = mocker.spy(main, "CloudRequestMetrics")
     spied_get_setting = mocker.spy(main, "_get_user_config_settings")
 
     await main.main([])
@@ -294,10 +390,42 @@ async def test_main__creates_CloudComm_and_runs_correctly(patch_run_tasks, patch
         mocker.ANY,
         expected_queues["to"]["cloud_comm"],
         expected_queues["from"]["cloud_comm"],
+        upload_dir_path=os.path.join(os.getcwd(), UPLOADS_SUBDIR),
+        upload_part_size=DEFAULT_UPLOAD_PART_SIZE_BYTES,
+        firmware_cache_dir_path=os.path.join(os.getcwd(), FW_CACHE_SUBDIR),
+        version_check_cache_file_path=os.path.join(os.getcwd(), VERSION_CHECK_CACHE_FILE_NAME),
+        cloud_client_settings=DEFAULT_CLOUD_CLIENT_SETTINGS,
+        request_metrics=spied_cloud_request_metrics.spy_return,
         **spied_get_setting.spy_return,
     )
 
 
+@pytest.mark.asyncio
+async def test_main__creates_CloudComm_with_http2_if_specified(
+    patch_run_tasks, patch_subsystem_inits, mocker
+):
+    await main.main(["--cloud-http2"])
+
+    assert patch_subsystem_inits["cloud_comm"].call_args[1]["cloud_client_settings"].http2 is True
+
+
+@pytest.mark.asyncio
+async def test_main__creates_CloudComm_with_dirs_in_base_directory_and_upload_part_size_if_specified(
+    patch_run_tasks, patch_subsystem_inits, mocker
+):
+    test_base_directory = os.path.join("Users", "Username", "AppData")
+
+    await main.main([f"--base-directory={test_base_directory}", "--upload-part-size-mib", "16"])
+
+    cloud_comm_kwargs = patch_subsystem_inits["cloud_comm"].call_args[1]
+    assert cloud_comm_kwargs["upload_dir_path"] == os.path.join(test_base_directory, UPLOADS_SUBDIR)
+    assert cloud_comm_kwargs["upload_part_size"] == 16 * 1024**2
+    assert cloud_comm_kwargs["firmware_cache_dir_path"] == os.path.join(test_base_directory, FW_CACHE_SUBDIR)
+    assert cloud_comm_kwargs["version_check_cache_file_path"] == os.path.join(
+        test_base_directory, VERSION_CHECK_CACHE_FILE_NAME
+    )
+
+
 @pytest.mark.asyncio
 async def test_main__waits_for_server_to_start_before_running_other_subsystems(patch_run_tasks, mocker):
     mocked_aio_event = mocker.patch.object(main.asyncio, "Event", autospec=True)
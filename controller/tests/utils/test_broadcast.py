@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from controller.utils.broadcast import BroadcastClient
+from controller.utils.broadcast import BroadcastHub
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_BroadcastHub__broadcast__sends_same_encoded_msg_to_each_client():
+    hub = BroadcastHub()
+    clients = [hub.add_client() for _ in range(3)]
+
+    test_msgs = ["msg_0", b"msg_1"]
+    for msg in test_msgs:
+        hub.broadcast(msg)
+
+    for client in clients:
+        msgs = await client.get_msgs()
+        assert msgs == test_msgs
+        # the msgs should not be copied for each client
+        assert all(msg is test_msg for msg, test_msg in zip(msgs, test_msgs))
+
+
+@pytest.mark.asyncio
+async def test_BroadcastHub__broadcast__does_not_send_msgs_to_removed_client():
+    hub = BroadcastHub()
+    client = hub.add_client()
+    hub.remove_client(client)
+    assert hub.num_clients == 0
+
+    hub.broadcast("msg")
+    assert not client._msgs
+
+
+@pytest.mark.asyncio
+async def test_BroadcastHub__broadcast__evicts_client_that_falls_behind_without_affecting_other_clients():
+    hub = BroadcastHub(max_num_queued_msgs_per_client=2)
+    slow_client = hub.add_client()
+    fast_client = hub.add_client()
+
+    for msg_idx in range(3):
+        hub.broadcast(str(msg_idx))
+        assert await fast_client.get_msgs() == [str(msg_idx)]
+
+    assert slow_client.is_evicted
+    assert hub.num_clients == 1
+    assert hub.num_clients_evicted == 1
+    # an empty list indicates that the client has been evicted
+    assert await slow_client.get_msgs() == []
+
+
+def test_BroadcastClient__raises_error_if_max_num_queued_msgs_invalid():
+    with pytest.raises(ValueError, match="Invalid max num queued msgs: 0"):
+        BroadcastClient(0)
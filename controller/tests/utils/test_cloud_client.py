@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from controller.constants import CLOUD_REQUEST_MAX_NUM_ATTEMPTS
+from controller.constants import CLOUD_REQUEST_RETRY_MAX_DELAY_SECONDS
+from controller.constants import CloudClientSettings
+from controller.constants import CloudRequestTypes
+from controller.utils import cloud_client
+from controller.utils.cloud_client import CloudClient
+from controller.utils.cloud_client import CloudRequestMetrics
+from controller.utils.cloud_client import LatencyHistogram
+import httpx
+import pytest
+
+
+TEST_URL = "https://cloud.local/route"
+
+# reference to the function before it is patched by fixture__patch_retry_delay
+get_retry_delay = cloud_client._get_retry_delay
+
+
+@pytest.fixture(scope="function", autouse=True)
+def fixture__patch_retry_delay(mocker):
+    yield mocker.patch.object(cloud_client, "_get_retry_delay", autospec=True, return_value=0)
+
+
+class FlakyRoute:
+    def __init__(self, num_failures: int, failure: int | type[httpx.TransportError]) -> None:
+        self.num_failures = num_failures
+        self.failure = failure
+        self.num_requests = 0
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.num_requests += 1
+        if self.num_requests > self.num_failures:
+            return httpx.Response(200)
+        if isinstance(self.failure, int):
+            return httpx.Response(self.failure)
+        raise self.failure("failed", request=request)
+
+
+def test_LatencyHistogram__counts_latencies_in_correct_buckets():
+    histogram = LatencyHistogram((10, 100))
+    for latency_ms in (5, 10, 50, 1000):
+        histogram.record(latency_ms)
+
+    assert histogram.get_metrics() == {
+        "count": 4,
+        "mean_ms": 266.25,
+        "max_ms": 1000,
+        "buckets": {"<=10ms": 2, "<=100ms": 1, ">100ms": 1},
+    }
+
+
+def test_LatencyHistogram__get_metrics__returns_correct_values_if_nothing_recorded():
+    assert LatencyHistogram((10,)).get_metrics() == {
+        "count": 0,
+        "mean_ms": None,
+        "max_ms": None,
+        "buckets": {"<=10ms": 0, ">10ms": 0},
+    }
+
+
+def test_get_retry_delay__never_exceeds_max_delay():
+    for retry_idx in range(20):
+        assert 0 <= get_retry_delay(retry_idx) <= CLOUD_REQUEST_RETRY_MAX_DELAY_SECONDS
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("test_failure", [503, httpx.ConnectError, httpx.ReadTimeout])
+async def test_CloudClient__request__retries_idempotent_request_until_it_succeeds(test_failure):
+    route = FlakyRoute(CLOUD_REQUEST_MAX_NUM_ATTEMPTS - 1, test_failure)
+    client = CloudClient(transport=httpx.MockTransport(route.handle_request))
+
+    res = await client.request("get", TEST_URL, request_type=CloudRequestTypes.METADATA)
+
+    assert res.status_code == 200
+    assert route.num_requests == CLOUD_REQUEST_MAX_NUM_ATTEMPTS
+    assert client.metrics.num_retries == CLOUD_REQUEST_MAX_NUM_ATTEMPTS - 1
+
+
+@pytest.mark.asyncio
+async def test_CloudClient__request__returns_last_response_if_all_attempts_fail():
+    route = FlakyRoute(CLOUD_REQUEST_MAX_NUM_ATTEMPTS, 503)
+    client = CloudClient(transport=httpx.MockTransport(route.handle_request))
+
+    res = await client.request("get", TEST_URL, request_type=CloudRequestTypes.METADATA)
+
+    assert res.status_code == 503
+    assert route.num_requests == CLOUD_REQUEST_MAX_NUM_ATTEMPTS
+
+
+@pytest.mark.asyncio
+async def test_CloudClient__request__raises_error_if_all_attempts_fail_with_transport_error():
+    route = FlakyRoute(CLOUD_REQUEST_MAX_NUM_ATTEMPTS, httpx.ConnectError)
+    client = CloudClient(transport=httpx.MockTransport(route.handle_request))
+
+    with pytest.raises(httpx.ConnectError):
+        await client.request("get", TEST_URL, request_type=CloudRequestTypes.METADATA)
+    assert route.num_requests == CLOUD_REQUEST_MAX_NUM_ATTEMPTS
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("test_failure", [503, httpx.ConnectError])
+async def test_CloudClient__request__does_not_retry_non_idempotent_request(test_failure):
+    route = FlakyRoute(1, test_failure)
+    client = CloudClient(transport=httpx.MockTransport(route.handle_request))
+
+    if isinstance(test_failure, int):
+        res = await client.request("post", TEST_URL, request_type=CloudRequestTypes.METADATA)
+        assert res.status_code == test_failure
+    else:
+        with pytest.raises(test_failure):
+            await client.request("post", TEST_URL, request_type=CloudRequestTypes.METADATA)
+
+    assert route.num_requests == 1
+    assert client.metrics.num_retries == 0
+
+
+@pytest.mark.asyncio
+async def test_CloudClient__request__does_not_retry_request_with_status_code_that_will_not_change():
+    route = FlakyRoute(1, 404)
+    client = CloudClient(transport=httpx.MockTransport(route.handle_request))
+
+    res = await client.request("get", TEST_URL, request_type=CloudRequestTypes.METADATA)
+
+    assert res.status_code == 404
+    assert route.num_requests == 1
+
+
+@pytest.mark.asyncio
+async def test_CloudClient__records_latencies_of_each_request_type():
+    test_metrics = CloudRequestMetrics()
+    client = CloudClient(metrics=test_metrics, transport=httpx.MockTransport(lambda _: httpx.Response(200)))
+
+    await client.request("post", TEST_URL, request_type=CloudRequestTypes.AUTH)
+    await client.request("get", TEST_URL, request_type=CloudRequestTypes.METADATA)
+    async with client.stream("get", TEST_URL, request_type=CloudRequestTypes.DOWNLOAD):
+        pass
+
+    latencies = test_metrics.get_metrics()["latencies"]
+    assert {request_type: metrics["count"] for request_type, metrics in latencies.items()} == {
+        "auth": 1,
+        "metadata": 1,
+        "download": 1,
+        "upload": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_CloudClient__uses_http1_if_http2_not_available(mocker):
+    mocker.patch.object(cloud_client, "IS_HTTP2_AVAILABLE", False)
+    spied_async_client = mocker.spy(httpx, "AsyncClient")
+
+    client = CloudClient(CloudClientSettings(10, 5, 30, True))
+    await client.aclose()
+
+    assert spied_async_client.call_args[1]["http2"] is False
@@ -2,21 +2,68 @@
 import asyncio
 from random import randint
 
-from controller.constants import SERIAL_COMM_RESPONSE_TIMEOUT_SECONDS
 from controller.utils import command_tracking
 from controller.utils.command_tracking import CommandTracker
 import pytest
 
 
 @pytest.mark.asyncio
-async def test_CommandTracker__add__sets_up_timer_for_command_expiration(mocker):
-    spied_sleep = mocker.spy(command_tracking.asyncio, "sleep")
+async def test_CommandTracker__add__sets_default_timeout_for_command_expiration(mocker):
+    mocker.patch.object(command_tracking, "SERIAL_COMM_RESPONSE_TIMEOUT_SECONDS", 0.01)
+    ct = CommandTracker()
+
+    await ct.add(randint(0, 100), {"test": "command"})
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(ct.wait_for_expired_command(), timeout=0.005)
+    assert await asyncio.wait_for(ct.wait_for_expired_command(), timeout=1) == {"test": "command"}
+
+
+@pytest.mark.asyncio
+async def test_CommandTracker__add__uses_given_timeout_instead_of_default():
+    ct = CommandTracker()
+
+    # this command would take longer than the test to expire with the default timeout
+    await ct.add(randint(0, 100), {"test": "command"}, timeout_seconds=0)
+
+    assert await asyncio.wait_for(ct.wait_for_expired_command(), timeout=1) == {"test": "command"}
+
+
+@pytest.mark.asyncio
+async def test_CommandTracker__add__does_not_create_task_for_command(mocker):
+    spied_create_task = mocker.spy(command_tracking.asyncio, "create_task")
+
+    ct = CommandTracker()
+    for packet_type in range(10):
+        await ct.add(packet_type, {})
+
+    spied_create_task.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_CommandTracker__wait_for_expired_command__wakes_up_for_command_added_with_earlier_deadline():
+    ct = CommandTracker()
+    await ct.add(randint(0, 100), {})
+
+    expired_command_task = asyncio.create_task(ct.wait_for_expired_command())
+    await asyncio.sleep(0)
+    await ct.add(randint(0, 100), {"expected": "command"}, timeout_seconds=0)
+
+    assert await asyncio.wait_for(expired_command_task, timeout=1) == {"expected": "command"}
 
-    await CommandTracker().add(randint(0, 100), {})
 
-    # this is assuming that the last await of asyncio.sleep is the one we're expecting.
-    # if this assertion starts failing, try assert_any_await
-    spied_sleep.assert_awaited_with(SERIAL_COMM_RESPONSE_TIMEOUT_SECONDS)
+@pytest.mark.asyncio
+async def test_CommandTracker__pop__removes_completed_commands_from_deadline_heap():
+    ct = CommandTracker()
+
+    test_packet_type = randint(0, 100)
+    for _ in range(10):
+        await ct.add(test_packet_type, {})
+    for _ in range(10):
+        await ct.pop(test_packet_type)
+
+    assert len(ct) == 0
+    assert ct._deadline_heap == []
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+from random import choice
+from random import randint
+import time
+
+from controller.constants import MICRO_TO_BASE_CONVERSION
+from controller.constants import NUM_WELLS
+from controller.constants import SERIAL_COMM_MAGIC_WORD_BYTES
+from controller.constants import SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES
+from controller.constants import SERIAL_COMM_MIN_SAMPLING_PERIOD_MICROSECONDS
+from controller.constants import SERIAL_COMM_MODULE_ID_TO_WELL_IDX
+from controller.constants import SERIAL_COMM_NUM_CHANNELS_PER_SENSOR
+from controller.constants import SERIAL_COMM_TIME_INDEX_LENGTH_BYTES
+from controller.constants import SERIAL_COMM_TIME_OFFSET_LENGTH_BYTES
+from controller.constants import SerialCommPacketTypes
+from controller.constants import StimProtocolStatuses
+from controller.exceptions import SerialCommIncorrectChecksumFromInstrumentError
+from controller.exceptions import SerialCommIncorrectMagicWordFromInstrumentError
+from controller.utils.data_parsing_cy import PacketBuilder
+from controller.utils.data_parsing_cy import parse_magnetometer_data
+from controller.utils.data_parsing_cy import parse_stim_data
+from controller.utils.data_parsing_cy import sort_serial_packets
+from controller.utils.data_parsing_cy import STIM_STATUS_UPDATE_DTYPE
+from controller.utils.serial_comm import create_data_packet
+from controller.utils.serial_comm import get_serial_comm_timestamp
+import numpy as np
+import pytest
+
+from ..helpers import get_random_protocol_status
+from ..helpers import random_timestamp
+
+
+def _create_stim_status_packet(num_status_updates=1):
+    return create_data_packet(
+        random_timestamp(),
+        SerialCommPacketTypes.STIM_STATUS,
+        bytes([num_status_updates])
+        + b"".join(
+            get_random_protocol_status(stim_status=StimProtocolStatuses.ACTIVE)
+            for _ in range(num_status_updates)
+        ),
+    )
+
+
+def _create_magnetometer_data_packet(time_index, well_data, num_sensors_per_well=1):
+    payload = time_index.to_bytes(SERIAL_COMM_TIME_INDEX_LENGTH_BYTES, byteorder="little")
+    for module_id in range(NUM_WELLS):
+        well_idx = SERIAL_COMM_MODULE_ID_TO_WELL_IDX[module_id]
+        sensor_data = (
+            bytes(SERIAL_COMM_TIME_OFFSET_LENGTH_BYTES) + well_data[well_idx].astype("<u2").tobytes()
+        )
+        payload += sensor_data * num_sensors_per_well
+    return create_data_packet(random_timestamp(), SerialCommPacketTypes.MAGNETOMETER_DATA, payload)
+
+
+def _create_random_magnetometer_data(num_samples):
+    return np.random.randint(
+        0, 0xFFFF, (NUM_WELLS, SERIAL_COMM_NUM_CHANNELS_PER_SENSOR, num_samples), dtype=np.uint16
+    )
+
+
+def _create_output_arrays(num_samples):
+    return (
+        np.zeros(num_samples, dtype=np.int64),
+        np.zeros((NUM_WELLS, SERIAL_COMM_NUM_CHANNELS_PER_SENSOR, num_samples), dtype=np.uint16),
+    )
+
+
+def test_sort_serial_packets__sorts_packets_by_type_and_returns_num_bytes_sorted():
+    test_timestamp = random_timestamp()
+    test_barcode = b"ML22001000-2"
+
+    stim_packet = _create_stim_status_packet()
+    other_packet = create_data_packet(test_timestamp, SerialCommPacketTypes.BARCODE_FOUND, test_barcode)
+    incomplete_packet = _create_stim_status_packet()[:-1]
+
+    test_bytes = bytearray(stim_packet + other_packet + incomplete_packet)
+
+    sorted_packet_dict = sort_serial_packets(test_bytes)
+
+    assert sorted_packet_dict["num_packets_sorted"] == 2
+    assert sorted_packet_dict["num_bytes_sorted"] == len(stim_packet) + len(other_packet)
+    assert sorted_packet_dict["stimulation_stream_info"]["num_packets"] == 1
+    assert sorted_packet_dict["other_packet_info"] == [
+        (test_timestamp, SerialCommPacketTypes.BARCODE_FOUND, bytearray(test_barcode))
+    ]
+
+
+def test_sort_serial_packets__parses_memoryview_of_reused_buffer_in_place():
+    stim_packet = _create_stim_status_packet()
+
+    buffer = bytearray(len(stim_packet) * 3)
+    buffer[: len(stim_packet)] = stim_packet
+    view = memoryview(buffer)[: len(stim_packet)]
+
+    sorted_packet_dict = sort_serial_packets(view)
+    assert sorted_packet_dict["num_bytes_sorted"] == len(stim_packet)
+
+    # modifying the buffer afterwards should not affect the returned values
+    stim_bytes_copy = bytes(sorted_packet_dict["stimulation_stream_info"]["raw_bytes"])
+    buffer[:] = bytes(len(buffer))
+    assert bytes(sorted_packet_dict["stimulation_stream_info"]["raw_bytes"]) == stim_bytes_copy
+
+
+def test_sort_serial_packets__raises_error_if_magic_word_incorrect():
+    bad_packet = bytearray(_create_stim_status_packet())
+    bad_packet[randint(0, len(SERIAL_COMM_MAGIC_WORD_BYTES) - 1)] ^= 0xFF
+
+    with pytest.raises(SerialCommIncorrectMagicWordFromInstrumentError):
+        sort_serial_packets(bad_packet)
+
+
+def test_sort_serial_packets__raises_error_if_checksum_incorrect():
+    bad_packet = bytearray(_create_stim_status_packet())
+    bad_packet[-1] ^= 0xFF
+
+    with pytest.raises(SerialCommIncorrectChecksumFromInstrumentError):
+        sort_serial_packets(bad_packet)
+
+
+def test_sort_serial_packets__sorts_magnetometer_data_packets():
+    test_data = _create_random_magnetometer_data(2)
+    mag_packets = [_create_magnetometer_data_packet(i, test_data[:, :, i]) for i in range(2)]
+
+    sorted_packet_dict = sort_serial_packets(
+        bytearray(mag_packets[0] + _create_stim_status_packet() + mag_packets[1])
+    )
+
+    mag_stream_info = sorted_packet_dict["magnetometer_stream_info"]
+    assert mag_stream_info["num_packets"] == 2
+    assert len(mag_stream_info["raw_bytes"]) == 2 * (
+        SERIAL_COMM_TIME_INDEX_LENGTH_BYTES
+        + NUM_WELLS * (SERIAL_COMM_TIME_OFFSET_LENGTH_BYTES + SERIAL_COMM_NUM_CHANNELS_PER_SENSOR * 2)
+    )
+
+
+@pytest.mark.parametrize("num_sensors_per_well", [1, 3])
+def test_parse_magnetometer_data__decodes_data_into_given_arrays_by_well_idx(num_sensors_per_well):
+    num_samples = randint(1, 10)
+    test_time_indices = np.arange(num_samples, dtype=np.int64) * randint(1, 1000) + randint(0, 1000)
+    test_data = _create_random_magnetometer_data(num_samples)
+
+    test_bytes = bytearray(
+        b"".join(
+            _create_magnetometer_data_packet(
+                int(test_time_indices[i]), test_data[:, :, i], num_sensors_per_well
+            )
+            for i in range(num_samples)
+        )
+    )
+    mag_stream_info = sort_serial_packets(test_bytes)["magnetometer_stream_info"]
+
+    time_indices, data = _create_output_arrays(num_samples)
+    num_samples_written = parse_magnetometer_data(
+        mag_stream_info["raw_bytes"], mag_stream_info["num_packets"], time_indices, data
+    )
+
+    assert num_samples_written == num_samples
+    np.testing.assert_array_equal(time_indices, test_time_indices)
+    np.testing.assert_array_equal(data, test_data)
+
+
+def test_parse_magnetometer_data__writes_samples_starting_at_given_idx():
+    test_data = _create_random_magnetometer_data(2)
+    test_bytes = bytearray(
+        b"".join(_create_magnetometer_data_packet(i + 1, test_data[:, :, i]) for i in range(2))
+    )
+    mag_stream_info = sort_serial_packets(test_bytes)["magnetometer_stream_info"]
+
+    time_indices, data = _create_output_arrays(5)
+    parse_magnetometer_data(mag_stream_info["raw_bytes"], 2, time_indices, data, start_idx=3)
+
+    np.testing.assert_array_equal(time_indices, [0, 0, 0, 1, 2])
+    np.testing.assert_array_equal(data[:, :, :3], 0)
+    np.testing.assert_array_equal(data[:, :, 3:], test_data)
+
+
+def test_parse_magnetometer_data__raises_error_if_not_enough_space_in_arrays():
+    test_bytes = bytearray(
+        b"".join(
+            _create_magnetometer_data_packet(i, _create_random_magnetometer_data(1)[:, :, 0])
+            for i in range(3)
+        )
+    )
+    mag_stream_info = sort_serial_packets(test_bytes)["magnetometer_stream_info"]
+
+    time_indices, data = _create_output_arrays(3)
+    with pytest.raises(ValueError, match="Not enough space to write 3 samples starting at idx 1"):
+        parse_magnetometer_data(mag_stream_info["raw_bytes"], 3, time_indices, data, start_idx=1)
+
+
+def test_parse_magnetometer_data__raises_error_if_data_array_has_incorrect_shape():
+    mag_packet = _create_magnetometer_data_packet(0, _create_random_magnetometer_data(1)[:, :, 0])
+    mag_stream_info = sort_serial_packets(bytearray(mag_packet))["magnetometer_stream_info"]
+
+    time_indices = np.zeros(1, dtype=np.int64)
+    data = np.zeros((NUM_WELLS - 1, SERIAL_COMM_NUM_CHANNELS_PER_SENSOR, 1), dtype=np.uint16)
+    with pytest.raises(ValueError, match="data array must have shape"):
+        parse_magnetometer_data(mag_stream_info["raw_bytes"], 1, time_indices, data)
+
+
+@pytest.mark.slow
+def test_parse_magnetometer_data__performance_keeps_up_with_min_sampling_period():
+    # one second of data at the fastest sampling period the firmware supports
+    num_samples = MICRO_TO_BASE_CONVERSION // SERIAL_COMM_MIN_SAMPLING_PERIOD_MICROSECONDS
+    test_data = _create_random_magnetometer_data(num_samples)
+    test_bytes = bytearray(
+        b"".join(_create_magnetometer_data_packet(i, test_data[:, :, i]) for i in range(num_samples))
+    )
+    time_indices, data = _create_output_arrays(num_samples)
+
+    num_iterations = 20
+    start = time.perf_counter()
+    for _ in range(num_iterations):
+        mag_stream_info = sort_serial_packets(test_bytes)["magnetometer_stream_info"]
+        parse_magnetometer_data(mag_stream_info["raw_bytes"], num_samples, time_indices, data)
+    dur_per_second_of_data = (time.perf_counter() - start) / num_iterations
+
+    np.testing.assert_array_equal(data, test_data)
+    # sorting and parsing should only take a small fraction of the time it takes the instrument to produce the data
+    assert dur_per_second_of_data < 0.05
+
+
+def test_sort_serial_packets__raises_error_if_magic_word_incorrect_even_if_packet_appears_incomplete():
+    stim_packet = _create_stim_status_packet()
+    # the bytes where the packet length would be will be interpreted as a length much longer than the bytes given
+    bad_bytes = bytes(len(SERIAL_COMM_MAGIC_WORD_BYTES)) + bytes([0xFF, 0xFF]) + bytes(20)
+
+    with pytest.raises(SerialCommIncorrectMagicWordFromInstrumentError):
+        sort_serial_packets(bytearray(stim_packet + bad_bytes))
+
+
+def test_sort_serial_packets__returns_no_corruption_counts_if_no_corrupted_packets():
+    sorted_packet_dict = sort_serial_packets(bytearray(_create_stim_status_packet()), resilient=True)
+
+    for counts in sorted_packet_dict["corruption_counts"].values():
+        assert counts == {"num_packets_dropped": 0, "num_bytes_dropped": 0}
+
+
+def test_sort_serial_packets__drops_and_counts_corrupted_packets_in_resilient_mode():
+    test_timestamp = random_timestamp()
+    test_barcode = b"ML22001000-2"
+    good_packets = [
+        create_data_packet(test_timestamp, SerialCommPacketTypes.BARCODE_FOUND, test_barcode)
+        for _ in range(4)
+    ]
+
+    bad_magic_word_bytes = bytes(randint(1, 30))
+
+    bad_length_packet = bytearray(good_packets[0])
+    bad_length_packet[len(SERIAL_COMM_MAGIC_WORD_BYTES) + 1] = 0xFF
+
+    bad_checksum_packet = bytearray(good_packets[0])
+    bad_checksum_packet[-1] ^= 0xFF
+
+    test_bytes = bytearray(
+        good_packets[0]
+        + bad_magic_word_bytes
+        + good_packets[1]
+        + bad_length_packet
+        + good_packets[2]
+        + bad_checksum_packet
+        + good_packets[3]
+    )
+
+    sorted_packet_dict = sort_serial_packets(test_bytes, resilient=True)
+
+    assert sorted_packet_dict["num_packets_sorted"] == 4
+    assert sorted_packet_dict["num_bytes_sorted"] == len(test_bytes)
+    assert sorted_packet_dict["other_packet_info"] == [
+        (test_timestamp, SerialCommPacketTypes.BARCODE_FOUND, bytearray(test_barcode))
+    ] * len(good_packets)
+    assert sorted_packet_dict["corruption_counts"] == {
+        "incorrect_magic_word": {"num_packets_dropped": 1, "num_bytes_dropped": len(bad_magic_word_bytes)},
+        "invalid_packet_length": {"num_packets_dropped": 1, "num_bytes_dropped": len(bad_length_packet)},
+        "incorrect_checksum": {"num_packets_dropped": 1, "num_bytes_dropped": len(bad_checksum_packet)},
+    }
+
+
+def test_sort_serial_packets__keeps_bytes_that_could_be_start_of_magic_word_after_corruption_in_resilient_mode():
+    stim_packet = _create_stim_status_packet()
+    test_bytes = bytearray(bytes(30) + stim_packet[:5])
+
+    sorted_packet_dict = sort_serial_packets(test_bytes, resilient=True)
+
+    assert test_bytes[sorted_packet_dict["num_bytes_sorted"] :].endswith(stim_packet[:5])
+    assert len(test_bytes) - sorted_packet_dict["num_bytes_sorted"] < len(SERIAL_COMM_MAGIC_WORD_BYTES)
+
+
+def test_sort_serial_packets__counts_corrupted_bytes_split_across_calls_as_single_packet_in_resilient_mode():
+    stim_packet = _create_stim_status_packet()
+    test_chunks = [bytes(range(1, 16)), bytes(range(16, 31)), stim_packet]
+
+    unsorted_bytes = bytearray()
+    is_in_corrupted_run = False
+    num_packets_dropped = num_bytes_dropped = num_packets_sorted = 0
+    for chunk in test_chunks:
+        unsorted_bytes += chunk
+        sorted_packet_dict = sort_serial_packets(
+            unsorted_bytes, resilient=True, is_in_corrupted_run=is_in_corrupted_run
+        )
+        del unsorted_bytes[: sorted_packet_dict["num_bytes_sorted"]]
+        is_in_corrupted_run = sorted_packet_dict["is_in_corrupted_run"]
+
+        counts = sorted_packet_dict["corruption_counts"]["incorrect_magic_word"]
+        num_packets_dropped += counts["num_packets_dropped"]
+        num_bytes_dropped += counts["num_bytes_dropped"]
+        num_packets_sorted += sorted_packet_dict["num_packets_sorted"]
+
+    assert num_packets_dropped == 1
+    assert num_bytes_dropped == 30
+    assert num_packets_sorted == 1
+    assert not unsorted_bytes
+    assert is_in_corrupted_run is False
+
+
+def test_parse_stim_data__parses_all_status_updates_into_structured_array():
+    test_status_updates = [
+        (protocol_idx, randint(0, 2**63 - 1), choice(list(StimProtocolStatuses)), randint(0, 0xFF))
+        for protocol_idx in (1, 0, 1, 2, 1)
+    ]
+    status_update_bytes = [
+        get_random_protocol_status(
+            protocol_id=protocol_idx,
+            subprotocol_start_time_idx=time_index,
+            stim_status=status,
+            subprotocol_idx=subprotocol_idx,
+        )
+        for protocol_idx, time_index, status, subprotocol_idx in test_status_updates
+    ]
+    stim_packets = [
+        create_data_packet(
+            random_timestamp(),
+            SerialCommPacketTypes.STIM_STATUS,
+            bytes([2]) + b"".join(status_update_bytes[:2]),
+        ),
+        create_data_packet(
+            random_timestamp(),
+            SerialCommPacketTypes.STIM_STATUS,
+            bytes([3]) + b"".join(status_update_bytes[2:]),
+        ),
+    ]
+    stim_stream_info = sort_serial_packets(bytearray(b"".join(stim_packets)))["stimulation_stream_info"]
+
+    status_updates, status_updates_by_protocol = parse_stim_data(*stim_stream_info.values())
+
+    assert status_updates.dtype == STIM_STATUS_UPDATE_DTYPE
+    assert status_updates.tolist() == test_status_updates
+
+    assert list(status_updates_by_protocol) == [0, 1, 2]
+    for protocol_idx, protocol_status_updates in status_updates_by_protocol.items():
+        assert protocol_status_updates.tolist() == [
+            status_update for status_update in test_status_updates if status_update[0] == protocol_idx
+        ]
+
+
+def test_parse_stim_data__returns_empty_array_if_no_packets():
+    status_updates, status_updates_by_protocol = parse_stim_data(bytearray(), 0)
+    assert len(status_updates) == 0
+    assert status_updates_by_protocol == {}
+
+
+@pytest.mark.parametrize("test_num_status_updates_per_packet", [[0], [1, 0], [0, 1, 0]])
+def test_parse_stim_data__handles_packets_without_any_status_updates(test_num_status_updates_per_packet):
+    test_status_updates = [
+        get_random_protocol_status(stim_status=StimProtocolStatuses.ACTIVE)
+        for _ in range(sum(test_num_status_updates_per_packet))
+    ]
+    test_payloads = bytearray()
+    for num_status_updates in test_num_status_updates_per_packet:
+        test_payloads += bytes([num_status_updates]) + b"".join(test_status_updates[:num_status_updates])
+        test_status_updates = test_status_updates[num_status_updates:]
+
+    status_updates, status_updates_by_protocol = parse_stim_data(
+        test_payloads, len(test_num_status_updates_per_packet)
+    )
+    assert len(status_updates) == sum(test_num_status_updates_per_packet)
+    assert sum(len(updates) for updates in status_updates_by_protocol.values()) == len(status_updates)
+
+
+def test_parse_stim_data__raises_error_if_packet_contains_fewer_status_updates_than_specified():
+    with pytest.raises(ValueError, match="Stim packet 0 contains more status updates than bytes"):
+        parse_stim_data(
+            bytearray([2]) + get_random_protocol_status(stim_status=StimProtocolStatuses.FINISHED), 1
+        )
+
+
+@pytest.mark.parametrize("test_payload", [bytes(0), bytes([1, 2, 3]), bytearray(range(0xFF))])
+def test_PacketBuilder__build__creates_same_packet_as_create_data_packet(test_payload):
+    test_timestamp = random_timestamp()
+    test_packet_type = randint(0, 0xFF)
+
+    builder = PacketBuilder()
+    assert builder.build(test_packet_type, test_payload, test_timestamp) == create_data_packet(
+        test_timestamp, test_packet_type, bytes(test_payload)
+    )
+
+
+def test_PacketBuilder__build__does_not_modify_previously_built_packets():
+    builder = PacketBuilder()
+    first_packet = builder.build(SerialCommPacketTypes.STOP_STIM, bytes([1, 2, 3]), 0)
+    builder.build(SerialCommPacketTypes.HANDSHAKE, bytes(0), 1)
+
+    assert first_packet == create_data_packet(0, SerialCommPacketTypes.STOP_STIM, bytes([1, 2, 3]))
+
+
+def test_PacketBuilder__build__uses_current_timestamp_if_not_given():
+    builder = PacketBuilder()
+
+    timestamp_before = builder.get_timestamp()
+    sorted_packet_dict = sort_serial_packets(bytearray(builder.build(SerialCommPacketTypes.HANDSHAKE)))
+    timestamp_after = builder.get_timestamp()
+
+    packet_timestamp = sorted_packet_dict["other_packet_info"][0][0]
+    assert timestamp_before <= packet_timestamp <= timestamp_after
+
+
+def test_PacketBuilder__build__raises_error_if_payload_too_long():
+    with pytest.raises(ValueError, match="exceeds max"):
+        PacketBuilder().build(
+            SerialCommPacketTypes.HANDSHAKE, bytes(SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES + 1)
+        )
+
+
+def test_PacketBuilder__get_timestamp__is_anchored_to_serial_comm_timestamp_epoch():
+    timestamp_before = get_serial_comm_timestamp()
+    builder = PacketBuilder()
+    timestamp_after = get_serial_comm_timestamp()
+
+    # the builder's monotonic clock is not adjusted with the wall clock, so allow a little drift
+    assert timestamp_before - 1000 <= builder.get_timestamp() <= timestamp_after + 1000
+    assert builder.get_timestamp() <= builder.get_timestamp()
+
+
+@pytest.mark.slow
+def test_PacketBuilder__performance_compared_to_create_data_packet():
+    num_packets = 10000
+    test_payload = bytes(20)
+    builder = PacketBuilder()
+
+    start = time.perf_counter()
+    for _ in range(num_packets):
+        create_data_packet(get_serial_comm_timestamp(), SerialCommPacketTypes.HANDSHAKE, test_payload)
+    create_data_packet_dur = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(num_packets):
+        builder.build(SerialCommPacketTypes.HANDSHAKE, test_payload)
+    packet_builder_dur = time.perf_counter() - start
+
+    print(  # allow-print
+        f"create_data_packet: {create_data_packet_dur / num_packets * 1e6:.3f} us/packet, "
+        f"PacketBuilder: {packet_builder_dur / num_packets * 1e6:.3f} us/packet"
+    )
+    assert packet_builder_dur < create_data_packet_dur
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import os
+from time import perf_counter
+import tracemalloc
+import zipfile
+
+from controller.utils.files import create_zip_file_and_get_md5
+from controller.utils.files import get_file_md5
+import pytest
+
+
+def _get_expected_md5s(file_path):
+    with open(file_path, "rb") as f:
+        return base64.b64encode(hashlib.md5(f.read()).digest()).decode()
+
+
+def _create_log_files(dir_path, num_files, num_lines_per_file):
+    os.makedirs(dir_path)
+    for file_idx in range(num_files):
+        with open(os.path.join(dir_path, f"log_{file_idx}.txt"), "w") as f:
+            for line_idx in range(num_lines_per_file):
+                f.write(
+                    f"[2023-04-10 12:00:00.{line_idx % 1000:03}] INFO Log line {line_idx} of file {file_idx}\n"
+                )
+
+
+def test_get_file_md5__returns_base64_encoded_md5_of_file(tmp_path):
+    test_file_path = os.path.join(tmp_path, "test_file")
+    with open(test_file_path, "wb") as f:
+        f.write(os.urandom(1000000))
+
+    assert get_file_md5(test_file_path) == _get_expected_md5s(test_file_path)
+
+
+def test_create_zip_file_and_get_md5__zips_all_files_in_folder_and_returns_md5_of_zip_file(tmp_path):
+    test_dir_path = os.path.join(tmp_path, "logs")
+    _create_log_files(test_dir_path, num_files=3, num_lines_per_file=1000)
+    test_zip_file_path = os.path.join(tmp_path, "logs.zip")
+
+    md5s = create_zip_file_and_get_md5(test_dir_path, test_zip_file_path)
+
+    assert md5s == _get_expected_md5s(test_zip_file_path)
+
+    with zipfile.ZipFile(test_zip_file_path) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == sorted(os.listdir(test_dir_path))
+        for file_name in zf.namelist():
+            with open(os.path.join(test_dir_path, file_name), "rb") as f:
+                assert zf.read(file_name) == f.read()
+            assert zf.getinfo(file_name).compress_type == zipfile.ZIP_DEFLATED
+
+
+@pytest.mark.slow
+def test_create_zip_file_and_get_md5__performance_and_peak_memory_of_large_log_folder(tmp_path):
+    test_dir_path = os.path.join(tmp_path, "logs")
+    # ~100 MB
+    _create_log_files(test_dir_path, num_files=10, num_lines_per_file=150000)
+    total_size = sum(os.path.getsize(os.path.join(test_dir_path, name)) for name in os.listdir(test_dir_path))
+
+    tracemalloc.start()
+    start = perf_counter()
+    create_zip_file_and_get_md5(test_dir_path, os.path.join(tmp_path, "logs.zip"))
+    dur = perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(  # allow-print
+        f"Zipped {total_size / 1e6:.0f} MB in {dur:.2f} s, peak memory: {peak_memory / 1e6:.2f} MB"
+    )
+    assert peak_memory < 4e6
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import os
+
+from controller.utils.firmware_cache import FirmwareCache
+import pytest
+
+
+async def _to_stream(contents, chunk_size=100):
+    for chunk_start_idx in range(0, len(contents), chunk_size):
+        yield contents[chunk_start_idx : chunk_start_idx + chunk_size]
+
+
+def _get_object_file_names(cache_dir_path):
+    return os.listdir(os.path.join(cache_dir_path, "objects"))
+
+
+@pytest.mark.asyncio
+async def test_FirmwareCache__add_from_stream__stores_file_that_persists_across_instances(tmp_path):
+    test_contents = os.urandom(1000)
+
+    cache = FirmwareCache(tmp_path)
+    assert cache.get("main", "1.0.0") is None
+    assert await cache.add_from_stream("main", "1.0.0", _to_stream(test_contents)) == test_contents
+
+    cache = FirmwareCache(tmp_path)
+    assert cache.get("main", "1.0.0") == test_contents
+    assert cache.get("channel", "1.0.0") is None
+    assert cache.get_metrics() == {
+        "num_entries": 1,
+        "size_bytes": len(test_contents),
+        "max_size_bytes": cache._max_size_bytes,
+        "num_hits": 1,
+        "num_misses": 1,
+        "num_evictions": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_FirmwareCache__add_from_stream__only_stores_identical_files_once(tmp_path):
+    test_contents = os.urandom(1000)
+
+    cache = FirmwareCache(tmp_path)
+    await cache.add_from_stream("main", "1.0.0", _to_stream(test_contents))
+    await cache.add_from_stream("main", "1.0.1", _to_stream(test_contents))
+
+    assert len(_get_object_file_names(tmp_path)) == 1
+    assert cache.size_bytes == len(test_contents)
+    assert cache.get("main", "1.0.0") == cache.get("main", "1.0.1") == test_contents
+
+
+@pytest.mark.asyncio
+async def test_FirmwareCache__add_from_stream__keeps_file_when_same_file_is_added_again_for_same_version(
+    tmp_path,
+):
+    test_contents = os.urandom(1000)
+
+    cache = FirmwareCache(tmp_path)
+    await cache.add_from_stream("main", "1.0.0", _to_stream(test_contents))
+    assert await cache.add_from_stream("main", "1.0.0", _to_stream(test_contents)) == test_contents
+
+    assert len(_get_object_file_names(tmp_path)) == 1
+    assert cache.size_bytes == len(test_contents)
+    assert FirmwareCache(tmp_path).get("main", "1.0.0") == test_contents
+
+
+@pytest.mark.asyncio
+async def test_FirmwareCache__add_from_stream__evicts_least_recently_used_files_when_max_size_exceeded(
+    tmp_path,
+):
+    # only enough room for 2 files
+    cache = FirmwareCache(tmp_path, max_size_bytes=2000)
+
+    await cache.add_from_stream("main", "1.0.0", _to_stream(os.urandom(1000)))
+    await cache.add_from_stream("channel", "1.0.0", _to_stream(os.urandom(1000)))
+    # use the first file so that the second is now the least recently used
+    cache.get("main", "1.0.0")
+    await cache.add_from_stream("main", "1.0.1", _to_stream(os.urandom(1000)))
+
+    assert cache.num_evictions == 1
+    assert cache.get("channel", "1.0.0") is None
+    assert cache.get("main", "1.0.0") is not None
+    assert len(_get_object_file_names(tmp_path)) == 2
+
+
+@pytest.mark.asyncio
+async def test_FirmwareCache__get__removes_corrupted_file(tmp_path):
+    cache = FirmwareCache(tmp_path)
+    await cache.add_from_stream("main", "1.0.0", _to_stream(os.urandom(1000)))
+
+    (object_file_name,) = _get_object_file_names(tmp_path)
+    with open(os.path.join(tmp_path, "objects", object_file_name), "r+b") as f:
+        f.write(b"corrupted")
+
+    assert cache.get("main", "1.0.0") is None
+    assert _get_object_file_names(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_FirmwareCache__removes_files_left_behind_by_interrupted_downloads(tmp_path):
+    async def interrupted_stream():
+        yield b"partial"
+        raise ConnectionError()
+
+    cache = FirmwareCache(tmp_path)
+    with pytest.raises(ConnectionError):
+        await cache.add_from_stream("main", "1.0.0", interrupted_stream())
+    assert os.listdir(tmp_path) == ["objects"]
+
+    # simulate the controller shutting down in the middle of a download
+    with open(os.path.join(tmp_path, "download.tmp"), "wb") as f:
+        f.write(b"partial")
+    with open(os.path.join(tmp_path, "objects", "unknown"), "wb") as f:
+        f.write(b"unknown")
+
+    FirmwareCache(tmp_path)
+    assert os.listdir(tmp_path) == ["objects"]
+    assert _get_object_file_names(tmp_path) == []
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from random import randint
+
+from controller.constants import SERIAL_COMM_PACKET_BUFFER_SIZE_BYTES
+from controller.utils.packet_buffer import SerialPacketBuffer
+import pytest
+
+
+def test_SerialPacketBuffer__uses_default_capacity():
+    assert SerialPacketBuffer().capacity == SERIAL_COMM_PACKET_BUFFER_SIZE_BYTES
+
+
+def test_SerialPacketBuffer__write__appends_bytes_to_unread_bytes():
+    buffer = SerialPacketBuffer(100)
+
+    buffer.write(bytes([1, 2, 3]))
+    buffer.write(bytes([4, 5]))
+
+    assert len(buffer) == 5
+    assert bytes(buffer.unread_bytes) == bytes([1, 2, 3, 4, 5])
+    assert buffer.num_bytes_free == 95
+
+
+def test_SerialPacketBuffer__write__raises_error_if_not_enough_space():
+    buffer = SerialPacketBuffer(10)
+    buffer.write(bytes(8))
+
+    with pytest.raises(ValueError, match="Cannot write 3 bytes, only 2 bytes free"):
+        buffer.write(bytes(3))
+
+
+def test_SerialPacketBuffer__get_write_view__and__commit__add_bytes_without_extra_copy():
+    buffer = SerialPacketBuffer(20)
+    buffer.write(bytes([9]))
+
+    write_view = buffer.get_write_view(4)
+    assert len(write_view) == 4
+
+    write_view[:3] = bytes([1, 2, 3])
+    buffer.commit(3)
+
+    assert bytes(buffer.unread_bytes) == bytes([9, 1, 2, 3])
+
+
+def test_SerialPacketBuffer__get_write_view__is_limited_to_free_space():
+    buffer = SerialPacketBuffer(10)
+    buffer.write(bytes(7))
+
+    assert len(buffer.get_write_view(100)) == 3
+    assert len(buffer.get_write_view()) == 3
+
+
+def test_SerialPacketBuffer__commit__raises_error_if_more_bytes_than_free_space():
+    buffer = SerialPacketBuffer(10)
+
+    with pytest.raises(ValueError, match="Cannot commit 11 bytes, only 10 bytes free"):
+        buffer.commit(11)
+
+
+def test_SerialPacketBuffer__consume__moves_remaining_bytes_to_start_of_buffer():
+    buffer = SerialPacketBuffer(50)
+
+    test_bytes = bytes(range(30))
+    num_bytes_to_consume = randint(1, 29)
+
+    buffer.write(test_bytes)
+    buffer.consume(num_bytes_to_consume)
+
+    assert bytes(buffer.unread_bytes) == test_bytes[num_bytes_to_consume:]
+    assert buffer.get_metrics()["num_compactions"] == 1
+    assert buffer.get_metrics()["num_bytes_compacted"] == 30 - num_bytes_to_consume
+
+
+@pytest.mark.parametrize("num_bytes_to_consume", [0, 30])
+def test_SerialPacketBuffer__consume__does_not_compact_if_no_bytes_need_to_be_moved(num_bytes_to_consume):
+    buffer = SerialPacketBuffer(50)
+
+    buffer.write(bytes(30))
+    buffer.consume(num_bytes_to_consume)
+
+    assert len(buffer) == 30 - num_bytes_to_consume
+    assert buffer.get_metrics()["num_compactions"] == 0
+
+
+def test_SerialPacketBuffer__consume__raises_error_if_more_bytes_than_unread():
+    buffer = SerialPacketBuffer(50)
+    buffer.write(bytes(5))
+
+    with pytest.raises(ValueError, match="Cannot consume 6 bytes, only 5 bytes unread"):
+        buffer.consume(6)
+
+
+def test_SerialPacketBuffer__tracks_high_water_mark():
+    buffer = SerialPacketBuffer(50)
+
+    buffer.write(bytes(20))
+    buffer.consume(15)
+    buffer.write(bytes(10))
+
+    assert buffer.get_metrics()["high_water_mark"] == 20
+
+    buffer.write(bytes(30))
+
+    assert buffer.get_metrics()["high_water_mark"] == 45
+
+
+def test_SerialPacketBuffer__clear__removes_all_unread_bytes():
+    buffer = SerialPacketBuffer(50)
+    buffer.write(bytes(20))
+
+    buffer.clear()
+
+    assert len(buffer) == 0
+    assert buffer.num_bytes_free == 50
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from controller.constants import QueuePolicies
+from controller.utils.queues import BoundedQueue
+from controller.utils.queues import get_queue_diagnostics
+import pytest
+
+TEST_POLICIES = {"coalesce_msg": QueuePolicies.COALESCE, "drop_msg": QueuePolicies.DROP_OLDEST}
+
+
+def _get_all_msgs(queue):
+    msgs = []
+    while not queue.empty():
+        msgs.append(queue.get_nowait())
+    return msgs
+
+
+def test_BoundedQueue__raises_error_if_max_size_invalid():
+    with pytest.raises(ValueError, match="Invalid max size: 0"):
+        BoundedQueue(0)
+
+
+@pytest.mark.asyncio
+async def test_BoundedQueue__drops_oldest_msg_of_same_type_when_full():
+    queue = BoundedQueue(3, TEST_POLICIES)
+
+    for msg in ({"command": "drop_msg", "idx": 0}, {"command": "other"}, {"command": "drop_msg", "idx": 1}):
+        await queue.put(msg)
+    await queue.put({"command": "drop_msg", "idx": 2})
+
+    assert _get_all_msgs(queue) == [
+        {"command": "other"},
+        {"command": "drop_msg", "idx": 1},
+        {"command": "drop_msg", "idx": 2},
+    ]
+    assert queue.num_msgs_dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_BoundedQueue__merges_msg_into_newest_queued_msg_of_same_type_when_full():
+    queue = BoundedQueue(3, TEST_POLICIES)
+
+    for msg in (
+        {"communication_type": "coalesce_msg", "a": 0},
+        {"communication_type": "coalesce_msg", "a": 1},
+        {"communication_type": "other"},
+    ):
+        await queue.put(msg)
+    queue.put_nowait({"communication_type": "coalesce_msg", "a": 2, "b": 0})
+
+    assert _get_all_msgs(queue) == [
+        {"communication_type": "coalesce_msg", "a": 0},
+        {"communication_type": "coalesce_msg", "a": 2, "b": 0},
+        {"communication_type": "other"},
+    ]
+    assert queue.num_msgs_coalesced == 1
+
+
+@pytest.mark.asyncio
+async def test_BoundedQueue__does_not_apply_policy_if_not_full():
+    queue = BoundedQueue(3, TEST_POLICIES)
+
+    for msg in ({"communication_type": "coalesce_msg"}, {"communication_type": "coalesce_msg"}):
+        await queue.put(msg)
+
+    assert queue.qsize() == 2
+    assert queue.num_msgs_coalesced == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("test_command", ["other", "drop_msg", "coalesce_msg"])
+async def test_BoundedQueue__blocks_when_full_if_no_queued_msg_can_be_dropped_or_merged_into(test_command):
+    queue = BoundedQueue(1, TEST_POLICIES)
+    await queue.put({"command": "other"})
+
+    put_task = asyncio.create_task(queue.put({"command": test_command}))
+    await asyncio.sleep(0)
+    assert not put_task.done()
+    assert queue.num_blocked_puts == 1
+
+    with pytest.raises(asyncio.QueueFull):
+        queue.put_nowait({"command": test_command})
+
+    assert queue.get_nowait() == {"command": "other"}
+    await asyncio.wait_for(put_task, 1)
+    assert queue.get_nowait() == {"command": test_command}
+
+
+@pytest.mark.asyncio
+async def test_BoundedQueue__drops_oldest_msg_of_any_type_instead_of_blocking_if_not_blocking_when_full():
+    queue = BoundedQueue(2, TEST_POLICIES, block_when_full=False)
+
+    for msg in ({"command": "other", "idx": 0}, {"command": "drop_msg"}, {"command": "other", "idx": 1}):
+        await asyncio.wait_for(queue.put(msg), 1)
+    queue.put_nowait({"command": "coalesce_msg"})
+
+    assert _get_all_msgs(queue) == [{"command": "other", "idx": 1}, {"command": "coalesce_msg"}]
+    assert queue.num_msgs_dropped == 2
+    assert queue.num_blocked_puts == 0
+
+
+@pytest.mark.asyncio
+async def test_BoundedQueue__join_does_not_wait_for_dropped_msgs():
+    queue = BoundedQueue(1, TEST_POLICIES)
+
+    for idx in range(3):
+        await queue.put({"command": "drop_msg", "idx": idx})
+    queue.get_nowait()
+    queue.task_done()
+
+    await asyncio.wait_for(queue.join(), 1)
+
+
+@pytest.mark.asyncio
+async def test_get_queue_diagnostics__returns_diagnostics_of_each_bounded_queue():
+    queues = {
+        "to": {"server": BoundedQueue(2, TEST_POLICIES), "other": asyncio.Queue()},
+        "from": {"server": BoundedQueue(5, TEST_POLICIES)},
+    }
+    for _ in range(3):
+        await queues["to"]["server"].put({"command": "drop_msg"})
+    queues["to"]["server"].get_nowait()
+
+    assert get_queue_diagnostics(queues) == {
+        "to": {
+            "server": {
+                "size": 1,
+                "max_size": 2,
+                "max_size_reached": 2,
+                "num_msgs_dropped": 1,
+                "num_msgs_coalesced": 0,
+                "num_blocked_puts": 0,
+            }
+        },
+        "from": {
+            "server": {
+                "size": 0,
+                "max_size": 5,
+                "max_size_reached": 0,
+                "num_msgs_dropped": 0,
+                "num_msgs_coalesced": 0,
+                "num_blocked_puts": 0,
+            }
+        },
+    }
@@ -26,7 +26,9 @@ from controller.utils.serial_comm import convert_subprotocol_pulse_bytes_to_dict
 from controller.utils.serial_comm import convert_subprotocol_pulse_dict_to_bytes
 from controller.utils.serial_comm import convert_well_name_to_module_id
 from controller.utils.serial_comm import create_data_packet
+from controller.utils.serial_comm import find_first_valid_packet
 from controller.utils.serial_comm import get_serial_comm_timestamp
+from controller.utils.serial_comm import get_valid_packet_length
 from controller.utils.serial_comm import parse_end_offline_mode_bytes
 from controller.utils.serial_comm import parse_instrument_event_info
 from controller.utils.serial_comm import parse_metadata_bytes
@@ -96,6 +98,53 @@ def test_validate_checksum__returns_false_when_checksum_is_incorrect():
     assert validate_checksum(test_bytes) is False
 
 
+def test_get_valid_packet_length__returns_length_of_valid_packet():
+    test_packet = create_data_packet(random_timestamp(), randint(0, 255), bytes(randint(0, 10)))
+    test_bytes = bytes(randint(1, 10)) + test_packet
+
+    assert get_valid_packet_length(test_bytes, len(test_bytes) - len(test_packet)) == len(test_packet)
+
+
+@pytest.mark.parametrize("num_bytes_to_remove", [1, len(SERIAL_COMM_MAGIC_WORD_BYTES) + 1])
+def test_get_valid_packet_length__returns_none_if_packet_is_incomplete(num_bytes_to_remove):
+    test_packet = create_data_packet(random_timestamp(), randint(0, 255))
+    assert get_valid_packet_length(test_packet[:-num_bytes_to_remove]) is None
+
+
+@pytest.mark.parametrize("idx_to_corrupt", [0, len(SERIAL_COMM_MAGIC_WORD_BYTES) + 1, -1])
+def test_get_valid_packet_length__returns_zero_if_magic_word_length_or_checksum_is_incorrect(idx_to_corrupt):
+    test_packet = bytearray(create_data_packet(random_timestamp(), randint(0, 255)))
+    test_packet[idx_to_corrupt] ^= 0xFF
+
+    assert get_valid_packet_length(test_packet) == 0
+
+
+def test_find_first_valid_packet__skips_bytes_and_candidate_packets_with_incorrect_checksums():
+    test_packet = create_data_packet(random_timestamp(), randint(0, 255))
+    bad_packet = bytearray(test_packet)
+    bad_packet[-1] ^= 0xFF
+
+    test_bytes = bytes(randint(1, 10)) + bad_packet + bytes([1, 2, 3]) + test_packet
+
+    assert find_first_valid_packet(memoryview(test_bytes)) == (len(test_bytes) - len(test_packet), True)
+
+
+def test_find_first_valid_packet__returns_idx_of_incomplete_candidate_packet():
+    test_packet = create_data_packet(random_timestamp(), randint(0, 255))
+    test_bytes = bytes(5) + test_packet[:-1]
+
+    assert find_first_valid_packet(test_bytes) == (5, False)
+
+
+def test_find_first_valid_packet__keeps_bytes_that_could_be_start_of_magic_word_if_no_candidate_found():
+    test_bytes = bytes(20) + SERIAL_COMM_MAGIC_WORD_BYTES[:3]
+
+    idx, is_valid_packet = find_first_valid_packet(test_bytes)
+
+    assert is_valid_packet is False
+    assert test_bytes[idx:] == bytes(4) + SERIAL_COMM_MAGIC_WORD_BYTES[:3]
+
+
 def test_parse_metadata_bytes__returns_expected_value():
     test_status_codes = list(range(SERIAL_COMM_STATUS_CODE_LENGTH_BYTES))
 
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+
+from controller.utils import serial_reader
+from controller.utils.serial_reader import EventDrivenSerialReader
+import pytest
+import serial
+from stdlib_utils import is_system_windows
+
+
+@pytest.fixture(scope="function", name="loopback_port")
+def fixture__loopback_port():
+    port = serial.serial_for_url("loop://", timeout=0.01)
+    yield port
+    port.close()
+
+
+@pytest.fixture(scope="function", name="patch_is_system_windows")
+def fixture__patch_is_system_windows(mocker):
+    # readers on Windows use a thread, which works with any type of port
+    yield mocker.patch.object(serial_reader, "is_system_windows", autospec=True, return_value=True)
+
+
+@pytest.mark.asyncio
+async def test_EventDrivenSerialReader__reads_bytes_in_thread_on_windows(
+    patch_is_system_windows, loopback_port
+):
+    reader = EventDrivenSerialReader(loopback_port)
+    reader.start()
+
+    try:
+        loopback_port.write(bytes([1, 2, 3]))
+
+        buffer = bytearray(10)
+        num_bytes_read = await asyncio.wait_for(reader.readinto_async(buffer), 1)
+
+        assert buffer[:num_bytes_read] == bytes([1, 2, 3])
+    finally:
+        reader.stop()
+
+    assert not reader.is_running
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(is_system_windows(), reason="ptys are not available on Windows")
+async def test_EventDrivenSerialReader__reads_bytes_when_file_descriptor_is_readable():
+    primary_fd, secondary_fd = os.openpty()
+    port = serial.Serial(os.ttyname(secondary_fd), timeout=0.01)
+    reader = EventDrivenSerialReader(port)
+    reader.start()
+
+    try:
+        os.write(primary_fd, bytes([4, 5, 6]))
+
+        buffer = bytearray(10)
+        num_bytes_read = await asyncio.wait_for(reader.readinto_async(buffer), 1)
+
+        assert buffer[:num_bytes_read] == bytes([4, 5, 6])
+    finally:
+        reader.stop()
+        port.close()
+        os.close(primary_fd)
+        os.close(secondary_fd)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(is_system_windows(), reason="ptys are not available on Windows")
+async def test_EventDrivenSerialReader__stops_watching_file_descriptor_and_returns_no_bytes_after_port_hangs_up():
+    primary_fd, secondary_fd = os.openpty()
+    port = serial.Serial(os.ttyname(secondary_fd), timeout=0.01)
+    reader = EventDrivenSerialReader(port)
+    reader.start()
+
+    try:
+        os.write(primary_fd, bytes([4, 5, 6]))
+        buffer = bytearray(10)
+        assert await asyncio.wait_for(reader.readinto_async(buffer), 1) == 3
+
+        # closing the other end of the pty hangs up the port
+        os.close(primary_fd)
+        primary_fd = None
+
+        with pytest.raises(OSError):
+            await asyncio.wait_for(reader.readinto_async(buffer), 1)
+        assert reader._fd is None
+        # every read after the error should indicate that the port has hung up
+        for _ in range(2):
+            assert await asyncio.wait_for(reader.readinto_async(buffer), 1) == 0
+    finally:
+        reader.stop()
+        port.close()
+        if primary_fd is not None:
+            os.close(primary_fd)
+        os.close(secondary_fd)
+
+
+@pytest.mark.asyncio
+async def test_EventDrivenSerialReader__readinto_async__returns_bytes_already_read_before_raising_error(
+    mocker,
+):
+    reader = EventDrivenSerialReader(mocker.MagicMock())
+    reader._chunks.put_nowait(bytes([1, 2]))
+    reader._chunks.put_nowait(serial.SerialException("test error"))
+
+    buffer = bytearray(10)
+    assert await reader.readinto_async(buffer) == 2
+    assert buffer[:2] == bytes([1, 2])
+
+    with pytest.raises(serial.SerialException, match="test error"):
+        await reader.readinto_async(buffer)
+
+
+@pytest.mark.asyncio
+async def test_EventDrivenSerialReader__readinto_async__keeps_bytes_that_do_not_fit_in_buffer_for_next_read(
+    patch_is_system_windows, loopback_port
+):
+    reader = EventDrivenSerialReader(loopback_port)
+    reader.start()
+
+    try:
+        loopback_port.write(bytes(range(5)))
+
+        buffer = bytearray(3)
+        assert await asyncio.wait_for(reader.readinto_async(buffer), 1) == 3
+        assert buffer == bytes([0, 1, 2])
+
+        assert await asyncio.wait_for(reader.readinto_async(buffer), 1) == 2
+        assert buffer[:2] == bytes([3, 4])
+    finally:
+        reader.stop()
+
+
+@pytest.mark.asyncio
+async def test_EventDrivenSerialReader__readinto_async__returns_immediately_if_buffer_is_empty(loopback_port):
+    reader = EventDrivenSerialReader(loopback_port)
+    assert await reader.readinto_async(bytearray(0)) == 0
+
+
+@pytest.mark.asyncio
+async def test_EventDrivenSerialReader__readinto_async__raises_error_from_failed_read(
+    patch_is_system_windows, mocker
+):
+    mocked_port = mocker.MagicMock()
+    mocked_port.in_waiting = 0
+    mocked_port.read.side_effect = serial.SerialException("test error")
+
+    reader = EventDrivenSerialReader(mocked_port)
+    reader.start()
+
+    try:
+        with pytest.raises(serial.SerialException, match="test error"):
+            await asyncio.wait_for(reader.readinto_async(bytearray(10)), 1)
+    finally:
+        reader.stop()
+
+
+@pytest.mark.asyncio
+async def test_EventDrivenSerialReader__start__raises_error_if_already_running(
+    patch_is_system_windows, loopback_port
+):
+    reader = EventDrivenSerialReader(loopback_port)
+    reader.start()
+
+    try:
+        with pytest.raises(NotImplementedError, match="Reader is already running"):
+            reader.start()
+    finally:
+        reader.stop()
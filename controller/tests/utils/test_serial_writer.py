@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from controller.utils import serial_writer
+from controller.utils.serial_writer import CoalescingSerialWriter
+import pytest
+import pytest_asyncio
+
+
+@pytest.fixture(scope="function", name="mocked_write_async")
+def fixture__mocked_write_async(mocker):
+    yield mocker.AsyncMock(side_effect=lambda data: len(data))
+
+
+@pytest_asyncio.fixture(scope="function", name="test_writer")
+async def fixture__test_writer(mocked_write_async):
+    writer = CoalescingSerialWriter(mocked_write_async)
+    writer.start()
+    yield writer
+    await writer.stop()
+
+
+@pytest.mark.asyncio
+async def test_CoalescingSerialWriter__send__writes_packet(test_writer, mocked_write_async):
+    await test_writer.send(bytes([1, 2, 3]))
+    mocked_write_async.assert_awaited_once_with(bytes([1, 2, 3]))
+
+
+@pytest.mark.asyncio
+async def test_CoalescingSerialWriter__send_many__writes_all_packets_in_order_in_single_write(
+    test_writer, mocked_write_async
+):
+    await test_writer.send_many([bytes([1]), bytes([2, 3]), bytes([4])])
+    mocked_write_async.assert_awaited_once_with(bytes([1, 2, 3, 4]))
+
+
+@pytest.mark.asyncio
+async def test_CoalescingSerialWriter__coalesces_packets_sent_in_same_loop_iteration(
+    test_writer, mocked_write_async
+):
+    await asyncio.gather(*(test_writer.send(bytes([i])) for i in range(5)))
+    mocked_write_async.assert_awaited_once_with(bytes(range(5)))
+
+
+@pytest.mark.asyncio
+async def test_CoalescingSerialWriter__coalesces_packets_sent_while_previous_write_is_in_progress(
+    test_writer, mocked_write_async
+):
+    write_started = asyncio.Event()
+    allow_write_to_complete = asyncio.Event()
+
+    async def write_se(data):
+        write_started.set()
+        await allow_write_to_complete.wait()
+        return len(data)
+
+    mocked_write_async.side_effect = write_se
+
+    first_send = asyncio.create_task(test_writer.send(bytes([0])))
+    await write_started.wait()
+    other_sends = [asyncio.create_task(test_writer.send(bytes([i]))) for i in range(1, 4)]
+    await asyncio.sleep(0)
+    allow_write_to_complete.set()
+    await asyncio.gather(first_send, *other_sends)
+
+    assert [call.args[0] for call in mocked_write_async.await_args_list] == [bytes([0]), bytes([1, 2, 3])]
+
+
+@pytest.mark.asyncio
+async def test_CoalescingSerialWriter__get_metrics__returns_write_sizes_and_queue_latencies(test_writer):
+    await test_writer.send_many([bytes(2), bytes(3)])
+    await test_writer.send(bytes(1))
+
+    metrics = test_writer.get_metrics()
+    assert metrics["num_writes"] == 2
+    assert metrics["num_packets_written"] == 3
+    assert metrics["num_bytes_written"] == 6
+    assert metrics["max_write_size"] == 5
+    assert metrics["max_num_packets_per_write"] == 2
+    assert 0 <= metrics["mean_queue_latency_seconds"] <= metrics["max_queue_latency_seconds"]
+
+
+@pytest.mark.asyncio
+async def test_CoalescingSerialWriter__logs_error_if_no_bytes_written(
+    test_writer, mocked_write_async, mocker
+):
+    mocked_write_async.side_effect = None
+    mocked_write_async.return_value = 0
+    spied_error = mocker.spy(serial_writer.logger, "error")
+
+    await test_writer.send(bytes(1))
+
+    spied_error.assert_called_once_with("Serial data write reporting no bytes written")
+
+
+@pytest.mark.asyncio
+async def test_CoalescingSerialWriter__raises_error_from_failed_write_to_all_senders_and_keeps_running(
+    test_writer, mocked_write_async
+):
+    mocked_write_async.side_effect = [Exception("test error"), 1]
+
+    results = await asyncio.gather(
+        test_writer.send(bytes(1)), test_writer.send(bytes(1)), return_exceptions=True
+    )
+    assert [str(result) for result in results] == ["test error"] * 2
+
+    await test_writer.send(bytes(1))
+    assert test_writer.is_running
+
+
+@pytest.mark.asyncio
+async def test_CoalescingSerialWriter__send_many__raises_error_if_not_running(mocked_write_async):
+    writer = CoalescingSerialWriter(mocked_write_async)
+    with pytest.raises(NotImplementedError, match="Writer must be running to send packets"):
+        await writer.send(bytes(1))
+
+
+@pytest.mark.asyncio
+async def test_CoalescingSerialWriter__stop__cancels_sends_that_have_not_been_written(
+    test_writer, mocked_write_async
+):
+    async def write_se(data):
+        await asyncio.sleep(10)
+
+    mocked_write_async.side_effect = write_se
+
+    send_task = asyncio.create_task(test_writer.send(bytes(1)))
+    await asyncio.sleep(0)
+    await test_writer.stop()
+
+    with pytest.raises(asyncio.CancelledError):
+        await send_task
+    assert not test_writer.is_running
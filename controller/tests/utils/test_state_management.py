@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from types import MappingProxyType
+
+from controller.utils.state_management import derived_from_system_state
+from controller.utils.state_management import freeze
+from controller.utils.state_management import SystemStateManager
+import pytest
+
+
+def test_freeze__makes_nested_containers_immutable():
+    frozen_value = freeze({"a": [1, {"b": {2}}], "c": (3, [4])})
+
+    assert isinstance(frozen_value, MappingProxyType)
+    assert frozen_value == {"a": (1, {"b": frozenset({2})}), "c": (3, (4,))}
+    assert isinstance(frozen_value["a"][1], MappingProxyType)
+
+
+@pytest.mark.asyncio
+async def test_SystemStateManager__update__creates_new_snapshot_with_incremented_version():
+    ssm = SystemStateManager()
+    assert ssm.version == 0
+
+    await ssm.update({"a": 1, "b": {"c": [1, 2]}})
+    first_snapshot = ssm.data
+    assert first_snapshot.version == ssm.version == 1
+    assert ssm.get_read_only_copy() is first_snapshot
+
+    await ssm.update({"a": 2})
+    second_snapshot = ssm.data
+    assert second_snapshot.version == 2
+    assert dict(second_snapshot) == {"a": 2, "b": {"c": (1, 2)}}
+
+    # previous snapshots are not modified, and values that were not updated are shared
+    assert first_snapshot["a"] == 1
+    assert second_snapshot["b"] is first_snapshot["b"]
+
+
+@pytest.mark.asyncio
+async def test_SystemStateManager__update__does_not_allow_state_to_be_modified_through_given_values():
+    ssm = SystemStateManager()
+
+    test_statuses = [0, 0]
+    await ssm.update({"statuses": test_statuses})
+    test_statuses.append(1)
+
+    assert ssm.data["statuses"] == (0, 0)
+    with pytest.raises(TypeError):
+        ssm.data["statuses"][0] = 1
+    with pytest.raises(TypeError):
+        ssm.data._data["statuses"] = 1
+
+
+@pytest.mark.asyncio
+async def test_SystemStateManager__subscribe__first_diff_contains_current_values_of_subscribed_keys():
+    ssm = SystemStateManager()
+    await ssm.update({"a": 1, "b": [2], "c": 3})
+
+    subscription = ssm.subscribe(["a", "b"])
+    assert await subscription.get() == {"a": 1, "b": (2,)}
+    assert subscription.qsize() == 0
+
+
+@pytest.mark.asyncio
+async def test_SystemStateManager__update__only_notifies_subscribers_of_changed_subscribed_keys():
+    ssm = SystemStateManager()
+    await ssm.update({"a": 1, "b": 2})
+
+    subscription = ssm.subscribe(["a"])
+    await subscription.get()
+
+    await ssm.update({"b": 3})
+    await ssm.update({"a": 1})
+    await asyncio.sleep(0)
+    assert subscription.qsize() == 0
+    assert ssm.version == 2
+
+    await ssm.update({"a": 4, "b": 5})
+    assert await subscription.get() == {"a": 4}
+
+
+@pytest.mark.asyncio
+async def test_SystemStateManager__update__only_notifies_subscribers_of_changes_matching_predicate():
+    ssm = SystemStateManager()
+    subscription = ssm.subscribe(predicate=lambda key, value: value > 1)
+
+    await ssm.update({"a": 1, "b": 2})
+    assert await subscription.get() == {"b": 2}
+
+
+@pytest.mark.asyncio
+async def test_SystemStateManager__update__merges_updates_made_in_same_loop_iteration_into_one_diff():
+    ssm = SystemStateManager()
+    subscription = ssm.subscribe(["a", "b"])
+
+    await ssm.update({"a": 1})
+    await ssm.update({"b": 2})
+    await ssm.update({"a": 3})
+    await asyncio.sleep(0)
+
+    assert subscription.qsize() == 1
+    assert await subscription.get() == {"a": 3, "b": 2}
+
+
+@pytest.mark.asyncio
+async def test_SystemStateManager__update__merges_new_diff_into_most_recent_diff_when_subscription_queue_is_full():
+    ssm = SystemStateManager()
+    subscription = ssm.subscribe(["a", "b"], max_queue_size=2)
+
+    for new_values in ({"a": 1}, {"b": 2}, {"a": 3}):
+        await ssm.update(new_values)
+        await asyncio.sleep(0)
+
+    assert subscription.qsize() == 2
+    assert subscription.num_diffs_merged_on_overflow == 1
+    assert await subscription.get() == {"a": 1}
+    assert await subscription.get() == {"a": 3, "b": 2}
+
+
+@pytest.mark.asyncio
+async def test_SystemStateManager__unsubscribe__stops_subscription_from_receiving_diffs():
+    ssm = SystemStateManager()
+    subscription = ssm.subscribe()
+
+    ssm.unsubscribe(subscription)
+    await ssm.update({"a": 1})
+    await asyncio.sleep(0)
+    assert subscription.qsize() == 0
+
+
+def test_SystemStateManager__subscribe__raises_error_if_max_queue_size_invalid():
+    with pytest.raises(ValueError, match="Invalid max queue size: 0"):
+        SystemStateManager().subscribe(max_queue_size=0)
+
+
+@pytest.mark.asyncio
+async def test_derived_from_system_state__only_computes_value_once_per_snapshot(mocker):
+    mocked_func = mocker.Mock(side_effect=lambda system_state: system_state["a"])
+    derived_func = derived_from_system_state(mocked_func)
+
+    ssm = SystemStateManager()
+    await ssm.update({"a": 1})
+    assert derived_func(ssm.data) == derived_func(ssm.data) == 1
+    assert mocked_func.call_count == 1
+
+    await ssm.update({"a": 2})
+    assert derived_func(ssm.data) == 2
+    assert mocked_func.call_count == 2
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import copy
+from random import choice
+from random import randint
+
+from controller.constants import ALL_WELL_NAMES
+from controller.constants import STIM_ENCODING_CACHE_MAX_SIZE_BYTES
+from controller.utils import stim_encoding_cache
+from controller.utils.serial_comm import convert_stim_dict_to_bytes
+from controller.utils.stim_encoding_cache import serialize_stim_info
+from controller.utils.stim_encoding_cache import StimEncodingCache
+from controller.utils.stimulation import chunk_protocols_in_stim_info
+import pytest
+
+from ..helpers import get_random_stim_delay
+
+
+def _create_stim_info():
+    pulse = {
+        "type": "biphasic",
+        "phase_one_duration": 1000,
+        "phase_one_charge": 100,
+        "interphase_interval": 0,
+        "phase_two_duration": 1000,
+        "phase_two_charge": -100,
+        "postphase_interval": 8000,
+        # long enough that the pulse will be chunked
+        "num_cycles": randint(100, 100000),
+    }
+    return {
+        "protocols": [
+            {
+                "protocol_id": protocol_id,
+                "stimulation_type": "C",
+                "run_until_stopped": True,
+                "subprotocols": [
+                    pulse,
+                    {"type": "loop", "num_iterations": 2, "subprotocols": [get_random_stim_delay(), pulse]},
+                ],
+            }
+            for protocol_id in ("A", "B")
+        ],
+        "protocol_assignments": {well_name: choice(["A", "B"]) for well_name in ALL_WELL_NAMES},
+    }
+
+
+def _get_entry_size(stim_info):
+    return len(serialize_stim_info(stim_info)) + len(StimEncodingCache().encode(stim_info).stim_bytes)
+
+
+def test_StimEncodingCache__encode__returns_chunked_stim_info_and_bytes():
+    test_stim_info = _create_stim_info()
+    expected_chunked_stim_info, expected_mappings, expected_counts = chunk_protocols_in_stim_info(
+        test_stim_info
+    )
+
+    encoded_stim_info = StimEncodingCache().encode(copy.deepcopy(test_stim_info))
+
+    assert encoded_stim_info.stim_bytes == convert_stim_dict_to_bytes(expected_chunked_stim_info)
+    assert len(encoded_stim_info.chunked_stim_info["protocols"]) == len(
+        expected_chunked_stim_info["protocols"]
+    )
+    assert encoded_stim_info.subprotocol_idx_mappings == expected_mappings
+    assert {
+        protocol_id: tuple(counts)
+        for protocol_id, counts in encoded_stim_info.max_subprotocol_idx_counts.items()
+    } == expected_counts
+    # the cached values are shared, so they must not be modifiable
+    with pytest.raises(TypeError):
+        encoded_stim_info.chunked_stim_info["protocols"] = []
+
+
+def test_StimEncodingCache__encode__returns_cached_value_for_stim_info_with_same_contents(mocker):
+    cache = StimEncodingCache()
+    spied_chunk = mocker.spy(stim_encoding_cache, "chunk_protocols_in_stim_info")
+
+    test_stim_info = _create_stim_info()
+    # the order of keys should not affect the cache key
+    reordered_stim_info = dict(reversed(copy.deepcopy(test_stim_info).items()))
+
+    first_encoded_stim_info = cache.encode(test_stim_info)
+    assert cache.encode(reordered_stim_info) is first_encoded_stim_info
+
+    spied_chunk.assert_called_once()
+    assert cache.get_metrics() == {
+        "num_entries": 1,
+        "size_bytes": _get_entry_size(test_stim_info),
+        "max_size_bytes": STIM_ENCODING_CACHE_MAX_SIZE_BYTES,
+        "num_hits": 1,
+        "num_misses": 1,
+        "num_evictions": 0,
+    }
+
+
+def test_StimEncodingCache__encode__evicts_least_recently_used_entries_when_max_size_exceeded():
+    test_stim_infos = [_create_stim_info() for _ in range(3)]
+    max_entry_size = max(_get_entry_size(stim_info) for stim_info in test_stim_infos)
+    # only enough room for 2 entries
+    cache = StimEncodingCache(max_size_bytes=max_entry_size * 2)
+
+    cache.encode(test_stim_infos[0])
+    cache.encode(test_stim_infos[1])
+    # use the first entry so that the second is now the least recently used
+    cache.encode(test_stim_infos[0])
+    cache.encode(test_stim_infos[2])
+
+    assert cache.num_evictions == 1
+    assert cache.get_metrics()["size_bytes"] <= max_entry_size * 2
+
+    cache.encode(test_stim_infos[0])
+    assert cache.num_hits == 2
+    cache.encode(test_stim_infos[1])
+    assert cache.num_misses == 4
+
+
+def test_StimEncodingCache__encode__does_not_cache_stim_info_larger_than_max_size():
+    test_stim_info = _create_stim_info()
+    cache = StimEncodingCache(max_size_bytes=_get_entry_size(test_stim_info) - 1)
+
+    first_encoded_stim_info = cache.encode(test_stim_info)
+    assert cache.encode(test_stim_info) == first_encoded_stim_info
+
+    assert cache.get_metrics()["num_entries"] == 0
+    assert cache.num_misses == 2
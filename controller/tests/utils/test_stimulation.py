@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import copy
+from time import perf_counter
+
+from controller.constants import ALL_WELL_NAMES
+from controller.constants import NUM_WELLS
+from controller.constants import STIM_MAX_ABSOLUTE_CURRENT_MICROAMPS
+from controller.constants import STIM_MAX_NUM_SUBPROTOCOLS_PER_PROTOCOL
+from controller.utils.stimulation import validate_stim_info
+import pytest
+
+
+def _create_pulse(**kwargs):
+    return {
+        "type": "biphasic",
+        "phase_one_duration": 1000,
+        "phase_one_charge": 100,
+        "interphase_interval": 0,
+        "phase_two_duration": 1000,
+        "phase_two_charge": -100,
+        "postphase_interval": 8000,
+        "num_cycles": 100,
+        **kwargs,
+    }
+
+
+def _create_stim_info(protocols):
+    protocol_ids = [protocol["protocol_id"] for protocol in protocols]
+    return {
+        "protocols": protocols,
+        "protocol_assignments": {
+            well_name: protocol_ids[well_idx % len(protocol_ids)]
+            for well_idx, well_name in enumerate(sorted(ALL_WELL_NAMES))
+        },
+    }
+
+
+def _create_largest_stim_info():
+    """Create the max number of protocols, each with the max number of subprotocols nested in loops."""
+    protocols = []
+    for protocol_idx in range(NUM_WELLS):
+        subprotocols = []
+        num_subprotocols_per_loop = 5
+        for _ in range(STIM_MAX_NUM_SUBPROTOCOLS_PER_PROTOCOL // num_subprotocols_per_loop):
+            loop = {
+                "type": "loop",
+                "num_iterations": 2,
+                "subprotocols": [{"type": "Delay", "duration": 1e6}]
+                + [_create_pulse(type="Biphasic") for _ in range(num_subprotocols_per_loop - 1)],
+            }
+            for _ in range(3):
+                loop = {"type": "loop", "num_iterations": 2, "subprotocols": [loop]}
+            subprotocols.append(loop)
+        protocols.append(
+            {"protocol_id": str(protocol_idx), "stimulation_type": "C", "subprotocols": subprotocols}
+        )
+
+    return _create_stim_info(protocols)
+
+
+def test_validate_stim_info__returns_no_errors_and_normalizes_subprotocols_if_valid():
+    test_stim_info = _create_largest_stim_info()
+
+    assert validate_stim_info(test_stim_info) == []
+
+    loop = test_stim_info["protocols"][0]["subprotocols"][0]
+    while loop["type"] == "loop" and loop["subprotocols"][0]["type"] == "loop":
+        loop = loop["subprotocols"][0]
+    delay, pulse, *_ = loop["subprotocols"]
+    assert delay == {"type": "delay", "duration": 1000000}
+    assert isinstance(delay["duration"], int)
+    assert pulse["type"] == "biphasic"
+
+
+def test_validate_stim_info__reports_all_errors_in_single_pass():
+    test_protocols = [
+        {
+            "protocol_id": "A",
+            "stimulation_type": "C",
+            "subprotocols": [
+                _create_pulse(phase_one_duration=0),
+                {
+                    "type": "loop",
+                    "num_iterations": 1,
+                    "subprotocols": [
+                        _create_pulse(),
+                        {"type": "loop", "num_iterations": 1, "subprotocols": [{"type": "bad_type"}]},
+                    ],
+                },
+                {"type": "delay", "duration": 10},
+                _create_pulse(type="monophasic", phase_one_charge=STIM_MAX_ABSOLUTE_CURRENT_MICROAMPS + 1),
+            ],
+        },
+        {"protocol_id": "A", "stimulation_type": "bad", "subprotocols": []},
+        {"protocol_id": "B", "stimulation_type": "V", "subprotocols": [{"type": "monophasic"}]},
+    ]
+    test_stim_info = _create_stim_info(test_protocols)
+    test_stim_info["protocol_assignments"]["Z9"] = "C"
+    test_stim_info["protocol_assignments"].pop("A1")
+
+    assert validate_stim_info(test_stim_info) == [
+        "Protocol A, Subprotocol 0, Invalid phase one duration: 0",
+        "Protocol A, Subprotocol 1, Invalid subprotocol type: bad_type",
+        "Protocol A, Subprotocol 2, Subprotocol duration not long enough",
+        f"Protocol A, Subprotocol 3, Invalid phase one charge: {STIM_MAX_ABSOLUTE_CURRENT_MICROAMPS + 1}",
+        "Multiple protocols given with ID: A",
+        "Protocol A, Invalid stimulation type: bad",
+        "Protocol B, Subprotocol 0, Missing phase one duration",
+        "Protocol B, Subprotocol 0, Missing phase one charge",
+        "Protocol B, Subprotocol 0, Missing postphase interval",
+        "Protocol B, Subprotocol 0, Missing num cycles",
+        "Protocol assignments missing wells: {'A1'}",
+        "Protocol assignments contain invalid wells: {'Z9'}",
+        "Protocol assignments contain invalid protocol IDs: {'C'}",
+    ]
+
+
+@pytest.mark.parametrize(
+    "test_pulse,expected_error",
+    [
+        (
+            _create_pulse(phase_one_duration=45000, phase_two_duration=10000, postphase_interval=20000),
+            "Duty cycle duration too long",
+        ),
+        (_create_pulse(postphase_interval=0), "Duty cycle exceeds 80%"),
+        (_create_pulse(num_cycles=int(1e7)), "Subprotocol duration too long"),
+        (_create_pulse(num_cycles=0), "Subprotocol duration not long enough"),
+    ],
+)
+def test_validate_stim_info__reports_invalid_pulse_durations(test_pulse, expected_error):
+    test_stim_info = _create_stim_info(
+        [{"protocol_id": "A", "stimulation_type": "C", "subprotocols": [test_pulse]}]
+    )
+
+    assert validate_stim_info(test_stim_info) == [f"Protocol A, Subprotocol 0, {expected_error}"]
+
+
+def test_validate_stim_info__reports_empty_protocol_list():
+    test_stim_info = {
+        "protocols": [],
+        "protocol_assignments": {well_name: None for well_name in ALL_WELL_NAMES},
+    }
+
+    assert validate_stim_info(test_stim_info) == ["Protocol list empty"]
+
+
+@pytest.mark.slow
+def test_validate_stim_info__performance_of_largest_allowed_protocols():
+    num_iterations = 200
+    # validation modifies the stim info, so use a fresh copy for each iteration
+    test_stim_infos = [copy.deepcopy(_create_largest_stim_info()) for _ in range(num_iterations)]
+
+    start = perf_counter()
+    for test_stim_info in test_stim_infos:
+        validate_stim_info(test_stim_info)
+    dur = perf_counter() - start
+
+    print(f"Stim info validation: {dur / num_iterations * 1e3:.2f} ms per message")  # allow-print
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from controller.utils.ui_messages import UiMessageAggregator
+import pytest
+
+
+@pytest.fixture(scope="function", name="sent_msgs")
+def fixture__sent_msgs():
+    yield []
+
+
+@pytest.fixture(scope="function", name="test_aggregator")
+def fixture__test_aggregator(sent_msgs):
+    async def _send_msg(msg):
+        sent_msgs.append(msg)
+
+    yield UiMessageAggregator(_send_msg, window_seconds=0.02)
+
+
+@pytest.mark.asyncio
+async def test_UiMessageAggregator__merges_status_updates_received_within_window(test_aggregator, sent_msgs):
+    assert test_aggregator.flush_deadline is None
+
+    await test_aggregator.add({"communication_type": "status_update", "system_status": "a"})
+    flush_deadline = test_aggregator.flush_deadline
+    assert flush_deadline is not None
+
+    await test_aggregator.add(
+        {"communication_type": "status_update", "stimulation_protocols_running": [True]}
+    )
+    await test_aggregator.add({"communication_type": "status_update", "system_status": "b"})
+    # the window should not be extended by status updates received after the first
+    assert test_aggregator.flush_deadline == flush_deadline
+    assert sent_msgs == []
+
+    await test_aggregator.flush()
+    assert sent_msgs == [
+        {"communication_type": "status_update", "system_status": "b", "stimulation_protocols_running": [True]}
+    ]
+    assert test_aggregator.flush_deadline is None
+
+    metrics = test_aggregator.get_metrics()
+    assert metrics["num_msgs_received"] == 3
+    assert metrics["num_msgs_sent"] == 1
+    assert metrics["num_status_updates_coalesced"] == 2
+    assert metrics["send_latency_seconds"]["p99"] >= metrics["send_latency_seconds"]["p50"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_UiMessageAggregator__sends_error_messages_before_pending_status_update(
+    test_aggregator, sent_msgs
+):
+    test_status_update = {"communication_type": "status_update", "system_status": "a"}
+    test_error_msg = {"communication_type": "error", "error_code": 1}
+
+    await test_aggregator.add(test_status_update)
+    await test_aggregator.add(test_error_msg)
+    assert sent_msgs == [test_error_msg]
+
+    await test_aggregator.flush()
+    assert sent_msgs == [test_error_msg, test_status_update]
+
+
+@pytest.mark.asyncio
+async def test_UiMessageAggregator__sends_pending_status_update_before_other_messages(
+    test_aggregator, sent_msgs
+):
+    test_status_update = {"communication_type": "status_update", "system_status": "a"}
+    test_barcode_msg = {"communication_type": "barcode_update", "new_barcode": "ML2022001000"}
+
+    await test_aggregator.add(test_status_update)
+    await test_aggregator.add(test_barcode_msg)
+    assert sent_msgs == [test_status_update, test_barcode_msg]
+    assert test_aggregator.flush_deadline is None
+
+
+@pytest.mark.asyncio
+async def test_UiMessageAggregator__sends_status_updates_immediately_if_window_is_zero(sent_msgs):
+    async def _send_msg(msg):
+        sent_msgs.append(msg)
+
+    aggregator = UiMessageAggregator(_send_msg, window_seconds=0)
+
+    test_status_updates = [{"communication_type": "status_update", "system_status": str(i)} for i in range(2)]
+    for status_update in test_status_updates:
+        await aggregator.add(status_update)
+
+    assert sent_msgs == test_status_updates
+
+
+@pytest.mark.asyncio
+async def test_UiMessageAggregator__flush__does_nothing_if_no_pending_status_update(
+    test_aggregator, sent_msgs
+):
+    await test_aggregator.flush()
+    assert sent_msgs == []
+    assert "send_latency_seconds" not in test_aggregator.get_metrics()
+
+
+@pytest.mark.asyncio
+async def test_UiMessageAggregator__flush_deadline_is_end_of_window(test_aggregator):
+    loop = asyncio.get_running_loop()
+
+    before = loop.time()
+    await test_aggregator.add({"communication_type": "status_update", "system_status": "a"})
+    after = loop.time()
+
+    assert before + 0.02 <= test_aggregator.flush_deadline <= after + 0.02
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import os
+
+from controller.utils.version_check_cache import VersionCheckCache
+
+
+def test_VersionCheckCache__update__saves_entry_that_persists_across_instances(tmp_path):
+    test_file_path = os.path.join(tmp_path, "cache.json")
+    test_url = "https://test.com/versions"
+
+    cache = VersionCheckCache(test_file_path)
+    assert cache.get(test_url) is None
+    cache.update(test_url, {"main_fw": "1.0.0"}, '"etag"')
+
+    entry = VersionCheckCache(test_file_path).get(test_url)
+    assert entry.body == {"main_fw": "1.0.0"}
+    assert entry.etag == '"etag"'
+    assert cache.is_fresh(entry)
+
+
+def test_VersionCheckCache__is_fresh__returns_false_once_ttl_expires_and_true_after_revalidation(
+    tmp_path, mocker
+):
+    mocked_time = mocker.patch("controller.utils.version_check_cache.time.time", autospec=True)
+    mocked_time.return_value = 0
+    test_url = "https://test.com/versions"
+
+    cache = VersionCheckCache(os.path.join(tmp_path, "cache.json"), ttl_seconds=10)
+    cache.update(test_url, {}, None)
+
+    mocked_time.return_value = 10
+    assert not cache.is_fresh(cache.get(test_url))
+
+    cache.mark_revalidated(test_url)
+    assert cache.is_fresh(cache.get(test_url))
+
+    # entries from the future can't be trusted
+    mocked_time.return_value = 0
+    assert not cache.is_fresh(cache.get(test_url))
+
+
+def test_VersionCheckCache__ignores_corrupted_file(tmp_path):
+    test_file_path = os.path.join(tmp_path, "cache.json")
+    with open(test_file_path, "w") as f:
+        f.write("{")
+
+    assert VersionCheckCache(test_file_path).get("https://test.com/versions") is None
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+from controller.constants import NUM_WELLS
+from controller.constants import SERIAL_COMM_NUM_CHANNELS_PER_SENSOR
+from controller.utils.waveform_stream import encode_waveform_block
+from controller.utils.waveform_stream import WAVEFORM_BLOCK_FORMAT_VERSION
+from controller.utils.waveform_stream import WAVEFORM_BLOCK_HEADER
+from controller.utils.waveform_stream import WaveformStream
+from controller.utils.waveform_stream import WaveformStreamClient
+import numpy as np
+import pytest
+
+TEST_SAMPLE_PERIOD_US = 10000
+
+
+def _create_test_data(num_samples, start_sample_idx=0):
+    sample_idxs = np.arange(start_sample_idx, start_sample_idx + num_samples)
+    time_indices = sample_idxs.astype(np.int64) * TEST_SAMPLE_PERIOD_US
+    data = np.random.randint(
+        0, 2**16, (NUM_WELLS, SERIAL_COMM_NUM_CHANNELS_PER_SENSOR, num_samples), dtype=np.uint16
+    )
+    return time_indices, data
+
+
+def _decode_waveform_block(block):
+    (
+        version,
+        dtype_code,
+        well_idx,
+        num_channels,
+        num_samples,
+        sample_period_us,
+        start_time_index,
+    ) = WAVEFORM_BLOCK_HEADER.unpack_from(block)
+    assert version == WAVEFORM_BLOCK_FORMAT_VERSION
+    dtype = {0: "<u2", 1: "<f4"}[dtype_code]
+    well_data = np.frombuffer(block, dtype=dtype, offset=WAVEFORM_BLOCK_HEADER.size).reshape(
+        num_channels, num_samples
+    )
+    return well_idx, start_time_index, sample_period_us, well_data
+
+
+@pytest.mark.parametrize("test_dtype", [np.uint16, np.float32])
+def test_encode_waveform_block__creates_header_followed_by_raw_little_endian_data(test_dtype):
+    test_well_data = (np.arange(12).reshape(3, 4) * 7).astype(test_dtype)
+
+    block = encode_waveform_block(5, 123456789, 1000, test_well_data[:, ::2])
+    assert WAVEFORM_BLOCK_HEADER.size % 8 == 0
+    assert len(block) == WAVEFORM_BLOCK_HEADER.size + test_well_data[:, ::2].nbytes
+
+    well_idx, start_time_index, sample_period_us, well_data = _decode_waveform_block(block)
+    assert (well_idx, start_time_index, sample_period_us) == (5, 123456789, 1000)
+    np.testing.assert_array_equal(well_data, test_well_data[:, ::2])
+
+
+def test_encode_waveform_block__raises_error_if_dtype_not_supported():
+    with pytest.raises(ValueError, match="Unsupported waveform dtype"):
+        encode_waveform_block(0, 0, 0, np.zeros((1, 1), dtype=np.int64))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("test_decimation", [1, 3])
+async def test_WaveformStream__publish__sends_decimated_block_for_each_well_evenly_spaced_across_batches(
+    test_decimation,
+):
+    waveform_stream = WaveformStream()
+    client = waveform_stream.add_client(test_decimation)
+
+    batch_sizes = [10, 4, 1, 7]
+    all_time_indices, all_data = [], []
+    start_sample_idx = 0
+    for batch_size in batch_sizes:
+        time_indices, data = _create_test_data(batch_size, start_sample_idx)
+        waveform_stream.publish(time_indices, data)
+        all_time_indices.append(time_indices)
+        all_data.append(data)
+        start_sample_idx += batch_size
+
+    expected_time_indices = np.concatenate(all_time_indices)[::test_decimation]
+    expected_data = np.concatenate(all_data, axis=2)[:, :, ::test_decimation]
+
+    blocks = [_decode_waveform_block(block) for block in await client.get_frames()]
+
+    for well_idx in range(NUM_WELLS):
+        well_blocks = [block for block in blocks if block[0] == well_idx]
+        assert [start_time_index for _, start_time_index, *_ in well_blocks] == [
+            time_indices[0] for time_indices in _split_time_indices(expected_time_indices, well_blocks)
+        ]
+        assert all(
+            sample_period_us == TEST_SAMPLE_PERIOD_US * test_decimation
+            for *_, sample_period_us, _ in well_blocks
+        )
+        np.testing.assert_array_equal(
+            np.concatenate([well_data for *_, well_data in well_blocks], axis=1), expected_data[well_idx]
+        )
+
+
+def _split_time_indices(time_indices, blocks):
+    split_idxs = np.cumsum([well_data.shape[1] for *_, well_data in blocks])[:-1]
+    return np.split(time_indices, split_idxs)
+
+
+@pytest.mark.asyncio
+async def test_WaveformStream__publish__only_encodes_batch_once_for_clients_with_same_decimation(mocker):
+    waveform_stream = WaveformStream()
+    clients = [waveform_stream.add_client(2) for _ in range(3)]
+    spied_encode = mocker.spy(waveform_stream, "_encode_batch")
+
+    waveform_stream.publish(*_create_test_data(10))
+
+    spied_encode.assert_called_once()
+    frames = [await client.get_frames() for client in clients]
+    assert frames[0] == frames[1] == frames[2]
+
+
+@pytest.mark.asyncio
+async def test_WaveformStream__publish__does_not_send_data_to_removed_client():
+    waveform_stream = WaveformStream()
+    client = waveform_stream.add_client(1)
+    waveform_stream.remove_client(client)
+    assert waveform_stream.num_clients == 0
+
+    waveform_stream.publish(*_create_test_data(10))
+    assert client.num_batches_dropped == 0
+    assert not client._batches
+
+
+@pytest.mark.asyncio
+async def test_WaveformStreamClient__drops_oldest_batches_if_client_falls_behind():
+    client = WaveformStreamClient(1, max_num_queued_batches=2)
+
+    for batch_idx in range(4):
+        client.add_batch([bytes([batch_idx])], 1)
+
+    assert client.num_batches_dropped == 2
+    assert await client.get_frames() == [bytes([2]), bytes([3])]
+
+
+def test_WaveformStreamClient__raises_error_if_decimation_invalid():
+    with pytest.raises(ValueError, match="Invalid decimation: 0"):
+        WaveformStreamClient(0)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import json
+from time import perf_counter
+
+from controller.constants import NUM_WELLS
+from controller.constants import SERIAL_COMM_NUM_CHANNELS_PER_SENSOR
+from controller.exceptions import WebsocketCodecUnavailableError
+from controller.exceptions import WebsocketCommandError
+from controller.utils import websocket_codecs
+from controller.utils.websocket_codecs import create_websocket_codec
+from controller.utils.websocket_codecs import MSGPACK_SCHEMA_VERSION
+from controller.utils.websocket_codecs import WEBSOCKET_CODECS
+import numpy as np
+import pytest
+
+
+def _create_codec_or_skip(codec_name):
+    try:
+        return create_websocket_codec(codec_name)
+    except WebsocketCodecUnavailableError:
+        pytest.skip(f"{codec_name} is not installed")
+
+
+def _create_magnetometer_data_msg(num_samples):
+    return {
+        "communication_type": "magnetometer_data",
+        "time_indices": np.arange(num_samples, dtype=np.int64) * 10000,
+        "data": np.random.randint(
+            0, 2**16, (NUM_WELLS, SERIAL_COMM_NUM_CHANNELS_PER_SENSOR, num_samples), dtype=np.uint16
+        ),
+    }
+
+
+def _create_recorded_message_mix():
+    """Messages in roughly the proportions they are sent to the UI while stimulating and streaming data."""
+    status_update = {
+        "communication_type": "status_update",
+        "system_status": "009301eb-625c-4dc4-9e92-1a4d0762465f",
+        "stimulation_protocols_running": [True] * NUM_WELLS,
+    }
+    stimulator_circuit_statuses = {
+        "communication_type": "stimulator_circuit_statuses",
+        "stimulator_circuit_statuses": {str(well_idx): "media" for well_idx in range(NUM_WELLS)},
+    }
+    barcode_update = {
+        "communication_type": "barcode_update",
+        "barcode_type": "plate_barcode",
+        "new_barcode": "ML2022001000",
+    }
+    return (
+        [_create_magnetometer_data_msg(100) for _ in range(20)]
+        + [status_update] * 10
+        + [stimulator_circuit_statuses] * 2
+        + [barcode_update] * 2
+    )
+
+
+@pytest.mark.parametrize("test_codec_name", list(WEBSOCKET_CODECS))
+def test_WebsocketCodec__round_trips_messages_without_arrays(test_codec_name):
+    codec = _create_codec_or_skip(test_codec_name)
+    test_msg = {"command": "set_stim_status", "running": True, "well_indices": [1, 2], "info": {"a": None}}
+
+    encoded_msg = codec.encode(test_msg)
+    assert isinstance(encoded_msg, bytes if codec.is_binary else str)
+    assert codec.decode(encoded_msg) == test_msg
+
+
+@pytest.mark.parametrize("test_codec_name", ["json", "orjson"])
+def test_WebsocketCodec__json_codecs_serialize_numpy_objects_as_json_values(test_codec_name):
+    codec = _create_codec_or_skip(test_codec_name)
+    test_arr = np.arange(12, dtype=np.uint16).reshape(3, 4)
+    test_msg = {"arr": test_arr, "non_contiguous_arr": test_arr[:, ::2], "scalar": np.int64(5)}
+
+    assert json.loads(codec.encode(test_msg)) == {
+        "arr": test_arr.tolist(),
+        "non_contiguous_arr": test_arr[:, ::2].tolist(),
+        "scalar": 5,
+    }
+
+
+def test_MsgpackCodec__encodes_message_with_schema_version_byte_and_numpy_arrays_from_buffer():
+    codec = _create_codec_or_skip("msgpack")
+    test_arr = np.arange(12, dtype=np.uint16).reshape(3, 4)
+
+    encoded_msg = codec.encode({"arr": test_arr[:, ::2]})
+    assert encoded_msg[0] == MSGPACK_SCHEMA_VERSION
+
+    decoded_arr_info = websocket_codecs.msgpack.unpackb(encoded_msg[1:])["arr"]
+    assert decoded_arr_info["dtype"] == "<u2"
+    assert decoded_arr_info["shape"] == [3, 2]
+    np.testing.assert_array_equal(
+        np.frombuffer(decoded_arr_info["data"], dtype=decoded_arr_info["dtype"]).reshape(3, 2),
+        test_arr[:, ::2],
+    )
+
+
+@pytest.mark.parametrize("test_data", ["{}", bytes([MSGPACK_SCHEMA_VERSION + 1]) + bytes([0x80]), b""])
+def test_MsgpackCodec__decode__raises_error_if_message_is_not_a_binary_frame_with_supported_schema_version(
+    test_data,
+):
+    codec = _create_codec_or_skip("msgpack")
+
+    with pytest.raises(WebsocketCommandError):
+        codec.decode(test_data)
+
+
+def test_create_websocket_codec__raises_error_if_codec_name_invalid():
+    with pytest.raises(ValueError, match="Invalid websocket codec: bad"):
+        create_websocket_codec("bad")
+
+
+def test_create_websocket_codec__raises_error_if_dependency_of_codec_not_installed(mocker):
+    mocker.patch.object(websocket_codecs, "_CODEC_DEPENDENCIES", {"orjson": None})
+
+    with pytest.raises(WebsocketCodecUnavailableError, match="orjson"):
+        create_websocket_codec("orjson")
+
+
+@pytest.mark.slow
+def test_WebsocketCodec__performance_of_encoding_recorded_message_mix():
+    msgs = _create_recorded_message_mix()
+    num_iterations = 20
+
+    for codec_name in WEBSOCKET_CODECS:
+        try:
+            codec = create_websocket_codec(codec_name)
+        except WebsocketCodecUnavailableError:
+            print(f"{codec_name}: not installed")  # allow-print
+            continue
+
+        start = perf_counter()
+        for _ in range(num_iterations):
+            num_bytes = sum(len(codec.encode(msg)) for msg in msgs)
+        dur = perf_counter() - start
+
+        print(  # allow-print
+            f"{codec_name}: {dur / (num_iterations * len(msgs)) * 1e6:.1f} us per msg, {num_bytes} bytes per mix"
+        )
@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
+import argparse
 import socket
 
 from virtual_instrument.virtual_instrument import MantarrayMcSimulator
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--reject-pipelined-firmware-packets",
+        action="store_true",
+        help="reject firmware packets sent before the response to the previous one, so that the controller has to fall back to sending them one at a time",
+    )
+    parsed_args = parser.parse_args()
+
     HOST = ""
     PORT = 56575  # TODO figure out what to do if port is already in use
 
@@ -13,5 +22,7 @@ if __name__ == "__main__":
         s.setblocking(False)
         print("WAITING")  # allow-print
 
-        simulator = MantarrayMcSimulator(s)
+        simulator = MantarrayMcSimulator(
+            s, reject_pipelined_firmware_packets=parsed_args.reject_pipelined_firmware_packets
+        )
         simulator.run()
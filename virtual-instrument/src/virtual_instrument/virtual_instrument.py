@@ -148,7 +148,11 @@ class MantarrayMcSimulator(InfiniteProcess):
     global_timer_offset_secs = 2.5  # TODO Tanner (11/17/21): figure out if this should be removed
 
     def __init__(
-        self, sock: socket.socket, logging_level: int = logging.INFO, num_wells: int = NUM_WELLS
+        self,
+        sock: socket.socket,
+        logging_level: int = logging.INFO,
+        num_wells: int = NUM_WELLS,
+        reject_pipelined_firmware_packets: bool = False,
     ) -> None:
         # InfiniteProcess values
         super().__init__(Queue(), logging_level=logging_level)
@@ -185,6 +189,9 @@ class MantarrayMcSimulator(InfiniteProcess):
         self._firmware_update_type: int | None = None
         self._firmware_update_idx: int | None = None
         self._firmware_update_bytes: bytes | None
+        self._firmware_update_info: bytes | None = None
+        # when set, firmware packets received before the response to the previous one was sent are rejected, like firmware that can only handle one firmware packet at a time
+        self._reject_pipelined_firmware_packets = reject_pipelined_firmware_packets
         self._new_nickname: str | None = None
         self._handle_boot_up_config()
 
@@ -295,6 +302,7 @@ class MantarrayMcSimulator(InfiniteProcess):
             if not self._reboot_again:
                 self._send_status_beacon(truncate=False)
         self._firmware_update_type = None
+        self._firmware_update_info = None
 
     def _reset_metadata_dict(self) -> None:
         self._metadata_dict = dict(self.default_metadata_values)
@@ -396,7 +404,10 @@ class MantarrayMcSimulator(InfiniteProcess):
             return
         else:
             if not magic_word:
-                # assume that the controller disconnected here and ignore
+                # assume that the controller disconnected here. Any firmware update in progress is kept
+                # so that it can be resumed once the controller reconnects
+                self.conn.close()
+                self.conn = None
                 return
 
         if magic_word != SERIAL_COMM_MAGIC_WORD_BYTES:
@@ -418,6 +429,20 @@ class MantarrayMcSimulator(InfiniteProcess):
             return
         self._process_main_module_command(comm_from_controller)
 
+    def _has_pending_firmware_packet_from_controller(self) -> bool:
+        if not self.conn:
+            return False
+        # only peek at the header of the next packet so that it is still read normally
+        header_len = SERIAL_COMM_PACKET_TYPE_INDEX + 1
+        try:
+            header = self.conn.recv(header_len, socket.MSG_PEEK)
+        except BlockingIOError:
+            return False
+        return (
+            len(header) == header_len
+            and header[SERIAL_COMM_PACKET_TYPE_INDEX] == SerialCommPacketTypes.FIRMWARE_UPDATE
+        )
+
     def _check_handshake_timeout(self) -> None:
         if self._time_of_last_handshake_secs is None or self._connection_status in (
             InstrumentConnectionStatuses.DISCONNECTED,
@@ -504,11 +529,28 @@ class MantarrayMcSimulator(InfiniteProcess):
             self._reboot_again = True
         elif packet_type == SerialCommPacketTypes.BEGIN_FIRMWARE_UPDATE:
             firmware_type = comm_from_controller[SERIAL_COMM_PAYLOAD_INDEX]
-            command_failed = firmware_type not in (0, 1) or self._firmware_update_type is not None
-            # TODO store new FW version and number of bytes in FW
-            self._firmware_update_idx = 0
-            self._firmware_update_type = firmware_type
-            self._firmware_update_bytes = bytes(0)
+            # version and number of bytes in FW
+            firmware_info = comm_from_controller[
+                SERIAL_COMM_PAYLOAD_INDEX + 1 : SERIAL_COMM_PAYLOAD_INDEX + 8
+            ]
+            resume_info = comm_from_controller[
+                SERIAL_COMM_PAYLOAD_INDEX + 8 : -SERIAL_COMM_CHECKSUM_LENGTH_BYTES
+            ]
+            if resume_info:
+                command_failed = not self._resume_firmware_update(firmware_type, firmware_info, resume_info)
+                if command_failed:
+                    # the controller will start the update over, so the update in progress can't be resumed anymore
+                    self._firmware_update_type = None
+                    self._firmware_update_info = None
+                    self._firmware_update_idx = None
+                    self._firmware_update_bytes = None
+            else:
+                # an update that was not completed is replaced, since the controller is starting it over
+                command_failed = firmware_type not in (0, 1)
+                self._firmware_update_idx = 0
+                self._firmware_update_type = firmware_type
+                self._firmware_update_info = firmware_info
+                self._firmware_update_bytes = bytes(0)
             response_body += bytes([command_failed])
         elif packet_type == SerialCommPacketTypes.FIRMWARE_UPDATE:
             if self._firmware_update_bytes is None:
@@ -524,10 +566,15 @@ class MantarrayMcSimulator(InfiniteProcess):
             command_failed = (
                 len(new_firmware_bytes) > SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES - 1
                 or packet_idx != self._firmware_update_idx
+                or (
+                    self._reject_pipelined_firmware_packets
+                    and self._has_pending_firmware_packet_from_controller()
+                )
             )
             response_body += bytes([command_failed])
-            self._firmware_update_bytes += new_firmware_bytes
-            self._firmware_update_idx += 1
+            if not command_failed:
+                self._firmware_update_bytes += new_firmware_bytes
+                self._firmware_update_idx += 1
         elif packet_type == SerialCommPacketTypes.END_FIRMWARE_UPDATE:
             if self._firmware_update_type is None:
                 # Tanner (11/10/21): currently unsure how real board would handle receiving this packet before the previous two firmware packet types
@@ -603,6 +650,33 @@ class MantarrayMcSimulator(InfiniteProcess):
         if send_response:
             self._send_data_packet(packet_type, response_body)
 
+    def _resume_firmware_update(self, firmware_type: int, firmware_info: bytes, resume_info: bytes) -> bool:
+        """Resume an interrupted firmware update from the given packet index.
+
+        This only succeeds if the same firmware is being updated and the checksum of all the bytes received
+        before the given packet index matches the given checksum.
+        """
+        if (
+            self._firmware_update_type != firmware_type
+            or self._firmware_update_info != firmware_info
+            or self._firmware_update_bytes is None
+            or self._firmware_update_idx is None
+        ):
+            return False
+
+        resume_idx = resume_info[0]
+        expected_checksum = int.from_bytes(resume_info[1:5], byteorder="little")
+        num_bytes_to_keep = resume_idx * (SERIAL_COMM_MAX_PAYLOAD_LENGTH_BYTES - 1)
+        if (
+            resume_idx > self._firmware_update_idx
+            or crc32(self._firmware_update_bytes[:num_bytes_to_keep]) != expected_checksum
+        ):
+            return False
+
+        self._firmware_update_bytes = self._firmware_update_bytes[:num_bytes_to_keep]
+        self._firmware_update_idx = resume_idx
+        return True
+
     def _update_sampling_period(self, comm_from_controller: bytes) -> bytes:
         update_status_byte = bytes([self._is_streaming_data])
         if self._is_streaming_data:
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import socket
+from zlib import crc32
+
+from controller.constants import SerialCommPacketTypes
+from controller.utils.data_parsing_cy import sort_serial_packets
+from controller.utils.serial_comm import create_data_packet
+import pytest
+from virtual_instrument.virtual_instrument import MantarrayMcSimulator
+
+
+TEST_FIRMWARE_CHUNKS = [bytes([chunk_idx]) * 100 for chunk_idx in range(3)]
+# firmware version and number of bytes in the firmware
+TEST_FIRMWARE_INFO = bytes([1, 2, 3]) + sum(len(chunk) for chunk in TEST_FIRMWARE_CHUNKS).to_bytes(
+    4, "little"
+)
+
+
+@pytest.fixture(scope="function", name="simulator_items")
+def fixture__simulator_items():
+    simulator_socket, controller_socket = socket.socketpair()
+    simulator_socket.setblocking(False)
+    controller_socket.settimeout(1)
+
+    simulator = MantarrayMcSimulator(socket.socket())
+    simulator.conn = simulator_socket
+
+    yield simulator, controller_socket
+
+    simulator_socket.close()
+    controller_socket.close()
+
+
+def _send_packets(controller_socket, *packets):
+    controller_socket.sendall(
+        b"".join(create_data_packet(0, packet_type, payload) for packet_type, payload in packets)
+    )
+
+
+def _process_next_packet(simulator, controller_socket):
+    simulator._handle_comm_from_controller()
+    ((_, packet_type, response_payload),) = sort_serial_packets(bytearray(controller_socket.recv(1000)))[
+        "other_packet_info"
+    ]
+    return packet_type, response_payload
+
+
+def _begin_firmware_update(simulator, controller_socket, resume_info=bytes(0)):
+    _send_packets(
+        controller_socket,
+        (SerialCommPacketTypes.BEGIN_FIRMWARE_UPDATE, bytes([0]) + TEST_FIRMWARE_INFO + resume_info),
+    )
+    _, response_payload = _process_next_packet(simulator, controller_socket)
+    return bool(response_payload[0])
+
+
+def _send_firmware_chunk(simulator, controller_socket, chunk_idx):
+    _send_packets(
+        controller_socket,
+        (SerialCommPacketTypes.FIRMWARE_UPDATE, bytes([chunk_idx]) + TEST_FIRMWARE_CHUNKS[chunk_idx]),
+    )
+    _, response_payload = _process_next_packet(simulator, controller_socket)
+    return bool(response_payload[0])
+
+
+def test_MantarrayMcSimulator__starts_firmware_update_over_after_rejecting_resume(simulator_items):
+    simulator, controller_socket = simulator_items
+
+    assert _begin_firmware_update(simulator, controller_socket) is False
+    assert _send_firmware_chunk(simulator, controller_socket, 0) is False
+
+    # try to resume with a checksum that does not match the bytes received
+    test_resume_info = bytes([1]) + (crc32(TEST_FIRMWARE_CHUNKS[0]) + 1).to_bytes(4, "little")
+    assert _begin_firmware_update(simulator, controller_socket, test_resume_info) is True
+
+    assert _begin_firmware_update(simulator, controller_socket) is False
+    for chunk_idx in range(len(TEST_FIRMWARE_CHUNKS)):
+        assert _send_firmware_chunk(simulator, controller_socket, chunk_idx) is False
+
+    _send_packets(
+        controller_socket,
+        (
+            SerialCommPacketTypes.END_FIRMWARE_UPDATE,
+            crc32(b"".join(TEST_FIRMWARE_CHUNKS)).to_bytes(4, "little"),
+        ),
+    )
+    _, response_payload = _process_next_packet(simulator, controller_socket)
+    assert response_payload[0] == 0
+
+
+def test_MantarrayMcSimulator__only_rejects_firmware_packet_if_another_firmware_packet_is_pending(
+    simulator_items,
+):
+    simulator, controller_socket = simulator_items
+    simulator._reject_pipelined_firmware_packets = True
+
+    assert _begin_firmware_update(simulator, controller_socket) is False
+
+    # a pending packet of any other type should not cause a rejection
+    _send_packets(
+        controller_socket,
+        (SerialCommPacketTypes.FIRMWARE_UPDATE, bytes([0]) + TEST_FIRMWARE_CHUNKS[0]),
+        (SerialCommPacketTypes.HANDSHAKE, bytes(0)),
+    )
+    packet_type, response_payload = _process_next_packet(simulator, controller_socket)
+    assert packet_type == SerialCommPacketTypes.FIRMWARE_UPDATE
+    assert response_payload[0] == 0
+    _process_next_packet(simulator, controller_socket)
+
+    _send_packets(
+        controller_socket,
+        (SerialCommPacketTypes.FIRMWARE_UPDATE, bytes([1]) + TEST_FIRMWARE_CHUNKS[1]),
+        (SerialCommPacketTypes.FIRMWARE_UPDATE, bytes([2]) + TEST_FIRMWARE_CHUNKS[2]),
+    )
+    packet_type, response_payload = _process_next_packet(simulator, controller_socket)
+    assert packet_type == SerialCommPacketTypes.FIRMWARE_UPDATE
+    assert response_payload[0] == 1